@@ -105,6 +105,7 @@ TODO: DecisionTree    Supervised decision tree induction based classifier.
 
 import auxiliary
 import mymath
+import weightvec
 
 import heapq
 import logging
@@ -140,6 +141,49 @@ except:
 if (imp_svm == False):
   logging.warn('Cannot import svm module')
 
+try:
+  import numpy
+  imp_numpy = True
+except:
+  imp_numpy = False
+
+# =============================================================================
+# Distance functions that calculate the distances between all rows of a NumPy
+# weight matrix and one vector (a cluster centroid). They give the same
+# results as the corresponding distance functions in the mymath.py module,
+# and are used by the K-means and farthest first classifiers to process many
+# weight vectors at once.
+
+def _dist_matrix_L1(w_matrix, vec):
+  return numpy.abs(w_matrix - vec).sum(axis=1)
+
+def _dist_matrix_L2(w_matrix, vec):
+  diff = w_matrix - vec
+  return numpy.sqrt((diff*diff).sum(axis=1))
+
+def _dist_matrix_LInf(w_matrix, vec):
+  return numpy.abs(w_matrix - vec).max(axis=1)
+
+def _dist_matrix_Canberra(w_matrix, vec):
+  x = numpy.abs(w_matrix - vec)
+  y = numpy.abs(w_matrix) + numpy.abs(vec)
+  y_pos = y > 0.0
+  return numpy.where(y_pos, x / numpy.where(y_pos, y, 1.0), 0.0).sum(axis=1)
+
+def _dist_matrix_Cosine(w_matrix, vec):
+  vec1sum =  numpy.sqrt((w_matrix*w_matrix).sum(axis=1))
+  vec2sum =  math.sqrt(numpy.dot(vec, vec))
+  vec12sum = numpy.dot(w_matrix, vec)
+  is_zero =  (vec1sum*vec2sum) == 0.0  # At least one vector is all zeros
+  cos_sim =  vec12sum / numpy.where(is_zero, 1.0, vec1sum*vec2sum)
+  return numpy.where(is_zero, 1.0, 1.0 - numpy.minimum(cos_sim, 1.0))
+
+_dist_matrix_funct_dict = {mymath.distL1:       _dist_matrix_L1,
+                           mymath.distL2:       _dist_matrix_L2,
+                           mymath.distLInf:     _dist_matrix_LInf,
+                           mymath.distCanberra: _dist_matrix_Canberra,
+                           mymath.distCosine:   _dist_matrix_Cosine}
+
 # =============================================================================
 
 class Classifier:
@@ -190,7 +234,7 @@ class Classifier:
         self.description = value
 
       elif (keyword.startswith('train_w_vec')):
-        auxiliary.check_is_dictionary('train_w_vec_dict', value)
+        weightvec.check_is_weight_vector_dict('train_w_vec_dict', value)
         self.train_w_vec_dict = value
 
       elif (keyword.startswith('train_mat')):
@@ -390,7 +434,7 @@ class FellegiSunter(Classifier):
        - Is this correct, does this makes sense?
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -477,7 +521,7 @@ class FellegiSunter(Classifier):
        2) non-match set, and 3) possible match set
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     logging.info('')
     logging.info('Classify %d weight vectors using Fellegi and Sunter ' % \
@@ -597,7 +641,7 @@ class OptimalThreshold(Classifier):
        (dimension).
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -768,7 +812,7 @@ class OptimalThreshold(Classifier):
        Will return a confusion matrix as a list of the form: [TP, FN, FP, TN].
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -853,7 +897,7 @@ class OptimalThreshold(Classifier):
 
     auxiliary.check_is_integer('n', n)
     auxiliary.check_is_positive('n', n)
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -997,7 +1041,7 @@ class OptimalThreshold(Classifier):
        weight vectors as either matches or non-matches.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     # Get a random vector dictionary element to get dimensionality of vectors
     #
@@ -1089,6 +1133,16 @@ class KMeans(Classifier):
                        case no fuzzy region calculation will be done and no
                        weight vectors will be inserted into the possible match
                        set.
+       chunk_size      If NumPy is installed and the distance measure is one
+                       of the distance functions in the Febrl mymath.py module
+                       (distL1, distL2, distLInf, distCanberra or distCosine),
+                       then the weight vectors are converted into a NumPy
+                       matrix and the training iterations are done with matrix
+                       operations. This argument gives the maximum number of
+                       weight vectors (rows) processed in one matrix operation,
+                       to limit the memory needed for intermediate results.
+                       Default value is 100000. For other distance functions
+                       the weight vectors are processed one by one.
   """
 
   # ---------------------------------------------------------------------------
@@ -1103,6 +1157,7 @@ class KMeans(Classifier):
     self.sample =         100.0
     self.centroid_init =  'min/max'
     self.fuzz_reg_thres = None
+    self.chunk_size =     100000
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -1136,6 +1191,11 @@ class KMeans(Classifier):
           auxiliary.check_is_normalised('fuzz_reg_thres', value)
           self.fuzz_reg_thres = value
 
+      elif (keyword.startswith('chunk')):
+        auxiliary.check_is_integer('chunk_size', value)
+        auxiliary.check_is_positive('chunk_size', value)
+        self.chunk_size = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -1151,7 +1211,8 @@ class KMeans(Classifier):
               ('Distance measure function', self.dist_measure),
               ('Sampling rate', self.sample),
               ('Centroid initialisation', self.centroid_init),
-              ('Fuzzy match threshold', self.fuzz_reg_thres)]) # Log a message
+              ('Fuzzy match threshold', self.fuzz_reg_thres),
+              ('Chunk size', self.chunk_size)]) # Log a message
 
     # If the weight vector dictionary and both match and non-match sets - - - -
     # are given start the training process
@@ -1173,7 +1234,7 @@ class KMeans(Classifier):
        vectors given.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     self.train_w_vec_dict =    w_vec_dict  # Save
     self.train_match_set =     match_set
@@ -1208,6 +1269,17 @@ class KMeans(Classifier):
     logging.info('  Number of weight vectors to be used for clustering: %d' % \
                  (len(use_w_vec_dict)))
 
+    # Use a NumPy weight matrix if the distance measure is known - - - - - - -
+    #
+    dist_matrix_funct = _dist_matrix_funct_dict.get(self.dist_measure, None)
+
+    if ((imp_numpy == True) and (dist_matrix_funct != None)):
+      w_matrix = weightvec.get_weight_matrix(use_w_vec_dict)
+      logging.info('  Use NumPy weight matrix with chunk size: %d' % \
+                   (self.chunk_size))
+    else:
+      w_matrix = None
+
     zero_w_vec = [0.0]*v_dim  # Weight vector with all zeros
 
     # Initialise the cluster centroid - - - - - - - - - - - - - - - - - - - - -
@@ -1234,6 +1306,10 @@ class KMeans(Classifier):
         m_centroid =  use_w_vec_dict[nm_centroid_rec_id]
         nm_centroid = use_w_vec_dict[m_centroid_rec_id]
 
+    elif (w_matrix is not None):  # Minimum and maximum values in each column
+      m_centroid =  numpy.maximum(w_matrix.max(axis=0), -999.99).tolist()
+      nm_centroid = numpy.minimum(w_matrix.min(axis=0), 999.99).tolist()
+
     else:  # Get the minimum and maximum values in each weight vector element
       m_centroid =  [-999.99]*v_dim
       nm_centroid = [999.99]*v_dim
@@ -1252,7 +1328,110 @@ class KMeans(Classifier):
 
     # Start iterations - - - - - - - - - - - - - - - - - - - - - - - - - - - -
     #
-    cluster_assign_dict = {}  # Dictionary with cluster assignments
+    if (w_matrix is not None):
+      (m_centroid, nm_centroid, num_m, num_nm) = \
+                 self.__cluster_weight_matrix__(w_matrix, dist_matrix_funct,
+                                                m_centroid, nm_centroid)
+
+    else:  # Process weight vectors one by one
+      cluster_assign_dict = {}  # Dictionary with cluster assignments
+
+      iter_cnt = 1  # Iteration counter
+
+      num_changed = 1
+
+      while (num_changed > 0) and (iter_cnt < self.max_iter_count):
+
+        num_changed =     0
+        new_m_centroid =  [0.0]*v_dim  # Summed new distances
+        new_nm_centroid = [0.0]*v_dim
+
+        # Step 1: Calculate cluster membership for each weight vector - - - -
+        #
+        num_m =  0  # Number of weight vectors assigned to matches
+        num_nm = 0  # Number of weight vectors assigned to non-matches
+
+        for (rec_id_tuple, w_vec) in use_w_vec_dict.iteritems():
+
+          m_dist =  self.dist_measure(w_vec, m_centroid)
+          nm_dist = self.dist_measure(w_vec, nm_centroid)
+
+          if (m_dist < nm_dist):  # Assign to cluster M (matches)
+            old_assign = cluster_assign_dict.get(rec_id_tuple, 'X')
+            if (old_assign != 'M'):
+              num_changed += 1
+            cluster_assign_dict[rec_id_tuple] = 'M'
+            num_m += 1
+
+            for i in range(v_dim):  # Add to summed cluster distances
+              new_m_centroid[i] += w_vec[i]
+
+          else:  # Assign to cluster NM (non-matches)
+            old_assign = cluster_assign_dict.get(rec_id_tuple, 'X')
+            if (old_assign != 'NM'):
+              num_changed += 1
+            cluster_assign_dict[rec_id_tuple] = 'NM'
+            num_nm += 1
+
+            for i in range(v_dim):  # Add to summed cluster distances
+              new_nm_centroid[i] += w_vec[i]
+
+        num_all = len(cluster_assign_dict)
+
+        if ((num_m + num_nm) != num_all):
+          logging.exception('Not all %d weight vectors assigned: M=%d, ' % \
+                            (num_all, num_m) + 'U=%d' % (num_nm))
+          raise Exception
+
+        if (num_m == 0) or (num_nm == 0):
+          logging.warn('One cluster is empty: matches=%d, non-matches=%d' % \
+                       (num_m, num_nm))
+          break  # Stop K-means iterations
+
+        # Step 2: Calculate new cluster centroids - - - - - - - - - - - - - -
+        #
+        for i in range(v_dim):  # Normalise new centroids
+          new_m_centroid[i] /=  float(num_m)
+          new_nm_centroid[i] /= float(num_nm)
+
+        m_centroid =  new_m_centroid  # Assign new centroids
+        nm_centroid = new_nm_centroid
+
+        logging.info('Iteration %d: %d vectors changed cluster assignment' % \
+              (iter_cnt, num_changed))
+
+        iter_cnt += 1
+
+    self.m_centroid =  m_centroid  # Save for later use
+    self.nm_centroid = nm_centroid
+
+    logging.info('Final cluster centroids using method "%s":' % \
+                 (self.centroid_init))
+    logging.info('  Match centroid:     %s' % \
+                 (auxiliary.str_vector(m_centroid)))
+    logging.info('  Non-match centroid: %s' % \
+                 (auxiliary.str_vector(nm_centroid)))
+    logging.info('  Cluster sizes: M=%d, NM=%d' % (num_m, num_nm))
+
+  # ---------------------------------------------------------------------------
+
+  def __cluster_weight_matrix__(self, w_matrix, dist_matrix_funct, m_centroid,
+                                nm_centroid):
+    """Conduct the K-means iterations on the given NumPy weight matrix, with
+       the given matrix distance function, processing 'chunk_size' weight
+       vectors at a time.
+
+       Returns the final match and non-match centroids and the number of
+       weight vectors in both clusters.
+    """
+
+    num_w_vec =  w_matrix.shape[0]
+    chunk_size = self.chunk_size
+
+    is_match = numpy.zeros(num_w_vec, numpy.bool_)  # Cluster assignments
+
+    num_m =  0
+    num_nm = 0
 
     iter_cnt = 1  # Iteration counter
 
@@ -1261,45 +1440,35 @@ class KMeans(Classifier):
     while (num_changed > 0) and (iter_cnt < self.max_iter_count):
 
       num_changed =     0
-      new_m_centroid =  [0.0]*v_dim  # Summed new distances
-      new_nm_centroid = [0.0]*v_dim
+      new_m_centroid =  numpy.zeros(w_matrix.shape[1], numpy.float64)
+      new_nm_centroid = numpy.zeros(w_matrix.shape[1], numpy.float64)
+
+      m_centroid_array =  numpy.array(m_centroid, numpy.float64)
+      nm_centroid_array = numpy.array(nm_centroid, numpy.float64)
 
       # Step 1: Calculate cluster membership for each weight vector - - - - - -
       #
-      num_m =  0  # Number of weight vectors assigned to matches
-      num_nm = 0  # Number of weight vectors assigned to non-matches
+      for start in xrange(0, num_w_vec, chunk_size):
+        end =            min(start+chunk_size, num_w_vec)
+        w_matrix_chunk = w_matrix[start:end]
 
-      for (rec_id_tuple, w_vec) in use_w_vec_dict.iteritems():
+        m_dist =  dist_matrix_funct(w_matrix_chunk, m_centroid_array)
+        nm_dist = dist_matrix_funct(w_matrix_chunk, nm_centroid_array)
 
-        m_dist =  self.dist_measure(w_vec, m_centroid)
-        nm_dist = self.dist_measure(w_vec, nm_centroid)
+        chunk_is_match = m_dist < nm_dist  # Assign to cluster M (matches)
 
-        if (m_dist < nm_dist):  # Assign to cluster M (matches)
-          old_assign = cluster_assign_dict.get(rec_id_tuple, 'X')
-          if (old_assign != 'M'):
-            num_changed += 1
-          cluster_assign_dict[rec_id_tuple] = 'M'
-          num_m += 1
-
-          for i in range(v_dim):  # Add to summed cluster distances
-            new_m_centroid[i] += w_vec[i]
-
-        else:  # Assign to cluster NM (non-matches)
-          old_assign = cluster_assign_dict.get(rec_id_tuple, 'X')
-          if (old_assign != 'NM'):
-            num_changed += 1
-          cluster_assign_dict[rec_id_tuple] = 'NM'
-          num_nm += 1
+        if (iter_cnt == 1):  # No previous assignments, all have changed
+          num_changed += end - start
+        else:
+          num_changed += int((chunk_is_match != is_match[start:end]).sum())
 
-          for i in range(v_dim):  # Add to summed cluster distances
-            new_nm_centroid[i] += w_vec[i]
+        is_match[start:end] = chunk_is_match
 
-      num_all = len(cluster_assign_dict)
+        new_m_centroid +=  w_matrix_chunk[chunk_is_match].sum(axis=0)
+        new_nm_centroid += w_matrix_chunk[~chunk_is_match].sum(axis=0)
 
-      if ((num_m + num_nm) != num_all):
-        logging.exception('Not all %d weight vectors assigned: M=%d, U=%d' % \
-                          (num_all, num_m, num_nm))
-        raise Exception
+      num_m =  int(is_match.sum())
+      num_nm = num_w_vec - num_m
 
       if (num_m == 0) or (num_nm == 0):
         logging.warn('One cluster is empty: matches=%d, non-matches=%d' % \
@@ -1308,28 +1477,15 @@ class KMeans(Classifier):
 
       # Step 2: Calculate new cluster centroids - - - - - - - - - - - - - - - -
       #
-      for i in range(v_dim):  # Normalise new centroids
-        new_m_centroid[i] /=  float(num_m)
-        new_nm_centroid[i] /= float(num_nm)
-
-      m_centroid =  new_m_centroid  # Assign new centroids
-      nm_centroid = new_nm_centroid
+      m_centroid =  (new_m_centroid / float(num_m)).tolist()
+      nm_centroid = (new_nm_centroid / float(num_nm)).tolist()
 
       logging.info('Iteration %d: %d vectors changed cluster assignment' % \
             (iter_cnt, num_changed))
 
       iter_cnt += 1
 
-    self.m_centroid =  m_centroid  # Save for later use
-    self.nm_centroid = nm_centroid
-
-    logging.info('Final cluster centroids using method "%s":' % \
-                 (self.centroid_init))
-    logging.info('  Match centroid:     %s' % \
-                 (auxiliary.str_vector(m_centroid)))
-    logging.info('  Non-match centroid: %s' % \
-                 (auxiliary.str_vector(nm_centroid)))
-    logging.info('  Cluster sizes: M=%d, NM=%d' % (num_m, num_nm))
+    return (m_centroid, nm_centroid, num_m, num_nm)
 
   # ---------------------------------------------------------------------------
 
@@ -1346,7 +1502,7 @@ class KMeans(Classifier):
        Will return a confusion matrix as a list of the form: [TP, FN, FP, TN].
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -1415,7 +1571,7 @@ class KMeans(Classifier):
 
     auxiliary.check_is_integer('n', n)
     auxiliary.check_is_positive('n', n)
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -1569,7 +1725,7 @@ class KMeans(Classifier):
        set, otherwise the possible match set will be empty.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     logging.info('')
     logging.info('Classify %d weight vectors using K-means classifier' % \
@@ -1652,6 +1808,17 @@ class FarthestFirst(Classifier):
                        'traditional' (the default), 'min/max', or 'mode/max'.
        fuzz_reg_thres  The fuzzy region threshold, see K-means classifier for
                        more detailed information
+       chunk_size      If NumPy is installed and the distance measure is one
+                       of the distance functions in the Febrl mymath.py module
+                       (distL1, distL2, distLInf, distCanberra or distCosine),
+                       then the weight vectors are converted into a NumPy
+                       matrix and the 'traditional' and 'min/max' centroid
+                       initialisations are done with matrix operations. This
+                       argument gives the maximum number of weight vectors
+                       (rows) processed in one matrix operation, to limit the
+                       memory needed for intermediate results. Default value
+                       is 100000. For other distance functions the weight
+                       vectors are processed one by one.
   """
 
   # ---------------------------------------------------------------------------
@@ -1666,6 +1833,7 @@ class FarthestFirst(Classifier):
     self.centroid_init =  'traditional'
     self.fuzz_reg_thres = None
     self.num_choices =    10  # Number of choices for the traditional approach
+    self.chunk_size =     100000
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -1695,6 +1863,11 @@ class FarthestFirst(Classifier):
           auxiliary.check_is_normalised('fuzz_reg_thres', value)
           self.fuzz_reg_thres = value
 
+      elif (keyword.startswith('chunk')):
+        auxiliary.check_is_integer('chunk_size', value)
+        auxiliary.check_is_positive('chunk_size', value)
+        self.chunk_size = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -1707,7 +1880,8 @@ class FarthestFirst(Classifier):
     self.log([('Distance measure function', self.dist_measure),
               ('Sampling rate', self.sample),
               ('Centroid initialisation', self.centroid_init),
-              ('Fuzzy match threshold', self.fuzz_reg_thres)]) # Log a message
+              ('Fuzzy match threshold', self.fuzz_reg_thres),
+              ('Chunk size', self.chunk_size)]) # Log a message
 
     # If the weight vector dictionary and both match and non-match sets - - - -
     # are given start the training process
@@ -1729,7 +1903,7 @@ class FarthestFirst(Classifier):
        vectors given.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     self.train_w_vec_dict =    w_vec_dict  # Save
     self.train_match_set =     match_set
@@ -1764,6 +1938,17 @@ class FarthestFirst(Classifier):
     logging.info('  Number of weight vectors to be used for clustering: %d' % \
                  (len(use_w_vec_dict)))
 
+    # Use a NumPy weight matrix if the distance measure is known - - - - - - -
+    #
+    dist_matrix_funct = _dist_matrix_funct_dict.get(self.dist_measure, None)
+
+    if ((imp_numpy == True) and (dist_matrix_funct != None)):
+      w_matrix = weightvec.get_weight_matrix(use_w_vec_dict)
+      logging.info('  Use NumPy weight matrix with chunk size: %d' % \
+                   (self.chunk_size))
+    else:
+      w_matrix = None
+
     # Iniialise the cluster centroid - - - - - - - - - - - - - - - - - - - - -
     #
     if (self.centroid_init == 'traditional'):
@@ -1778,15 +1963,22 @@ class FarthestFirst(Classifier):
       # Search the farthest weight vector from the initial centroid
       #
       for i in range(self.num_choices):
-        max_dist =          -1.0
-        max_dist_centroid = None
 
-        for (rec_id_tuple, w_vec) in use_w_vec_dict.iteritems():
-          dist = self.dist_measure(centroid1, w_vec)
+        if (w_matrix is not None):
+          max_dist_row = self.__farthest_row__(w_matrix, dist_matrix_funct,
+                                               centroid1)
+          max_dist_centroid = w_matrix[max_dist_row].tolist()
 
-          if (dist > max_dist):
-            max_dist =          dist
-            max_dist_centroid = w_vec
+        else:
+          max_dist =          -1.0
+          max_dist_centroid = None
+
+          for (rec_id_tuple, w_vec) in use_w_vec_dict.iteritems():
+            dist = self.dist_measure(centroid1, w_vec)
+
+            if (dist > max_dist):
+              max_dist =          dist
+              max_dist_centroid = w_vec
 
         centroid2 = centroid1  # Update farthest away centroid
         centroid1 = max_dist_centroid
@@ -1804,6 +1996,12 @@ class FarthestFirst(Classifier):
     # Get the weight vectors with minimum and maximum values in each - - - - -
     # vector element
     #
+    elif ((self.centroid_init == 'min/max') and (w_matrix is not None)):
+      w_vec_sum_array = w_matrix.sum(axis=1)
+
+      m_centroid =  w_matrix[int(w_vec_sum_array.argmax())].tolist()
+      nm_centroid = w_matrix[int(w_vec_sum_array.argmin())].tolist()
+
     elif (self.centroid_init == 'min/max'):
       m_centroid_sum = -999999
       nm_centroid_sum = 999999
@@ -1867,6 +2065,30 @@ class FarthestFirst(Classifier):
 
   # ---------------------------------------------------------------------------
 
+  def __farthest_row__(self, w_matrix, dist_matrix_funct, centroid):
+    """Return the number of the row in the given NumPy weight matrix that is
+       farthest away from the given centroid (the first such row if there are
+       several), processing 'chunk_size' weight vectors at a time.
+    """
+
+    centroid_array = numpy.array(centroid, numpy.float64)
+
+    max_dist =     -1.0
+    max_dist_row = None
+
+    for start in xrange(0, w_matrix.shape[0], self.chunk_size):
+      dist_array = dist_matrix_funct(w_matrix[start:start+self.chunk_size],
+                                     centroid_array)
+      chunk_max_row = int(dist_array.argmax())
+
+      if (dist_array[chunk_max_row] > max_dist):
+        max_dist =     dist_array[chunk_max_row]
+        max_dist_row = start + chunk_max_row
+
+    return max_dist_row
+
+  # ---------------------------------------------------------------------------
+
   def test(self, w_vec_dict, match_set, non_match_set):
     """Method to test a classifier using the given weight vector dictionary and
        match and non-match sets of record identifier pairs.
@@ -1880,7 +2102,7 @@ class FarthestFirst(Classifier):
        Will return a confusion matrix as a list of the form: [TP, FN, FP, TN].
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -1949,7 +2171,7 @@ class FarthestFirst(Classifier):
 
     auxiliary.check_is_integer('n', n)
     auxiliary.check_is_positive('n', n)
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -2101,7 +2323,7 @@ class FarthestFirst(Classifier):
        set, otherwise the possible match set will be empty.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     logging.info('')
     logging.info('Classify %d weight vectors using farthest first ' % \
@@ -2243,7 +2465,7 @@ class SuppVecMachine(Classifier):
        non-match training sets.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -2351,7 +2573,7 @@ class SuppVecMachine(Classifier):
 
     svm_version = self.svm_version  # Shortcut
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -2423,7 +2645,7 @@ class SuppVecMachine(Classifier):
 
     auxiliary.check_is_integer('n', n)
     auxiliary.check_is_positive('n', n)
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -2578,7 +2800,7 @@ class SuppVecMachine(Classifier):
 
     svm_version = self.svm_version  # Shortcut
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     match_set =      set()
     non_match_set =  set()
@@ -2924,7 +3146,7 @@ class TwoStep(Classifier):
        classifier on them
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     self.train_w_vec_dict =    w_vec_dict  # Save
     self.train_match_set =     match_set
@@ -3809,7 +4031,7 @@ class TwoStep(Classifier):
        Will return a confusion matrix as a list of the form: [TP, FN, FP, TN].
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -4018,7 +4240,7 @@ class TwoStep(Classifier):
        weight vectors as either matches or non-matches.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     match_set =      set()
     non_match_set =  set()
@@ -4264,7 +4486,7 @@ class TAILOR(Classifier):
        clusters to train a SVM.
     """
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     self.train_w_vec_dict =    w_vec_dict  # Save
     self.train_match_set =     match_set
@@ -4496,7 +4718,7 @@ class TAILOR(Classifier):
 
     svm_version = self.svm_version  # Shortcut
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -4568,7 +4790,7 @@ class TAILOR(Classifier):
 
     auxiliary.check_is_integer('n', n)
     auxiliary.check_is_positive('n', n)
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
     auxiliary.check_is_set('match_set', match_set)
     auxiliary.check_is_set('non_match_set', non_match_set)
 
@@ -4726,7 +4948,7 @@ class TAILOR(Classifier):
 
     svm_version = self.svm_version  # Shortcut
 
-    auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+    weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
 
     match_set =      set()
     non_match_set =  set()
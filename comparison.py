@@ -49,7 +49,6 @@
    used for the linkage process.
 
    TODO:
-   - improve cache: how to remove oldest count-1 pair efficiently?
    - do caching timing test -> comparisonTiming.py module
    - improve value frequency based weight calculations
 
@@ -71,12 +70,17 @@ import datetime
 import difflib
 import logging
 import math
+import mmap
+import multiprocessing
+import struct
+import sys
 import time
 import zlib
 
 import auxiliary
 import encode
 import mymath
+import stringcmp
 
 # =============================================================================
 
@@ -202,9 +206,65 @@ class RecordComparator:
 
   # ---------------------------------------------------------------------------
 
+  def compare_batch(self, rec_pair_list, lower_case = True):
+    """Compare a batch of record pairs (a list of tuples made of two records)
+       and return a list with one weight vector per record pair, in the same
+       order as the record pairs.
+
+       The comparisons are done field by field over the whole batch. For each
+       field comparator every distinct pair of field values in the batch is
+       only compared once.
+
+       If the field values are already lower case (as in the record caches of
+       an index), the argument 'lower_case' can be set to False.
+    """
+
+    num_rec_pairs = len(rec_pair_list)
+
+    weight_matrix = []  # One weight vector per record pair
+    for j in xrange(num_rec_pairs):
+      weight_matrix.append([])
+
+    # Compute the weights column by column
+    #
+    for (comp_method,field_index1,field_index2) in self.field_comparison_list:
+
+      val_pair_weight_dict = {}  # Weights of the field value pairs in batch
+
+      for j in xrange(num_rec_pairs):
+        (rec1, rec2) = rec_pair_list[j]
+
+        if (field_index1 >= len(rec1)):
+          val1 = ''
+        else:
+          val1 = rec1[field_index1]
+
+        if (field_index2 >= len(rec2)):
+          val2 = ''
+        else:
+          val2 = rec2[field_index2]
+
+        val_pair = (val1, val2)
+
+        if (val_pair in val_pair_weight_dict):
+          w = val_pair_weight_dict[val_pair]
+        else:
+          if (lower_case == True):
+            w = comp_method(val1.lower(),val2.lower())
+          else:
+            w = comp_method(val1,val2)
+          val_pair_weight_dict[val_pair] = w
+
+        weight_matrix[j].append(w)
+
+    return weight_matrix
+
+  # ---------------------------------------------------------------------------
+
   def get_cache_stats(self):
-    """Extract information about the cache size, maximum and average counts for
-       all the field comparators that have an activated cache.
+    """Extract information about the cache size, maximum and average counts,
+       and the numbers of cache hits, misses and evictions for all the field
+       comparators that have an activated cache.
     """
 
     logging.info('Caching statistics for record comparator "%s"' % \
@@ -227,8 +287,8 @@ class RecordComparator:
         cache_max_count = -1
         cache_count_sum = 0.0
 
-        for cache_key in field_comp.cache:  # Get all cache entries and counts
-          (cache_weight, access_count) = field_comp.cache[cache_key]
+        for cache_entry in field_comp.cache.itervalues():  # Get all counts
+          access_count = cache_entry[1]
 
           cache_max_count = max(cache_max_count, access_count)
           cache_count_sum += access_count
@@ -242,9 +302,183 @@ class RecordComparator:
           cache_size_str += ' (Cache size is limited to %d entries)' % \
                             (field_comp.max_cache_size)
         logging.info(cache_size_str)
+        if (field_comp.max_cache_mem != None):
+          logging.info('    Approximate cache memory: %.2f MBytes ' % \
+                       (field_comp.cache_mem_used / (1024.0*1024.0)) + \
+                       '(limited to %s MBytes)' % \
+                       (str(field_comp.max_cache_mem)))
         logging.info('    Maximum and average cache entry count: %d / %.2f' % \
                      (cache_max_count, cache_avrg_count))
 
+      if (field_comp.do_caching == True):
+        logging.info('    Cache hits / misses / evictions: %d / %d / %d' % \
+                     (field_comp.cache_num_hits, field_comp.cache_num_misses,
+                      field_comp.cache_num_evicted))
+
+      if (field_comp.shared_cache != None):
+        shared_cache = field_comp.shared_cache
+        (num_stored, num_not_stored) = shared_cache.get_stats()
+        logging.info('    Shared cache "%s": %d hits, %d / %d ' % \
+                     (shared_cache.description,
+                      field_comp.cache_num_shared_hits, num_stored,
+                      shared_cache.num_slots) + \
+                     'comparisons stored (%d not stored)' % (num_not_stored))
+
+# =============================================================================
+
+class SharedComparisonCache:
+  """Class that implements a comparison cache that can be shared by several
+     processes, so that a comparison done in one process does not have to be
+     done again in the other processes.
+
+     The cache is a hash table in anonymous shared memory (a memory mapped
+     block), and it is shared by all processes forked after it has been
+     created (like the worker processes of the indexing module). Each slot in
+     the table holds the hash value of a values pair (8 bytes) and the
+     comparison weight (8 bytes), so no values have to be pickled or sent
+     between processes. Collisions are resolved with linear probing over at
+     most 'max_probes' slots. Once the table (or the probed part of it) is
+     full, new comparisons are not stored anymore.
+
+     Looking up a comparison does not need a lock, while new comparisons are
+     inserted while holding a lock. As only the hash values of values pairs
+     are stored, two different values pairs with the same 64 bit hash value
+     would get the same weight (which is very unlikely).
+
+     A shared cache is given to a field comparator with its 'shared_cache'
+     argument. As the weights of different field comparators are different,
+     each field comparator must have its own shared cache.
+  """
+
+  # ---------------------------------------------------------------------------
+
+  SLOT_FORMAT = '<qd'  # Hash value of a values pair and its weight
+  SLOT_SIZE =   16
+  HEAD_FORMAT = '<qq'  # Number of stored and of not stored comparisons
+  HEAD_SIZE =   16
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, num_slots = 1048576, max_probes = 8, descr = ''):
+    """Constructor.
+
+       Has as arguments the number of slots in the hash table (each using 16
+       bytes of memory), the maximum number of slots that are checked for a
+       values pair, and a description.
+    """
+
+    auxiliary.check_is_string('description', descr)
+    auxiliary.check_is_integer('num_slots', num_slots)
+    auxiliary.check_is_positive('num_slots', num_slots)
+    auxiliary.check_is_integer('max_probes', max_probes)
+    auxiliary.check_is_positive('max_probes', max_probes)
+
+    self.description = descr
+    self.num_slots =   num_slots
+    self.max_probes =  min(max_probes, num_slots)
+    self.in_use =      False  # Set once given to a field comparator
+
+    # An anonymous memory map is shared with forked processes, and it is
+    # initialised with zeros (a hash value of 0 marks an empty slot)
+    #
+    self.table = mmap.mmap(-1, self.HEAD_SIZE + num_slots*self.SLOT_SIZE)
+    self.lock =  multiprocessing.Lock()
+
+  # ---------------------------------------------------------------------------
+
+  def __get_hash__(self, cache_key):
+    """Return the hash value of the given (sorted) values pair, which is never
+       0. Should not be used from outside the module.
+    """
+
+    hash_val = hash(cache_key)
+
+    if (hash_val == 0):
+      hash_val = 1
+
+    return hash_val
+
+  # ---------------------------------------------------------------------------
+
+  def get(self, cache_key):
+    """Return the weight of the given (sorted) values pair if it is in the
+       cache, otherwise return None.
+    """
+
+    hash_val = self.__get_hash__(cache_key)
+
+    table =     self.table
+    num_slots = self.num_slots
+    slot_num =  hash_val % num_slots
+
+    for i in xrange(self.max_probes):
+      (slot_hash, weight) = struct.unpack_from(self.SLOT_FORMAT, table,
+                                               self.HEAD_SIZE + \
+                                               slot_num*self.SLOT_SIZE)
+      if (slot_hash == hash_val):
+        return weight
+      elif (slot_hash == 0):  # An empty slot, so the pair is not cached
+        return None
+
+      slot_num = (slot_num+1) % num_slots
+
+    return None
+
+  # ---------------------------------------------------------------------------
+
+  def put(self, cache_key, weight):
+    """Insert the given (sorted) values pair with the given weight into the
+       cache if there is an empty slot for it.
+
+       The weight of a slot is written before its hash value, so a process
+       looking up the pair at the same time either does not find it or gets
+       the complete weight.
+    """
+
+    hash_val = self.__get_hash__(cache_key)
+
+    table =     self.table
+    num_slots = self.num_slots
+    slot_num =  hash_val % num_slots
+
+    self.lock.acquire()
+
+    try:
+      (num_stored, num_not_stored) = struct.unpack_from(self.HEAD_FORMAT,
+                                                        table, 0)
+
+      for i in xrange(self.max_probes):
+        slot_offset = self.HEAD_SIZE + slot_num*self.SLOT_SIZE
+        slot_hash = struct.unpack_from('<q', table, slot_offset)[0]
+
+        if (slot_hash == hash_val):  # Already inserted by another process
+          return
+
+        elif (slot_hash == 0):  # An empty slot
+          struct.pack_into('<d', table, slot_offset+8, weight)
+          struct.pack_into('<q', table, slot_offset, hash_val)
+          struct.pack_into(self.HEAD_FORMAT, table, 0, num_stored+1,
+                           num_not_stored)
+          return
+
+        slot_num = (slot_num+1) % num_slots
+
+      struct.pack_into(self.HEAD_FORMAT, table, 0, num_stored,
+                       num_not_stored+1)
+
+    finally:
+      self.lock.release()
+
+  # ---------------------------------------------------------------------------
+
+  def get_stats(self):
+    """Return the number of comparisons stored in the cache and the number
+       of comparisons that could not be stored (because all probed slots were
+       used).
+    """
+
+    return struct.unpack_from(self.HEAD_FORMAT, self.table, 0)
+
 # =============================================================================
 
 class FieldComparator:
@@ -256,7 +490,23 @@ class FieldComparator:
        description      A string describing the field comparator.
        do_caching       A flag, True or False, to enable or disable caching.
        max_cache_size   The maximum number of comparisons to be cached.
+       max_cache_mem    The maximum (approximate) amount of memory in mega
+                        bytes the cache can use. Default is None (no memory
+                        limit).
+       cache_policy     What to do with a new comparison if the cache is full
+                        (either its maximum size or its maximum memory is
+                        reached). Possible values are 'lru' (default, remove
+                        the least recently used comparison), 'clock' (remove
+                        a comparison that has not been used since the clock
+                        hand last passed it, which is cheaper on cache hits
+                        than LRU), or 'fill' (do not cache any new comparisons
+                        once the cache is full).
        cache            A dictionary with cached comparisons.
+       shared_cache     A shared comparison cache (an object of class
+                        SharedComparisonCache) which is used in addition to
+                        the cache of this process, so that comparisons are
+                        shared with other (forked) processes. Requires that
+                        caching is enabled. Default is None.
        missing_values   A list of one or more strings that correspond to
                         missing values.
        missing_weight   Numerical weight when values are missing.
@@ -279,8 +529,16 @@ class FieldComparator:
 
     self.do_caching =           False        # Caching disabled by default
     self.max_cache_size =       None         # None - no maximum cache size
+    self.max_cache_mem =        None         # None - no maximum cache memory
+    self.cache_policy =         'lru'        # Remove least recently used
     self.cache =                {}           # Dictionary with cached values
     self.cache_num_not_cached = 0            # Number of comparisons not cached
+    self.cache_num_hits =       0            # Number of comparisons found in
+    self.cache_num_misses =     0            # the cache, not found, and
+    self.cache_num_evicted =    0            # removed from the cache
+    self.shared_cache =         None         # Shared comparison cache
+    self.cache_num_shared_hits = 0           # Number of comparisons found in
+                                             # the shared cache
     self.cache_warn_counts =    [2,5,10,50]  # List of when warnings should be
                                              # given (minimum counts)
     self.missing_values =  ['']
@@ -309,6 +567,27 @@ class FieldComparator:
         auxiliary.check_is_flag('do_caching', value)
         self.do_caching = value
 
+      elif (keyword.startswith('max_cache_m')):
+        if (value != None):
+          auxiliary.check_is_number('max_cache_mem', value)
+          auxiliary.check_is_positive('max_cache_mem', value)
+        self.max_cache_mem = value
+
+      elif (keyword.startswith('shared_c')):
+        if ((value != None) and \
+            (not isinstance(value, SharedComparisonCache))):
+          logging.exception('Argument "shared_cache" is not a shared ' + \
+                            'comparison cache: %s' % (str(value)))
+          raise Exception
+        self.shared_cache = value
+
+      elif (keyword.startswith('cache_p')):
+        if (value not in ['lru', 'clock', 'fill']):
+          logging.exception('Value of "cache_policy" is not one of "lru", ' + \
+                            '"clock", or "fill": %s' % (str(value)))
+          raise Exception
+        self.cache_policy = value
+
       elif (keyword.startswith('max_cach')):
         if (value == None):  # No maximum cache size (use with care!)
           self.max_cache_size = value
@@ -346,6 +625,19 @@ class FieldComparator:
                           (str(keyword)))
         raise Exception
 
+    if (self.shared_cache != None):
+      if (self.do_caching == False):
+        logging.exception('A shared cache can only be used if caching is ' + \
+                          'enabled ("do_caching" set to True)')
+        raise Exception
+
+      if (self.shared_cache.in_use == True):
+        logging.exception('Shared cache "%s" is already used by another ' % \
+                          (self.shared_cache.description) + \
+                          'field comparator')
+        raise Exception
+      self.shared_cache.in_use = True
+
     # Create a dictionary with the warning counts - - - - - - - - - - - - - - -
     #
     self.cache_warn_dict_counts = {}
@@ -353,6 +645,42 @@ class FieldComparator:
     for i in self.cache_warn_counts:
       self.cache_warn_dict_counts[i] = 0  # No value pairs with count i so far
 
+    # Set up the data structures needed to remove comparisons from a limited
+    # cache - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    # Each cache entry is a list that starts with the weight and the access
+    # count, so that a cache hit only has to modify the entry in place. For
+    # the LRU policy an entry is an element [weight, count, previous, next,
+    # cache key] of a circular doubly linked list, with the least recently
+    # used entry following the root element. For the CLOCK policy an entry is
+    # [weight, count, referenced flag, cache key] and is kept in a list that
+    # is scanned by the clock hand.
+    #
+    if ((self.max_cache_size == None) and (self.max_cache_mem == None)):
+      self.cache_evict = None  # Unlimited cache, nothing is ever removed
+    elif (self.cache_policy == 'fill'):
+      self.cache_evict = None
+    else:
+      self.cache_evict = self.cache_policy
+
+    if (self.max_cache_mem != None):
+      self.cache_max_bytes = int(self.max_cache_mem * 1024 * 1024)
+
+      if (self.cache_evict == 'lru'):
+        entry_len = 5
+      elif (self.cache_evict == 'clock'):
+        entry_len = 4
+      else:
+        entry_len = 2
+
+      # Size of an entry list, its weight, and a dictionary slot (three
+      # pointers, assuming the dictionary is two thirds full)
+      #
+      self.cache_entry_overhead = sys.getsizeof([None]*entry_len) + \
+                                  sys.getsizeof(0.0) + 36
+
+    self.__reset_cache_structures__()
+
     # If a frequency table is given calculate the sum of all counts
     #
     if (self.val_freq_table != None):
@@ -412,14 +740,51 @@ class FieldComparator:
 
   # ---------------------------------------------------------------------------
 
+  def __reset_cache_structures__(self):
+    """Reset the LRU list, the CLOCK list and the memory used by the cache.
+       Should not be used from outside the module.
+
+       This is also done when a new comparison is put into an empty cache, so
+       that the cache can be cleared by assigning an empty dictionary to it.
+    """
+
+    self.cache_mem_used = 0  # Approximate number of bytes used by the cache
+
+    if (self.cache_evict == 'lru'):
+      root = []
+      root[:] = [None, None, root, root, None]
+      self.cache_lru_root = root
+
+    elif (self.cache_evict == 'clock'):
+      self.cache_clock_list =  []  # Entries or None for free slots
+      self.cache_clock_free =  []  # Indices of free slots in the clock list
+      self.cache_clock_hand =  0
+
+  # ---------------------------------------------------------------------------
+
+  def __get_cache_entry_size__(self, cache_key):
+    """Return the approximate number of bytes used by the cache entry with the
+       given key. Should not be used from outside the module.
+    """
+
+    return sys.getsizeof(cache_key) + sys.getsizeof(cache_key[0]) + \
+           sys.getsizeof(cache_key[1]) + self.cache_entry_overhead
+
+  # ---------------------------------------------------------------------------
+
   def __get_from_cache__(self, val1, val2):
     """Check if the given pair of values is in the cache, if so return cached
        similarity weight. Otherwise return None.
 
-       If found in the cache, the pair's count is increased by one.
+       If found in the cache, the pair's count is increased by one, and the
+       pair is marked as recently used (for the 'lru' and 'clock' cache
+       policies). The numbers of cache hits and misses are counted. If not
+       found but a shared cache is given, the pair is looked up in the shared
+       cache, and if found there it is put into the cache of this process.
 
-       warning messages are logged if the cache size is limited and all entries
-       have certain counts (see numbers: self.cache_warn_counts).
+       warning messages are logged if the cache policy is 'fill', the cache
+       size is limited and all entries have certain counts (see numbers:
+       self.cache_warn_counts).
 
        If caching is disabled, returned None.
     """
@@ -435,17 +800,52 @@ class FieldComparator:
     else:
       cache_key = (val2, val1)
 
-    if cache_key not in self.cache:  # The values pair is not in the cache
+    cache_entry = self.cache.get(cache_key)
+
+    if (cache_entry == None):  # The values pair is not in the cache
+      self.cache_num_misses += 1
+
+      if (self.shared_cache != None):  # Check the cache shared by processes
+        cache_weight = self.shared_cache.get(cache_key)
+
+        if (cache_weight != None):
+          self.cache_num_shared_hits += 1
+          self.__put_into_local_cache__(cache_key, cache_weight)
+
+        return cache_weight
+
       return None
 
-    # Get weight and access count from cache, increase count, and put it back
+    self.cache_num_hits += 1
+
+    # Increase the access count in place
     #
-    (cache_weight, access_count) = self.cache[cache_key]
-    access_count += 1
-    self.cache[cache_key] = (cache_weight, access_count)
+    cache_entry[1] += 1
+
+    cache_evict = self.cache_evict
+
+    if (cache_evict == 'lru'):  # Move entry to the end of the list
+      link_prev = cache_entry[2]
+      link_next = cache_entry[3]
+      link_prev[3] = link_next
+      link_next[2] = link_prev
+      root = self.cache_lru_root
+      last = root[2]
+      last[3] = root[2] = cache_entry
+      cache_entry[2] = last
+      cache_entry[3] = root
+
+      return cache_entry[0]
+
+    elif (cache_evict == 'clock'):  # Mark entry as referenced
+      cache_entry[2] = True
+
+      return cache_entry[0]
 
     if (self.max_cache_size == None):
-      return cache_weight  # Unlimited cache size, simply return
+      return cache_entry[0]  # Unlimited cache size, simply return
+
+    access_count = cache_entry[1]
 
     if (access_count in self.cache_warn_counts):  # Check if warning needed
 
@@ -456,16 +856,21 @@ class FieldComparator:
         logging.warning('All cache entries have a count of %d' % \
                         (access_count))
 
-    return cache_weight
+    return cache_entry[0]
 
   # ---------------------------------------------------------------------------
 
   def __put_into_cache__(self, val1, val2, weight):
-    """If caching is enabled and there is room in the cache put the given pair
-       of values into the cache with the given similarity weight.
+    """If caching is enabled put the given pair of values into the cache with
+       the given similarity weight.
+
+       If the cache is full (its maximum size or maximum memory is reached),
+       then with the 'lru' and 'clock' cache policies comparisons are removed
+       from the cache until the new pair fits. With the 'fill' cache policy
+       the new pair is not inserted but the number of non-cached comparisons
+       is increased.
 
-       If the cache is full don't insert values pair but increase the number of
-       non-cached comparisons.
+       If a shared cache is given the pair is also put into the shared cache.
 
        If caching is disabled do nothing.
     """
@@ -473,19 +878,6 @@ class FieldComparator:
     if (self.do_caching == False):
       return
 
-    # Check if the cache is full
-    #
-    if ((self.max_cache_size != None) and \
-        (len(self.cache) == self.max_cache_size)):
-
-      self.cache_num_not_cached += 1  # One more pair not cached
-
-      if (self.cache_num_not_cached in [100, 1000, 10000, 100000]):
-        logging.warning('Cache is full, %d comparisons cannot be cached' % \
-                        (self.cache_num_not_cached))
-
-      return
-
     # Comparisons have to be symmetric: Only one of the pairs (val1,val2) and
     # (val2,val1) should be stored in the cache, so sort them
     #
@@ -494,9 +886,109 @@ class FieldComparator:
     else:
       cache_key = (val2, val1)
 
-    # Insert new pair into cache and list of pairs with count 1
+    if (self.shared_cache != None):
+      self.shared_cache.put(cache_key, weight)
+
+    self.__put_into_local_cache__(cache_key, weight)
+
+  # ---------------------------------------------------------------------------
+
+  def __put_into_local_cache__(self, cache_key, weight):
+    """Put the given (sorted) values pair with the given similarity weight
+       into the cache of this process, as described in __put_into_cache__().
+       Should not be used from outside the module.
+    """
+
+    cache = self.cache
+
+    if (cache_key in cache):  # Already cached, only update the weight
+      cache[cache_key][0] = weight
+      return
+
+    if (len(cache) == 0):  # Cache is new or has been cleared
+      self.__reset_cache_structures__()
+
+    max_cache_size = self.max_cache_size
+    max_cache_bytes = None
+
+    if (self.max_cache_mem != None):
+      max_cache_bytes = self.cache_max_bytes
+      entry_size = self.__get_cache_entry_size__(cache_key)
+
+    cache_evict = self.cache_evict
+
+    # Check if the cache is full
     #
-    self.cache[cache_key] = (weight, 1)
+    while (((max_cache_size != None) and (len(cache) >= max_cache_size)) or \
+           ((max_cache_bytes != None) and \
+            (self.cache_mem_used + entry_size > max_cache_bytes))):
+
+      if ((cache_evict == None) or (len(cache) == 0)):
+        self.cache_num_not_cached += 1  # One more pair not cached
+
+        if (self.cache_num_not_cached in [100, 1000, 10000, 100000]):
+          logging.warning('Cache is full, %d comparisons cannot be cached' % \
+                          (self.cache_num_not_cached))
+
+        return
+
+      if (cache_evict == 'lru'):  # Remove least recently used entry
+        root = self.cache_lru_root
+        oldest = root[3]
+        root[3] = oldest[3]
+        oldest[3][2] = root
+        old_key = oldest[4]
+
+      else:  # Move clock hand to the first entry not referenced
+        clock_list = self.cache_clock_list
+        clock_len =  len(clock_list)
+        hand =       self.cache_clock_hand
+
+        while True:
+          oldest = clock_list[hand]
+
+          if (oldest == None):  # A free slot
+            hand = (hand+1) % clock_len
+          elif (oldest[2] == True):  # Give entry a second chance
+            oldest[2] = False
+            hand = (hand+1) % clock_len
+          else:
+            break
+
+        old_key = oldest[3]
+        clock_list[hand] = None
+        self.cache_clock_free.append(hand)
+        self.cache_clock_hand = (hand+1) % clock_len
+
+      del cache[old_key]
+      self.cache_num_evicted += 1
+
+      if (max_cache_bytes != None):
+        self.cache_mem_used -= self.__get_cache_entry_size__(old_key)
+
+    # Insert new pair into cache
+    #
+    if (cache_evict == 'lru'):  # Append at the end of the list
+      root = self.cache_lru_root
+      last = root[2]
+      cache_entry = [weight, 1, last, root, cache_key]
+      last[3] = root[2] = cache_entry
+
+    elif (cache_evict == 'clock'):  # Put into a free slot of the clock list
+      cache_entry = [weight, 1, False, cache_key]
+
+      if (self.cache_clock_free != []):
+        self.cache_clock_list[self.cache_clock_free.pop()] = cache_entry
+      else:
+        self.cache_clock_list.append(cache_entry)
+
+    else:
+      cache_entry = [weight, 1]
+
+    cache[cache_key] = cache_entry
+
+    if (max_cache_bytes != None):
+      self.cache_mem_used += entry_size
 
   # ---------------------------------------------------------------------------
 
@@ -637,8 +1129,17 @@ class FieldComparator:
       logging.info('  Maximum cache size:  %s' % (str(self.max_cache_size)))
     else:
       logging.info('  Unlimited cache size')
-    logging.info('    Warnings will be given once all cache entries have ' + \
-                 'counts: %s' % (str(self.cache_warn_counts)))
+    if (self.max_cache_mem != None):
+      logging.info('  Maximum cache memory: %s MBytes' % \
+                   (str(self.max_cache_mem)))
+    logging.info('  Cache policy:        %s' % (self.cache_policy))
+    if (self.shared_cache != None):
+      logging.info('  Shared cache:        "%s" (%d slots)' % \
+                   (self.shared_cache.description,
+                    self.shared_cache.num_slots))
+    if (self.cache_policy == 'fill'):
+      logging.info('    Warnings will be given once all cache entries ' + \
+                   'have counts: %s' % (str(self.cache_warn_counts)))
     logging.info('  Missing values:      %s' % (str(self.missing_weight)))
     logging.info('  Missing weight:      %f' % (self.missing_weight))
     logging.info('  Agreement weight:    %f' % (self.agree_weight))
@@ -666,7 +1167,8 @@ class FieldComparator:
   # ---------------------------------------------------------------------------
 
   def get_cache_stats(self):
-    """Extract information about the cache size, maximum and average counts.
+    """Extract information about the cache size, maximum and average counts,
+       and the numbers of cache hits, misses and evictions.
     """
 
     logging.info('Field comparator: "%s"' % (self.description))
@@ -683,9 +1185,9 @@ class FieldComparator:
       cache_max_count = -1
       cache_count_sum = 0.0
 
-      for cache_key in self.cache:  # Get all cache entries and extract counts
+      for cache_entry in self.cache.itervalues():  # Extract entry counts
 
-        (cache_weight, access_count) = self.cache[cache_key]
+        access_count = cache_entry[1]
 
         cache_max_count = max(cache_max_count, access_count)
         cache_count_sum += access_count
@@ -699,9 +1201,26 @@ class FieldComparator:
         cache_size_str += ' (Cache size is limited to %d entries)' % \
                           (self.max_cache_size)
       logging.info(cache_size_str)
+      if (self.max_cache_mem != None):
+        logging.info('  Approximate cache memory: %.2f MBytes (limited ' % \
+                     (self.cache_mem_used / (1024.0*1024.0)) + \
+                     'to %s MBytes)' % (str(self.max_cache_mem)))
       logging.info('  Maximum and average cache entry count: %d / %.2f' % \
                    (cache_max_count, cache_avrg_count))
 
+    if (self.do_caching == True):
+      logging.info('  Cache hits / misses / evictions: %d / %d / %d' % \
+                   (self.cache_num_hits, self.cache_num_misses,
+                    self.cache_num_evicted))
+
+    if (self.shared_cache != None):
+      (num_stored, num_not_stored) = self.shared_cache.get_stats()
+      logging.info('  Shared cache "%s": %d hits, %d / %d comparisons ' % \
+                   (self.shared_cache.description,
+                    self.cache_num_shared_hits, num_stored,
+                    self.shared_cache.num_slots) + \
+                   'stored (%d not stored)' % (num_not_stored))
+
 # =============================================================================
 
 class FieldComparatorExactString(FieldComparator):
@@ -2391,6 +2910,23 @@ class FieldComparatorJaro(FieldComparatorApproxString):
     # Calculate Jaro similarity value - - - - - - - - - - - - - - - - - - - - -
     #
     len1, len2 = len(val1), len(val2)
+
+    # Quick check if Jaro similarity can reach the threshold (if all common
+    # characters are assigned and there are no transpositions)
+    #
+    if (self.threshold > 0.0):
+      max_common = float(stringcmp.common_char_count(val1, val2))
+    else:
+      max_common = float(min(len1, len2))  # No need to check
+
+    if (1./3.*(max_common / float(len1) + max_common / float(len2) + 1.0) < \
+        self.threshold):
+      w = self.disagree_weight
+
+      if (self.do_caching == True):  # Put values pair into the cache
+        self.__put_into_cache__(val1, val2, w)
+
+      return w
     halflen = max(len1,len2) / 2 - 1  # Or + 1?? PC 12/03/2009
 
     ass1, ass2 = '', ''  # Characters assigned in string 1 and string 2
@@ -3369,41 +3905,24 @@ class FieldComparatorEditDist(FieldComparatorApproxString):
     if (w  < self.threshold):  # Similariy is smaller than threshold
       w = self.disagree_weight
 
-    else: # Calculate the maximum distance possible with this threshold
-      max_dist = (1.0-self.threshold)*max_len
-
-      if (n > m):  # Make sure n <= m, to use O(min(n,m)) space
-        str1 = val2
-        str2 = val1
-        n, m = m, n
-      else:
-        str1 = val1
-        str2 = val2
-
-      current = range(n+1)
-
-      w = -1  # Set weight to an illegal value (so it can be chacked later)
-
-      for i in range(1, m+1):
-        previous = current
-        current =  [i]+n*[0]
-        str2char = str2[i-1]
-
-        for j in range(1,n+1):
-          substitute = previous[j-1]
-          if (str1[j-1] != str2char):
-            substitute += 1
+    # The bag distance is never larger than the edit distance
+    #
+    elif ((self.threshold > 0.0) and \
+          (1.0 - float(max_len - stringcmp.common_char_count(val1, val2)) / \
+           float(max_len) < self.threshold)):
+      w = self.disagree_weight
 
-          # Get minimum of insert, delete and substitute
-          #
-          current[j] = min(previous[j]+1, current[j-1]+1, substitute)
+    else: # Calculate the maximum distance possible with this threshold
+      #   (slightly larger to allow for rounding)
+      #
+      max_dist = (1.0-self.threshold)*max_len + 1e-9
 
-        if (min(current) > max_dist):  # Distance is already too large
-          w = max(1.0 - float(max_dist+1) / float(max_len), 0.0)
-          break  # Exit loop
+      # The bit-parallel calculation stops as soon as the distance is known
+      # to be larger than the maximum distance
+      #
+      dist = stringcmp.editdist_bitparallel(val1, val2, max_dist)
 
-      if (w == -1):  # Weight has not been calculated
-        w = 1.0 - float(current[n]) / float(max_len)
+      w = 1.0 - float(dist) / float(max_len)
 
       assert (w >= 0.0), 'Edit distance: Similarity weight < 0.0'
       assert (w <= 1.0), 'Edit distance: Similarity weight > 1.0'
@@ -3478,59 +3997,24 @@ class FieldComparatorDaLeDist(FieldComparatorApproxString):
     if (w  < self.threshold):  # Similariy is smaller than threshold
       w = self.disagree_weight
 
-    else: # Calculate the maximum distance possible with this threshold
-      max_dist = (1.0-self.threshold)*max_len
-
-      if (n > m):  # Make sure n <= m, to use O(min(n,m)) space
-        str1 = val2
-        str2 = val1
-        n, m = m, n
-      else:
-        str1 = val1
-        str2 = val2
-
-      d = []  # Table with the full distance matrix
-
-      current = range(n+1)
-      d.append(current)
-
-      w = -1  # Set weight to an illegal value (so it can be chacked later)
-
-      for i in range(1,m+1):
-
-        previous = current
-        current =  [i]+n*[0]
-        str2char = str2[i-1]
-
-        for j in range(1,n+1):
-          substitute = previous[j-1]
-          if (str1[j-1] != str2char):
-            substitute += 1
-
-          if (i == 1) or (j == 1):  # First characters, no transp possible
-
-            # Get minimum of insert, delete and substitute
-            #
-            current[j] = min(previous[j]+1, current[j-1]+1, substitute)
-
-          else:
-            if (str1[j-2] == str2[i-1]) and (str1[j-1] == str2[i-2]):
-              transpose = d[i-2][j-2] + 1
-            else:
-              transpose = d[i-2][j-2] + 3
-
-            current[j] = min(previous[j]+1, current[j-1]+1, substitute, \
-                             transpose)
-
-        d.append(current)
+    # The bag distance is never larger than the edit distance
+    #
+    elif ((self.threshold > 0.0) and \
+          (1.0 - float(max_len - stringcmp.common_char_count(val1, val2)) / \
+           float(max_len) < self.threshold)):
+      w = self.disagree_weight
 
-        if (min(current) > max_dist):  # Distance is already too large
-          w = max(1.0 - float(max_dist+1) / float(max_len), 0.0)
-          break  # Exit loop
+    else: # Calculate the maximum distance possible with this threshold
+      #   (slightly larger to allow for rounding)
+      #
+      max_dist = (1.0-self.threshold)*max_len + 1e-9
 
-      if (w == -1):  # Weight has not been calculated
+      # The bit-parallel calculation stops as soon as the distance is known
+      # to be larger than the maximum distance
+      #
+      dist = stringcmp.mod_editdist_bitparallel(val1, val2, max_dist)
 
-        w = 1.0 - float(current[n]) / float(max_len)
+      w = 1.0 - float(dist) / float(max_len)
 
       assert (w >= 0.0), 'DaLe distance: Similarity weight < 0.0'
       assert (w <= 1.0), 'DaLe distance: Similarity weight > 1.0'
@@ -3595,26 +4079,26 @@ class FieldComparatorBagDist(FieldComparatorApproxString):
     #
     n = len(val1)
     m = len(val2)
+    max_len = max(n,m)
 
-    list1 = list(val1)
-    list2 = list(val2)
-
-    for ch in val1:
-      if (ch in list2):
-        list2.remove(ch)
+    # Quick check if bag distance is below threshold (the bag distance is at
+    # least the length difference)
+    #
+    len_diff = abs(n-m)
+    w = 1.0 - float(len_diff) / float(max_len)
 
-    for ch in val2:
-      if (ch in list1):
-        list1.remove(ch)
+    if (w  < self.threshold):  # Similariy is smaller than threshold
+      w = self.disagree_weight
 
-    b = max(len(list1),len(list2))
+    else:  # Characters not in common are left in the bags of both strings
+      b = max_len - stringcmp.common_char_count(val1, val2)
 
-    w = 1.0 - float(b) / float(max(n,m))
+      w = 1.0 - float(b) / float(max_len)
 
-    assert (w >= 0.0), 'Bag distance: Similarity weight < 0.0'
-    assert (w <= 1.0), 'Bag distance: Similarity weight > 1.0'
+      assert (w >= 0.0), 'Bag distance: Similarity weight < 0.0'
+      assert (w <= 1.0), 'Bag distance: Similarity weight > 1.0'
 
-    w = self.__calc_partagree_weight__(val1, val2, w)
+      w = self.__calc_partagree_weight__(val1, val2, w)
 
     if (self.do_caching == True):  # Put values pair into the cache
       self.__put_into_cache__(val1, val2, w)
@@ -3727,21 +4211,46 @@ class FieldComparatorSWDist(FieldComparatorApproxString):
     else:  # Longest
       divisor = max(n,m)*self.match_score
 
+    # Quick check if the best score can reach the threshold (if all common
+    # characters are matched and all others approximately matched)
+    #
+    num_common = stringcmp.common_char_count(val1, val2)
+    max_score =  num_common*self.match_score + \
+                 (min(n,m)-num_common)*self.approx_score
+
+    if (float(max_score) / float(divisor) < self.threshold):
+      w = self.disagree_weight
+
+      if (self.do_caching == True):  # Put values pair into the cache
+        self.__put_into_cache__(val1, val2, w)
+
+      return w
+
     best_score = 0  # Keep the best score while calculating table
 
-    d = []  # Table with the full distance matrix
+    # Only the previous row of the table is needed. The best scores of a gap
+    # ending in a cell are updated from the neighbouring cell (Gotoh), rather
+    # than by looping over all possible gap lengths.
+    #
+    current = [0.0]*(m+1)
 
-    for i in range(n+1):  # Initalise table
-      d.append([0.0]*(m+1))
+    insert = [0]*(m+1)  # Best score of a vertical gap, for each column
+
+    gap_open = self.gap_penalty + self.extension_penalty
 
     for i in range(1,n+1):
+      previous = current
+      current =  [0.0]*(m+1)
+
       vali1 = val1[i-1]
       approx_match1 = self.approx_matches.get(vali1,-1)
 
+      delete = 0  # Best score of a horizontal gap
+
       for j in range(1,m+1):
         valj2 = val2[j-1]
 
-        match = d[i-1][j-1]
+        match = previous[j-1]
 
         if (vali1 == valj2):
           match += self.match_score
@@ -3754,18 +4263,30 @@ class FieldComparatorSWDist(FieldComparatorApproxString):
           else:
             match += self.mismatch_score
 
-        insert = 0
-        for k in range(1,i):
-          score = d[i-k][j] - self.gap_penalty - k*self.extension_penalty
-          insert = max(insert, score)
+        insert[j] = max(insert[j] - self.extension_penalty,
+                        previous[j] - gap_open, 0)
+
+        delete = max(delete - self.extension_penalty, current[j-1] - gap_open,
+                     0)
+
+        current[j] = max(match, insert[j], delete, 0)
+        best_score = max(current[j], best_score)
+
+      # Each of the remaining rows can increase the best score by at most a
+      # match score
+      #
+      if (float(best_score + (n-i)*self.match_score) / float(divisor) < \
+          self.threshold):
+        best_score = -1  # Similarity is smaller than threshold
+        break
+
+    if (best_score == -1):
+      w = self.disagree_weight
 
-        delete = 0
-        for l in range(1,j):
-          score = d[i][j-l] - self.gap_penalty - l*self.extension_penalty
-          delete = max(delete, score)
+      if (self.do_caching == True):  # Put values pair into the cache
+        self.__put_into_cache__(val1, val2, w)
 
-        d[i][j] = max(match, insert, delete, 0)
-        best_score = max(d[i][j], best_score)
+      return w
 
     # best_score can be min(len(str1),len)str2))*match_score (if one string is
     # a sub-string of the other string)
@@ -4303,54 +4824,7 @@ class FieldComparatorLCS(FieldComparatorApproxString):
        Should not be used from outside the module.
     """
 
-    n = len(str1)
-    m = len(str2)
-
-    if (n > m):  # Make sure n <= m, to use O(min(n,m)) space
-      str1, str2 = str2, str1
-      n, m =       m, n
-      swapped = True
-    else:
-      swapped = False
-
-    current = (n+1)*[0]
-
-    com_len = 0
-    com_ans1 = -1
-    com_ans2 = -1
-
-    for i in range(m):
-      previous = current
-      current =  (n+1)*[0]
-
-      for j in range(n):
-        if (str1[j] != str2[i]):
-          current[j] = 0
-        else:
-          current[j] = previous[j-1]+1
-          if (current[j] > com_len):
-            com_len = current[j]
-            com_ans1 = j
-            com_ans2 = i
-
-    com1 = str1[com_ans1-com_len+1:com_ans1+1]
-    com2 = str2[com_ans2-com_len+1:com_ans2+1]
-
-    if (com1 != com2):
-      logging.exception('LCS: Different common substrings: %s / %s in ' % \
-                        (com1, com2) + 'original strings: %s / %s' % \
-                        (str1, str2))
-      raise Exception
-
-    # Remove common substring from input strings
-    #
-    str1 = str1[:com_ans1-com_len+1] + str1[1+com_ans1:]
-    str2 = str2[:com_ans2-com_len+1] + str2[1+com_ans2:]
-
-    if (swapped == True):
-      return com1, com_len, str2, str1
-    else:
-      return com1, com_len, str1, str2
+    return stringcmp.do_lcs(str1, str2)
 
   # ---------------------------------------------------------------------------
 
@@ -4392,6 +4866,14 @@ class FieldComparatorLCS(FieldComparatorApproxString):
     if (w  < self.threshold):  # Similariy is smaller than threshold
       w = self.disagree_weight
 
+    # The total length of common substrings is at most the number of common
+    # characters
+    #
+    elif ((self.threshold > 0.0) and \
+          (float(stringcmp.common_char_count(val1, val2)) / float(divisor) < \
+           self.threshold)):
+      w = self.disagree_weight
+
     else:
       # Iterative calculation of longest common substring until strings to s
       #
@@ -4512,54 +4994,7 @@ class FieldComparatorOntoLCS(FieldComparatorApproxString):
        Should not be used from outside the module.
     """
 
-    n = len(str1)
-    m = len(str2)
-
-    if (n > m):  # Make sure n <= m, to use O(min(n,m)) space
-      str1, str2 = str2, str1
-      n, m =       m, n
-      swapped = True
-    else:
-      swapped = False
-
-    current = (n+1)*[0]
-
-    com_len = 0
-    com_ans1 = -1
-    com_ans2 = -1
-
-    for i in range(m):
-      previous = current
-      current =  (n+1)*[0]
-
-      for j in range(n):
-        if (str1[j] != str2[i]):
-          current[j] = 0
-        else:
-          current[j] = previous[j-1]+1
-          if (current[j] > com_len):
-            com_len = current[j]
-            com_ans1 = j
-            com_ans2 = i
-
-    com1 = str1[com_ans1-com_len+1:com_ans1+1]
-    com2 = str2[com_ans2-com_len+1:com_ans2+1]
-
-    if (com1 != com2):
-      logging.exception('LCS: Different common substrings: %s / %s in ' % \
-                        (com1, com2) + 'original strings: %s / %s' % \
-                        (str1, str2))
-      raise Exception
-
-    # Remove common substring from input strings
-    #
-    str1 = str1[:com_ans1-com_len+1] + str1[1+com_ans1:]
-    str2 = str2[:com_ans2-com_len+1] + str2[1+com_ans2:]
-
-    if (swapped == True):
-      return com1, com_len, str2, str1
-    else:
-      return com1, com_len, str1, str2
+    return stringcmp.do_lcs(str1, str2)
 
   # ---------------------------------------------------------------------------
 
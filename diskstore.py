@@ -0,0 +1,514 @@
+# =============================================================================
+# AUSTRALIAN NATIONAL UNIVERSITY OPEN SOURCE LICENSE (ANUOS LICENSE)
+# VERSION 1.3
+# 
+# The contents of this file are subject to the ANUOS License Version 1.3
+# (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at:
+# 
+#   https://sourceforge.net/projects/febrl/
+# 
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and limitations
+# under the License.
+# 
+# The Original Software is: "diskstore.py"
+# 
+# The Initial Developer of the Original Software is:
+#   Dr Peter Christen (Research School of Computer Science, The Australian
+#                      National University)
+# 
+# Copyright (C) 2002 - 2011 the Australian National University and
+# others. All Rights Reserved.
+# 
+# Contributors:
+# 
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 2 or later (the "GPL"), in
+# which case the provisions of the GPL are applicable instead of those
+# above. The GPL is available at the following URL: http://www.gnu.org/
+# If you wish to allow use of your version of this file only under the
+# terms of the GPL, and not to allow others to use your version of this
+# file under the terms of the ANUOS License, indicate your decision by
+# deleting the provisions above and replace them with the notice and
+# other provisions required by the GPL. If you do not delete the
+# provisions above, a recipient may use your version of this file under
+# the terms of any one of the ANUOS License or the GPL.
+# =============================================================================
+#
+# Freely extensible biomedical record linkage (Febrl) - Version 0.4.2
+#
+# See: http://datamining.anu.edu.au/linkage.html
+#
+# =============================================================================
+
+"""Module diskstore.py - Disk based storage for index data structures.
+
+   This module provides classes that keep the inverted index (blocks) and the
+   record caches of an index in a file rather than in main memory. An index
+   uses a disk store if a file name is given for its index or record cache
+   data structures (see the 'index1_shelve_name', 'index2_shelve_name',
+   'rec_cache1_file_name' and 'rec_cache2_file_name' arguments in
+   indexing.py).
+
+     SQLiteStore       A disk store made of one SQLite database file (in
+                       write-ahead logging mode), which contains one table per
+                       block or record dictionary.
+     SQLiteBlockDict   A dictionary of blocks (block values as keys and lists
+                       of record identifiers as values) stored in a table.
+     SQLiteRecordDict  A dictionary of records (record identifiers as keys and
+                       lists of field values as values) stored in a table.
+
+   A disk store is opened with a file name. Any existing file is removed, so
+   opening a store takes constant time no matter how much data the file
+   contains. The store then provides the two methods block_dict() and
+   record_dict() which return a new, empty dictionary stored in a table of the
+   given name. Other disk stores (for example based on a different database)
+   can be used with an index if they provide the same methods.
+
+   Writes into these dictionaries are kept in a buffer and written in batches
+   (one transaction per batch). Record identifiers are appended to a block
+   with the append() method of a block dictionary, so an existing block does
+   not have to be read and written again when a record is added to it. Reading
+   from a dictionary first writes the buffer.
+"""
+
+# =============================================================================
+# Import necessary modules (Python standard modules first, then Febrl modules)
+
+import array
+import cPickle
+import logging
+import os
+import sqlite3
+
+# =============================================================================
+
+class SQLiteStore:
+  """A disk store based on a SQLite database file.
+
+     The database connection is opened again if a dictionary is used in a
+     process different from the one which opened the store (for example a
+     worker process created by the multiprocessing module), as SQLite
+     connections cannot be shared between processes. In such a case the
+     buffers of all dictionaries have to be written with the flush() method
+     before the new process is created.
+  """
+
+  def __init__(self, file_name, buffer_size = 10000):
+    """Constructor. Remove an existing file with the given name, then create a
+       new database file.
+
+       The 'buffer_size' is the number of writes that are kept in the buffer
+       of a dictionary before they are written into the database.
+    """
+
+    if (not isinstance(file_name, str)):
+      logging.exception('Disk store file name is not a string: %s' % \
+                        (type(file_name)))
+      raise Exception
+    if ((not isinstance(buffer_size, int)) or (buffer_size <= 0)):
+      logging.exception('Disk store buffer size is not a positive integer: ' \
+                        + '%s' % (str(buffer_size)))
+      raise Exception
+
+    self.file_name =   file_name
+    self.buffer_size = buffer_size
+    self.dict_list =   []    # All dictionaries created in this store
+    self.conn =        None  # The database connection
+    self.conn_pid =    None  # The identifier of the process that opened it
+
+    # Remove an old database file plus its write-ahead log and journal files
+    #
+    for file_suffix in ['', '-wal', '-shm', '-journal']:
+      if (os.access(file_name+file_suffix, os.F_OK) == True):
+        try:
+          os.remove(file_name+file_suffix)
+        except:
+          logging.exception('Cannot remove old disk store file: "%s"' % \
+                            (file_name+file_suffix))
+          raise Exception
+
+    self.get_connection()
+
+  # ---------------------------------------------------------------------------
+
+  def get_connection(self):
+    """Return the database connection for the current process, open it if
+       needed.
+    """
+
+    if ((self.conn == None) or (self.conn_pid != os.getpid())):
+
+      try:
+        conn = sqlite3.connect(self.file_name, isolation_level=None)
+      except:
+        logging.exception('Cannot open disk store file: "%s"' % \
+                          (self.file_name))
+        raise Exception
+
+      conn.text_factory = str  # Strings are not converted into unicode
+      conn.execute('PRAGMA journal_mode=WAL')
+      conn.execute('PRAGMA synchronous=OFF')  # The data is not kept anyway
+
+      self.conn =     conn
+      self.conn_pid = os.getpid()
+
+    return self.conn
+
+  # ---------------------------------------------------------------------------
+
+  def block_dict(self, table_name, int_postings = False):
+    """Return a new empty block dictionary stored in the table with the given
+       name. If 'int_postings' is set to True the blocks are returned as
+       arrays of integers, otherwise as lists.
+    """
+
+    block_dict = SQLiteBlockDict(self, table_name, int_postings)
+    self.dict_list.append(block_dict)
+
+    return block_dict
+
+  # ---------------------------------------------------------------------------
+
+  def record_dict(self, table_name):
+    """Return a new empty record dictionary stored in the table with the given
+       name.
+    """
+
+    record_dict = SQLiteRecordDict(self, table_name)
+    self.dict_list.append(record_dict)
+
+    return record_dict
+
+  # ---------------------------------------------------------------------------
+
+  def flush(self):
+    """Write the buffers of all dictionaries into the database.
+    """
+
+    for this_dict in self.dict_list:
+      this_dict.flush()
+
+  # ---------------------------------------------------------------------------
+
+  def close(self):
+    """Write all buffers and close the database connection.
+    """
+
+    self.flush()
+
+    if (self.conn != None):
+      self.conn.close()
+      self.conn = None
+
+# =============================================================================
+
+class SQLiteBlockDict:
+  """A dictionary of blocks stored in a table of a SQLite database, with one
+     row per record identifier in a block. Record identifiers are appended to
+     a block with the append() method.
+
+     The index on the block values is only created when the dictionary is
+     read from for the first time, so that building the blocks only appends
+     rows to the table. Note that a block which is set to an empty list is
+     removed.
+  """
+
+  def __init__(self, store, table_name, int_postings = False):
+    """Constructor. Create a new table with the given name.
+    """
+
+    self.store =        store
+    self.table_name =   table_name
+    self.int_postings = int_postings
+    self.write_buffer = []     # Pairs of block values and record identifiers
+    self.has_index =    False  # Set to True once the index has been created
+
+    conn = store.get_connection()
+    conn.execute('DROP TABLE IF EXISTS %s' % (table_name))
+    conn.execute('CREATE TABLE %s (block_val TEXT, rec_ident)' % \
+                 (table_name))
+
+    self.insert_sql = 'INSERT INTO %s VALUES (?,?)' % (table_name)
+    self.block_sql =  'SELECT rec_ident FROM %s WHERE block_val=? ' % \
+                      (table_name) + 'ORDER BY rowid'
+
+  # ---------------------------------------------------------------------------
+
+  def append(self, block_val, rec_ident):
+    """Append the given record identifier to the block with the given value
+       (a new block is created if needed).
+    """
+
+    write_buffer = self.write_buffer
+    write_buffer.append((block_val, rec_ident))
+
+    if (len(write_buffer) >= self.store.buffer_size):
+      self.flush()
+
+  # ---------------------------------------------------------------------------
+
+  def flush(self):
+    """Write the buffer into the database in one transaction.
+    """
+
+    if (self.write_buffer != []):
+      conn = self.store.get_connection()
+      conn.execute('BEGIN')
+      conn.executemany(self.insert_sql, self.write_buffer)
+      conn.execute('COMMIT')
+      self.write_buffer = []
+
+  # ---------------------------------------------------------------------------
+
+  def __prepare_read__(self):
+    """Write the buffer and create the index on the block values if needed,
+       then return the database connection.
+    """
+
+    self.flush()
+
+    conn = self.store.get_connection()
+
+    if (self.has_index == False):
+      conn.execute('CREATE INDEX IF NOT EXISTS %s_block_val ON %s ' % \
+                   (self.table_name, self.table_name) + '(block_val)')
+      self.has_index = True
+
+    return conn
+
+  # ---------------------------------------------------------------------------
+
+  def __make_block__(self, rec_ident_list):
+    if (self.int_postings == True):
+      return array.array('l', rec_ident_list)
+    else:
+      return rec_ident_list
+
+  # ---------------------------------------------------------------------------
+
+  def __getitem__(self, block_val):
+    conn = self.__prepare_read__()
+
+    rec_ident_list = [row[0] for row in conn.execute(self.block_sql,
+                                                      (block_val,))]
+    if (rec_ident_list == []):
+      raise KeyError(block_val)
+
+    return self.__make_block__(rec_ident_list)
+
+  def get(self, block_val, default = None):
+    try:
+      return self[block_val]
+    except KeyError:
+      return default
+
+  def __contains__(self, block_val):
+    conn = self.__prepare_read__()
+
+    return (conn.execute('SELECT 1 FROM %s WHERE block_val=? LIMIT 1' % \
+                         (self.table_name), (block_val,)).fetchone() != None)
+
+  def has_key(self, block_val):
+    return self.__contains__(block_val)
+
+  def __setitem__(self, block_val, rec_ident_list):
+    conn = self.__prepare_read__()
+
+    conn.execute('DELETE FROM %s WHERE block_val=?' % (self.table_name),
+                 (block_val,))
+    for rec_ident in rec_ident_list:
+      self.append(block_val, rec_ident)
+
+  def __delitem__(self, block_val):
+    if (block_val not in self):
+      raise KeyError(block_val)
+
+    conn = self.store.get_connection()
+    conn.execute('DELETE FROM %s WHERE block_val=?' % (self.table_name),
+                 (block_val,))
+
+  def __len__(self):
+    conn = self.__prepare_read__()
+
+    return conn.execute('SELECT COUNT(DISTINCT block_val) FROM %s' % \
+                        (self.table_name)).fetchone()[0]
+
+  def keys(self):
+    conn = self.__prepare_read__()
+
+    return [row[0] for row in conn.execute('SELECT DISTINCT block_val ' + \
+                                           'FROM %s' % (self.table_name))]
+
+  def __iter__(self):
+    return iter(self.keys())
+
+  def iterkeys(self):
+    return iter(self.keys())
+
+  def iteritems(self):
+    """Return the blocks in one pass over the table (ordered by block value).
+    """
+
+    conn = self.__prepare_read__()
+
+    block_val =      None
+    rec_ident_list = []
+
+    for (this_block_val, rec_ident) in \
+      conn.execute('SELECT block_val, rec_ident FROM %s ORDER BY ' % \
+                   (self.table_name) + 'block_val, rowid'):
+      if ((this_block_val != block_val) and (rec_ident_list != [])):
+        yield (block_val, self.__make_block__(rec_ident_list))
+        rec_ident_list = []
+      block_val = this_block_val
+      rec_ident_list.append(rec_ident)
+
+    if (rec_ident_list != []):
+      yield (block_val, self.__make_block__(rec_ident_list))
+
+  def itervalues(self):
+    for (block_val, block) in self.iteritems():
+      yield block
+
+  def items(self):
+    return list(self.iteritems())
+
+  def values(self):
+    return list(self.itervalues())
+
+  def clear(self):
+    self.write_buffer = []
+
+    conn = self.store.get_connection()
+    conn.execute('DELETE FROM %s' % (self.table_name))
+
+# =============================================================================
+
+class SQLiteRecordDict:
+  """A dictionary of records stored in a table of a SQLite database, with one
+     row per record. The records are stored as pickled strings.
+  """
+
+  def __init__(self, store, table_name):
+    """Constructor. Create a new table with the given name.
+    """
+
+    self.store =        store
+    self.table_name =   table_name
+    self.write_buffer = {}  # Records not yet written into the database
+
+    conn = store.get_connection()
+    conn.execute('DROP TABLE IF EXISTS %s' % (table_name))
+    conn.execute('CREATE TABLE %s (rec_ident TEXT PRIMARY KEY, rec BLOB)' % \
+                 (table_name))
+
+    self.insert_sql = 'INSERT OR REPLACE INTO %s VALUES (?,?)' % (table_name)
+    self.select_sql = 'SELECT rec FROM %s WHERE rec_ident=?' % (table_name)
+
+  # ---------------------------------------------------------------------------
+
+  def flush(self):
+    """Write the buffer into the database in one transaction.
+    """
+
+    if (self.write_buffer != {}):
+      conn = self.store.get_connection()
+      conn.execute('BEGIN')
+      conn.executemany(self.insert_sql,
+                       [(rec_ident, buffer(cPickle.dumps(rec, 2))) for \
+                        (rec_ident, rec) in self.write_buffer.iteritems()])
+      conn.execute('COMMIT')
+      self.write_buffer = {}
+
+  # ---------------------------------------------------------------------------
+
+  def __getitem__(self, rec_ident):
+    rec = self.write_buffer.get(rec_ident, None)
+    if (rec != None):
+      return rec
+
+    row = self.store.get_connection().execute(self.select_sql,
+                                              (rec_ident,)).fetchone()
+    if (row == None):
+      raise KeyError(rec_ident)
+
+    return cPickle.loads(str(row[0]))
+
+  def get(self, rec_ident, default = None):
+    try:
+      return self[rec_ident]
+    except KeyError:
+      return default
+
+  def __contains__(self, rec_ident):
+    if (rec_ident in self.write_buffer):
+      return True
+
+    return (self.store.get_connection().execute(self.select_sql,
+                                        (rec_ident,)).fetchone() != None)
+
+  def has_key(self, rec_ident):
+    return self.__contains__(rec_ident)
+
+  def __setitem__(self, rec_ident, rec):
+    write_buffer = self.write_buffer
+    write_buffer[rec_ident] = rec
+
+    if (len(write_buffer) >= self.store.buffer_size):
+      self.flush()
+
+  def __delitem__(self, rec_ident):
+    if (rec_ident not in self):
+      raise KeyError(rec_ident)
+
+    self.write_buffer.pop(rec_ident, None)
+    self.store.get_connection().execute('DELETE FROM %s WHERE rec_ident=?' \
+                                        % (self.table_name), (rec_ident,))
+
+  def __len__(self):
+    self.flush()
+
+    return self.store.get_connection().execute('SELECT COUNT(*) FROM %s' % \
+                                            (self.table_name)).fetchone()[0]
+
+  def iterkeys(self):
+    self.flush()
+
+    for row in self.store.get_connection().execute('SELECT rec_ident ' + \
+                                                'FROM %s' % (self.table_name)):
+      yield row[0]
+
+  def __iter__(self):
+    return self.iterkeys()
+
+  def iteritems(self):
+    self.flush()
+
+    conn = self.store.get_connection()
+
+    for (rec_ident, rec_str) in conn.execute('SELECT rec_ident, rec FROM %s' \
+                                             % (self.table_name)):
+      yield (rec_ident, cPickle.loads(str(rec_str)))
+
+  def itervalues(self):
+    for (rec_ident, rec) in self.iteritems():
+      yield rec
+
+  def keys(self):
+    return list(self.iterkeys())
+
+  def items(self):
+    return list(self.iteritems())
+
+  def values(self):
+    return list(self.itervalues())
+
+  def clear(self):
+    self.write_buffer = {}
+
+    self.store.get_connection().execute('DELETE FROM %s' % (self.table_name))
+
+# =============================================================================
@@ -115,898 +115,3990 @@
 # =============================================================================
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
+import array
+import bisect
+import cPickle
 import csv
 import heapq
 import gc
 import logging
 import math
+import mmap
+import multiprocessing
+import os
 import random
-import shelve
+import struct
+import sys
 import time
 
 import auxiliary
 import dataset
+import diskstore
 import encode
+import mymath
+import weightvec
+
+try:
+  import numpy
+  imp_numpy = True
+except:
+  imp_numpy = False
 
 # =============================================================================
+# Record pairs are compared in batches using the compare_batch() method of the
+# record comparator, which compares each distinct pair of field values in a
+# batch only once.
+
+COMPARE_BATCH_SIZE = 1000  # Maximum number of record pairs per batch
+
+def _compare_rec_pair_batch(rec_comp_batch, batch_list, cut_off_threshold,
+                            w_vec_list):
+  """Compare the record pairs in the given batch, a list of tuples made of
+     two record identifiers and the two records (with lower case values), with
+     the given compare_batch() method of a record comparator.
+
+     The (rec_ident1, rec_ident2, weight vector) tuples of all record pairs
+     with a summed weight of at least the cut-off threshold are appended to
+     the given list 'w_vec_list'. Returns the number of record pairs with a
+     summed weight below the cut-off threshold.
+  """
 
-class Indexing:
-  """Base class for indexing. Handles index initialisation, as well as saving
-     and loading of indices to/from files.
+  w_vec_batch = rec_comp_batch([(rec1, rec2) for (rec_ident1, rec_ident2,
+                                rec1, rec2) in batch_list], False)
 
-     Indexing (or blocking as it is called in traditional record linkage) is
-     used to reduce the large number of possible record pair comparisons by
-     grouping together records into 'blocks' that are similar according to some
-     criteria.
+  num_rec_pairs_below_thres = 0
 
-     Indices have to be defined when an index is initialised. Basically, an
-     index is specific to two fields (one per data set). An index definition is
-     made of a list containing one or more sub-lists each made of:
+  for j in xrange(len(batch_list)):
+    w_vec = w_vec_batch[j]
 
-     1) The name of a field from data set 1 which is used for the index.
+    if (cut_off_threshold == None) or (sum(w_vec) >= cut_off_threshold):
+      w_vec_list.append((batch_list[j][0], batch_list[j][1], w_vec))
+    else:
+      num_rec_pairs_below_thres += 1
 
-     2) The name of a field from data set 2 which is used for the index.
+  return num_rec_pairs_below_thres
 
-     3) A flag, if set to True and the index value contains more than one word
-        (i.e. contains whitespace characters), then these words will be sorted
-        first (before being possibly reversed and then encoded). For example,
-        a value 'peter a. christen' would be sorted into 'a. christen peter'.
-        If set to False, no such sorting will be done.
+# =============================================================================
+# Functions used by the worker processes when record pairs are compared in
+# parallel (see the 'num_processes' argument of the Indexing class). The state
+# of the comparison (record cache and record comparator) is set before the
+# worker processes are started, so that each process has its own copy.
+
+_compare_worker_state = None
+
+def _compare_rec_pair_chunk(chunk):
+  """Compare the record pairs in the given chunk, which is a list of tuples
+     made of a record identifier from data set 1, the record itself, and a
+     list of record identifiers from data set 2 (or None in which case the
+     record is compared with all records in the second record cache).
+
+     Returns a tuple with the number of record pairs processed, a list of
+     (rec_ident1, rec_ident2, weight vector) tuples, the number of record pairs
+     removed by length filtering and the number of record pairs with a summed
+     weight below the cut-off threshold.
+
+     If the records in the second record cache are from data set 1 (as set in
+     the state), the records are compared and returned the other way round,
+     i.e. as (rec_ident2, rec_ident1, weight vector) tuples.
+  """
 
-     4) A flag, if set to True the index variable (assumed to be a string) will
-        be reversed before it is used within an index definition, if set to
-        False it is not reversed.
+  (rec_cache2, rec_comp_batch, length_filter_perc, cut_off_threshold,
+   rec_length_cache, swap_rec_pairs) = _compare_worker_state
 
-     5) A positive integer specifying the maximum length (in characters) of the
-        index variable; or None (no maximum length of the index variable).
+  w_vec_list = []
+  comp_done =  0
+  batch_list = []  # Record pairs to be compared in the next batch
 
-     6) A list made of a function and its input parameters that will be applied
-        to the data set field values to create an index variable. If this list
-        is empty (or no list is given but None instead), then the field values
-        will be taken directly as index
-        variables.
-        The function can be any function that has a string as its first input
-        argument and returns a string.
+  num_rec_pairs_filtered =    0
+  num_rec_pairs_below_thres = 0
 
-     The final index variable values are the concatenated values (possibly with
-     a separator string between as detailed below) of each of the index
-     definitions.
+  for (rec_ident1, rec1, rec_ident2_list) in chunk:
 
-     Here is an example index definition:
+    if (rec_ident2_list == None):
+      rec_ident2_list = rec_cache2.iterkeys()
 
-       index_def_1 = [['surname','sname',True,True,None,[encode.soundex]],
-                      ['postcode','zipcode',False,False,3,[]]]
+    if (length_filter_perc != None):
+      rec1_len = len(''.join(rec1))
 
-     For this index, index variables will be the concatenations of the Soundex
-     encoding of the sorted (if containing more than one word) reversed
-     surnames (fields 'surname' in data set 1 and field 'sname' in data set 2)
-     and the first three characters (digits) from the fields 'postcode' from
-     data set 1 and 'zipcode' from data set 2.
+    for rec_ident2 in rec_ident2_list:
 
-     So for a record ['peter','meier','2000','sydney'] in data set 1 and a
-     record ['paul','meyer','2010','sydney south'] the following two index
-     variable values will be constructed (and inserted into the index data
-     structure):
+      rec2 = rec_cache2[rec_ident2]
 
-       ['peter','meier','2000',sydney'] ->       'r500'+'200' -> 'r500200'
-       ['paul','meyer','2010','sydney south'] -> 'r500'+'201' -> 'r500201'
+      do_comp = True
 
-     So these two records will (depending upon the index implementation) likely
-     be put into different 'blocks' and therefore not being compared.
+      if (length_filter_perc != None):
+        if (rec_ident2 in rec_length_cache):
+          rec2_len = rec_length_cache[rec_ident2]
+        else:
+          rec2_len = len(''.join(rec2))
+          rec_length_cache[rec_ident2] = rec2_len
 
-     Here is another example:
+        perc_diff = float(abs(rec1_len - rec2_len)) / max(rec1_len, rec2_len)
 
-       index_def_2 = \
-          [['year_of_birth','yob',False,False,None,[encode.get_substring,3,5]],
-           ['locality_name','loc_name',True,True,None,[encode.dmetaphone, 4]]]
+        if (perc_diff > length_filter_perc):
+          do_comp = False
+          num_rec_pairs_filtered += 1
 
-     In this example, the third and fourth year digits extracted from the
-     fields 'year_of_birth' (from data set 1) and 'yob' (from data set 2) will
-     be concatenated with the Double-Metaphone encoding (first 4 characters of
-     the encoding only) of the sorted and reversed values from the fields
-     'locality_name' (from data set 1) and 'loc_name' (from data set 2).
+      if (do_comp == True):
+        if (swap_rec_pairs == True):
+          batch_list.append((rec_ident2, rec_ident1, rec2, rec1))
+        else:
+          batch_list.append((rec_ident1, rec_ident2, rec1, rec2))
 
-     The final index definition given to an index when it is initialised is a
-     list of index definitions, for example:
+        if (len(batch_list) >= COMPARE_BATCH_SIZE):
+          num_rec_pairs_below_thres += _compare_rec_pair_batch(rec_comp_batch,
+                                     batch_list, cut_off_threshold, w_vec_list)
+          batch_list = []
 
-       full_index = indexing.BlockingIndex(description = 'Example full index',
-                                           dataset1 = example_csv_data_set,
-                                           dataset2 = example_csv_data_set,
-                                           index_def = [index_def_1,
-                                                        index_def_2],
-                                           index_sep_str = ' ',
-                                           rec_comparator = example_rec_comp)
+      comp_done += 1
 
-     In this example, two indices will be built according to the two index
-     definitions provided.
+  if (batch_list != []):
+    num_rec_pairs_below_thres += _compare_rec_pair_batch(rec_comp_batch,
+                                 batch_list, cut_off_threshold, w_vec_list)
 
-     All index classed have the following instance variables, which can be set
-     when an index is initialised:
+  return (comp_done, w_vec_list, num_rec_pairs_filtered,
+          num_rec_pairs_below_thres)
 
-       description      A string describing the index
-       dataset1         The first data set the index is built for
-       dataset2         The second data set the index is built for
-       rec_comparator   The record comparator
-       index_def        Definitions of the indexes as described above
-       index_sep_str    A separator string which will be inserted if an index
-                        is made of more than one value. Default is the empty
-                        string ''.
-       skip_missing     A flag, if set to True records which have empty index
-                        variable values will be skipped over, if set to False a
-                        record with an empty indexing variable value will be
-                        included in the index as well. Default value is True
-       log_funct        This can be a Python function or method which will log
-                        (print or save to a file) a progress report message. It
-                        is assumed that this function or method has one input
-                        argument of type string (the message to be printed).
-                        Default is None, in which case the normal logging
-                        module will be used.
-       progress_report  Can be set to a percentage number between 1 and 50 in
-                        which case a progress report is logged during the
-                        record pair comparison stage (in the run() method)
-                        every selected percentage number. Default values is 10.
-                        If set to None no progress report will be logged.
-       weight_vec_file  If this is set to a string (assumed to be a file name)
-                        then the weight vectors will be written into this file
-                        and NOT stored in the weight_vector dictionary. Each
-                        weight vector is a comma separated line containing:
-                          rec_id1, rec_id2, weight1, weight2, ... weightN
-                        Default value is None, in which case the weight vectors
-                        will not be written into a file but returned as a
-                        dictionary.
+# =============================================================================
+# Function run by the worker processes of the DedupIndex if it is run with
+# more than one process. Each worker owns the blocks of the blocking keys
+# (tuples made of index number and key value) with a hash value that maps to
+# its partition number, and compares records within these blocks only.
+
+def _dedup_partition_worker(part_num, num_parts, in_queue, out_queue,
+                            rec_comp_batch, length_filter_perc,
+                            cut_off_threshold):
+  """Process lists of records sent by the main process via the 'in_queue'
+     until None is received. Each record is a tuple made of its record
+     identifier, the record, the record with only the fields used in
+     comparisons, its length, the list of blocking keys the record is
+     inserted into, and the sorted list of blocking keys of the blocks it is
+     to be compared with.
+
+     A record pair is only compared in the block of the smallest blocking key
+     both records have in common, so pairs in several blocks (of the same or
+     of other partitions) are only compared once.
+
+     The record pairs are compared in batches with the given compare_batch()
+     method of the record comparator. For each list of records, a list of
+     (rec_ident1, rec_ident2, weight vector) tuples is put into the
+     'out_queue'. Finally a tuple with the number of comparisons done, the
+     number of record pairs removed by length filtering and the number of
+     record pairs with a summed weight below the cut-off threshold is put into
+     the 'out_queue'.
+  """
+
+  block_dict = {}  # Blocks of this partition with lists of record identifiers
+  rec_dict =   {}  # Records in these blocks with their length and keys
+
+  comp_done =                 0
+  num_rec_pairs_filtered =    0
+  num_rec_pairs_below_thres = 0
+
+  while (True):
+
+    rec_list = in_queue.get()
+    if (rec_list == None):
+      break
+
+    w_vec_list = []
+    batch_list = []  # Record pairs to be compared in the next batch
+
+    for (rec_ident1, rec1, comp_rec, rec_len1, insert_key_list,
+         lookup_key_list) in rec_list:
+
+      for key in lookup_key_list:
+        if ((hash(key) % num_parts) != part_num):
+          continue  # Block of another partition
+
+        for rec_ident2 in block_dict.get(key, []):
+          (rec2, rec_len2, insert_key_set2) = rec_dict[rec_ident2]
+
+          # Only compare in the block of the smallest key in common
+          #
+          for first_key in lookup_key_list:
+            if (first_key in insert_key_set2):
+              break
+          if (first_key != key):
+            continue
+
+          if (length_filter_perc != None):
+            perc_diff = float(abs(rec_len1 - rec_len2)) / \
+                        max(rec_len1, rec_len2)
+
+            if (perc_diff > length_filter_perc):
+              num_rec_pairs_filtered += 1
+              continue
+
+          batch_list.append((rec_ident1, rec_ident2, rec1, rec2))
+
+          if (len(batch_list) >= COMPARE_BATCH_SIZE):
+            num_rec_pairs_below_thres += _compare_rec_pair_batch(
+                                           rec_comp_batch, batch_list,
+                                           cut_off_threshold, w_vec_list)
+            batch_list = []
+
+          comp_done += 1
+
+      # Insert the record into the blocks of this partition
+      #
+      is_inserted = False
+      for key in insert_key_list:
+        if ((hash(key) % num_parts) == part_num):
+          block_rec_ident_list = block_dict.get(key, [])
+          block_rec_ident_list.append(rec_ident1)
+          block_dict[key] = block_rec_ident_list
+          is_inserted = True
+
+      if (is_inserted == True):
+        rec_dict[rec_ident1] = (comp_rec, rec_len1, frozenset(insert_key_list))
+
+    if (batch_list != []):
+      num_rec_pairs_below_thres += _compare_rec_pair_batch(rec_comp_batch,
+                                   batch_list, cut_off_threshold, w_vec_list)
+
+    out_queue.put(w_vec_list)
+
+  out_queue.put((comp_done, num_rec_pairs_filtered, num_rec_pairs_below_thres))
+
+# =============================================================================
+# Binary index file format used by the save() and load() methods of the
+# Indexing class. A file starts with a fixed size preamble (magic string,
+# version, and offset and length of the header), followed by sections that
+# are aligned to 8 bytes so that they can be memory mapped. The header (at
+# the end of the file) is a pickled dictionary which contains the index
+# meta-data and the offsets of all sections.
+#
+# Each inverted index is stored as three sections: the sorted block keys
+# (strings concatenated), the offsets of the keys in this string, and the
+# offsets of the blocks into a fourth section containing the record numbers
+# of all blocks (postings). When an index is loaded these sections are not
+# copied, blocks are looked up in the mapped file (see _MappedBlockDict).
+#
+# The record pair dictionary and the index values of records are stored in
+# the same way, with sorted record numbers as keys, and are looked up in the
+# mapped file as well (see _MappedRecPairDict and _MappedIndexValDict).
+
+INDEX_FILE_MAGIC =    'FEBRLIDX'
+INDEX_FILE_VERSION =  2
+INDEX_FILE_PREAMBLE = '<8sIIQQ'  # Magic, version, unused, header offset and
+                                 # header length
+
+def _str_list_to_arrays(str_list):
+  """Convert a list of strings into one string (with all strings
+     concatenated) and an array with the offsets of the strings (with one more
+     element than the number of strings).
+  """
+
+  offsets = array.array('l', [0])
+  pos =     0
+  for s in str_list:
+    pos += len(s)
+    offsets.append(pos)
+
+  return (''.join(str_list), offsets)
+
+def _arrays_to_str_list(all_str, offsets):
+  """Convert a string and an offsets array (as generated by the function
+     _str_list_to_arrays()) back into a list of strings.
+  """
+
+  return [all_str[offsets[i]:offsets[i+1]] for i in xrange(len(offsets)-1)]
+
+class _MappedBlockDict:
+  """A read-only dictionary view of the blocks of one inverted index in a
+     memory mapped index file, as used by the load() method of the Indexing
+     class so that the blocks do not have to be copied into a dictionary.
+
+     A block key is found with a binary search on the sorted keys of the
+     index, and the postings of a block are converted into an array of record
+     numbers (or a list of record identifiers if these are not interned) only
+     when the block is accessed. Blocks that are set after loading (when
+     records are added to an incremental index) are kept in a dictionary
+     that takes precedence over the mapped blocks.
+  """
+
+  def __init__(self, index_mmap, section_dict, section_suffix,
+               rec_ident_list):
+    """Constructor. The given record identifier list is None if record
+       identifiers are interned (blocks contain record numbers).
+    """
+
+    self.index_mmap =     index_mmap
+    self.rec_ident_list = rec_ident_list
+
+    self.keys_start =          section_dict['keys'+section_suffix][1]
+    (self.typecode, self.key_offsets_start, num_offsets) = \
+                              section_dict['key_offsets'+section_suffix]
+    self.block_offsets_start = section_dict['block_offsets'+section_suffix][1]
+    self.postings_start =      section_dict['postings'+section_suffix][1]
+
+    self.int_size =  struct.calcsize(self.typecode)
+    self.pair_fmt =  '2'+self.typecode  # Start and end offsets
+    self.num_keys =  num_offsets - 1
+
+    self.block_dict =    {}  # Blocks set after loading
+    self.num_new_keys =  0   # Keys in the block dictionary that are not mapped
+
+  # ---------------------------------------------------------------------------
+
+  def __offsets__(self, section_start, k):
+    """Return the start and end offsets of the k-th key or block.
+    """
+
+    return struct.unpack_from(self.pair_fmt, self.index_mmap,
+                              section_start + k*self.int_size)
+
+  def __key__(self, k):
+    """Return the k-th mapped key.
+    """
+
+    (start, end) = self.__offsets__(self.key_offsets_start, k)
+
+    return self.index_mmap[self.keys_start+start:self.keys_start+end]
+
+  def __find_key__(self, key):
+    """Return the number of the given key in the mapped keys, or -1 if it is
+       not a mapped key.
+    """
+
+    low =  0
+    high = self.num_keys
+
+    while (low < high):
+      mid = (low + high) / 2
+      if (self.__key__(mid) < key):
+        low = mid + 1
+      else:
+        high = mid
+
+    if ((low < self.num_keys) and (self.__key__(low) == key)):
+      return low
+    return -1
+
+  def __block__(self, k):
+    """Return the k-th mapped block.
+    """
+
+    (start, end) = self.__offsets__(self.block_offsets_start, k)
+
+    block = array.array(self.typecode)
+    block.fromstring(self.index_mmap[self.postings_start + \
+                                     start*self.int_size: \
+                                     self.postings_start+end*self.int_size])
+
+    if (self.rec_ident_list == None):
+      return block
+    rec_ident_list = self.rec_ident_list  # Shorthand
+    return [rec_ident_list[rec_num] for rec_num in block]
+
+  # ---------------------------------------------------------------------------
+
+  def __getitem__(self, key):
+    if (key in self.block_dict):
+      return self.block_dict[key]
+
+    k = self.__find_key__(key)
+    if (k < 0):
+      raise KeyError(key)
+    return self.__block__(k)
+
+  def __setitem__(self, key, block):
+    if ((key not in self.block_dict) and (self.__find_key__(key) < 0)):
+      self.num_new_keys += 1
+    self.block_dict[key] = block
+
+  def __contains__(self, key):
+    return ((key in self.block_dict) or (self.__find_key__(key) >= 0))
+
+  def __len__(self):
+    return self.num_keys + self.num_new_keys
+
+  def __iter__(self):
+    return self.iterkeys()
+
+  def has_key(self, key):
+    return self.__contains__(key)
+
+  def get(self, key, default=None):
+    if (key in self.block_dict):
+      return self.block_dict[key]
+
+    k = self.__find_key__(key)
+    if (k < 0):
+      return default
+    return self.__block__(k)
+
+  def iterkeys(self):
+    for k in xrange(self.num_keys):
+      key = self.__key__(k)
+      if (key not in self.block_dict):
+        yield key
+    for key in self.block_dict:
+      yield key
+
+  def iteritems(self):
+    for k in xrange(self.num_keys):
+      key = self.__key__(k)
+      if (key not in self.block_dict):
+        yield (key, self.__block__(k))
+    for key_block in self.block_dict.iteritems():
+      yield key_block
+
+  def itervalues(self):
+    for (key, block) in self.iteritems():
+      yield block
+
+  def keys(self):
+    return list(self.iterkeys())
+
+  def items(self):
+    return list(self.iteritems())
+
+  def values(self):
+    return list(self.itervalues())
+
+  def clear(self):
+    self.num_keys =     0
+    self.num_new_keys = 0
+    self.block_dict.clear()
+
+class _MappedRecPairDict(_MappedBlockDict):
+  """A read-only dictionary view of the record pair dictionary of a compacted
+     index in a memory mapped index file.
+
+     The keys (record identifiers from data set 1) are saved as a sorted array
+     of record numbers, and the values (sets of record identifiers from data
+     set 2) as postings with their offsets, in the same way as blocks.
+  """
+
+  def __init__(self, index_mmap, section_dict, section_suffix,
+               key_ident_list, rec_ident_list):
+    """Constructor. The given lists of record identifiers for the keys and the
+       values are None if record identifiers are interned. Record numbers
+       refer to the sorted record identifiers otherwise, so the keys are
+       sorted in the same way as their record identifiers.
+    """
+
+    self.index_mmap =     index_mmap
+    self.key_ident_list = key_ident_list
+    self.rec_ident_list = rec_ident_list
+
+    (self.typecode, self.keys_start, self.num_keys) = \
+                              section_dict['rec_keys'+section_suffix]
+    self.block_offsets_start = section_dict['rec_offsets'+section_suffix][1]
+    self.postings_start =      section_dict['rec_values'+section_suffix][1]
+
+    self.int_size = struct.calcsize(self.typecode)
+    self.pair_fmt = '2'+self.typecode
+
+    self.block_dict =   {}
+    self.num_new_keys = 0
+
+  def __key__(self, k):
+    """Return the k-th mapped key.
+    """
+
+    rec_num = struct.unpack_from(self.typecode, self.index_mmap,
+                                 self.keys_start + k*self.int_size)[0]
+
+    if (self.key_ident_list == None):
+      return rec_num
+    return self.key_ident_list[rec_num]
+
+  def __block__(self, k):
+    """Return the set of record identifiers for the k-th mapped key.
+    """
+
+    return set(_MappedBlockDict.__block__(self, k))
+
+class _MappedIndexValDict(_MappedRecPairDict):
+  """A read-only dictionary view of the index values of records (as kept if
+     record pairs are streamed) in a memory mapped index file.
+
+     The keys are saved as for a _MappedRecPairDict, the values (tuples with
+     one index value per index) as the concatenated index values with their
+     offsets.
+  """
+
+  def __init__(self, index_mmap, section_dict, section_suffix,
+               key_ident_list, num_indices):
+    """Constructor. The given list of record identifiers is None if record
+       identifiers are interned.
+    """
+
+    _MappedRecPairDict.__init__(self, index_mmap, section_dict,
+                                section_suffix, key_ident_list, None)
+
+    self.num_indices = num_indices
+    self.vals_fmt =    '%d%s' % (num_indices+1, self.typecode)
+
+  def __block__(self, k):
+    """Return the tuple of index values for the k-th mapped key.
+    """
+
+    offsets = struct.unpack_from(self.vals_fmt, self.index_mmap,
+                                 self.block_offsets_start + \
+                                 k*self.num_indices*self.int_size)
+    start = self.postings_start
+
+    return tuple([self.index_mmap[start+offsets[j]:start+offsets[j+1]] \
+                  for j in xrange(self.num_indices)])
+
+# =============================================================================
+# Canopy extraction engine used by the CanopyIndex if the 'canopy_engine'
+# argument is set to 'maxscore'. The q-gram inverted index of one index is
+# converted into arrays: each record (numbered 0..n-1) has a sparse vector of
+# q-gram numbers (sorted) and weights, and each q-gram has an inverted list of
+# record numbers and weights. Records removed from the pool are only marked
+# as such and skipped in the inverted lists, which are filtered once more than
+# half of their records have been removed.
+#
+# The records similar to a canopy centre are found with the MaxScore method:
+# The q-grams of the centre are processed in decreasing order of the largest
+# similarity contribution they can make, and once the sum of these upper
+# bounds of the remaining q-grams is below the similarity a record needs (the
+# loose threshold, or the similarity of the currently k-th nearest record), no
+# new records are considered, and the remaining q-grams are looked up in the
+# sparse vectors of the records found so far. The absolute values of the
+# TF-IDF weights are used (the normalised counts are negative if no q-gram
+# occurs more than once in a value), as their products are never negative.
+
+class _CanopyEngine:
+  """Extract canopies from the inverted index of a built CanopyIndex.
+  """
+
+  def __init__(self, canopy_index, i):
+    """Convert the inverted index 'i' of the given canopy index into arrays.
+       The inverted index (a dictionary) is cleared afterwards.
+    """
+
+    self.canopy_method =   canopy_index.canopy_method
+    self.do_tfidf =        (canopy_index.canopy_method[0] == 'tfidf')
+    self.get_qgram_list =  canopy_index.__get_qgram_list__
+    self.qgram_list_to_dict = canopy_index.__qgram_list_to_dict__
+    self.index_val_cache = canopy_index.index_val_cache[i]
+
+    if (self.do_tfidf == True):
+      qgram_inv_doc_freq_cache = canopy_index.qgram_inv_doc_freq_cache[i]
+      self.qgram_inv_doc_freq_cache = qgram_inv_doc_freq_cache
+      self.max_qgram_count = canopy_index.max_qgram_count[i]
+
+    index = canopy_index.index1[i]
+
+    self.rec_ident_list = self.index_val_cache.keys()
+    self.rec_num_dict =   dict(zip(self.rec_ident_list,
+                                   xrange(len(self.rec_ident_list))))
+    rec_num_dict =        self.rec_num_dict
+    num_recs = len(self.rec_ident_list)
+
+    self.qgram_num_dict = {}  # Q-gram numbers
+
+    self.term_rec_list = []  # Per q-gram an array with record numbers
+    self.term_wgt_list = []  # and an array with their weights
+    self.term_max_list = []  # Largest weight in inverted list
+    self.term_live_list = array.array('l')  # Records in pool per q-gram
+
+    rec_term_list = [[] for r in xrange(num_recs)]
+
+    for (qgram, qgram_rec_dict) in index.iteritems():
+      t = len(self.term_rec_list)
+      self.qgram_num_dict[qgram] = t
+
+      term_recs = array.array('l')
+      term_wgts = array.array('d')
+
+      for (rec_ident, qgram_val) in qgram_rec_dict.iteritems():
+        if (self.do_tfidf == True):  # Normalised count divided by W_d
+          wgt = abs(qgram_inv_doc_freq_cache[qgram] * qgram_val)
+        else:
+          wgt = 1.0
+        r = rec_num_dict[rec_ident]
+        term_recs.append(r)
+        term_wgts.append(wgt)
+        rec_term_list[r].append((t, wgt))
+
+      self.term_rec_list.append(term_recs)
+      self.term_wgt_list.append(term_wgts)
+      self.term_max_list.append(max(term_wgts))
+      self.term_live_list.append(len(term_recs))
+
+    index.clear()  # Not needed anymore
+
+    self.rec_term_list = []  # Sparse vectors (sorted q-gram numbers)
+    self.rec_wgt_list =  []
+
+    for r in xrange(num_recs):
+      rec_term_list[r].sort()
+      self.rec_term_list.append(array.array('l', [term_pair[0] for term_pair in
+                                                  rec_term_list[r]]))
+      self.rec_wgt_list.append(array.array('d', [term_pair[1] for term_pair in
+                                                 rec_term_list[r]]))
+    del rec_term_list
+
+    if (self.do_tfidf == False):  # Number of q-grams per record for Jaccard
+      index_val_num_qgram = canopy_index.index_val_num_qgram[i]
+      self.rec_size_list = array.array('l', [index_val_num_qgram[rec_ident]
+                                      for rec_ident in self.rec_ident_list])
+
+    # The pool of records not yet removed, with the positions of records in
+    # the pool (or -1 for removed records)
+    #
+    self.pool_list = array.array('l', xrange(num_recs))
+    self.pool_pos =  array.array('l', xrange(num_recs))
+
+  # ---------------------------------------------------------------------------
+
+  def __len__(self):
+    """Return the number of records left in the pool.
+    """
+
+    return len(self.pool_list)
+
+  # ---------------------------------------------------------------------------
+
+  def next_centre(self):
+    """Return the record identifier of a record from the pool.
+    """
+
+    return self.rec_ident_list[self.pool_list[-1]]
+
+  # ---------------------------------------------------------------------------
+
+  def get_canopy(self, rec_ident):
+    """Return the list of record identifiers in the canopy with the given
+       record as centre, and remove the records within the tight threshold (or
+       the 'remove_nearest' records) from the pool. The canopies are the same
+       as generated by the __tfidf_canopy__() and __jaccard_canopy__() methods
+       of the CanopyIndex (apart from rounding differences, and for the
+       Jaccard nearest method, which does not use an approximation here).
+    """
+
+    EPS = 0.000000001
+
+    do_tfidf =     self.do_tfidf  # Shorthands
+    pool_pos =     self.pool_pos
+    do_threshold = (self.canopy_method[1] == 'threshold')
+
+    centre = self.rec_num_dict[rec_ident]
+
+    # Get the q-grams of the centre and their weights - - - - - - - - - - - -
+    #
+    query_list = []  # Tuples (upper bound, q-gram number, weight)
+
+    if (do_tfidf == True):
+      qgram_dict = self.qgram_list_to_dict(self.get_qgram_list(
+                                           self.index_val_cache[rec_ident]))
+      W_q = 0.0
+      for (qgram, qgram_count) in qgram_dict.iteritems():
+        if (qgram in self.qgram_num_dict):
+          t = self.qgram_num_dict[qgram]
+          W_qt = abs(self.qgram_inv_doc_freq_cache[qgram] * qgram_count / \
+                     self.max_qgram_count)
+          W_q += W_qt*W_qt
+          query_list.append((W_qt*self.term_max_list[t], t, W_qt))
+      W_q = math.sqrt(W_q)
+
+    else:
+      for t in self.rec_term_list[centre]:
+        query_list.append((1.0, t, 1.0))
+      num_qgrams = len(query_list)
+
+    if (query_list == []):  # No q-grams left, canopy only contains centre
+      self.__remove_recs__([centre])
+      return [rec_ident]
+
+    # Largest upper bounds first, and shorter inverted lists for equal bounds
+    #
+    term_live_list = self.term_live_list
+    query_list.sort(key = lambda query: (-query[0], term_live_list[query[1]]))
+
+    # The similarity a record must have (in units of the accumulated scores)
+    #
+    if (do_threshold == True):
+      if (do_tfidf == True):
+        min_score = self.canopy_method[3]*W_q
+      else:
+        min_score = self.canopy_method[3]*num_qgrams
+    else:
+      cluster_nearest = self.canopy_method[3]
+
+    def get_sim(r, score):  # Similarity used to rank records
+      if (do_tfidf == True):
+        return score
+      return score / (self.rec_size_list[r] + num_qgrams - score)
+
+    # Scan the inverted lists while new records can reach the needed score - -
+    #
+    score_dict = {}
+    rest_bound = sum([bound for (bound, t, wgt) in query_list])
+
+    j = 0
+    while (j < len(query_list)):
+
+      if (do_threshold == True):
+        if (rest_bound < min_score-EPS):
+          break
+
+      elif (len(score_dict) >= cluster_nearest):
+        kth_sim = heapq.nlargest(cluster_nearest, [get_sim(r, score) for
+                                 (r, score) in score_dict.iteritems()])[-1]
+        if (do_tfidf == True):
+          max_new_sim = rest_bound
+        else:
+          max_new_sim = rest_bound / num_qgrams
+        if (max_new_sim < kth_sim-EPS):
+          break
+
+      (bound, t, W_qt) = query_list[j]
+      term_recs = self.term_rec_list[t]
+      term_wgts = self.term_wgt_list[t]
+
+      for p in xrange(len(term_recs)):
+        r = term_recs[p]
+        if (pool_pos[r] >= 0):
+          score_dict[r] = score_dict.get(r, 0.0) + W_qt*term_wgts[p]
+
+      rest_bound -= bound
+      j += 1
+
+    # Add the contributions of the remaining q-grams from the sparse vectors
+    #
+    if (j < len(query_list)):
+      bisect_left = bisect.bisect_left
+      rest_query_list = query_list[j:]
+
+      for r in score_dict:
+        rec_terms = self.rec_term_list[r]
+        rec_wgts =  self.rec_wgt_list[r]
+        num_terms = len(rec_terms)
+
+        score = score_dict[r]
+        for (bound, t, W_qt) in rest_query_list:
+          p = bisect_left(rec_terms, t)
+          if ((p < num_terms) and (rec_terms[p] == t)):
+            score += W_qt*rec_wgts[p]
+        score_dict[r] = score
+
+    return_list = []  # Record numbers to be returned
+    delete_list = []  # Record numbers to be removed
+
+    if (do_threshold == True):  # Threshold based canopy - - - - - - - - - - -
+
+      if (do_tfidf == True):
+        t_tight = self.canopy_method[2]*W_q
+        t_loose = self.canopy_method[3]*W_q
+
+        for (r, score) in score_dict.iteritems():
+          if (score >= t_loose):
+            return_list.append(r)
+            if (score >= t_tight):
+              delete_list.append(r)
+
+      else:
+        for (r, score) in score_dict.iteritems():
+          jacc_sim = get_sim(r, score)
+          if (jacc_sim >= self.canopy_method[3]):
+            return_list.append(r)
+            if (jacc_sim >= self.canopy_method[2]):
+              delete_list.append(r)
+
+    else:  # Nearest neighbour based canopy - - - - - - - - - - - - - - - - - -
+
+      remove_nearest = self.canopy_method[2]
+
+      sim_dict = {}  # Similarities as keys, lists of record numbers as values
+
+      for (r, score) in score_dict.iteritems():
+        if (do_tfidf == True):
+          sim = round(score, 10)  # As in __tfidf_canopy__()
+        else:
+          sim = get_sim(r, score)
+        sim_rec_list = sim_dict.get(sim, [])
+        sim_rec_list.append(r)
+        sim_dict[sim] = sim_rec_list
+
+      sim_values = sim_dict.keys()
+      sim_values.sort(reverse=True)  # Largest values first
+
+      for sim_val in sim_values:
+        sim_val_rec_list = sim_dict[sim_val]
+
+        if ((len(return_list) + len(sim_val_rec_list)) <= cluster_nearest):
+          return_list += sim_val_rec_list
+
+          if ((len(delete_list) + len(sim_val_rec_list)) <= remove_nearest) \
+             or (delete_list == []):  # Make sure delete is not empty
+            delete_list += sim_val_rec_list
+
+        else:
+          if (return_list == []):  # Make sure at least nearest neighbours are
+                                   # returned and deleted
+            return_list += sim_val_rec_list
+            delete_list += sim_val_rec_list
+
+          break  # Exit loop, enough nearest neighbours found
+
+    if (centre not in return_list):  # Only possible due to rounding errors
+      return_list.append(centre)
+    if (centre not in delete_list):
+      delete_list.append(centre)
+
+    self.__remove_recs__(delete_list)
+
+    rec_ident_list = self.rec_ident_list
+
+    return [rec_ident_list[r] for r in return_list]
+
+  # ---------------------------------------------------------------------------
+
+  def __remove_recs__(self, rec_num_list):
+    """Remove the given records from the pool, and filter the inverted lists
+       in which more than half of the records have been removed.
+    """
+
+    pool_list =      self.pool_list  # Shorthands
+    pool_pos =       self.pool_pos
+    term_live_list = self.term_live_list
+
+    for r in rec_num_list:
+
+      # Move the last record in the pool into the position of this record
+      #
+      pos = pool_pos[r]
+      last_r = pool_list[-1]
+      pool_list[pos] = last_r
+      pool_pos[last_r] = pos
+      pool_list.pop()
+      pool_pos[r] = -1
+
+      for t in self.rec_term_list[r]:
+        term_live_list[t] -= 1
+
+        if (2*term_live_list[t] < len(self.term_rec_list[t])):
+          term_recs = self.term_rec_list[t]
+          term_wgts = self.term_wgt_list[t]
+
+          live_pos_list = [p for p in xrange(len(term_recs)) if \
+                           pool_pos[term_recs[p]] >= 0]
+
+          self.term_rec_list[t] = array.array('l', [term_recs[p] for p in
+                                                    live_pos_list])
+          self.term_wgt_list[t] = array.array('d', [term_wgts[p] for p in
+                                                    live_pos_list])
+          if (len(live_pos_list) > 0):
+            self.term_max_list[t] = max(self.term_wgt_list[t])
+
+
+# =============================================================================
+# Generalised suffix array used by the SuffixArrayIndex and the
+# RobustSuffixArrayIndex if the 'array_method' argument is set to 'lcp'. The
+# distinct index variable values of one index are concatenated into one
+# string buffer, each value followed by a separator. The suffix array only
+# contains the positions of the value characters (not of the separators), and
+# is built with prefix doubling, where each separator has its own rank (smaller
+# than the ranks of all characters) so that no suffix comparison extends into
+# the next value. The LCP array contains the lengths of the longest common
+# prefixes of neighbouring suffixes, again only up to the end of the values.
+#
+# Instead of copies of all suffix strings only three integers are kept per
+# character: the value number and the suffix length (up to the separator) of
+# each suffix array entry, and the LCP array. Blocks of values with the same
+# suffix or sub-string are then ranges in the suffix array.
+
+class _SuffixArray:
+  """Suffix array with LCP array over a list of distinct strings.
+  """
+
+  def __init__(self, str_list):
+    """Concatenate the given strings (which must be distinct) and build the
+       suffix and LCP arrays.
+    """
+
+    num_str = len(str_list)
+
+    buf = '\x00'.join(str_list)+'\x00'  # Separator after each string
+    buf_len = len(buf)
+
+    self.buf = buf
+
+    # Start positions of the strings in the buffer (plus the buffer length)
+    #
+    self.str_start = array.array('l', [0])
+    for s in str_list:
+      self.str_start.append(self.str_start[-1] + len(s) + 1)
+    str_start = self.str_start
+
+    self.empty_str_list = [v for v in xrange(num_str) if (str_list[v] == '')]
+
+    # Initial ranks: separators get their string number, characters the
+    # (larger) character code offset by the number of strings
+    #
+    rank = array.array('l', [0])*buf_len
+    sa =   []  # Positions of all characters, will be sorted
+
+    for v in xrange(num_str):
+      s = str_list[v]
+      start = str_start[v]
+      for k in xrange(len(s)):
+        rank[start+k] = num_str + ord(s[k])
+        sa.append(start+k)
+      rank[start+len(s)] = v
+
+    # Prefix doubling: sort the suffixes on pairs of ranks of the first h and
+    # the following h characters, until all ranks are different
+    #
+    num_sa = len(sa)
+    h = 1
+
+    while (num_sa > 0):
+      max_rank = num_str + 256 + num_sa + 1
+
+      def sort_key(p):
+        if (p+h < buf_len):
+          return rank[p]*max_rank + rank[p+h]
+        return rank[p]*max_rank
+
+      sa.sort(key = sort_key)
+
+      new_rank = array.array('l', [0])*num_sa  # Assign new ranks in order
+      r = num_str
+      prev_key = sort_key(sa[0])
+      for j in xrange(1, num_sa):
+        this_key = sort_key(sa[j])
+        if (this_key != prev_key):
+          r += 1
+          prev_key = this_key
+        new_rank[j] = r - num_str
+
+      for j in xrange(num_sa):
+        rank[sa[j]] = num_str + new_rank[j]
+      del new_rank
+
+      if (r - num_str == num_sa-1):  # All ranks different
+        break
+      h *= 2
+
+    rank = None  # Not needed anymore
+
+    # For each suffix array entry keep the string number and the length of
+    # the suffix up to the separator
+    #
+    self.sa_str = array.array('l', [0])*num_sa
+    self.sa_len = array.array('l', [0])*num_sa
+
+    inv_sa = array.array('l', [-1])*buf_len
+
+    for j in xrange(num_sa):
+      p = sa[j]
+      v = bisect.bisect_right(str_start, p) - 1
+      self.sa_str[j] = v
+      self.sa_len[j] = str_start[v+1] - 1 - p
+      inv_sa[p] = j
+
+    # LCP array (Kasai et al.), with lcp[j] the length of the common prefix of
+    # the suffixes at j-1 and j (and lcp[0] = 0)
+    #
+    lcp = array.array('l', [0])*num_sa
+
+    for v in xrange(num_str):
+      end = str_start[v+1] - 1  # Position of separator
+      lcp_len = 0
+      for p in xrange(str_start[v], end):
+        j = inv_sa[p]
+        if (j > 0):
+          q = sa[j-1]
+          q_end = str_start[self.sa_str[j-1]+1] - 1
+          while ((p+lcp_len < end) and (q+lcp_len < q_end) and \
+                 (buf[p+lcp_len] == buf[q+lcp_len])):
+            lcp_len += 1
+          lcp[j] = lcp_len
+          if (lcp_len > 0):
+            lcp_len -= 1
+        else:
+          lcp_len = 0
+
+    self.lcp = lcp
+
+    del sa
+    del inv_sa
+
+  # ---------------------------------------------------------------------------
+
+  def __len__(self):
+    """Return the number of entries in the suffix array (the number of
+       characters in all strings).
+    """
+
+    return len(self.sa_len)
+
+  # ---------------------------------------------------------------------------
+
+  def get_str(self, str_num):
+    """Return the string with the given number.
+    """
+
+    return self.buf[self.str_start[str_num]:self.str_start[str_num+1]-1]
+
+  # ---------------------------------------------------------------------------
+
+  def suffix_groups(self, min_len):
+    """Generator which returns, in sorted order, all distinct suffixes of the
+       strings that are at least 'min_len' characters long, and all strings
+       that are shorter than 'min_len'. For each such suffix a tuple
+       (position, length, string number list) is returned, with the suffix
+       starting at the given position in the buffer, and the numbers of all
+       strings having this suffix (only the string itself for a string shorter
+       than 'min_len').
+    """
+
+    sa_str =    self.sa_str  # Shorthands
+    sa_len =    self.sa_len
+    lcp =       self.lcp
+    str_start = self.str_start
+
+    for v in self.empty_str_list:  # Sorted before all other suffixes
+      yield (str_start[v], 0, [v])
+
+    num_sa = len(sa_len)
+
+    j = 0
+    while (j < num_sa):
+      suff_len = sa_len[j]
+
+      k = j+1  # Find following entries with the same suffix
+      while ((k < num_sa) and (sa_len[k] == suff_len) and \
+             (lcp[k] >= suff_len)):
+        k += 1
+
+      if (suff_len >= min_len):
+        str_num_list = list(sa_str[j:k])
+      else:  # Only strings that are equal to the suffix
+        str_num_list = [sa_str[l] for l in xrange(j, k) if \
+                 (str_start[sa_str[l]+1]-str_start[sa_str[l]]-1 == suff_len)]
+
+      if (str_num_list != []):
+        yield (str_start[sa_str[j]+1]-1-suff_len, suff_len, str_num_list)
+
+      j = k
+
+  # ---------------------------------------------------------------------------
+
+  def substring_groups(self, min_len, size_list1, size_list2, max_size):
+    """Generator which returns lists of string numbers, one for each distinct
+       set of strings that contain a common sub-string of at least 'min_len'
+       characters, and one for each string shorter than 'min_len' (containing
+       only this string). The same list might be returned more than once.
+
+       'size_list1' and 'size_list2' contain a size (number of records) per
+       string. Sets of strings with a total size larger than 'max_size' in
+       either of these lists are not returned (and neither are all sets that
+       contain such a set).
+
+       The sets are the intervals in the suffix array where all entries have
+       a common prefix of a certain length (found with a stack over the LCP
+       array), and the single strings which have a sub-string that does not
+       occur in any other string.
+    """
+
+    sa_str =    self.sa_str  # Shorthands
+    sa_len =    self.sa_len
+    lcp =       self.lcp
+    str_start = self.str_start
+
+    num_sa = len(sa_len)
+
+    single_done = set()  # Strings returned on their own
+
+    for v in xrange(len(str_start)-1):  # Strings shorter than minimum length
+      if (str_start[v+1]-str_start[v]-1 < min_len):
+        single_done.add(v)
+        yield [v]
+
+    # Single strings with a unique sub-string of at least minimum length
+    #
+    for j in xrange(num_sa):
+      v = sa_str[j]
+      if (v not in single_done):
+        if (j+1 < num_sa):
+          max_lcp = max(lcp[j], lcp[j+1])
+        else:
+          max_lcp = lcp[j]
+        if (sa_len[j] > max(max_lcp, min_len-1)):
+          single_done.add(v)
+          yield [v]
+
+    del single_done
+
+    # Intervals with a common prefix length of at least the minimum length,
+    # processed bottom-up. Each stack element is a list [prefix length, left
+    # bound, too large flag].
+    #
+    stack = [[0, 0, False]]
+
+    for j in xrange(1, num_sa+1):
+      if (j < num_sa):
+        this_lcp = lcp[j]
+      else:
+        this_lcp = 0
+
+      left_bound = j-1
+      child_too_large = False
+
+      while (this_lcp < stack[-1][0]):
+        [pref_len, left_bound, too_large] = stack.pop()
+        too_large = (too_large or child_too_large)
+
+        if ((pref_len >= min_len) and (too_large == False)):
+          str_num_set = set(sa_str[left_bound:j])
+          size1 = 0
+          size2 = 0
+          for v in str_num_set:
+            size1 += size_list1[v]
+            size2 += size_list2[v]
+          if ((size1 > max_size) or (size2 > max_size)):
+            too_large = True
+          else:
+            yield list(str_num_set)
+
+        child_too_large = too_large
+
+      if (this_lcp > stack[-1][0]):
+        stack.append([this_lcp, left_bound, child_too_large])
+      elif (child_too_large == True):
+        stack[-1][2] = True
+
+
+# =============================================================================
+# Vantage point tree used by the StringMapIndex if the 'metric_index' argument
+# is set to 'vptree'. Each node of the tree is one of the strings (the node
+# number is the string number), and its sub-trees contain the other strings of
+# its sub-tree that are closer to it than the node's median distance (the
+# inside sub-tree), or further away (the outside sub-tree). Range and nearest
+# neighbour queries use the triangle inequality to skip sub-trees, so their
+# results are exact if the string distance is a metric (like the edit
+# distance). For other distances they might miss some close strings.
+#
+# Strings can be removed from the tree, which only marks them as removed and
+# updates the number of strings left in the sub-trees above them, so that
+# sub-trees without strings left are not searched anymore. Removed strings
+# still have to be compared with the query strings while they route queries to
+# the sub-trees below them, so once more than half of the strings in the tree
+# have been removed the tree is rebuilt from the strings left (at the start of
+# the next query).
+
+class _VPTree:
+  """Vantage point tree over a list of strings.
+  """
+
+  EPS = 0.000000001  # To allow for rounding errors when sub-trees are skipped
+
+  def __init__(self, str_list, dist_funct):
+    """Build the tree using the given distance function, which must have two
+       strings as input and return their distance.
+    """
+
+    self.str_list = str_list
+
+    num_str = len(str_list)
+
+    self.num_dist_calc = 0  # Count the number of distance calculations
+
+    self.node_mu =      array.array('d', [0.0])*num_str  # Median distances
+    self.node_inside =  array.array('l', [-1])*num_str   # Sub-tree nodes
+    self.node_outside = array.array('l', [-1])*num_str
+    self.node_parent =  array.array('l', [-1])*num_str
+    self.node_num_str = array.array('l', [0])*num_str    # Strings left in
+                                                         # sub-trees
+    self.str_left =     array.array('b', [1])*num_str    # 0 once removed
+
+    self.root =         -1
+    self.num_tree_str = 0  # Number of strings the tree was built with
+
+    self.__build__(range(num_str), dist_funct)
+
+  # ---------------------------------------------------------------------------
+
+  def __build__(self, str_num_list, dist_funct):
+    """Build the tree from the given list of string numbers.
+    """
+
+    str_list = self.str_list  # Shorthand
+
+    self.root =         -1
+    self.num_tree_str = len(str_num_list)
+
+    if (str_num_list == []):
+      return
+
+    # Each stack element contains the parent node, the side (0 for inside, 1
+    # for outside) and the strings of a sub-tree, sorted by their distance to
+    # the parent node. The string furthest away becomes the vantage point.
+    #
+    stack = [(-1, 0, str_num_list)]
+
+    while (stack != []):
+      (parent, side, str_num_list) = stack.pop()
+
+      node = str_num_list[-1]
+      if (parent == -1):
+        self.root = node
+      elif (side == 0):
+        self.node_inside[parent] = node
+      else:
+        self.node_outside[parent] = node
+      self.node_parent[node] =  parent
+      self.node_num_str[node] = len(str_num_list)
+      self.node_inside[node] =  -1
+      self.node_outside[node] = -1
+
+      if (len(str_num_list) == 1):
+        continue
+
+      node_str = str_list[node]
+      dist_list = [(dist_funct(node_str, str_list[str_num]), str_num) for \
+                   str_num in str_num_list[:-1]]
+      self.num_dist_calc += len(dist_list)
+      dist_list.sort()
+
+      # Strings in the inside sub-tree have a distance equal to or smaller than
+      # the median, strings in the outside sub-tree equal to or larger
+      #
+      mid = len(dist_list) / 2
+      self.node_mu[node] = dist_list[mid][0]
+
+      if (mid > 0):
+        stack.append((node, 0, [str_num for (dist, str_num) in \
+                                dist_list[:mid]]))
+      stack.append((node, 1, [str_num for (dist, str_num) in \
+                              dist_list[mid:]]))
+
+  # ---------------------------------------------------------------------------
+
+  def __len__(self):
+    """Return the number of strings left in the tree.
+    """
+
+    if (self.root == -1):
+      return 0
+    return self.node_num_str[self.root]
+
+  # ---------------------------------------------------------------------------
+
+  def is_left(self, str_num):
+    """Return True if the given string has not been removed from the tree.
+    """
+
+    return (self.str_left[str_num] == 1)
+
+  # ---------------------------------------------------------------------------
+
+  def remove(self, str_num):
+    """Remove the given string from the tree.
+    """
+
+    if (self.str_left[str_num] == 0):
+      return
+    self.str_left[str_num] = 0
+
+    node = str_num
+    while (node != -1):
+      self.node_num_str[node] -= 1
+      node = self.node_parent[node]
+
+  # ---------------------------------------------------------------------------
+
+  def __check_rebuild__(self, dist_funct):
+    """Rebuild the tree from the strings left if more than half of the
+       strings it was built with have been removed.
+    """
+
+    if (2*len(self) < self.num_tree_str):
+      self.__build__([j for j in xrange(len(self.str_list)) if \
+                      self.str_left[j] == 1], dist_funct)
+
+  # ---------------------------------------------------------------------------
+
+  def range_query(self, query_str, radius, dist_funct):
+    """Return a list with tuples (distance, string number) of all strings left
+       in the tree that have a distance to the query string of at most the
+       given radius.
+    """
+
+    EPS = self.EPS
+
+    self.__check_rebuild__(dist_funct)
+
+    str_list =     self.str_list  # Shorthands
+    node_mu =      self.node_mu
+    node_inside =  self.node_inside
+    node_outside = self.node_outside
+    node_num_str = self.node_num_str
+    str_left =     self.str_left
+
+    result_list = []
+
+    if (len(self) == 0):
+      return result_list
+
+    stack = [self.root]  # Only sub-trees with strings left are pushed
+
+    while (stack != []):
+      node = stack.pop()
+
+      dist = dist_funct(query_str, str_list[node])
+      self.num_dist_calc += 1
+
+      if ((str_left[node] == 1) and (dist <= radius)):
+        result_list.append((dist, node))
+
+      mu =      node_mu[node]
+      inside =  node_inside[node]
+      outside = node_outside[node]
+      if ((inside != -1) and (node_num_str[inside] > 0) and
+          (dist - radius <= mu + EPS)):
+        stack.append(inside)
+      if ((outside != -1) and (node_num_str[outside] > 0) and
+          (dist + radius >= mu - EPS)):
+        stack.append(outside)
+
+    return result_list
+
+  # ---------------------------------------------------------------------------
+
+  def nearest(self, query_str, k, dist_funct):
+    """Return a list with tuples (distance, string number) of the k nearest
+       strings left in the tree to the query string, plus all other strings
+       with the same distance as the k-th nearest one (or all strings left if
+       less than k are left).
+    """
+
+    EPS = self.EPS
+
+    self.__check_rebuild__(dist_funct)
+
+    str_list =     self.str_list  # Shorthands
+    node_mu =      self.node_mu
+    node_inside =  self.node_inside
+    node_outside = self.node_outside
+    node_num_str = self.node_num_str
+    str_left =     self.str_left
+
+    if (len(self) == 0):
+      return []
+
+    cand_list =    []    # All strings left compared with the query string
+    nearest_heap = []    # Negative distances of the k nearest strings so far
+    max_dist =     None  # Distance of k-th nearest string (once k found)
+
+    # Each stack element contains a node and a lower bound of the distances
+    # of the strings in its sub-tree to the query string
+    #
+    stack = [(self.root, 0.0)]  # Only sub-trees with strings left are pushed
+
+    while (stack != []):
+      (node, min_dist) = stack.pop()
+
+      if ((max_dist != None) and (min_dist > max_dist + EPS)):
+        continue
+
+      dist = dist_funct(query_str, str_list[node])
+      self.num_dist_calc += 1
+
+      if (str_left[node] == 1):
+        cand_list.append((dist, node))
+        if (len(nearest_heap) < k):
+          heapq.heappush(nearest_heap, -dist)
+        elif (dist < -nearest_heap[0]):
+          heapq.heapreplace(nearest_heap, -dist)
+        if (len(nearest_heap) == k):
+          max_dist = -nearest_heap[0]
+
+      mu =      node_mu[node]
+      inside =  node_inside[node]
+      outside = node_outside[node]
+      if ((inside != -1) and (node_num_str[inside] == 0)):
+        inside = -1
+      if ((outside != -1) and (node_num_str[outside] == 0)):
+        outside = -1
+
+      inside_min_dist =  max(min_dist, dist - mu)
+      outside_min_dist = max(min_dist, mu - dist)
+
+      # Search the sub-tree on the same side as the query string first
+      #
+      if (dist <= mu):
+        if (outside != -1):
+          stack.append((outside, outside_min_dist))
+        if (inside != -1):
+          stack.append((inside, inside_min_dist))
+      else:
+        if (inside != -1):
+          stack.append((inside, inside_min_dist))
+        if (outside != -1):
+          stack.append((outside, outside_min_dist))
+
+    # All strings within the k-th nearest distance have been compared, as only
+    # sub-trees further away than the k-th nearest distance found so far (and
+    # thus also further than the final one) have been skipped
+    #
+    max_dist = -nearest_heap[0]
+
+    return [(cand_dist, str_num) for (cand_dist, str_num) in cand_list if \
+            cand_dist <= max_dist]
+
+
+# =============================================================================
+
+class Indexing:
+  """Base class for indexing. Handles index initialisation, as well as saving
+     and loading of indices to/from files.
+
+     Indexing (or blocking as it is called in traditional record linkage) is
+     used to reduce the large number of possible record pair comparisons by
+     grouping together records into 'blocks' that are similar according to some
+     criteria.
+
+     Indices have to be defined when an index is initialised. Basically, an
+     index is specific to two fields (one per data set). An index definition is
+     made of a list containing one or more sub-lists each made of:
+
+     1) The name of a field from data set 1 which is used for the index.
+
+     2) The name of a field from data set 2 which is used for the index.
+
+     3) A flag, if set to True and the index value contains more than one word
+        (i.e. contains whitespace characters), then these words will be sorted
+        first (before being possibly reversed and then encoded). For example,
+        a value 'peter a. christen' would be sorted into 'a. christen peter'.
+        If set to False, no such sorting will be done.
+
+     4) A flag, if set to True the index variable (assumed to be a string) will
+        be reversed before it is used within an index definition, if set to
+        False it is not reversed.
+
+     5) A positive integer specifying the maximum length (in characters) of the
+        index variable; or None (no maximum length of the index variable).
+
+     6) A list made of a function and its input parameters that will be applied
+        to the data set field values to create an index variable. If this list
+        is empty (or no list is given but None instead), then the field values
+        will be taken directly as index
+        variables.
+        The function can be any function that has a string as its first input
+        argument and returns a string.
+
+     The final index variable values are the concatenated values (possibly with
+     a separator string between as detailed below) of each of the index
+     definitions.
+
+     Here is an example index definition:
+
+       index_def_1 = [['surname','sname',True,True,None,[encode.soundex]],
+                      ['postcode','zipcode',False,False,3,[]]]
+
+     For this index, index variables will be the concatenations of the Soundex
+     encoding of the sorted (if containing more than one word) reversed
+     surnames (fields 'surname' in data set 1 and field 'sname' in data set 2)
+     and the first three characters (digits) from the fields 'postcode' from
+     data set 1 and 'zipcode' from data set 2.
+
+     So for a record ['peter','meier','2000','sydney'] in data set 1 and a
+     record ['paul','meyer','2010','sydney south'] the following two index
+     variable values will be constructed (and inserted into the index data
+     structure):
+
+       ['peter','meier','2000',sydney'] ->       'r500'+'200' -> 'r500200'
+       ['paul','meyer','2010','sydney south'] -> 'r500'+'201' -> 'r500201'
+
+     So these two records will (depending upon the index implementation) likely
+     be put into different 'blocks' and therefore not being compared.
+
+     Here is another example:
+
+       index_def_2 = \
+          [['year_of_birth','yob',False,False,None,[encode.get_substring,3,5]],
+           ['locality_name','loc_name',True,True,None,[encode.dmetaphone, 4]]]
+
+     In this example, the third and fourth year digits extracted from the
+     fields 'year_of_birth' (from data set 1) and 'yob' (from data set 2) will
+     be concatenated with the Double-Metaphone encoding (first 4 characters of
+     the encoding only) of the sorted and reversed values from the fields
+     'locality_name' (from data set 1) and 'loc_name' (from data set 2).
+
+     The final index definition given to an index when it is initialised is a
+     list of index definitions, for example:
+
+       full_index = indexing.BlockingIndex(description = 'Example full index',
+                                           dataset1 = example_csv_data_set,
+                                           dataset2 = example_csv_data_set,
+                                           index_def = [index_def_1,
+                                                        index_def_2],
+                                           index_sep_str = ' ',
+                                           rec_comparator = example_rec_comp)
+
+     In this example, two indices will be built according to the two index
+     definitions provided.
+
+     All index classed have the following instance variables, which can be set
+     when an index is initialised:
+
+       description      A string describing the index
+       dataset1         The first data set the index is built for
+       dataset2         The second data set the index is built for
+       rec_comparator   The record comparator
+       index_def        Definitions of the indexes as described above
+       index_sep_str    A separator string which will be inserted if an index
+                        is made of more than one value. Default is the empty
+                        string ''.
+       skip_missing     A flag, if set to True records which have empty index
+                        variable values will be skipped over, if set to False a
+                        record with an empty indexing variable value will be
+                        included in the index as well. Default value is True
+       log_funct        This can be a Python function or method which will log
+                        (print or save to a file) a progress report message. It
+                        is assumed that this function or method has one input
+                        argument of type string (the message to be printed).
+                        Default is None, in which case the normal logging
+                        module will be used.
+       progress_report  Can be set to a percentage number between 1 and 50 in
+                        which case a progress report is logged during the
+                        record pair comparison stage (in the run() method)
+                        every selected percentage number. Default values is 10.
+                        If set to None no progress report will be logged.
+       weight_vec_file  If this is set to a string (assumed to be a file name)
+                        then the weight vectors will be written into this file
+                        and NOT stored in the weight_vector dictionary. Each
+                        weight vector is a comma separated line containing:
+                          rec_id1, rec_id2, weight1, weight2, ... weightN
+                        Default value is None, in which case the weight vectors
+                        will not be written into a file but returned as a
+                        dictionary.
+       index_cache_size The maximum number of field values (and the index
+                        values generated from them) that are cached for each
+                        index definition that contains a function (like an
+                        encoding function), so that the function does not
+                        have to be called again for a field value that has
+                        been seen before. If the cache is full the least
+                        recently used field value is removed. The number of
+                        cache hits and misses can be obtained with the
+                        get_index_stats() method. If set to None no caching
+                        is done. Default value is 10000.
+       weight_vec_store A flag, if set to True the weight vectors returned by
+                        the run() method are stored in a weight vector store
+                        (see module weightvec.py) instead of a dictionary. A
+                        weight vector store keeps the weights in a NumPy array
+                        and needs much less memory than a dictionary, but it
+                        can be accessed in the same way. Default value is
+                        False.
+       stream_pairs     A flag, if set to True the record pairs will not be
+                        collected into a record pair dictionary in the
+                        compact() method, but instead be generated block by
+                        block while the comparisons are done in the run()
+                        method. Duplicate record pairs (that occur in blocks of
+                        more than one index) are removed by only comparing a
+                        record pair in the first index where both records are
+                        in the same block. Memory usage therefore depends upon
+                        the size of the largest block rather than the total
+                        number of record pairs. Until the run() method has
+                        been called, the number of record pairs is only an
+                        estimate that includes these duplicate record pairs.
+                        Default value is False. Currently only supported by
+                        the BlockingIndex.
+       num_processes    The number of processes used to compare record pairs
+                        in the run() method. If set to a value larger than 1,
+                        record pairs are split into chunks that are compared
+                        by a pool of worker processes (each with its own copy
+                        of the record caches and the record comparator), and
+                        the resulting weight vectors are merged in the same
+                        order as they would be produced by a single process.
+                        Note that the field comparator caches of the worker
+                        processes are not merged back. The DedupIndex instead
+                        partitions its records by blocking keys into the
+                        worker processes. Default value is 1.
+       intern_rec_ids   A flag, if set to True the record identifiers are
+                        replaced with integer record numbers (starting from 0
+                        in the order the records are read from a data set)
+                        when the index is built. The record caches then become
+                        lists, the blocks are stored as arrays of integers, and
+                        the record pairs in the weight vector dictionary
+                        returned by run() are tuples of record numbers. The
+                        original record identifiers are available in the lists
+                        'rec_ident_list1' and 'rec_ident_list2', and they are
+                        used when a weight vector file is written. To write
+                        match data sets or match status files use the
+                        'rec_ident_lists' argument of the corresponding
+                        functions in the output module. Cannot be used with
+                        file based record caches. Default value is
+                        False. Only supported by indices which build their
+                        index using an inverted index.
+       incremental      A flag, if set to True the blocks of the index are
+                        kept when the index is compacted, so that the records
+                        of new data sets can later be added to the index with
+                        the add_records() method. After this, only record
+                        pairs that contain at least one new record will be
+                        compared. Cannot be used together with the
+                        'stream_pairs' argument. Default value is False.
+                        Currently only supported by the BlockingIndex.
+       meta_blocking    If set to a tuple (weight_scheme, pruning_scheme) the
+                        record pairs are pruned before they are compared (so
+                        called meta-blocking). All record pairs form a graph
+                        with the records as nodes, and each pair (edge) is
+                        weighted by the blocks the two records have in common.
+                        The weighting scheme can be 'cbs' (the number of
+                        common blocks), 'ecbs' (the number of common blocks,
+                        multiplied with the logarithms of the total number of
+                        blocks divided by the number of blocks of each
+                        record), or 'jaccard' (the number of common blocks
+                        divided by the number of blocks of either record).
+                        With the pruning scheme 'wep' (weight edge pruning)
+                        all record pairs with a weight below the average
+                        weight are removed. With 'cnp' (cardinality node
+                        pruning) for each record only the record pairs with
+                        the k largest weights are kept, and a record pair is
+                        kept if it is kept for either of its records. The
+                        value of k can be given as a third tuple element,
+                        otherwise it is set to the average number of record
+                        pairs per record (but at least one). The pruning
+                        is done by the meta_block() method, or before the
+                        comparisons in the run() method. Cannot be used
+                        together with the 'stream_pairs' or 'incremental'
+                        arguments. Default value is None (no meta-blocking).
+                        Only supported by indices which generate their record
+                        pairs from blocks.
+       index1_shelve_name  If this is set to a file name, the blocks of the
+       index2_shelve_name  inverted index built for data set 1 (or 2) are not
+                        kept in memory but in a disk store with this file
+                        name. Records are appended to the blocks in batches.
+                        Default value is None.
+       rec_cache1_file_name  If this is set to a file name, the record cache
+       rec_cache2_file_name  for data set 1 (or 2) is kept in a disk store
+                        with this file name. Default value is None.
+       disk_store       The class used for disk stores, see module
+                        diskstore.py for the methods it needs to provide. Any
+                        existing file with the name of a disk store is
+                        removed when the index is initialised. Default is
+                        the SQLiteStore class.
+
+     Note that skip_missing cannot be set to False for certain index methods,
+     see their documentation for more details.
+
+     Indices which build their index using an inverted index can be saved into
+     a binary file with the save() method once they are built (or compacted),
+     and be loaded again with the load() method of an index which has been
+     initialised with the same arguments. The file contains the inverted
+     indices (as arrays of record numbers), the record caches and any further
+     index specific data structures, as well as the size and modification time
+     of the data set files, so that an index is only loaded if its data sets
+     have not been changed since it was saved.
+
+     Both the data sets and the index definitions must be provided when a index
+     is initialised.
+
+     If true matches are known for the data sets, the learn_index_def()
+     method can be used to select index definitions built from the fields
+     used by the record comparator. The selected index definitions can then
+     be used to initialise a new index.
+  """
+
+  supports_stream_pairs = False  # Set to True in derived classes which can
+                                 # generate their record pairs block by block
+  supports_intern_rec_ids = False  # Set to True in derived classes which can
+                                   # use integer record numbers
+  supports_save = False  # Set to True in derived classes which can be saved
+                         # and loaded with the save() and load() methods
+  saved_attr_list = []   # Names of index specific attributes that are saved
+  supports_incremental = False  # Set to True in derived classes which can
+                                # compare only the pairs of added records
+  supports_meta_blocking = False  # Set to True in derived classes which
+                                  # generate their record pairs block by
+                                  # block with the __dedup_rec_pairs__() and
+                                  # __link_rec_pairs__() methods
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, base_kwargs):
+    """Constructor
+    """
+
+    # General attributes for all index implementations
+    #
+    self.description =     ''
+    self.dataset1 =        None
+    self.dataset2 =        None
+    self.rec_comparator =  None  # A record comparator
+    self.index_def =       None  # The index definitions
+    self.index_sep_str =   ''    # Separator string for in-between index values
+    self.skip_missing =    True
+    self.progress_report = 10
+    self.log_funct =       None
+    self.weight_vec_file = None
+    self.weight_vec_store = False
+    self.stream_pairs =    False
+    self.num_processes =   1
+    self.intern_rec_ids =  False
+    self.index_cache_size = 10000
+    self.incremental =     False
+    self.meta_blocking =   None
+    self.disk_store =      diskstore.SQLiteStore
+
+    self.index_def_proc = None        # Processed version of the index
+                                      # definition for faster access to field
+                                      # values
+    self.index_key_funct_list = None  # For each index definition a function
+                                      # which generates the index value of a
+                                      # field value
+    self.index_cache_stats = None     # For each index definition a list with
+                                      # the number of cache hits and misses
+    self.index1 = {}                  # The index data structure for data set 1
+    self.index2 = {}                  # The index data structure for data set 2
+    self.index1_shelve_name = None    # If the index data structure for data
+                                      # set 1 is to be file (shelve) based this
+                                      # will be it's file name
+    self.index2_shelve_name = None    # Same for data set 2
+    self.index1_store = None          # The disk store for the index data
+    self.index2_store = None          # structures (if file based)
+    self.rec_cache1 = {}              # A dictionary containing all records
+                                      # from data set 1 with only the fields
+                                      # needed for field comparisons
+    self.rec_cache2 = {}              # Same for data set 2
+    self.rec_cache1_file_name = None  # If the record cache for data sets 1
+                                      # should be file (shelve) based this will
+                                      # be it's file name
+    self.rec_cache2_file_name = None  # Same for data sets 2
+    self.num_rec_pairs = None         # The number of record pairs that will be
+                                      # compared when the run() method is
+                                      # called
+    self.do_deduplication = None      # A Flag, set to True if both data sets
+                                      # are the same
+    self.comp_field_used1 = []        # A list of the fields in data set 1 as
+                                      # used by the record comparator (column
+                                      # indices)
+    self.comp_field_used2 = []        # Same for data set 2
+    self.rec_length_cache = {}        # Used in lenth filtering in run() method
+    self.rec_index_vals1 = {}         # If record pairs are streamed, the index
+                                      # variable values of all records from
+                                      # data set 1 (one per index definition)
+    self.rec_index_vals2 = {}         # Same for data set 2
+    self.rec_ident_list1 = []         # If record identifiers are interned,
+                                      # the original record identifiers from
+                                      # data set 1 (the list index is the
+                                      # record number)
+    self.rec_ident_list2 = []         # Same for data set 2
+    self.new_block_dicts = None       # If records have been added to an
+                                      # incremental index, for each index a
+                                      # dictionary with the values of the
+                                      # blocks that contain new records, and
+                                      # the lengths these blocks had before
+    self.meta_pair_count_dict = {}    # If meta-blocking is used, for each
+                                      # record pair the number of blocks the
+                                      # two records have in common
+    self.meta_rec_count_dict1 = {}    # If meta-blocking is used, for each
+                                      # record from data set 1 the number of
+                                      # blocks it is in
+    self.meta_rec_count_dict2 = {}    # Same for data set 2
+    self.meta_num_blocks = 0          # The number of blocks counted for
+                                      # meta-blocking
+    self.meta_pruned = False          # A flag, set to True once the record
+                                      # pairs have been pruned by meta-blocking
+
+    # Process base keyword arguments (all data set specific keywords were
+    # processed in the derived class constructor)
+    #
+    for (keyword, value) in base_kwargs.items():
+
+      if (keyword.startswith('desc')):
+        auxiliary.check_is_string('description', value)
+        self.description = value
+
+      elif (keyword == 'dataset1'):
+        auxiliary.check_is_list('Dataset 1 field list', value.field_list)
+        self.dataset1 = value
+      elif (keyword == 'dataset2'):
+        auxiliary.check_is_list('Dataset 2 field list', value.field_list)
+        self.dataset2 = value
+
+      elif (keyword.startswith('index_d')):
+        auxiliary.check_is_list('index_def', value)
+        self.index_def = value
+
+      elif (keyword.startswith('index_sep')):
+        auxiliary.check_is_string('index_sep_str', value)
+        self.index_sep_str = value
+
+      elif (keyword.startswith('index1_she')):
+        auxiliary.check_is_string('index1_shelve_name', value)
+        self.index1_shelve_name = value
+      elif (keyword.startswith('index2_she')):
+        auxiliary.check_is_string('index2_shelve_name', value)
+        self.index2_shelve_name = value
+
+      elif (keyword.startswith('rec_cache1_f')):
+        auxiliary.check_is_string('rec_cache1_file_name', value)
+        self.rec_cache1_file_name = value
+      elif (keyword.startswith('rec_cache2_f')):
+        auxiliary.check_is_string('rec_cache2_file_name', value)
+        self.rec_cache2_file_name = value
+
+      elif (keyword.startswith('rec_com')):
+        self.rec_comparator = value
+
+      elif (keyword.startswith('skip')):
+        auxiliary.check_is_flag('skip_missing', value)
+        self.skip_missing = value
+
+      elif (keyword.startswith('progr')):
+        if (value == None):
+          self.progress_report = value
+        else:
+          auxiliary.check_is_integer('progress_report', value)
+          if ((value < 1) or (value > 50)):
+            logging.exception('Illegal value for progress report, must be ' + \
+                              'False or between 1 and 50: "%s"' % \
+                              (str(value)))
+            raise Exception
+          self.progress_report = value
+
+      elif (keyword.startswith('log_f')):
+        auxiliary.check_is_function_or_method('log_funct', value)
+        self.log_funct =  value
+
+      elif (keyword.startswith('weight_vec_s')):
+        auxiliary.check_is_flag('weight_vec_store', value)
+        self.weight_vec_store = value
+
+      elif (keyword.startswith('weight_v')):
+        if (value != None):
+          auxiliary.check_is_string('weight_vec_file', value)
+        self.weight_vec_file = value
+
+      elif (keyword.startswith('stream')):
+        auxiliary.check_is_flag('stream_pairs', value)
+        self.stream_pairs = value
+
+      elif (keyword.startswith('num_proc')):
+        auxiliary.check_is_integer('num_processes', value)
+        auxiliary.check_is_positive('num_processes', value)
+        self.num_processes = value
+
+      elif (keyword.startswith('intern')):
+        auxiliary.check_is_flag('intern_rec_ids', value)
+        self.intern_rec_ids = value
+
+      elif (keyword.startswith('index_ca')):
+        if (value != None):
+          auxiliary.check_is_integer('index_cache_size', value)
+          auxiliary.check_is_positive('index_cache_size', value)
+        self.index_cache_size = value
+
+      elif (keyword.startswith('increm')):
+        auxiliary.check_is_flag('incremental', value)
+        self.incremental = value
+
+      elif (keyword.startswith('meta_b')):
+        if (value != None):
+          auxiliary.check_is_tuple('meta_blocking', value)
+          if ((len(value) not in [2,3]) or \
+              (value[0] not in ['cbs', 'ecbs', 'jaccard']) or \
+              (value[1] not in ['wep', 'cnp'])):
+            logging.exception('Value of "meta_blocking" must be a tuple ' + \
+                              'with a weighting scheme ("cbs", "ecbs" or ' + \
+                              '"jaccard") and a pruning scheme ("wep" or ' + \
+                              '"cnp"): %s' % (str(value)))
+            raise Exception
+          if (len(value) == 3):
+            if (value[1] != 'cnp'):
+              logging.exception('Only the "cnp" pruning scheme of ' + \
+                                '"meta_blocking" takes a number of ' + \
+                                'edges: %s' % (str(value)))
+              raise Exception
+            auxiliary.check_is_integer('meta_blocking number of edges',
+                                       value[2])
+            auxiliary.check_is_positive('meta_blocking number of edges',
+                                        value[2])
+        self.meta_blocking = value
+
+      elif (keyword.startswith('disk_s')):
+        if (not callable(value)):
+          logging.exception('Value of "disk_store" is not a class: %s' % \
+                            (str(value)))
+          raise Exception
+        self.disk_store = value
+
+      else:
+        logging.exception('Illegal constructor argument keyword: '+keyword)
+        raise Exception
+
+    # Check if the needed attributes are set  - - - - - - - - - - - - - - - - -
+    #
+    auxiliary.check_is_list('index_def', self.index_def)
+    auxiliary.check_is_not_none('rec_comparator', self.rec_comparator)
+    auxiliary.check_is_not_none('Dataset 1', self.dataset1)
+    auxiliary.check_is_not_none('Dataset 2', self.dataset2)
+    auxiliary.check_is_list('Dataset 1 field list', self.dataset1.field_list)
+    auxiliary.check_is_list('Dataset 2 field list', self.dataset2.field_list)
+
+    if ((self.stream_pairs == True) and (self.supports_stream_pairs == False)):
+      logging.exception('Record pair streaming is not supported by index ' + \
+                        'class %s' % (self.__class__.__name__))
+      raise Exception
+
+    if (self.intern_rec_ids == True):
+      if (self.supports_intern_rec_ids == False):
+        logging.exception('Interning of record identifiers is not ' + \
+                          'supported by index class %s' % \
+                          (self.__class__.__name__))
+        raise Exception
+      if ((self.rec_cache1_file_name != None) or \
+          (self.rec_cache2_file_name != None)):
+        logging.exception('Interning of record identifiers cannot be used ' + \
+                          'with file based record caches')
+        raise Exception
+
+      self.rec_cache1 = []  # Record caches are indexed by record numbers
+      self.rec_cache2 = []
+
+    if (self.incremental == True):
+      if (self.supports_incremental == False):
+        logging.exception('Incremental indexing is not supported by index ' \
+                          + 'class %s' % (self.__class__.__name__))
+        raise Exception
+      if (self.stream_pairs == True):
+        logging.exception('Incremental indexing cannot be used with ' + \
+                          'streamed record pairs')
+        raise Exception
+
+    if (self.meta_blocking != None):
+      if (self.supports_meta_blocking == False):
+        logging.exception('Meta-blocking is not supported by index class ' + \
+                          '%s' % (self.__class__.__name__))
+        raise Exception
+      if ((self.stream_pairs == True) or (self.incremental == True)):
+        logging.exception('Meta-blocking cannot be used with streamed ' + \
+                          'record pairs or incremental indexing')
+        raise Exception
+
+    # Check if the data sets in the record comparator are the same as the ones
+    # give in the index
+    #
+    if (self.rec_comparator.dataset1 != self.dataset1):
+      logging.exception('Data set 1 in record comparator is different from' + \
+                        ' data set 1 in index: "%s" / "%s"' % \
+                        (self.rec_comparator.dataset1, self.dataset1))
+      raise Exception
+    if (self.rec_comparator.dataset2 != self.dataset2):
+      logging.exception('Data set 2 in record comparator is different from' + \
+                        ' data set 2 in index: "%s" / "%s"' % \
+                        (self.rec_comparator.dataset2, self.dataset2))
+      raise Exception
+
+    # Check if a deduplication will be done or a linkage - - - - - - - - - - -
+    #
+    if (self.dataset1 == self.dataset2):
+      self.do_deduplication = True
+      self.rec_ident_list2 = self.rec_ident_list1
+    else:
+      self.do_deduplication = False
+
+    # If indices or record caches are file based open the disk stores - - - -
+    # (data structures with the same file name are put into the same store)
+    #
+    disk_store_dict = {}
+
+    for file_name in [self.index1_shelve_name, self.index2_shelve_name,
+                      self.rec_cache1_file_name, self.rec_cache2_file_name]:
+      if ((file_name != None) and (file_name not in disk_store_dict)):
+        disk_store_dict[file_name] = self.disk_store(file_name)
+
+    if (self.index1_shelve_name != None):
+      self.index1_store = disk_store_dict[self.index1_shelve_name]
+    if (self.index2_shelve_name != None):
+      self.index2_store = disk_store_dict[self.index2_shelve_name]
+    if (self.rec_cache1_file_name != None):
+      self.rec_cache1 = \
+        disk_store_dict[self.rec_cache1_file_name].record_dict('rec_cache1')
+    if (self.rec_cache2_file_name != None):
+      self.rec_cache2 = \
+        disk_store_dict[self.rec_cache2_file_name].record_dict('rec_cache2')
+
+    self.disk_store_list = disk_store_dict.values()
+
+    # Get the column indices of the fields used in the record comparator - - -
+    #
+    for (comp,f_ind1,f_ind2) in self.rec_comparator.field_comparison_list:
+      if (f_ind1 not in self.comp_field_used1):
+        self.comp_field_used1.append(f_ind1)
+      if (f_ind2 not in self.comp_field_used2):
+        self.comp_field_used2.append(f_ind2)
+    self.comp_field_used1.sort()
+    self.comp_field_used2.sort()
+
+    # Check if definition of indices is correct and fields are in the data sets
+    #
+    self.index_def_proc = []  # Checked and processed index definitions will be
+                              # added here
+    self.index_key_funct_list = []
+    self.index_cache_stats =    []
+
+    for index_def_list in self.index_def:
+
+      (index_def_list_proc, index_key_funct_list_proc,
+       index_cache_stats_proc) = self.__process_index_def__(index_def_list)
+
+      self.index_def_proc.append(index_def_list_proc)
+      self.index_key_funct_list.append(index_key_funct_list_proc)
+      self.index_cache_stats.append(index_cache_stats_proc)
+
+    assert len(self.index_def) == len(self.index_def_proc)
+
+    self.status = 'initialised'  # Status of the index (used by save and load
+                                 # methods)
+
+  # ---------------------------------------------------------------------------
+
+  def build(self):
+    """Method to build an index data structure.
+       See implementations in derived classes for details.
+    """
+
+    logging.exception('Override abstract method in derived class')
+    raise Exception
+
+  # ---------------------------------------------------------------------------
+
+  def __records_into_inv_index__(self):
+    """Load the records from the data sets and put them into an inverted index
+       data structure.
+
+       If both data sets are the same (a deduplication) only insert records
+       from one data set.
+
+       This method builds an inverted index (one per index definition) as a
+       Python dictionary with the keys being the indexing values (as returned
+       by the _get_index_values__() method.
+
+       If record identifiers are interned, the blocks are arrays of record
+       numbers instead of lists of record identifiers.
+    """
+
+    logging.info('Started to build inverted index:')
+
+    num_indices = len(self.index_def)
+
+    # Index data structure for blocks is one dictionary per index - - - - - - -
+    #
+    for i in range(num_indices):
+      self.index1[i] = self.__new_block_dict__(self.index1_store, 1, i)
+      self.index2[i] = self.__new_block_dict__(self.index2_store, 2, i)
+
+    self.new_block_dicts = None  # All records are new
+
+    # Index values of records are only needed to remove duplicate record pairs
+    # when these are streamed and there is more than one index
+    #
+    keep_index_vals = ((self.stream_pairs == True) and (num_indices > 1))
+
+    # A list of data structures needed for the build process:
+    # - the index data structure (dictionary)
+    # - the record cache
+    # - the data set to be read
+    # - the comparison fields which are used
+    # - a list index (0 for data set 1, 1 for data set 2)
+    # - the dictionary for the index values of records (if pairs are streamed)
+    # - the list of original record identifiers (if these are interned)
+    #
+    build_list = [(self.index1, self.rec_cache1, self.dataset1,
+                   self.comp_field_used1, 0, self.rec_index_vals1,
+                   self.rec_ident_list1)]
+
+    if (self.do_deduplication == False):  # If linkage append data set 2
+      build_list.append((self.index2, self.rec_cache2, self.dataset2,
+                   self.comp_field_used2, 1, self.rec_index_vals2,
+                   self.rec_ident_list2))
+
+    # Reading loop over all records in one or both data set(s) - - - - - - - -
+    #
+    for (index,rec_cache,dataset,comp_field_used_list,ds_index,
+         rec_index_vals,rec_ident_list) in build_list:
+
+      self.__read_into_inv_index__(index, rec_cache, dataset,
+                                   comp_field_used_list, ds_index,
+                                   rec_index_vals, rec_ident_list,
+                                   keep_index_vals)
+
+  # ---------------------------------------------------------------------------
+
+  def __read_into_inv_index__(self, index, rec_cache, dataset,
+                              comp_field_used_list, ds_index, rec_index_vals,
+                              rec_ident_list, keep_index_vals,
+                              new_block_dicts = None):
+    """Read all records from the given data set into the given record cache
+       and inverted index (a dictionary with one dictionary of blocks per
+       index definition). See the __records_into_inv_index__() method for a
+       description of the other arguments.
+
+       If 'new_block_dicts' is given (a list with one dictionary per index
+       definition), the records are added to an existing index. An exception
+       is raised if a record identifier is already in the record cache, and
+       for every block a new record is inserted into the length the block had
+       before records were added is kept in these dictionaries (as a list with
+       the lengths of the blocks of data set 1 and 2).
+    """
+
+    num_indices = len(self.index_def)
+
+    get_index_values_funct = self.__get_index_values__  # Shorthands
+    skip_missing =           self.skip_missing
+    intern_rec_ids =         self.intern_rec_ids
+
+    if ((new_block_dicts != None) and (intern_rec_ids == True)):
+      known_rec_ident_set = set(rec_ident_list)  # To check for duplicates
+
+    disk_index = isinstance(index[0], diskstore.SQLiteBlockDict)  # On disk
+
+    # Calculate a counter for the progress report
+    #
+    if (self.progress_report != None):
+      progress_report_cnt = max(1, int(dataset.num_records / \
+                                   (100.0 / self.progress_report)))
+    else:  # So no progress report is being logged
+      progress_report_cnt = dataset.num_records + 1
+
+    start_time = time.time()
+
+    rec_read = 0  # Number of records read from data set
+
+    for (rec_ident, rec) in dataset.readall(): # Read all records in data set
+
+      # Extract record fields needed for comparisons (set all others to '')
+      #
+      comp_rec = []
+
+      field_ind = 0
+      for field in rec:
+        if (field_ind in comp_field_used_list):
+          comp_rec.append(field.lower())  # Make them lower case
+        else:
+          comp_rec.append('')
+        field_ind += 1
+
+      if (new_block_dicts != None):  # Check the record is really new
+        if (intern_rec_ids == True):
+          rec_ident_known = (rec_ident in known_rec_ident_set)
+          known_rec_ident_set.add(rec_ident)
+        else:
+          rec_ident_known = (rec_ident in rec_cache)
+        if (rec_ident_known == True):
+          logging.exception('Record identifier "%s" from data set "%s" ' % \
+                            (str(rec_ident), dataset.description) + \
+                            'is already in the index')
+          raise Exception
+
+      if (intern_rec_ids == True):  # Replace identifier with record number
+        rec_ident_list.append(rec_ident)
+        rec_ident = len(rec_cache)
+        rec_cache.append(comp_rec)
+      else:
+        rec_cache[rec_ident] = comp_rec  # Put into record cache
+
+      # Now get the index variable values for this record - - - - - - - - - - -
+      #
+      rec_index_val_list = get_index_values_funct(rec, ds_index)
+
+      if (keep_index_vals == True):
+        rec_index_vals[rec_ident] = tuple(rec_index_val_list)
+
+      for i in range(num_indices):  # Put record identifier into all indices
+
+        this_index = index[i]  # Shorthand
+
+        block_val = rec_index_val_list[i]
+
+        if ((block_val != '') or (skip_missing == False)):
+
+          if (new_block_dicts != None):  # Keep old lengths of new blocks
+            if (block_val not in new_block_dicts[i]):
+              old_len_list = [len(self.index1[i].get(block_val, [])),
+                              len(self.index2[i].get(block_val, []))]
+              new_block_dicts[i][block_val] = old_len_list
+
+          if (disk_index == True):  # Only append the record identifier
+            this_index.append(block_val, rec_ident)
+
+          else:
+            if (block_val in this_index):
+              block_val_rec_list = this_index[block_val]
+            elif (intern_rec_ids == True):
+              block_val_rec_list = array.array('l')
+            else:
+              block_val_rec_list = []
+            block_val_rec_list.append(rec_ident)
+            this_index[block_val] = block_val_rec_list
+
+      rec_read += 1
+
+      if ((rec_read % progress_report_cnt) == 0):
+        self.__log_build_progress__(rec_read,dataset.num_records,start_time)
+
+    used_sec_str = auxiliary.time_string(time.time()-start_time)
+    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                         max(1, dataset.num_records))
+    logging.info('Read and indexed %d records in %s (%s per record)' % \
+                 (dataset.num_records, used_sec_str, rec_time_str))
+    logging.info('')
+
+  # ---------------------------------------------------------------------------
+
+  def __build_suffix_arrays__(self, padded, start_char, end_char):
+    """Load the records from the data sets into an inverted index (see the
+       __records_into_inv_index__() method), then build one suffix array
+       (with LCP array) per index definition over the distinct index variable
+       values of both data sets. If 'padded' is True the values are padded
+       with the given start and end characters.
+
+       The sorted lists of distinct index variable values are kept in
+       'suffix_array_vals', with the list position being the string number in
+       the corresponding suffix array in 'suffix_arrays'.
+    """
+
+    self.__records_into_inv_index__()  # Read records and put into index
+
+    num_indices = len(self.index_def)
+
+    self.suffix_arrays =     []
+    self.suffix_array_vals = []
+
+    logging.info('Build suffix arrays:')
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
+
+      index_val_set = set(self.index1[i].keys())
+      if (self.do_deduplication == False):
+        index_val_set.update(self.index2[i].keys())
+
+      index_val_list = sorted(index_val_set)
+      del index_val_set
+
+      if (padded == True):  # Add start and end characters
+        str_list = ['%s%s%s' % (start_char, index_val, end_char) for \
+                    index_val in index_val_list]
+      else:
+        str_list = index_val_list
+
+      suffix_array = _SuffixArray(str_list)
+      del str_list
+
+      self.suffix_arrays.append(suffix_array)
+      self.suffix_array_vals.append(index_val_list)
+
+      logging.info('  Built suffix array for index %d with %d values and ' % \
+                   (i, len(index_val_list)) + '%d suffixes in %s' % \
+                   (len(suffix_array),
+                    auxiliary.time_string(time.time()-istart_time)))
+
+  # ---------------------------------------------------------------------------
+
+  def add_records(self, new_dataset1 = None, new_dataset2 = None):
+    """Add the records from one or two new data sets into an index which has
+       been built (or compacted, or loaded from a file) with the 'incremental'
+       flag set to True.
+
+       The new data sets must have the same fields as the data sets the index
+       was initialised with, and their record identifiers must be different
+       from the identifiers of all records already in the index. For a
+       deduplication only 'new_dataset1' can be given, for a linkage new
+       records can be added to one or both data sets.
+
+       All records added since the index was last compacted are new records
+       (if the index has not been compacted since it was built, all its
+       records are new). When the index is compacted again, only record pairs
+       that contain at least one new record are generated, so the run()
+       method only compares these record pairs. The weight vectors of the old
+       record pairs can be given to the run() method, and the weight vectors
+       of the new record pairs will be added to them.
+    """
+
+    if (self.incremental == False):
+      logging.exception('Index "%s" is not incremental, records cannot ' % \
+                        (self.description) + 'be added')
+      raise Exception
+
+    if (self.status not in ['built', 'compacted']):
+      logging.exception('Index "%s" has not been built, adding records is ' \
+                        % (self.description) + 'not possible')
+      raise Exception
+
+    if ((self.do_deduplication == True) and (new_dataset2 != None)):
+      logging.exception('Only records for data set 1 can be added to a ' + \
+                        'deduplication index')
+      raise Exception
+
+    logging.info('')
+    logging.info('Add records to index: "%s"' % (self.description))
+
+    num_indices = len(self.index_def)
+
+    # Records added previously are not new anymore once the index has been
+    # compacted. If the index has not been compacted since it was built, the
+    # block dictionaries stay None as all records are still new.
+    #
+    if (self.status == 'compacted'):
+      self.new_block_dicts = []
+      for i in range(num_indices):
+        self.new_block_dicts.append({})
+
+    keep_index_vals = ((self.stream_pairs == True) and (num_indices > 1))
+
+    for (new_dataset, dataset, index, rec_cache, comp_field_used_list,
+         ds_index, rec_index_vals, rec_ident_list) in \
+        [(new_dataset1, self.dataset1, self.index1, self.rec_cache1,
+          self.comp_field_used1, 0, self.rec_index_vals1,
+          self.rec_ident_list1),
+         (new_dataset2, self.dataset2, self.index2, self.rec_cache2,
+          self.comp_field_used2, 1, self.rec_index_vals2,
+          self.rec_ident_list2)]:
+
+      if (new_dataset == None):
+        continue
+
+      auxiliary.check_is_list('New data set field list',
+                              new_dataset.field_list)
+
+      field_names =     [field_name for (field_name, field_data) in \
+                         dataset.field_list]
+      new_field_names = [field_name for (field_name, field_data) in \
+                         new_dataset.field_list]
+      if (new_field_names != field_names):
+        logging.exception('Data set "%s" has different fields than data ' % \
+                          (new_dataset.description) + 'set "%s": %s / %s' % \
+                          (dataset.description, str(new_field_names),
+                           str(field_names)))
+        raise Exception
+
+      self.__read_into_inv_index__(index, rec_cache, new_dataset,
+                                   comp_field_used_list, ds_index,
+                                   rec_index_vals, rec_ident_list,
+                                   keep_index_vals, self.new_block_dicts)
+
+    self.status = 'built'  # Index has to be compacted again
+
+  # ---------------------------------------------------------------------------
+  # Get sub-list functions are used for the q-gram and BigMatch index
+
+  def __get_sublists1__(self, in_list, min_len):
+    """An iterative method to compute all combinations of sub-lists of the list
+       'in_list' of lengths down to 'min_len'.
+
+       This routine seems to be faster for larger 'min_len' values (compared to
+       length of the input list), i.e. which would correspond to less deep
+       recursive levels (that correspond to higher threshold values) compared
+       to the recursive method using sets given below.
+    """
+
+    all_list = [in_list]
+    in_len =   len(in_list)
+
+    if (in_len > min_len):
+
+      for i in xrange(in_len):
+
+        sub_list = in_list[:i]+in_list[i+1:]
+
+        if (sub_list not in all_list):
+          all_list.append(sub_list)
+
+        if ((in_len-1) > min_len):
+          for sub_sub_list in self.__get_sublists1__(sub_list, min_len):
+
+            if (sub_sub_list not in all_list):
+              all_list.append(sub_sub_list)
+
+    return all_list
+
+  # ---------------------------------------------------------------------------
+
+  def __get_sublists2__(self, in_list, min_len):
+    """Method to recursively compute all combinations of sub-lists of the list
+       'in_list' of lengths down to 'min_len' using a Python generator.
+
+       This routine seems to be faster for deeper recursive levels (that
+       correspond to lower threshold values) compared to the iterative method
+       using sets given above.
+    """
+
+    unique_combinations_funct = self.__unique_combinations2__  # Shorthand
+
+
+    all_list = [in_list]
+    in_len =   len(in_list)
+
+    for i in xrange(in_len-1, min_len-1, -1):
+
+      for sub_list in unique_combinations_funct(in_list, i):
+        if (sub_list not in all_list):
+          all_list.append(sub_list)
+
+    return all_list
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __unique_combinations__(self, in_list, n):
+    """Get unique combinations of length 'n' of the given input list. Based on
+       a recipe from Activestate Python cookbook, see:
+
+       http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/190465
+    """
+
+    unique_combinations_funct = self.__unique_combinations__  # Shorthand
+
+    if (n == 0):
+      yield []
+    else:
+      for i in xrange(len(in_list)):
+        for sub_list in unique_combinations_funct(in_list[i+1:],n-1):
+          yield [in_list[i]]+sub_list
+
+  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+  def __unique_combinations2__(self, in_list, n):
+    """Another version from Activestate Python cookbook, see:
+
+       http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/66465
+
+       Seems to be of similar speed than the previous function.
+    """
+
+    unique_combinations_funct = self.__unique_combinations2__  # Shorthand
+
+    for i in xrange(len(in_list)):
+      if (n == 1):
+        yield in_list[i]
+      else:
+        for sub_list in unique_combinations_funct(in_list[i+1:], n-1):
+          yield in_list[i] + sub_list
+
+  # ---------------------------------------------------------------------------
+
+  def compact(self):
+    """Method to compact an index data structure.
+       See implementations in derived classes for details.
+    """
+
+    logging.exception('Override abstract method in derived class')
+    raise Exception
+
+  # ---------------------------------------------------------------------------
+
+  def __dedup_rec_pairs__(self, rec_id_list, rec_pair_dict):
+    """Create record pairs for a deduplication using the given record
+       identifier list and insert them into the given record pair dictionary.
+
+       This version does not modify the input record identifier list. It does
+       create a local copy of the record identifer list which is then sorted.
+    """
+
+    rec_cnt = 1  # Counter for second record identifier
+
+    this_rec_id_list = sorted(rec_id_list)
+    for rec_ident1 in this_rec_id_list:
+
+      rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+
+      for rec_ident2 in this_rec_id_list[rec_cnt:]:
+
+        assert rec_ident1 != rec_ident2
+
+        rec_ident2_set.add(rec_ident2)
+
+      rec_pair_dict[rec_ident1] = rec_ident2_set
+
+      rec_cnt += 1
+
+    if (self.meta_blocking != None):
+      self.__count_meta_block__(this_rec_id_list, None)
+
+    del this_rec_id_list
+
+  # ---------------------------------------------------------------------------
+
+  def __dedup_new_rec_pairs__(self, old_rec_id_list, new_rec_id_list,
+                              rec_pair_dict):
+    """Create the record pairs for a deduplication of a block which contains
+       the records in the old record identifier list and the records in the
+       new record identifier list, such that all record pairs contain at least
+       one new record. The record pairs are inserted into the given record
+       pair dictionary with the smaller record identifier first.
+    """
+
+    if (len(new_rec_id_list) > 1):
+      self.__dedup_rec_pairs__(new_rec_id_list, rec_pair_dict)
+
+    for rec_ident_new in new_rec_id_list:
+      for rec_ident_old in old_rec_id_list:
+
+        if (rec_ident_new < rec_ident_old):
+          rec_ident1 = rec_ident_new
+          rec_ident2 = rec_ident_old
+        else:
+          rec_ident1 = rec_ident_old
+          rec_ident2 = rec_ident_new
+
+        rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+        rec_ident2_set.add(rec_ident2)
+        rec_pair_dict[rec_ident1] = rec_ident2_set
+
+  # ---------------------------------------------------------------------------
+
+  def __link_rec_pairs__(self, rec_id_list1, rec_id_list2, rec_pair_dict):
+    """Create record pairs for a linkage using the given two record identifier
+       lists and insert them into the given record pair dictionary.
+    """
+
+    for rec_ident1 in rec_id_list1:
+      for rec_ident2 in rec_id_list2:
+
+        rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+        rec_ident2_set.add(rec_ident2)
+        rec_pair_dict[rec_ident1] = rec_ident2_set
+
+    if (self.meta_blocking != None):
+      self.__count_meta_block__(rec_id_list1, rec_id_list2)
+
+  # ---------------------------------------------------------------------------
+
+  def __count_meta_block__(self, rec_id_list1, rec_id_list2):
+    """Count a block for meta-blocking: the number of blocks each record is
+       in, and for each record pair the number of blocks its two records have
+       in common. For a deduplication the second list must be None and the
+       first list must be sorted.
+    """
+
+    if (((rec_id_list2 == None) and (len(rec_id_list1) < 2)) or \
+        ((rec_id_list2 != None) and \
+         ((len(rec_id_list1) == 0) or (len(rec_id_list2) == 0)))):
+      return  # No record pairs in this block
+
+    self.meta_num_blocks += 1
+
+    pair_count_dict = self.meta_pair_count_dict  # Shorthands
+    rec_count_dict1 = self.meta_rec_count_dict1
+    rec_count_dict2 = self.meta_rec_count_dict2
+
+    for rec_ident in rec_id_list1:
+      rec_count_dict1[rec_ident] = rec_count_dict1.get(rec_ident, 0) + 1
+
+    if (rec_id_list2 == None):  # A deduplication
+      rec_cnt = 1
+
+      for rec_ident1 in rec_id_list1:
+        rec_ident2_count_dict = pair_count_dict.get(rec_ident1, {})
+
+        for rec_ident2 in rec_id_list1[rec_cnt:]:
+          rec_ident2_count_dict[rec_ident2] = \
+                                  rec_ident2_count_dict.get(rec_ident2, 0) + 1
+
+        pair_count_dict[rec_ident1] = rec_ident2_count_dict
+        rec_cnt += 1
+
+    else:  # A linkage
+      for rec_ident in rec_id_list2:
+        rec_count_dict2[rec_ident] = rec_count_dict2.get(rec_ident, 0) + 1
+
+      for rec_ident1 in rec_id_list1:
+        rec_ident2_count_dict = pair_count_dict.get(rec_ident1, {})
+
+        for rec_ident2 in rec_id_list2:
+          rec_ident2_count_dict[rec_ident2] = \
+                                  rec_ident2_count_dict.get(rec_ident2, 0) + 1
+
+        pair_count_dict[rec_ident1] = rec_ident2_count_dict
+
+  # ---------------------------------------------------------------------------
+
+  def meta_block(self, true_match_set = None):
+    """Prune the record pairs of a compacted index according to the
+       'meta_blocking' argument, so that only the remaining record pairs are
+       compared in the run() method (which calls this method if it has not
+       been called before).
+
+       Each record pair is weighted using the blocks counted when the record
+       pairs were generated. Record pairs not generated by the
+       __dedup_rec_pairs__() or __link_rec_pairs__() methods are assumed to
+       have one block in common.
+
+       If a set of true matches is given (tuples of two record identifiers,
+       or record numbers if these are interned) the pairs completeness (the
+       percentage of true matches that are in the record pairs) is calculated
+       before and after the pruning.
+
+       Returns a tuple with the number of record pairs before and after the
+       pruning, the reduction ratio (one minus the number of record pairs
+       after divided by the number before), and the pairs completeness before
+       and after the pruning (None if no true matches are given).
+    """
+
+    if (self.meta_blocking == None):
+      logging.exception('Meta-blocking has not been set for index "%s"' % \
+                        (self.description))
+      raise Exception
+
+    if (self.status != 'compacted'):
+      logging.exception('Index "%s" has not been compacted, meta-blocking ' % \
+                        (self.description)+'not possible')
+      raise Exception
+
+    if (true_match_set != None):
+      auxiliary.check_is_set('true_match_set', true_match_set)
+
+    start_time = time.time()
+
+    rec_pair_dict = self.rec_pair_dict  # Shorthands
+    pair_count_dict = self.meta_pair_count_dict
+    rec_count_dict1 = self.meta_rec_count_dict1
+
+    if (self.do_deduplication == True):
+      rec_count_dict2 = self.meta_rec_count_dict1
+    else:
+      rec_count_dict2 = self.meta_rec_count_dict2
+
+    weight_scheme =  self.meta_blocking[0]
+    pruning_scheme = self.meta_blocking[1]
+
+    num_blocks = max(self.meta_num_blocks, 1)
+
+    old_num_rec_pairs = self.num_rec_pairs
+    old_pairs_compl =   self.__pairs_completeness__(true_match_set)
+
+    # Calculate the weights of all record pairs (edges) - - - - - - - - - - - -
+    #
+    edge_list = []
+
+    for (rec_ident1, rec_ident2_set) in rec_pair_dict.iteritems():
+      rec_ident2_count_dict = pair_count_dict.get(rec_ident1, {})
+      num_blocks1 = rec_count_dict1.get(rec_ident1, 1)
+
+      for rec_ident2 in rec_ident2_set:
+        num_common = rec_ident2_count_dict.get(rec_ident2, 1)
+
+        if (weight_scheme == 'cbs'):
+          weight = float(num_common)
+
+        else:
+          num_blocks2 = rec_count_dict2.get(rec_ident2, 1)
+
+          if (weight_scheme == 'ecbs'):
+            weight = num_common * \
+                     math.log(float(num_blocks) / num_blocks1) * \
+                     math.log(float(num_blocks) / num_blocks2)
+          else:  # Jaccard
+            weight = float(num_common) / max(num_blocks1 + num_blocks2 - \
+                                             num_common, num_common)
+
+        edge_list.append((weight, rec_ident1, rec_ident2))
+
+    # Prune the edges - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    new_rec_pair_dict = {}
+
+    if (pruning_scheme == 'wep'):  # Keep edges with at least average weight
+
+      if (len(edge_list) > 0):
+        avrg_weight = sum([edge[0] for edge in edge_list]) / len(edge_list)
+      else:
+        avrg_weight = 0.0
+
+      for (weight, rec_ident1, rec_ident2) in edge_list:
+        if (weight >= avrg_weight):
+          rec_ident2_set = new_rec_pair_dict.get(rec_ident1, set())
+          rec_ident2_set.add(rec_ident2)
+          new_rec_pair_dict[rec_ident1] = rec_ident2_set
+
+    else:  # Keep the k edges with the largest weights of each node
+
+      # Nodes are tuples of data set index and record identifier
+      #
+      node_edge_dict = {}
+
+      for (weight, rec_ident1, rec_ident2) in edge_list:
+        node1 = (0, rec_ident1)
+        if (self.do_deduplication == True):
+          node2 = (0, rec_ident2)
+        else:
+          node2 = (1, rec_ident2)
+
+        node_edge_list = node_edge_dict.get(node1, [])
+        node_edge_list.append((-weight, rec_ident1, rec_ident2))
+        node_edge_dict[node1] = node_edge_list
+        node_edge_list = node_edge_dict.get(node2, [])
+        node_edge_list.append((-weight, rec_ident1, rec_ident2))
+        node_edge_dict[node2] = node_edge_list
+
+      if (len(self.meta_blocking) == 3):
+        k = self.meta_blocking[2]
+      else:  # Average number of record pairs per record (node degree)
+        k = max(1, int(2.0*len(edge_list) / max(len(node_edge_dict), 1)))
+
+      for node_edge_list in node_edge_dict.itervalues():
+        if (len(node_edge_list) > k):
+          node_edge_list = heapq.nsmallest(k, node_edge_list)
+
+        for (neg_weight, rec_ident1, rec_ident2) in node_edge_list:
+          rec_ident2_set = new_rec_pair_dict.get(rec_ident1, set())
+          rec_ident2_set.add(rec_ident2)
+          new_rec_pair_dict[rec_ident1] = rec_ident2_set
+
+      del node_edge_dict
+
+    del edge_list
+
+    self.rec_pair_dict = new_rec_pair_dict
+    self.num_rec_pairs = 0
+    for rec_ident2_set in new_rec_pair_dict.itervalues():
+      self.num_rec_pairs += len(rec_ident2_set)
+
+    new_pairs_compl = self.__pairs_completeness__(true_match_set)
+
+    # The block counts are not needed anymore
+    #
+    self.meta_pair_count_dict = {}
+    self.meta_rec_count_dict1 = {}
+    self.meta_rec_count_dict2 = {}
+    self.meta_num_blocks = 0
+    self.meta_pruned = True
+
+    if (old_num_rec_pairs > 0):
+      red_ratio = 1.0 - float(self.num_rec_pairs) / old_num_rec_pairs
+    else:
+      red_ratio = 0.0
+
+    logging.info('')
+    logging.info('Meta-blocking of index "%s" using %s weights and %s ' % \
+                 (self.description, weight_scheme, pruning_scheme) + \
+                 'pruning in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Old number of record pairs: %d' % (old_num_rec_pairs))
+    logging.info('  New number of record pairs: %d' % (self.num_rec_pairs))
+    logging.info('  Reduction ratio: %.4f' % (red_ratio))
+    if (true_match_set != None):
+      logging.info('  Pairs completeness before pruning: %.2f%%' % \
+                   (old_pairs_compl))
+      logging.info('  Pairs completeness after pruning:  %.2f%%' % \
+                   (new_pairs_compl))
+
+    return (old_num_rec_pairs, self.num_rec_pairs, red_ratio,
+            old_pairs_compl, new_pairs_compl)
+
+  # ---------------------------------------------------------------------------
+
+  def __pairs_completeness__(self, true_match_set):
+    """Returns the percentage of the given true matches (tuples of two
+       record identifiers) that are in the record pair dictionary, or None if
+       no true matches are given. For a deduplication the two record
+       identifiers of a true match can be in any order.
+    """
+
+    if (true_match_set == None):
+      return None
+    if (len(true_match_set) == 0):
+      return 0.0
+
+    rec_pair_dict = self.rec_pair_dict  # Shorthand
+
+    num_found = 0
+
+    for (rec_ident1, rec_ident2) in true_match_set:
+      if (rec_ident2 in rec_pair_dict.get(rec_ident1, [])):
+        num_found += 1
+      elif ((self.do_deduplication == True) and \
+            (rec_ident1 in rec_pair_dict.get(rec_ident2, []))):
+        num_found += 1
+
+    return 100.0 * num_found / len(true_match_set)
+
+  # ---------------------------------------------------------------------------
+
+  def run(self):
+    """Run the record pair comparison accoding to the index.
+       See implementations in derived classes for details.
+    """
+
+    logging.exception('Override abstract method in derived class')
+    raise Exception
+
+  # ---------------------------------------------------------------------------
+
+  def __get_field_names_list__(self):
+    """Returns the list of all field comparison descriptions, to be used when
+       a weight vector file is written.
+    """
+
+    field_names_list = []
+    for field_comp_tuple in self.rec_comparator.field_comparator_list:
+        field_names_list.append(field_comp_tuple[0].description)
+    return field_names_list
+
+  # ---------------------------------------------------------------------------
+
+  def __new_weight_vec_dict__(self):
+    """Returns a new empty weight vector dictionary, or a weight vector store
+       if the 'weight_vec_store' flag is set.
+    """
+
+    if (self.weight_vec_store == False):
+      return {}
+
+    num_weights = len(self.rec_comparator.field_comparator_list)
+
+    if (self.intern_rec_ids == True):  # Use the record numbers directly
+      return weightvec.WeightVectorStore(description=self.description,
+                                         num_weights=num_weights,
+                                         rec_ident_lists=(self.rec_ident_list1,
+                                                          self.rec_ident_list2))
+    else:
+      return weightvec.WeightVectorStore(description=self.description,
+                                         num_weights=num_weights)
+
+  # ---------------------------------------------------------------------------
+
+  def __compare_rec_pairs_from_dict__(self, length_filter_perc = None,
+                                      cut_off_threshold = None,
+                                      weight_vec_dict = None):
+    """This method compares all the records pairs in the record pair dictionary
+       and puts the resulting weight vectors into a dictionary which is then
+       returned.
+
+       If the argument 'length_filter_perc' is set to a percentage value
+       between 0.0 and 100.0 the lengths of the concatenated record values in
+       the fields used for comparison will be calculated, and if the difference
+       is larger than the given percentage value the record pair will not be
+       compared. For example, if a record A has values with a total length of
+       12 characters and a record B values with a length of 16 characters, then
+       their percentage difference will be:
+
+          |12-16| / (max(12,16) = 4 / 16 = 0.25 (25%)
+
+       So if the value of 'length_filter_perc' is set to 20 this record pair
+       will be filtered out and not compared.
+
+       Default value for 'length_filter_perc' is None, which means no length
+       filtering will be performed. For more information about filtering in the
+       record linkage process please refer to:
+
+       - Adaptive Filtering for Efficient Record Linkage
+         Lifang Gu and Rohan Baxter,
+         SIAM Data Mining conference, 2004.
+
+       The second argument 'cut_off_threshold' can be set to a numerical value,
+       in which case all compared record pairs with a summed weight vector
+       value less than this threshold will not be stored in the weight vector
+       dictionary. Default value for 'cut_off_threshold' is None, which means
+       all compared record pairs will be stored in the weight vector
+       dictionary.
+
+       If the third argument 'weight_vec_dict' is given (a weight vector
+       dictionary or store, for example as returned by a previous call of the
+       run() method), the new weight vectors are added to it instead of a new
+       weight vector dictionary. The record pairs compared must not already be
+       in this dictionary. It cannot be used if weight vectors are written
+       into a file.
+
+       If meta-blocking is used and the record pairs have not been pruned yet
+       the meta_block() method is called first.
+    """
+
+    if ((self.meta_blocking != None) and (self.meta_pruned == False)):
+      self.meta_block()
+
+    return self.__compare_rec_pairs__(self.rec_pair_dict.iteritems(),
+                                      length_filter_perc, cut_off_threshold,
+                                      weight_vec_dict)
+
+  # ---------------------------------------------------------------------------
+
+  def __compare_rec_pairs_from_stream__(self, length_filter_perc = None,
+                                        cut_off_threshold = None):
+    """This method compares all the record pairs as they are generated block
+       by block by the __stream_rec_pairs__() method, without the need of a
+       record pair dictionary. The weight vectors are returned in the same way
+       as by __compare_rec_pairs_from_dict__(), and the arguments
+       'length_filter_perc' and 'cut_off_threshold' have the same meaning.
+    """
+
+    return self.__compare_rec_pairs__(self.__stream_rec_pairs__(),
+                                      length_filter_perc, cut_off_threshold)
+
+  # ---------------------------------------------------------------------------
+
+  def __stream_rec_pairs__(self):
+    """A generator which produces the record pairs of an index block by block,
+       as tuples made of a record identifier from data set 1 and a list of
+       record identifiers from data set 2 it is to be compared with.
+
+       This generator assumes that each record is inserted into only one block
+       per index (as done in the __records_into_inv_index__() method). A record
+       pair that occurs in blocks of several indices is only generated for the
+       first of these indices, using the index values of the two records as
+       stored in 'rec_index_vals1' and 'rec_index_vals2'. Therefore no set of
+       the already generated record pairs needs to be kept.
+    """
+
+    num_indices = len(self.index_def)
+
+    skip_missing =    self.skip_missing  # Shorthands
+    rec_index_vals1 = self.rec_index_vals1
+
+    if (self.do_deduplication == True):
+      rec_index_vals2 = self.rec_index_vals1
+    else:
+      rec_index_vals2 = self.rec_index_vals2
+
+    for i in range(num_indices):
+
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+
+        this_index = self.index1[i]  # Shorthand
+
+        for block_val in this_index:
+
+          block_recs = this_index[block_val]
+          if (len(block_recs) < 2):
+            continue
+          block_recs = sorted(block_recs)  # Local sorted copy
+
+          rec_cnt = 1  # Counter for second record identifier
+
+          for rec_ident1 in block_recs:
+
+            if (i == 0):  # No previous index, so all pairs are new
+              rec_ident2_list = block_recs[rec_cnt:]
+
+            else:
+              index_vals1 =     rec_index_vals1[rec_ident1]
+              rec_ident2_list = []
+
+              for rec_ident2 in block_recs[rec_cnt:]:
+                index_vals2 = rec_index_vals2[rec_ident2]
+
+                for j in range(i):  # Check if pair is in a previous block
+                  if ((index_vals1[j] == index_vals2[j]) and \
+                      ((index_vals1[j] != '') or (skip_missing == False))):
+                    break
+                else:
+                  rec_ident2_list.append(rec_ident2)
+
+            if (rec_ident2_list != []):
+              yield (rec_ident1, rec_ident2_list)
+
+            rec_cnt += 1
+
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        this_index1 = self.index1[i]  # Shorthands
+        this_index2 = self.index2[i]
+
+        for block_val in this_index1:
+
+          if (block_val not in this_index2):
+            continue
+
+          block_recs2 = this_index2[block_val]
+
+          for rec_ident1 in this_index1[block_val]:
+
+            if (i == 0):  # No previous index, so all pairs are new
+              rec_ident2_list = block_recs2
 
-     Note that skip_missing cannot be set to False for certain index methods,
-     see their documentation for more details.
+            else:
+              index_vals1 =     rec_index_vals1[rec_ident1]
+              rec_ident2_list = []
 
-     Both the data sets and the index definitions must be provided when a index
-     is initialised.
-  """
+              for rec_ident2 in block_recs2:
+                index_vals2 = rec_index_vals2[rec_ident2]
+
+                for j in range(i):  # Check if pair is in a previous block
+                  if ((index_vals1[j] == index_vals2[j]) and \
+                      ((index_vals1[j] != '') or (skip_missing == False))):
+                    break
+                else:
+                  rec_ident2_list.append(rec_ident2)
+
+            if (rec_ident2_list != []):
+              yield (rec_ident1, rec_ident2_list)
 
   # ---------------------------------------------------------------------------
 
-  def __init__(self, base_kwargs):
-    """Constructor
+  def __compare_rec_pairs__(self, rec_pair_iter, length_filter_perc,
+                            cut_off_threshold, weight_vec_dict = None):
+    """Compare the record pairs produced by the given iterator, which must
+       return tuples made of a record identifier from data set 1 and an
+       iterable of record identifiers from data set 2. See the method
+       __compare_rec_pairs_from_dict__() for a description of the arguments
+       and the returned values.
     """
 
-    # General attributes for all index implementations
+    # Check if weight vector file should be written - - - - - - - - - - - - - -
     #
-    self.description =     ''
-    self.dataset1 =        None
-    self.dataset2 =        None
-    self.rec_comparator =  None  # A record comparator
-    self.index_def =       None  # The index definitions
-    self.index_sep_str =   ''    # Separator string for in-between index values
-    self.skip_missing =    True
-    self.progress_report = 10
-    self.log_funct =       None
-    self.weight_vec_file = None
+    if (self.weight_vec_file != None):
+      try:
+        weight_vec_fp = open(self.weight_vec_file, 'w')
+      except:
+        logging.exception('Cannot write weight vector file: %s' % \
+                          (self.weight_vec_file))
+        raise Exception
+      weight_vec_writer = csv.writer(weight_vec_fp)
 
-    self.index_def_proc = None        # Processed version of the index
-                                      # definition for faster access to field
-                                      # values
-    self.index1 = {}                  # The index data structure for data set 1
-    self.index2 = {}                  # The index data structure for data set 2
-    self.index1_shelve_name = None    # If the index data structure for data
-                                      # set 1 is to be file (shelve) based this
-                                      # will be it's file name
-    self.index2_shelve_name = None    # Same for data set 2
-    self.rec_cache1 = {}              # A dictionary containing all records
-                                      # from data set 1 with only the fields
-                                      # needed for field comparisons
-    self.rec_cache2 = {}              # Same for data set 2
-    self.rec_cache1_file_name = None  # If the record cache for data sets 1
-                                      # should be file (shelve) based this will
-                                      # be it's file name
-    self.rec_cache2_file_name = None  # Same for data sets 2
-    self.num_rec_pairs = None         # The number of record pairs that will be
-                                      # compared when the run() method is
-                                      # called
-    self.do_deduplication = None      # A Flag, set to True if both data sets
-                                      # are the same
-    self.comp_field_used1 = []        # A list of the fields in data set 1 as
-                                      # used by the record comparator (column
-                                      # indices)
-    self.comp_field_used2 = []        # Same for data set 2
-    self.rec_length_cache = {}        # Used in lenth filtering in run() method
+      # Write header line with descriptions of field comparisons
+      #
+      weight_vec_header_line = ['rec_id1', 'rec_id2'] + \
+                                self.__get_field_names_list__()
+      weight_vec_writer.writerow(weight_vec_header_line)
 
-    # Process base keyword arguments (all data set specific keywords were
-    # processed in the derived class constructor)
+    # Calculate a counter for the progress report - - - - - - - - - - - - - - -
     #
-    for (keyword, value) in base_kwargs.items():
+    if (self.progress_report != None):
+      progress_report_cnt = max(1, int(self.num_rec_pairs / \
+                                   (100.0 / self.progress_report)))
+    else:  # So no progress report is being logged
+      progress_report_cnt = self.num_rec_pairs + 1
 
-      if (keyword.startswith('desc')):
-        auxiliary.check_is_string('description', value)
-        self.description = value
+    if (weight_vec_dict == None):
+      weight_vec_dict = self.__new_weight_vec_dict__()  # Calculated weight
+                                                        # vectors
+    else:  # Add new weight vectors to the given ones
+      weightvec.check_is_weight_vector_dict('weight_vec_dict',
+                                            weight_vec_dict)
+      if (self.weight_vec_file != None):
+        logging.exception('Weight vectors cannot be added to a weight ' + \
+                          'vector dictionary if they are written into ' + \
+                          'file: %s' % (self.weight_vec_file))
+        raise Exception
 
-      elif (keyword == 'dataset1'):
-        auxiliary.check_is_list('Dataset 1 field list', value.field_list)
-        self.dataset1 = value
-      elif (keyword == 'dataset2'):
-        auxiliary.check_is_list('Dataset 2 field list', value.field_list)
-        self.dataset2 = value
+    comp_done =       0   # Number of comparisons done
 
-      elif (keyword.startswith('index_d')):
-        auxiliary.check_is_list('index_def', value)
-        self.index_def = value
+    rec_cache1 =       self.rec_cache1  # Shorthands to make program faster
+    rec_comp_batch =   self.rec_comparator.compare_batch
+    rec_length_cache = self.rec_length_cache
 
-      elif (keyword.startswith('index_sep')):
-        auxiliary.check_is_string('index_sep_str', value)
-        self.index_sep_str = value
+    # Check length filter and cut-off threshold arguments - - - - - - - - - - -
+    #
+    if (length_filter_perc != None):
+      auxiliary.check_is_percentage('Length filter percentage',
+                                    length_filter_perc)
+      logging.info('  Length filtering set to %.1f%%' % (length_filter_perc))
+      length_filter_perc /= 100.0  # Normalise
 
-      elif (keyword.startswith('index1_she')):
-        auxiliary.check_is_string('index1_shelve_name', value)
-        self.index1_shelve_name = value
-      elif (keyword.startswith('index2_she')):
-        auxiliary.check_is_string('index2_shelve_name', value)
-        self.index2_shelve_name = value
+    if (cut_off_threshold != None):
+      auxiliary.check_is_number('Cut-off threshold', cut_off_threshold)
+      logging.info('  Cut-off threshold set to: %.2f' % (cut_off_threshold))
 
-      elif (keyword.startswith('rec_cache1_f')):
-        auxiliary.check_is_string('rec_cache1_file_name', value)
-        self.rec_cache1_file_name = value
-      elif (keyword.startswith('rec_cache2_f')):
-        auxiliary.check_is_string('rec_cache2_file_name', value)
-        self.rec_cache2_file_name = value
+    num_rec_pairs_filtered =    0  # Count number of removed record pairs
+    num_rec_pairs_below_thres = 0
 
-      elif (keyword.startswith('rec_com')):
-        self.rec_comparator = value
+    # Set shorthand depending upon deduplication or linkage - - - - - - - - - -
+    #
+    if (self.do_deduplication == True):  # A deduplication run
+      rec_cache2 = self.rec_cache1
+    else:
+      rec_cache2 = self.rec_cache2
 
-      elif (keyword.startswith('skip')):
-        auxiliary.check_is_flag('skip_missing', value)
-        self.skip_missing = value
+    intern_rec_ids =  self.intern_rec_ids  # Record numbers are translated
+    rec_ident_list1 = self.rec_ident_list1  # back into record identifiers
+    rec_ident_list2 = self.rec_ident_list2  # when written into a file
 
-      elif (keyword.startswith('progr')):
-        if (value == None):
-          self.progress_report = value
+    if (isinstance(weight_vec_dict, weightvec.WeightVectorStore)):
+      add_w_vec = weight_vec_dict.append  # Record pairs are unique, so they
+                                          # can be appended without a look-up
+    else:
+      add_w_vec = weight_vec_dict.__setitem__
+
+    def store_w_vec_list(w_vec_list):  # Put weight vectors into dictionary
+                                       # or write them into the file
+      for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+        if (self.weight_vec_file == None):
+          add_w_vec((rec_ident1, rec_ident2), w_vec)
+        elif (intern_rec_ids == True):
+          weight_vec_writer.writerow([rec_ident_list1[rec_ident1],
+                                      rec_ident_list2[rec_ident2]]+w_vec)
         else:
-          auxiliary.check_is_integer('progress_report', value)
-          if ((value < 1) or (value > 50)):
-            logging.exception('Illegal value for progress report, must be ' + \
-                              'False or between 1 and 50: "%s"' % \
-                              (str(value)))
-            raise Exception
-          self.progress_report = value
-
-      elif (keyword.startswith('log_f')):
-        auxiliary.check_is_function_or_method('log_funct', value)
-        self.log_funct =  value
+          weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
 
-      elif (keyword.startswith('weight_v')):
-        if (value != None):
-          auxiliary.check_is_string('weight_vec_file', value)
-        self.weight_vec_file = value
+    start_time = time.time()
 
-      else:
-        logging.exception('Illegal constructor argument keyword: '+keyword)
-        raise Exception
+    if (self.num_processes > 1):  # Compare record pairs in parallel - - - - -
 
-    # Check if the needed attributes are set  - - - - - - - - - - - - - - - - -
-    #
-    auxiliary.check_is_list('index_def', self.index_def)
-    auxiliary.check_is_not_none('rec_comparator', self.rec_comparator)
-    auxiliary.check_is_not_none('Dataset 1', self.dataset1)
-    auxiliary.check_is_not_none('Dataset 2', self.dataset2)
-    auxiliary.check_is_list('Dataset 1 field list', self.dataset1.field_list)
-    auxiliary.check_is_list('Dataset 2 field list', self.dataset2.field_list)
+      rec_chunk_iter = self.__rec_pair_chunks__(rec_pair_iter, rec_cache1)
 
-    # Check if the data sets in the record comparator are the same as the ones
-    # give in the index
-    #
-    if (self.rec_comparator.dataset1 != self.dataset1):
-      logging.exception('Data set 1 in record comparator is different from' + \
-                        ' data set 1 in index: "%s" / "%s"' % \
-                        (self.rec_comparator.dataset1, self.dataset1))
-      raise Exception
-    if (self.rec_comparator.dataset2 != self.dataset2):
-      logging.exception('Data set 2 in record comparator is different from' + \
-                        ' data set 2 in index: "%s" / "%s"' % \
-                        (self.rec_comparator.dataset2, self.dataset2))
-      raise Exception
+      for (chunk_comp_done, chunk_w_vec_list, chunk_num_filtered,
+           chunk_num_below_thres) in \
+          self.__compare_rec_pair_chunks__(rec_chunk_iter, rec_cache2,
+                                           length_filter_perc,
+                                           cut_off_threshold):
 
-    # Check if a deduplication will be done or a linkage - - - - - - - - - - -
-    #
-    if (self.dataset1 == self.dataset2):
-      self.do_deduplication = True
-    else:
-      self.do_deduplication = False
+        store_w_vec_list(chunk_w_vec_list)
 
-    # If indices or record caches are file (shelve) based open these shelves -
-    #
-    if (self.index1_shelve_name != None):
-      self.index1 = self.__open_shelve_file__(self.index1_shelve_name)
-    if (self.index2_shelve_name != None):
-      self.index2 = self.__open_shelve_file__(self.index2_shelve_name)
-    if (self.rec_cache1_file_name != None):
-      self.rec_cache1 = self.__open_shelve_file__(self.rec_cache1_file_name)
-    if (self.rec_cache2_file_name != None):
-      self.rec_cache2 = self.__open_shelve_file__(self.rec_cache2_file_name)
+        num_rec_pairs_filtered +=    chunk_num_filtered
+        num_rec_pairs_below_thres += chunk_num_below_thres
 
-    # Extract the field names from the two data set field name lists - - - - -
-    #
-    dataset1_field_names = []
-    dataset2_field_names = []
+        prev_comp_done = comp_done
+        comp_done +=     chunk_comp_done
 
-    for (field_name, field_data) in self.dataset1.field_list:
-      dataset1_field_names.append(field_name)
+        if ((comp_done / progress_report_cnt) > \
+            (prev_comp_done / progress_report_cnt)):
+          self.__log_comparison_progress__(comp_done, start_time)
 
-    for (field_name, field_data) in self.dataset2.field_list:
-      dataset2_field_names.append(field_name)
+    else:  # Compare record pairs in this process - - - - - - - - - - - - - -
 
-    # Get the column indices of the fields used in the record comparator - - -
-    #
-    for (comp,f_ind1,f_ind2) in self.rec_comparator.field_comparison_list:
-      if (f_ind1 not in self.comp_field_used1):
-        self.comp_field_used1.append(f_ind1)
-      if (f_ind2 not in self.comp_field_used2):
-        self.comp_field_used2.append(f_ind2)
-    self.comp_field_used1.sort()
-    self.comp_field_used2.sort()
+      batch_list = []  # Record pairs to be compared in the next batch
 
-    # Check if definition of indices is correct and fields are in the data sets
-    #
-    self.index_def_proc = []  # Checked and processed index definitions will be
-                              # added here
+      for (rec_ident1, rec_ident2_set) in rec_pair_iter:
 
-    for index_def_list in self.index_def:
+        rec1 = rec_cache1[rec_ident1]  # Get the actual first record
 
-      auxiliary.check_is_list('Index definition list "%s"' % \
-                              (str(index_def_list)), index_def_list)
+        if (length_filter_perc != None):
+          rec1_len = len(''.join(rec1))  # Get length in characters for record
 
-      index_def_list_proc = []
+        for rec_ident2 in rec_ident2_set:
 
-      for index_def in index_def_list:
+          rec2 = rec_cache2[rec_ident2]  # Get actual second record
 
-        auxiliary.check_is_list('Index definition "%s"' % \
-                                (str(index_def)), index_def)
-        if (index_def == []):
-          logging.info('Empty index definition given: %s' % \
-                       (str(self.index_def)))
+          do_comp = True  # Flag, specify if comparison should be done
 
-        # Check the two field names
-        #
-        field_name1 = index_def[0]
-        field_name2 = index_def[1]
+          if (length_filter_perc != None):
+            if (rec_ident2 in rec_length_cache):  # Length is cached
+              rec2_len = rec_length_cache[rec_ident2]
+            else:
+              rec2_len = len(''.join(rec2))
+              rec_length_cache[rec_ident2] = rec2_len
 
-        if (field_name1 not in dataset1_field_names):
-          logging.exception('Field "%s" is not in data set 1 field name ' \
-                            % (field_name1) + 'list: %s' % \
-                            (str(self.dataset1.field_list)))
-          raise Exception
-        field_index1 = dataset1_field_names.index(field_name1)
+            perc_diff = float(abs(rec1_len - rec2_len)) / \
+                        max(rec1_len, rec2_len)
 
-        if (field_name2 not in dataset2_field_names):
-          logging.exception('Field "%s" is not in data set 2 field name ' \
-                            % (field_name2) + 'list: %s' % \
-                            (str(self.dataset2.field_list)))
-          raise Exception
-        field_index2 = dataset2_field_names.index(field_name2)
+            if (perc_diff > length_filter_perc):
+              do_comp = False  # Difference too large, don't do comparison
+              num_rec_pairs_filtered += 1
 
-        index_def_proc = [field_index1,field_index2] # Processed index def.
+          if (do_comp == True):
+            batch_list.append((rec_ident1, rec_ident2, rec1, rec2))
 
-        # Check if sort words flag is True or False
-        #
-        auxiliary.check_is_flag('Sort words flag', index_def[2])
-        index_def_proc.append(index_def[2])
+            if (len(batch_list) >= COMPARE_BATCH_SIZE):  # Compare them
+              w_vec_list = []
+              num_rec_pairs_below_thres += _compare_rec_pair_batch(
+                                           rec_comp_batch, batch_list,
+                                           cut_off_threshold, w_vec_list)
+              store_w_vec_list(w_vec_list)
+              batch_list = []
 
-        # Check if reverse flag is True or False
-        #
-        auxiliary.check_is_flag('Reverse flag', index_def[3])
-        index_def_proc.append(index_def[3])
+          comp_done += 1  # Count all record pair comparisons (even if not
+                          # done)
 
-        # Check maximum length is a positive integer or None
-        #
-        if (index_def[4] == None):
-          index_def_proc.append(None)
-        else:
-          auxiliary.check_is_integer('Maximum length', index_def[4])
-          auxiliary.check_is_positive('Maximum length', index_def[4])
-          index_def_proc.append(index_def[4])
+          if ((comp_done % progress_report_cnt) == 0):
+            self.__log_comparison_progress__(comp_done, start_time)
 
-        # Check function definition
-        #
-        if ((index_def[5] != None) and (len(index_def[5]) > 0)):
-          index_funct_def = index_def[5]
-          auxiliary.check_is_function_or_method('Function "%s"' % \
-                           (index_funct_def[0]), index_funct_def[0])
-          index_def_proc.append(index_funct_def)
-        else:
-          index_def_proc.append(None)
+      if (batch_list != []):  # Compare the last batch
+        w_vec_list = []
+        num_rec_pairs_below_thres += _compare_rec_pair_batch(rec_comp_batch,
+                                     batch_list, cut_off_threshold, w_vec_list)
+        store_w_vec_list(w_vec_list)
 
-        index_def_list_proc.append(index_def_proc)
+    if (self.stream_pairs == True):  # Only now the number of unique record
+      self.num_rec_pairs = comp_done  # pairs is known
 
-      self.index_def_proc.append(index_def_list_proc)
+    used_sec_str = auxiliary.time_string(time.time()-start_time)
+    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                         max(1, self.num_rec_pairs))
+    logging.info('Compared %d record pairs in %s (%s per pair)' % \
+                 (self.num_rec_pairs, used_sec_str,rec_time_str))
+    if (length_filter_perc != None):
+      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
+                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
+    if (cut_off_threshold != None):
+      logging.info('  %d record pairs had summed weights below threshold ' % \
+                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
 
-    assert len(self.index_def) == len(self.index_def_proc)
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
 
-    self.status = 'initialised'  # Status of the index (used by save and load
-                                 # methods)
+    if (self.weight_vec_file == None):
+      return [self.__get_field_names_list__(), weight_vec_dict]
+    else:
+      weight_vec_fp.close()
+      return None
 
   # ---------------------------------------------------------------------------
 
-  def build(self):
-    """Method to build an index data structure.
-       See implementations in derived classes for details.
+  def __rec_pair_chunks__(self, rec_pair_iter, rec_cache1):
+    """A generator which splits the record pairs produced by the given
+       iterator (tuples made of a record identifier from data set 1 and an
+       iterable of record identifiers from data set 2) into chunks to be
+       compared by worker processes.
+
+       Each chunk is a list of tuples made of a record identifier from data
+       set 1, the record itself (taken from the given record cache), and a
+       list of record identifiers from data set 2.
     """
 
-    logging.exception('Override abstract method in derived class')
-    raise Exception
+    CHUNK_NUM_REC_PAIRS = 10000  # Approximate number of record pairs per chunk
 
-  # ---------------------------------------------------------------------------
+    chunk = []
+    chunk_num_rec_pairs = 0
 
-  def __records_into_inv_index__(self):
-    """Load the records from the data sets and put them into an inverted index
-       data structure.
+    for (rec_ident1, rec_ident2_set) in rec_pair_iter:
+
+      rec_ident2_list = list(rec_ident2_set)
+
+      chunk.append((rec_ident1, rec_cache1[rec_ident1], rec_ident2_list))
+      chunk_num_rec_pairs += len(rec_ident2_list)
+
+      if (chunk_num_rec_pairs >= CHUNK_NUM_REC_PAIRS):
+        yield chunk
+        chunk = []
+        chunk_num_rec_pairs = 0
+
+    if (chunk != []):
+      yield chunk
+
+  # ---------------------------------------------------------------------------
 
-       If both data sets are the same (a deduplication) only insert records
-       from one data set.
+  def __compare_rec_pair_chunks__(self, rec_chunk_iter, rec_cache2,
+                                  length_filter_perc, cut_off_threshold,
+                                  swap_rec_pairs = False):
+    """A generator which compares the chunks of record pairs produced by the
+       given iterator using a pool of 'num_processes' worker processes, and
+       returns the results of the chunks (as returned by the function
+       _compare_rec_pair_chunk()) in the same order as the chunks.
 
-       This method builds an inverted index (one per index definition) as a
-       Python dictionary with the keys being the indexing values (as returned
-       by the _get_index_values__() method.
+       The length filter percentage must already be normalised (between 0 and
+       1). Only a limited number of chunks is given to the worker processes at
+       any time, so the chunk iterator is consumed lazily. If 'swap_rec_pairs'
+       is set to True the records in 'rec_cache2' are from data set 1.
+
+       If 'num_processes' is 1 the chunks are compared in this process.
     """
 
-    logging.info('Started to build inverted index:')
+    global _compare_worker_state
 
-    num_indices = len(self.index_def)
+    max_pending = 2*self.num_processes  # Maximum number of chunks not yet
+                                        # returned by the worker processes
 
-    # Index data structure for blocks is one dictionary per index - - - - - - -
-    #
-    for i in range(num_indices):
-      self.index1[i] = {}  # Index for data set 1
-      self.index2[i] = {}  # Index for data set 2
+    if (self.num_processes == 1):  # No worker processes needed - - - - - - -
 
-    get_index_values_funct = self.__get_index_values__  # Shorthands
-    skip_missing =           self.skip_missing
+      _compare_worker_state = (rec_cache2,
+                               self.rec_comparator.compare_batch,
+                               length_filter_perc, cut_off_threshold,
+                               self.rec_length_cache, swap_rec_pairs)
+      try:
+        for chunk in rec_chunk_iter:
+          yield _compare_rec_pair_chunk(chunk)
+      finally:
+        _compare_worker_state = None
 
-    # A list of data structures needed for the build process:
-    # - the index data structure (dictionary)
-    # - the record cache
-    # - the data set to be read
-    # - the comparison fields which are used
-    # - a list index (0 for data set 1, 1 for data set 2)
+      return
+
+    # Set the state before the worker processes are started (forked) so each
+    # of them gets its own copy
     #
-    build_list = [(self.index1, self.rec_cache1, self.dataset1,
-                   self.comp_field_used1, 0)] # For data set 1
+    _compare_worker_state = (rec_cache2,
+                             self.rec_comparator.compare_batch,
+                             length_filter_perc, cut_off_threshold, {},
+                             swap_rec_pairs)
 
-    if (self.do_deduplication == False):  # If linkage append data set 2
-      build_list.append((self.index2, self.rec_cache2, self.dataset2,
-                   self.comp_field_used2, 1))
+    self.__flush_disk_stores__()  # Worker processes read from the files
 
-    # Reading loop over all records in one or both data set(s) - - - - - - - -
-    #
-    for (index,rec_cache,dataset,comp_field_used_list,ds_index) in build_list:
+    pool = multiprocessing.Pool(self.num_processes)
 
-      # Calculate a counter for the progress report
-      #
-      if (self.progress_report != None):
-        progress_report_cnt = max(1, int(dataset.num_records / \
-                                     (100.0 / self.progress_report)))
-      else:  # So no progress report is being logged
-        progress_report_cnt = dataset.num_records + 1
+    try:
+      pending_list = []  # Results of chunks in the order they were submitted
 
-      start_time = time.time()
+      for chunk in rec_chunk_iter:
+        pending_list.append(pool.apply_async(_compare_rec_pair_chunk,
+                                             (chunk,)))
 
-      rec_read = 0  # Number of records read from data set
+        if (len(pending_list) >= max_pending):
+          yield pending_list.pop(0).get()
 
-      for (rec_ident, rec) in dataset.readall(): # Read all records in data set
+      while (pending_list != []):
+        yield pending_list.pop(0).get()
 
-        # Extract record fields needed for comparisons (set all others to '')
-        #
-        comp_rec = []
+      pool.close()
 
-        field_ind = 0
-        for field in rec:
-          if (field_ind in comp_field_used_list):
-            comp_rec.append(field.lower())  # Make them lower case
-          else:
-            comp_rec.append('')
-          field_ind += 1
+    finally:
+      pool.terminate()
+      pool.join()
 
-        rec_cache[rec_ident] = comp_rec  # Put into record cache
+      _compare_worker_state = None
 
-        # Now get the index variable values for this record - - - - - - - - - -
-        #
-        rec_index_val_list = get_index_values_funct(rec, ds_index)
+  # ---------------------------------------------------------------------------
 
-        for i in range(num_indices):  # Put record identifier into all indices
+  def __find_closest__(self, sorted_list, elem):
+    """Binary search of the given element 'elem' in the given sorted list, and
+       return index of exact match or closest match (before where the element
+       would be).
 
-          this_index = index[i]  # Shorthand
+       Used in BigMatch and Dedup indexing methods.
+    """
 
-          block_val = rec_index_val_list[i]
+    start = 0
+    end =   len(sorted_list)-1
 
-          if ((block_val != '') or (skip_missing == False)):
-            block_val_rec_list = this_index.get(block_val, [])
-            block_val_rec_list.append(rec_ident)
-            this_index[block_val] = block_val_rec_list
+    while 1:
+      if (end < start):
+        return end  # Not found
 
-        rec_read += 1
+      middle = (start + end) / 2
+      middle_val = sorted_list[middle]  # Get the element from the middle
 
-        if ((rec_read % progress_report_cnt) == 0):
-          self.__log_build_progress__(rec_read,dataset.num_records,start_time)
+      if (middle_val == elem):  # Found the key value
+        return middle
+      elif (elem < middle_val):
+        end = middle - 1
+      else:
+        start = middle + 1
 
-      used_sec_str = auxiliary.time_string(time.time()-start_time)
-      rec_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                           dataset.num_records)
-      logging.info('Read and indexed %d records in %s (%s per record)' % \
-                   (dataset.num_records, used_sec_str, rec_time_str))
-      logging.info('')
+  # ---------------------------------------------------------------------------
+
+  def __index_file_info__(self):
+    """Return a dictionary with the information needed to check if a saved
+       index file can be loaded into this index: the class name, the index
+       definitions (with function names instead of functions), the main index
+       arguments and for both data sets the file name, size and modification
+       time (if the data set is based on a file).
+    """
+
+    index_def_info = []
+    for index_def_list in self.index_def:
+      index_def_list_info = []
+      for index_def in index_def_list:
+        index_def_info_list = list(index_def[:5])
+        if ((index_def[5] != None) and (len(index_def[5]) > 0)):
+          funct = index_def[5][0]
+          funct_name = '%s.%s' % (getattr(funct, '__module__', ''),
+                                  getattr(funct, '__name__', str(funct)))
+          index_def_info_list.append([funct_name]+list(index_def[5][1:]))
+        else:
+          index_def_info_list.append(None)
+        index_def_list_info.append(index_def_info_list)
+      index_def_info.append(index_def_list_info)
+
+    dataset_info = []
+    for ds in [self.dataset1, self.dataset2]:
+      file_name = getattr(ds, 'file_name', None)
+      if ((file_name != None) and (os.access(file_name, os.F_OK) == True)):
+        file_stat = os.stat(file_name)
+        dataset_info.append((file_name, file_stat.st_size,
+                             file_stat.st_mtime))
+      else:
+        dataset_info.append((file_name, None, None))
+
+    return {'class_name':       self.__class__.__name__,
+            'index_def':        index_def_info,
+            'index_sep_str':    self.index_sep_str,
+            'skip_missing':     self.skip_missing,
+            'intern_rec_ids':   self.intern_rec_ids,
+            'stream_pairs':     self.stream_pairs,
+            'incremental':      self.incremental,
+            'do_deduplication': self.do_deduplication,
+            'dataset_info':     dataset_info,
+            'int_size':         array.array('l').itemsize,
+            'byte_order':       sys.byteorder}
 
   # ---------------------------------------------------------------------------
-  # Get sub-list functions are used for the q-gram and BigMatch index
 
-  def __get_sublists1__(self, in_list, min_len):
-    """An iterative method to compute all combinations of sub-lists of the list
-       'in_list' of lengths down to 'min_len'.
+  def load(self, index_file_name):
+    """Load a previously saved index from a binary file.
 
-       This routine seems to be faster for larger 'min_len' values (compared to
-       length of the input list), i.e. which would correspond to less deep
-       recursive levels (that correspond to higher threshold values) compared
-       to the recursive method using sets given below.
+       The index must have been initialised with the same data sets and index
+       definitions as the saved index. An exception is raised if the file was
+       saved by a different index class or with different index definitions,
+       or if the size or modification time of a data set file has changed
+       since the index was saved.
+
+       After loading, the index has the status it had when it was saved (built
+       or compacted). Unless the blocks are kept in disk stores, they are not
+       copied but read from the memory mapped index file when accessed, and
+       so are the record pairs and the index values of records.
     """
 
-    all_list = [in_list]
-    in_len =   len(in_list)
+    auxiliary.check_is_string('index_file_name', index_file_name)
 
-    if (in_len > min_len):
+    if (self.supports_save == False):
+      logging.exception('Loading is not supported by index class %s' % \
+                        (self.__class__.__name__))
+      raise Exception
 
-      for i in xrange(in_len):
+    start_time = time.time()
 
-        sub_list = in_list[:i]+in_list[i+1:]
+    try:
+      index_fp = open(index_file_name, 'rb')
+    except:
+      logging.exception('Cannot open index file "%s" for reading' % \
+                        (index_file_name))
+      raise IOError
 
-        if (sub_list not in all_list):
-          all_list.append(sub_list)
+    index_mmap = mmap.mmap(index_fp.fileno(), 0, access=mmap.ACCESS_READ)
 
-        if ((in_len-1) > min_len):
-          for sub_sub_list in self.__get_sublists1__(sub_list, min_len):
+    preamble_size = struct.calcsize(INDEX_FILE_PREAMBLE)
 
-            if (sub_sub_list not in all_list):
-              all_list.append(sub_sub_list)
+    (magic, version, unused, header_offset, header_len) = \
+      struct.unpack(INDEX_FILE_PREAMBLE, index_mmap[:preamble_size])
 
-    return all_list
+    if ((magic != INDEX_FILE_MAGIC) or (version != INDEX_FILE_VERSION)):
+      logging.exception('File "%s" is not a Febrl index file of version %d' \
+                        % (index_file_name, INDEX_FILE_VERSION))
+      raise Exception
 
-  # ---------------------------------------------------------------------------
+    header = cPickle.loads(index_mmap[header_offset:header_offset+header_len])
 
-  def __get_sublists2__(self, in_list, min_len):
-    """Method to recursively compute all combinations of sub-lists of the list
-       'in_list' of lengths down to 'min_len' using a Python generator.
+    # Check the saved index is valid for this index - - - - - - - - - - - - - -
+    #
+    saved_info = header['info']
+    this_info =  self.__index_file_info__()
+
+    for info_key in ['class_name', 'index_def', 'index_sep_str',
+                     'skip_missing', 'intern_rec_ids', 'stream_pairs',
+                     'incremental', 'do_deduplication', 'int_size',
+                     'byte_order']:
+      if (saved_info[info_key] != this_info[info_key]):
+        logging.exception('Index file "%s" was saved with a different ' % \
+                          (index_file_name) + '"%s": %s (this index: %s)' % \
+                          (info_key, str(saved_info[info_key]),
+                           str(this_info[info_key])))
+        raise Exception
 
-       This routine seems to be faster for deeper recursive levels (that
-       correspond to lower threshold values) compared to the iterative method
-       using sets given above.
-    """
+    for ds_num in [0,1]:
+      (file_name, file_size, file_mtime) = this_info['dataset_info'][ds_num]
+      (saved_file_name, saved_file_size, saved_file_mtime) = \
+                                           saved_info['dataset_info'][ds_num]
+      if ((file_size != saved_file_size) or (file_mtime != saved_file_mtime)):
+        logging.exception('Data set file "%s" has changed since index file ' \
+                          % (str(file_name)) + '"%s" was saved' % \
+                          (index_file_name))
+        raise Exception
 
-    unique_combinations_funct = self.__unique_combinations2__  # Shorthand
+    section_dict = header['sections']
 
+    def get_section(name):  # Return an array or string
+      (typecode, offset, num_items) = section_dict[name]
+      if (typecode == 's'):
+        return index_mmap[offset:offset+num_items]
+      section_array = array.array(typecode)
+      section_array.fromstring(index_mmap[offset:offset+num_items * \
+                                                  section_array.itemsize])
+      return section_array
 
-    all_list = [in_list]
-    in_len =   len(in_list)
+    # Load the record caches and record identifiers - - - - - - - - - - - - - -
+    #
+    ds_list = [(1, self.index1, self.index1_store)]
+    if (self.do_deduplication == False):
+      ds_list.append((2, self.index2, self.index2_store))
 
-    for i in xrange(in_len-1, min_len-1, -1):
+    rec_ident_lists = {}
 
-      for sub_list in unique_combinations_funct(in_list, i):
-        if (sub_list not in all_list):
-          all_list.append(sub_list)
+    for (ds_num, index, index_store) in ds_list:
+      rec_ident_list = _arrays_to_str_list(
+                                get_section('rec_idents%d' % (ds_num)),
+                                get_section('rec_ident_offsets%d' % (ds_num)))
+      rec_list = cPickle.loads(get_section('rec_cache%d' % (ds_num)))
+      rec_ident_lists[ds_num] = rec_ident_list
 
-    return all_list
+      if (self.intern_rec_ids == True):
+        rec_cache = rec_list
+        if (ds_num == 1):
+          self.rec_ident_list1 = rec_ident_list
+        else:
+          self.rec_ident_list2 = rec_ident_list
+      elif (((ds_num == 1) and (self.rec_cache1_file_name != None)) or \
+            ((ds_num == 2) and (self.rec_cache2_file_name != None))):
+        rec_cache = getattr(self, 'rec_cache%d' % (ds_num))  # A disk store
+        rec_cache.clear()
+        for rec_num in xrange(len(rec_ident_list)):
+          rec_cache[rec_ident_list[rec_num]] = rec_list[rec_num]
+      else:
+        rec_cache = dict(zip(rec_ident_list, rec_list))
 
-  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+      if (ds_num == 1):
+        self.rec_cache1 = rec_cache
+      else:
+        self.rec_cache2 = rec_cache
 
-  def __unique_combinations__(self, in_list, n):
-    """Get unique combinations of length 'n' of the given input list. Based on
-       a recipe from Activestate Python cookbook, see:
+    if (self.do_deduplication == True):
+      self.rec_ident_list2 = self.rec_ident_list1
 
-       http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/190465
-    """
+    # Load the inverted indices - - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    num_blocks = 0
+    is_mapped =  False  # True if data is read from the mapped file
 
-    unique_combinations_funct = self.__unique_combinations__  # Shorthand
+    for i in range(len(self.index_def)):
 
-    if (n == 0):
-      yield []
-    else:
-      for i in xrange(len(in_list)):
-        for sub_list in unique_combinations_funct(in_list[i+1:],n-1):
-          yield [in_list[i]]+sub_list
+      for (ds_num, index, index_store) in ds_list:
+        section_suffix = '%d_%d' % (i, ds_num)
 
-  # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+        if (self.intern_rec_ids == True):  # Blocks are arrays of numbers
+          rec_ident_list = None
+        else:
+          rec_ident_list = rec_ident_lists[ds_num]
 
-  def __unique_combinations2__(self, in_list, n):
-    """Another version from Activestate Python cookbook, see:
+        mapped_index = _MappedBlockDict(index_mmap, section_dict,
+                                        section_suffix, rec_ident_list)
 
-       http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/66465
+        if (index_store == None):  # Blocks are read from the mapped file
+          this_index = mapped_index
+          is_mapped =  True
+        else:  # Copy the blocks into the disk store
+          this_index = self.__new_block_dict__(index_store, ds_num, i)
+          for (block_key, block) in mapped_index.iteritems():
+            this_index[block_key] = block
 
-       Seems to be of similar speed than the previous function.
-    """
+        index[i] = this_index
+        num_blocks += len(this_index)
 
-    unique_combinations_funct = self.__unique_combinations2__  # Shorthand
+      if (self.do_deduplication == True):
+        self.index2[i] = self.__new_block_dict__(self.index2_store, 2, i)
 
-    for i in xrange(len(in_list)):
-      if (n == 1):
-        yield in_list[i]
+    # Load the record pairs and index values of records - - - - - - - - - - - -
+    #
+    if (self.intern_rec_ids == True):  # Keys and values are record numbers
+      rec_ident_list1 = None
+      rec_ident_list2 = None
+    else:
+      rec_ident_list1 = rec_ident_lists[1]
+      rec_ident_list2 = rec_ident_lists.get(2, rec_ident_list1)
+
+    if ('rec_keys_pairs' in section_dict):
+      self.rec_pair_dict = _MappedRecPairDict(index_mmap, section_dict,
+                                              '_pairs', rec_ident_list1,
+                                              rec_ident_list2)
+      is_mapped = True
+
+    for (ds_num, rec_ident_list) in [(1, rec_ident_list1),
+                                     (2, rec_ident_list2)]:
+      section_suffix = '_index_vals%d' % (ds_num)
+
+      if (('rec_keys'+section_suffix) in section_dict):
+        rec_index_vals = _MappedIndexValDict(index_mmap, section_dict,
+                                             section_suffix, rec_ident_list,
+                                             len(self.index_def))
+        is_mapped = True
       else:
-        for sub_list in unique_combinations_funct(in_list[i+1:], n-1):
-          yield in_list[i] + sub_list
+        rec_index_vals = {}
+      setattr(self, 'rec_index_vals%d' % (ds_num), rec_index_vals)
 
-  # ---------------------------------------------------------------------------
+    # Load status and index specific data structures  - - - - - - - - - - - - -
+    #
+    state_dict = cPickle.loads(get_section('state'))
 
-  def compact(self):
-    """Method to compact an index data structure.
-       See implementations in derived classes for details.
-    """
+    for (attr_name, attr_value) in state_dict.iteritems():
+      setattr(self, attr_name, attr_value)
 
-    logging.exception('Override abstract method in derived class')
-    raise Exception
+    if (is_mapped == False):
+      index_mmap.close()
+    index_fp.close()
+
+    logging.info('Loaded index "%s" (%d blocks, status "%s") from file ' % \
+                 (self.description, num_blocks, self.status) + '"%s" in %s' % \
+                 (index_file_name, auxiliary.time_string(time.time() - \
+                                                         start_time)))
 
   # ---------------------------------------------------------------------------
 
-  def __dedup_rec_pairs__(self, rec_id_list, rec_pair_dict):
-    """Create record pairs for a deduplication using the given record
-       identifier list and insert them into the given record pair dictionary.
+  def save(self, index_file_name):
+    """Save an index into a binary file.
 
-       This version does not modify the input record identifier list. It does
-       create a local copy of the record identifer list which is then sorted.
+       The index must have been built (and possibly compacted). The inverted
+       indices are saved with their blocks converted into arrays of record
+       numbers, and the record pair dictionary and the index values of records
+       (if record pairs are streamed) in the same way with record numbers as
+       keys. The record caches and the remaining (small) state are pickled.
+       Index specific data structures are only needed to compact an index, so
+       they are only saved (pickled) if the index has not been compacted. If
+       meta-blocking is used, the record pairs of a compacted index are pruned
+       before it is saved.
     """
 
-    rec_cnt = 1  # Counter for second record identifier
+    auxiliary.check_is_string('index_file_name', index_file_name)
 
-    this_rec_id_list = rec_id_list[:]
-    this_rec_id_list.sort()
-    for rec_ident1 in this_rec_id_list:
+    if (self.supports_save == False):
+      logging.exception('Saving is not supported by index class %s' % \
+                        (self.__class__.__name__))
+      raise Exception
 
-      rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+    if (self.status not in ['built', 'compacted']):
+      logging.exception('Index "%s" has not been built, saving is not ' % \
+                        (self.description) + 'possible')
+      raise Exception
 
-      for rec_ident2 in this_rec_id_list[rec_cnt:]:
+    # The block counts of meta-blocking are not saved, so the record pairs of
+    # a compacted index are pruned first
+    #
+    if ((self.status == 'compacted') and (self.meta_blocking != None) and \
+        (self.meta_pruned == False)):
+      self.meta_block()
 
-        assert rec_ident1 != rec_ident2
+    start_time = time.time()
 
-        rec_ident2_set.add(rec_ident2)
+    # Write into a temporary file which then replaces the index file, as the
+    # blocks of a loaded index can be read from the (mapped) index file
+    #
+    tmp_file_name = index_file_name + '.tmp'
 
-      rec_pair_dict[rec_ident1] = rec_ident2_set
+    try:
+      index_fp = open(tmp_file_name, 'wb')
+    except:
+      logging.exception('Cannot open index file "%s" for writing' % \
+                        (tmp_file_name))
+      raise IOError
 
-      rec_cnt += 1
+    index_fp.write('\x00'*struct.calcsize(INDEX_FILE_PREAMBLE))
 
-    del this_rec_id_list
+    section_dict = {}
 
-  # ---------------------------------------------------------------------------
+    def write_section(name, data):  # Write an array or a string
+      index_fp.write('\x00'*((8 - index_fp.tell() % 8) % 8))  # Align
+      offset = index_fp.tell()
+      if (isinstance(data, str)):
+        index_fp.write(data)
+        section_dict[name] = ('s', offset, len(data))
+      else:
+        data.tofile(index_fp)
+        section_dict[name] = (data.typecode, offset, len(data))
 
-  def __link_rec_pairs__(self, rec_id_list1, rec_id_list2, rec_pair_dict):
-    """Create record pairs for a linkage using the given two record identifier
-       lists and insert them into the given record pair dictionary.
-    """
+    # Save the record caches and record identifiers - - - - - - - - - - - - - -
+    #
+    ds_list = [(1, self.index1, self.rec_cache1, self.rec_ident_list1)]
+    if (self.do_deduplication == False):
+      ds_list.append((2, self.index2, self.rec_cache2, self.rec_ident_list2))
 
-    for rec_ident1 in rec_id_list1:
-      for rec_ident2 in rec_id_list2:
+    rec_num_dicts = {}  # Record numbers of record identifiers (if these are
+                        # not interned)
 
-        rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
-        rec_ident2_set.add(rec_ident2)
-        rec_pair_dict[rec_ident1] = rec_ident2_set
+    for (ds_num, index, rec_cache, rec_ident_list) in ds_list:
 
-  # ---------------------------------------------------------------------------
+      if (self.intern_rec_ids == True):
+        rec_list = rec_cache
+      else:
+        rec_ident_list = sorted(rec_cache.keys())
+        rec_list = [rec_cache[rec_ident] for rec_ident in rec_ident_list]
+        rec_num_dicts[ds_num] = dict(zip(rec_ident_list,
+                                         xrange(len(rec_ident_list))))
+
+      (all_rec_ident_str, rec_ident_offsets) = \
+                                           _str_list_to_arrays(rec_ident_list)
+      write_section('rec_idents%d' % (ds_num), all_rec_ident_str)
+      write_section('rec_ident_offsets%d' % (ds_num), rec_ident_offsets)
+      write_section('rec_cache%d' % (ds_num), cPickle.dumps(rec_list, 2))
+
+    # Save the inverted indices - - - - - - - - - - - - - - - - - - - - - - - -
+    #
+    num_blocks = 0
 
-  def run(self):
-    """Run the record pair comparison accoding to the index.
-       See implementations in derived classes for details.
-    """
+    for i in range(len(self.index_def)):
 
-    logging.exception('Override abstract method in derived class')
-    raise Exception
+      for (ds_num, index, rec_cache, rec_ident_list) in ds_list:
+        section_suffix = '%d_%d' % (i, ds_num)
 
-  # ---------------------------------------------------------------------------
+        this_index =     index[i]
+        block_key_list = sorted(this_index.keys())
 
-  def __get_field_names_list__(self):
-    """Returns the list of all field comparison descriptions, to be used when
-       a weight vector file is written.
-    """
+        block_offsets = array.array('l', [0])
+        postings =      array.array('l')
 
-    field_names_list = []
-    for field_comp_tuple in self.rec_comparator.field_comparator_list:
-        field_names_list.append(field_comp_tuple[0].description)
-    return field_names_list
+        for block_key in block_key_list:
+          if (self.intern_rec_ids == True):
+            postings.extend(this_index[block_key])
+          else:
+            rec_num_dict = rec_num_dicts[ds_num]
+            postings.extend([rec_num_dict[rec_ident] for rec_ident in \
+                             this_index[block_key]])
+          block_offsets.append(len(postings))
 
-  # ---------------------------------------------------------------------------
+        (all_block_key_str, block_key_offsets) = \
+                                           _str_list_to_arrays(block_key_list)
+        write_section('keys'+section_suffix, all_block_key_str)
+        write_section('key_offsets'+section_suffix, block_key_offsets)
+        write_section('block_offsets'+section_suffix, block_offsets)
+        write_section('postings'+section_suffix, postings)
 
-  def __compare_rec_pairs_from_dict__(self, length_filter_perc = None,
-                                      cut_off_threshold = None):
-    """This method compares all the records pairs in the record pair dictionary
-       and puts the resulting weight vectors into a dictionary which is then
-       returned.
+        num_blocks += len(block_key_list)
 
-       If the argument 'length_filter_perc' is set to a percentage value
-       between 0.0 and 100.0 the lengths of the concatenated record values in
-       the fields used for comparison will be calculated, and if the difference
-       is larger than the given percentage value the record pair will not be
-       compared. For example, if a record A has values with a total length of
-       12 characters and a record B values with a length of 16 characters, then
-       their percentage difference will be:
+    # Save the record pairs and index values of records - - - - - - - - - - - -
+    #
+    def get_rec_nums(ds_num, rec_idents):  # Record numbers of identifiers
+      if (self.intern_rec_ids == True):
+        return list(rec_idents)
+      rec_num_dict = rec_num_dicts[ds_num]
+      return [rec_num_dict[rec_ident] for rec_ident in rec_idents]
+
+    def write_rec_keys(section_suffix, ds_num, rec_ident_list):  # Sorted
+      rec_num_list = get_rec_nums(ds_num, rec_ident_list)
+      key_list = sorted(zip(rec_num_list, rec_ident_list))
+      write_section('rec_keys'+section_suffix,
+                    array.array('l', [rec_num for (rec_num, rec_ident) in \
+                                      key_list]))
+      return [rec_ident for (rec_num, rec_ident) in key_list]
+
+    if (self.do_deduplication == True):
+      ds_num2 = 1
+    else:
+      ds_num2 = 2
 
-          |12-16| / (max(12,16) = 4 / 16 = 0.25 (25%)
+    if (hasattr(self, 'rec_pair_dict')):
+      rec_pair_dict = self.rec_pair_dict  # Shorthand
 
-       So if the value of 'length_filter_perc' is set to 20 this record pair
-       will be filtered out and not compared.
+      pair_offsets =  array.array('l', [0])
+      pair_postings = array.array('l')
 
-       Default value for 'length_filter_perc' is None, which means no length
-       filtering will be performed. For more information about filtering in the
-       record linkage process please refer to:
+      for rec_ident1 in write_rec_keys('_pairs', 1, rec_pair_dict.keys()):
+        pair_postings.extend(sorted(get_rec_nums(ds_num2,
+                                                 rec_pair_dict[rec_ident1])))
+        pair_offsets.append(len(pair_postings))
 
-       - Adaptive Filtering for Efficient Record Linkage
-         Lifang Gu and Rohan Baxter,
-         SIAM Data Mining conference, 2004.
+      write_section('rec_offsets_pairs', pair_offsets)
+      write_section('rec_values_pairs', pair_postings)
 
-       The second argument 'cut_off_threshold' can be set to a numerical value,
-       in which case all compared record pairs with a summed weight vector
-       value less than this threshold will not be stored in the weight vector
-       dictionary. Default value for 'cut_off_threshold' is None, which means
-       all compared record pairs will be stored in the weight vector
-       dictionary.
-    """
+    for (ds_num, rec_index_vals) in [(1, self.rec_index_vals1),
+                                     (2, self.rec_index_vals2)]:
+      if (len(rec_index_vals) > 0):
+        section_suffix = '_index_vals%d' % (ds_num)
 
-    # Check if weight vector file should be written - - - - - - - - - - - - - -
-    #
-    if (self.weight_vec_file != None):
-      try:
-        weight_vec_fp = open(self.weight_vec_file, 'w')
-      except:
-        logging.exception('Cannot write weight vector file: %s' % \
-                          (self.weight_vec_file))
-        raise Exception
-      weight_vec_writer = csv.writer(weight_vec_fp)
+        index_val_list = []
+        for rec_ident in write_rec_keys(section_suffix, ds_num,
+                                        rec_index_vals.keys()):
+          index_val_list.extend(rec_index_vals[rec_ident])
 
-      # Write header line with descriptions of field comparisons
-      #
-      weight_vec_header_line = ['rec_id1', 'rec_id2'] + \
-                                self.__get_field_names_list__()
-      weight_vec_writer.writerow(weight_vec_header_line)
+        (all_index_val_str, index_val_offsets) = \
+                                           _str_list_to_arrays(index_val_list)
+        write_section('rec_offsets'+section_suffix, index_val_offsets)
+        write_section('rec_values'+section_suffix, all_index_val_str)
 
-    # Calculate a counter for the progress report - - - - - - - - - - - - - - -
+    # Save status and index specific data structures  - - - - - - - - - - - - -
     #
-    if (self.progress_report != None):
-      progress_report_cnt = max(1, int(self.num_rec_pairs / \
-                                   (100.0 / self.progress_report)))
-    else:  # So no progress report is being logged
-      progress_report_cnt = self.num_rec_pairs + 1
+    state_dict = {'status':        self.status,
+                  'num_rec_pairs': self.num_rec_pairs,
+                  'meta_pruned':   self.meta_pruned}
+    if (self.new_block_dicts != None):
+      state_dict['new_block_dicts'] = self.new_block_dicts
+    if (self.status == 'built'):  # Only needed to compact the index
+      for attr_name in self.saved_attr_list:
+        if (hasattr(self, attr_name)):
+          state_dict[attr_name] = getattr(self, attr_name)
+
+    write_section('state', cPickle.dumps(state_dict, 2))
+
+    # Write the header and then the preamble with the header position - - - -
+    #
+    header_str = cPickle.dumps({'info':     self.__index_file_info__(),
+                                'sections': section_dict}, 2)
 
-    weight_vec_dict = {}  # Dictionary with calculated weight vectors
-    comp_done =       0   # Number of comparisons done
+    write_section('header', header_str)
+    header_offset = section_dict['header'][1]
 
-    rec_cache1 =       self.rec_cache1  # Shorthands to make program faster
-    rec_pair_dict =    self.rec_pair_dict
-    rec_comp =         self.rec_comparator.compare
-    rec_length_cache = self.rec_length_cache
+    index_fp.seek(0)
+    index_fp.write(struct.pack(INDEX_FILE_PREAMBLE, INDEX_FILE_MAGIC,
+                               INDEX_FILE_VERSION, 0, header_offset,
+                               len(header_str)))
+    index_fp.close()
 
-    # Check length filter and cut-off threshold arguments - - - - - - - - - - -
-    #
-    if (length_filter_perc != None):
-      auxiliary.check_is_percentage('Length filter percentage',
-                                    length_filter_perc)
-      logging.info('  Length filtering set to %.1f%%' % (length_filter_perc))
-      length_filter_perc /= 100.0  # Normalise
+    if ((os.name != 'posix') and os.path.exists(index_file_name)):
+      os.remove(index_file_name)  # Renaming does not replace files
+    os.rename(tmp_file_name, index_file_name)
 
-    if (cut_off_threshold != None):
-      auxiliary.check_is_number('Cut-off threshold', cut_off_threshold)
-      logging.info('  Cut-off threshold set to: %.2f' % (cut_off_threshold))
+    logging.info('Saved index "%s" (%d blocks) into file "%s" in %s' % \
+                 (self.description, num_blocks, index_file_name,
+                  auxiliary.time_string(time.time() - start_time)))
 
-    num_rec_pairs_filtered =    0  # Count number of removed record pairs
-    num_rec_pairs_below_thres = 0
+  # ---------------------------------------------------------------------------
 
-    # Set shorthand depending upon deduplication or linkage - - - - - - - - - -
+  def __process_index_def__(self, index_def_list):
+    """Check the given index definition (a list of definitions as described
+       in the class documentation) and return a tuple made of the processed
+       definitions (with column indices instead of field names), the compiled
+       functions that generate the index values (see __compile_index_def__())
+       and their cache statistics lists.
+    """
+
+    # Extract the field names from the two data set field name lists - - - - -
     #
-    if (self.do_deduplication == True):  # A deduplication run
-      rec_cache2 = self.rec_cache1
-    else:
-      rec_cache2 = self.rec_cache2
+    dataset1_field_names = []
+    dataset2_field_names = []
 
-    start_time = time.time()
+    for (field_name, field_data) in self.dataset1.field_list:
+      dataset1_field_names.append(field_name)
 
-    for rec_ident1 in rec_pair_dict:
+    for (field_name, field_data) in self.dataset2.field_list:
+      dataset2_field_names.append(field_name)
 
-      rec1 = rec_cache1[rec_ident1]  # Get the actual first record
+    auxiliary.check_is_list('Index definition list "%s"' % \
+                            (str(index_def_list)), index_def_list)
 
-      if (length_filter_perc != None):
-        rec1_len = len(''.join(rec1))  # Get length in characters for record
+    index_def_list_proc =       []
+    index_key_funct_list_proc = []
+    index_cache_stats_proc =    []
 
-      for rec_ident2 in rec_pair_dict[rec_ident1]:
+    for index_def in index_def_list:
 
-        rec2 = rec_cache2[rec_ident2]  # Get actual second record
+      auxiliary.check_is_list('Index definition "%s"' % \
+                              (str(index_def)), index_def)
+      if (index_def == []):
+        logging.info('Empty index definition given: %s' % \
+                     (str(index_def_list)))
 
-        do_comp = True  # Flag, specify if comparison should be done
+      # Check the two field names
+      #
+      field_name1 = index_def[0]
+      field_name2 = index_def[1]
 
-        if (length_filter_perc != None):
-          if (rec_ident2 in rec_length_cache):  # Length is cached
-            rec2_len = rec_length_cache[rec_ident2]
-          else:
-            rec2_len = len(''.join(rec2))
-            rec_length_cache[rec_ident2] = rec2_len
+      if (field_name1 not in dataset1_field_names):
+        logging.exception('Field "%s" is not in data set 1 field name ' \
+                          % (field_name1) + 'list: %s' % \
+                          (str(self.dataset1.field_list)))
+        raise Exception
+      field_index1 = dataset1_field_names.index(field_name1)
 
-          perc_diff = float(abs(rec1_len - rec2_len)) / max(rec1_len, rec2_len)
+      if (field_name2 not in dataset2_field_names):
+        logging.exception('Field "%s" is not in data set 2 field name ' \
+                          % (field_name2) + 'list: %s' % \
+                          (str(self.dataset2.field_list)))
+        raise Exception
+      field_index2 = dataset2_field_names.index(field_name2)
 
-          if (perc_diff > length_filter_perc):
-            do_comp = False  # Difference too large, don't do comparison
-            num_rec_pairs_filtered += 1
+      index_def_proc = [field_index1,field_index2] # Processed index def.
 
-        if (do_comp == True):
-          w_vec = rec_comp(rec1, rec2)  # Compare them
+      # Check if sort words flag is True or False
+      #
+      auxiliary.check_is_flag('Sort words flag', index_def[2])
+      index_def_proc.append(index_def[2])
 
-          if (cut_off_threshold == None) or (sum(w_vec) >= cut_off_threshold):
+      # Check if reverse flag is True or False
+      #
+      auxiliary.check_is_flag('Reverse flag', index_def[3])
+      index_def_proc.append(index_def[3])
 
-            # Put result into weight vector dictionary
-            #
-            if (self.weight_vec_file == None):
-              weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
-            else:
-              weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+      # Check maximum length is a positive integer or None
+      #
+      if (index_def[4] == None):
+        index_def_proc.append(None)
+      else:
+        auxiliary.check_is_integer('Maximum length', index_def[4])
+        auxiliary.check_is_positive('Maximum length', index_def[4])
+        index_def_proc.append(index_def[4])
 
-          else:
-            num_rec_pairs_below_thres += 1
+      # Check function definition
+      #
+      if ((index_def[5] != None) and (len(index_def[5]) > 0)):
+        index_funct_def = index_def[5]
+        auxiliary.check_is_function_or_method('Function "%s"' % \
+                         (index_funct_def[0]), index_funct_def[0])
+        if (len(index_funct_def) > 4):
+          logging.exception('Too many arguments for function call: %s' % \
+                            (str(index_funct_def)))
+          raise Exception
+        index_def_proc.append(index_funct_def)
+      else:
+        index_def_proc.append(None)
 
-        comp_done += 1  # Count all record pair comparisons (even if not done)
+      index_def_list_proc.append(index_def_proc)
 
-        if ((comp_done % progress_report_cnt) == 0):
-          self.__log_comparison_progress__(comp_done, start_time)
+      # Compile the index definition into a function (with cache)
+      #
+      cache_stats = [0, 0]  # Number of cache hits and misses
+      index_key_funct_list_proc.append(self.__compile_index_def__(
+                                       index_def_proc, cache_stats))
+      index_cache_stats_proc.append(cache_stats)
 
-    used_sec_str = auxiliary.time_string(time.time()-start_time)
-    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                         self.num_rec_pairs)
-    logging.info('Compared %d record pairs in %s (%s per pair)' % \
-                 (self.num_rec_pairs, used_sec_str,rec_time_str))
-    if (length_filter_perc != None):
-      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
-                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
-    if (cut_off_threshold != None):
-      logging.info('  %d record pairs had summed weights below threshold ' % \
-                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
+    return (index_def_list_proc, index_key_funct_list_proc,
+            index_cache_stats_proc)
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+  # ---------------------------------------------------------------------------
 
-    if (self.weight_vec_file == None):
-      return [self.__get_field_names_list__(), weight_vec_dict]
+  def __compile_index_def__(self, index_def_proc, cache_stats):
+    """Compile the given processed index definition into a function which for
+       a (lower case and non-empty) field value returns the index value (i.e.
+       with words sorted, reversed, with the index function applied and
+       truncated to the maximum length, as given in the index definition).
+
+       If the index definition contains a function and the 'index_cache_size'
+       is not None, then the index values of the most recently used field
+       values are kept in a LRU cache. The number of cache hits and misses are
+       counted in the given list 'cache_stats'.
+    """
+
+    sort_words = index_def_proc[2]
+    reverse =    index_def_proc[3]
+    max_len =    index_def_proc[4]
+    funct_def =  index_def_proc[5]
+
+    if (funct_def != None):
+      funct_call = funct_def[0]         # The function itself
+      funct_args = tuple(funct_def[1:])  # And its arguments
     else:
-      weight_vec_fp.close()
-      return None
+      funct_call = None
 
-  # ---------------------------------------------------------------------------
+    def get_index_key(field_val):
 
-  def __find_closest__(self, sorted_list, elem):
-    """Binary search of the given element 'elem' in the given sorted list, and
-       return index of exact match or closest match (before where the element
-       would be).
+      if ((sort_words == True) and (' ' in field_val)):
+        word_list = field_val.split()
+        word_list.sort()
+        field_val = ' '.join(word_list)
 
-       Used in BigMatch and Dedup indexing methods.
-    """
+      if (reverse == True):  # Reverse the index value
+        field_val = field_val[::-1]
 
-    start = 0
-    end =   len(sorted_list)-1
+      if (funct_call != None):  # There is a function defined for this index
+        field_val = funct_call(field_val, *funct_args)
 
-    while 1:
-      if (end < start):
-        return end  # Not found
+      if (max_len != None):  # There is  maximum length
+        field_val = field_val[:max_len]
 
-      middle = (start + end) / 2
-      middle_val = sorted_list[middle]  # Get the element from the middle
+      return field_val
 
-      if (middle_val == elem):  # Found the key value
-        return middle
-      elif (elem < middle_val):
-        end = middle - 1
-      else:
-        start = middle + 1
+    if ((funct_call == None) or (self.index_cache_size == None)):
+      return get_index_key  # Cheap to calculate or no cache, so no caching
 
-  # ---------------------------------------------------------------------------
+    # The LRU cache is a dictionary with field values as keys and elements of
+    # a circular doubly linked list as values. Each list element is a list
+    # [previous, next, field value, index value], with the least recently used
+    # element following the root element
+    #
+    max_cache_size = self.index_cache_size
+    cache =          {}
+    root =           []
+    root[:] =        [root, root, None, None]
 
-  def load(self, index_file_name):
-    """Load a previously saved index from a binary file.
-    """
+    def get_cached_index_key(field_val):
 
-    pass  # To be done
+      link = cache.get(field_val)
 
-  # ---------------------------------------------------------------------------
+      if (link != None):  # Cache hit, move element to end of list
+        (link_prev, link_next, field_val, index_val) = link
+        link_prev[1] = link_next
+        link_next[0] = link_prev
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
 
-  def save(self, index_file_name):
-    """Save an index into a binary file.
-    """
+        cache_stats[0] += 1
+        return index_val
+
+      index_val = get_index_key(field_val)
+      cache_stats[1] += 1
+
+      if (len(cache) >= max_cache_size):  # Remove least recently used value
+        oldest = root[1]
+        root[1] = oldest[1]
+        oldest[1][0] = root
+        del cache[oldest[2]]
+
+      last = root[0]
+      link = [last, root, field_val, index_val]
+      last[1] = root[0] = cache[field_val] = link
 
-    pass  # To be done
+      return index_val
 
-    # have to check that data sets are the same (have same field lists)
+    return get_cached_index_key
 
   # ---------------------------------------------------------------------------
 
@@ -1022,62 +4114,29 @@ class Indexing:
     index_var_values = []
 
     sep_str = self.index_sep_str
+    rec_len = len(rec)
 
     assert (data_set_num == 0) or (data_set_num == 1)
 
     # Go through the index definitions and extract and process field values - -
     #
-    for index_def_list in self.index_def_proc:
+    for (index_def_list, index_key_funct_list) in \
+        zip(self.index_def_proc, self.index_key_funct_list):
 
       index_val_list = []
 
-      for index_def in index_def_list:  # Loop over all the index' definitions
+      # Loop over all the index' definitions
+      #
+      for (index_def, index_key_funct) in zip(index_def_list,
+                                              index_key_funct_list):
 
         field_col = index_def[data_set_num]  # Column of the field to extract
 
-        if (field_col >= len(rec)):
-          field_val = ''
-        else:
+        if (field_col < rec_len):
           field_val = rec[field_col].lower()
 
-        if (field_val != ''):  # Field value is not empty
-
-          # Check for sorting of words
-          #
-          if ((' ' in field_val) and (index_def[2] == True)):
-            word_list = field_val.split()
-            word_list.sort()
-            field_val = ' '.join(word_list)
-
-          if (index_def[3] == True):  # Reverse the index value
-            field_val = field_val[::-1]
-
-          funct_def = index_def[5]
-
-          if (funct_def != None):  # There is a function defined for this index
-            funct_call =    funct_def[0]  # The function itself
-            num_funct_arg = len(funct_def)
-
-            if (num_funct_arg == 1):  # No arguments
-              funct_val = funct_call(field_val)
-            elif (num_funct_arg == 2):  # One argument
-              funct_val = funct_call(field_val, funct_def[1])
-            elif (num_funct_arg == 3):  # Two arguments
-              funct_val = funct_call(field_val, funct_def[1], funct_def[2])
-            elif (num_funct_arg == 4):  # Three arguments
-              funct_val = funct_call(field_val, funct_def[1], funct_def[2],
-                                     funct_def[3])
-            else:
-              logging.exception('Too many arguments for function call: %s' % \
-                                (str(funct_def)))
-              raise Exception
-          else:
-           funct_val = field_val  # No function applied to the field value
-
-          if (index_def[4] != None):  # There is  maximum length
-            funct_val = funct_val[:index_def[4]]
-
-          index_val_list.append(funct_val)
+          if (field_val != ''):  # Field value is not empty
+            index_val_list.append(index_key_funct(field_val))
 
       # Make it a string and add to list of index values
       #
@@ -1091,25 +4150,26 @@ class Indexing:
 
   # ---------------------------------------------------------------------------
 
-  def __open_shelve_file__(self, shelve_file_name):
-    """Open a shelve with the given file name, and clear all it's content.
-
-       Return the shelve.
+  def __new_block_dict__(self, index_store, ds_num, index_num):
+    """Return a new empty dictionary for the blocks of the given index number
+       and data set number (1 or 2). If the given disk store is not None the
+       dictionary is kept in this store.
     """
 
-    try:
-      this_shelve = shelve.open(shelve_file_name)
-    except:
-      logging.exception('Cannot open shelve: "%s"' % str(shelve_file_name))
-      raise Exception
+    if (index_store == None):
+      return {}
 
-    for rec_key in this_shelve:  # Now clear the shelve and remove all entries
+    return index_store.block_dict('index%d_%d' % (ds_num, index_num),
+                                  self.intern_rec_ids)
 
-        del this_shelve[rec_key]
+  # ---------------------------------------------------------------------------
 
-    this_shelve.sync()  # And make sure the database is updated
+  def __flush_disk_stores__(self):
+    """Write the buffers of all disk stores used by this index.
+    """
 
-    return this_shelve
+    for disk_store in self.disk_store_list:
+      disk_store.flush()
 
   # ---------------------------------------------------------------------------
 
@@ -1206,6 +4266,24 @@ class Indexing:
     if (self.weight_vec_file != None):
       logging.info('  Weight vectors will be written into: %s' % \
                    (self.weight_vec_file))
+    elif (self.weight_vec_store == True):
+      logging.info('  Weight vectors will be stored in a weight vector store')
+    if (self.stream_pairs == True):
+      logging.info('  Record pairs will be streamed block by block')
+    if (self.num_processes > 1):
+      logging.info('  Record pairs will be compared using %d processes' % \
+                   (self.num_processes))
+    if (self.intern_rec_ids == True):
+      logging.info('  Record identifiers are interned as record numbers')
+    if (self.index_cache_size == None):
+      logging.info('  Index values are not cached')
+    else:
+      logging.info('  Index value cache size: %d' % (self.index_cache_size))
+    if (self.incremental == True):
+      logging.info('  Records can be added incrementally')
+    if (self.meta_blocking != None):
+      logging.info('  Record pairs will be pruned by meta-blocking: %s' % \
+                   (str(self.meta_blocking)))
 
     if (instance_var_list != None):
       logging.info('  Index specific variables:')
@@ -1253,11 +4331,352 @@ class Indexing:
 
   # ---------------------------------------------------------------------------
 
+  def learn_index_def(self, true_match_set, target_pc = 95.0,
+                      sample_size = 1000, encode_funct_list = None,
+                      max_len_list = None, max_num_fields = 2,
+                      min_red_ratio = 0.9):
+    """Select index definitions from candidate definitions using a set of
+       known true matches (tuples with a record identifier from data set 1
+       and a record identifier from data set 2).
+
+       Candidate field definitions are built from the pairs of fields used by
+       the record comparator, with no encoding and a maximum length from the
+       list 'max_len_list' (default [None, 2, 4]), or with one of the
+       encoding functions in the list 'encode_funct_list' (default
+       encode.soundex, encode.nysiis and encode.dmetaphone). Candidate index
+       definitions are made of up to 'max_num_fields' (1 or 2) field
+       definitions on different fields.
+
+       The number of record pairs of each candidate is estimated from the
+       blocks of a random sample of about 'sample_size' records per data set,
+       and candidates with an estimated reduction ratio below
+       'min_red_ratio' are not used. The pairs completeness is calculated
+       from the records of the true matches. The index definitions are then
+       selected greedily, each time taking the candidate that adds the most
+       true matches per added record pair (in the sample), until the pairs
+       completeness reaches 'target_pc' (a percentage), or no candidate adds
+       further true matches.
+
+       Returns a tuple with the selected list of index definitions (that can
+       be given as 'index_def' argument to an index), the estimated number of
+       record pairs, reduction ratio and pairs completeness of this list.
+    """
+
+    auxiliary.check_is_set('true_match_set', true_match_set)
+    auxiliary.check_is_percentage('target_pc', target_pc)
+    auxiliary.check_is_integer('sample_size', sample_size)
+    auxiliary.check_is_positive('sample_size', sample_size)
+    auxiliary.check_is_integer('max_num_fields', max_num_fields)
+    if (max_num_fields not in [1,2]):
+      logging.exception('Value of "max_num_fields" must be 1 or 2: %s' % \
+                        (str(max_num_fields)))
+      raise Exception
+    auxiliary.check_is_normalised('min_red_ratio', min_red_ratio)
+
+    if (encode_funct_list == None):
+      encode_funct_list = [encode.soundex, encode.nysiis, encode.dmetaphone]
+    if (max_len_list == None):
+      max_len_list = [None, 2, 4]
+
+    logging.info('')
+    logging.info('Learn index definitions for index "%s" from %d true ' % \
+                 (self.description, len(true_match_set)) + 'matches')
+
+    start_time = time.time()
+
+    # Build the candidate index definitions - - - - - - - - - - - - - - - - - -
+    #
+    field_name_list1 = [field_name for (field_name, field_data) in \
+                        self.dataset1.field_list]
+    field_name_list2 = [field_name for (field_name, field_data) in \
+                        self.dataset2.field_list]
+
+    field_pair_list = []
+    for (comp, f_ind1, f_ind2) in self.rec_comparator.field_comparison_list:
+      field_pair = (field_name_list1[f_ind1], field_name_list2[f_ind2])
+      if (field_pair not in field_pair_list):
+        field_pair_list.append(field_pair)
+
+    field_def_list = []  # Pairs of field pair number and field definition
+
+    for f in range(len(field_pair_list)):
+      (field_name1, field_name2) = field_pair_list[f]
+
+      for max_len in max_len_list:
+        field_def_list.append((f, [field_name1, field_name2, False, False,
+                                   max_len, []]))
+      for encode_funct in encode_funct_list:
+        field_def_list.append((f, [field_name1, field_name2, False, False,
+                                   None, [encode_funct]]))
+
+    # Candidates are lists of field definition numbers
+    #
+    cand_field_list = [[j] for j in range(len(field_def_list))]
+
+    if (max_num_fields == 2):
+      for j in range(len(field_def_list)):
+        for k in range(j+1, len(field_def_list)):
+          if (field_def_list[j][0] != field_def_list[k][0]):
+            cand_field_list.append([j, k])
+
+    cand_index_def_list = []
+    for field_def_num_list in cand_field_list:
+      cand_index_def_list.append([list(field_def_list[j][1]) for j in \
+                                  field_def_num_list])
+
+    (field_def_proc_list, key_funct_list, cache_stats) = \
+       self.__process_index_def__([field_def for (f, field_def) in \
+                                   field_def_list])
+
+    # Index values of a record for all candidates (as in the method
+    # __get_index_values__())
+    #
+    sep_str = self.index_sep_str
+
+    def get_cand_index_values(rec, data_set_num):
+      field_val_list = []
+      for (field_def_proc, key_funct) in zip(field_def_proc_list,
+                                             key_funct_list):
+        field_col = field_def_proc[data_set_num]
+        field_val = ''
+        if (field_col < len(rec)):
+          field_val = rec[field_col].lower()
+        if (field_val != ''):
+          field_val_list.append(key_funct(field_val))
+        else:
+          field_val_list.append(None)
+
+      cand_val_list = []
+      for field_def_num_list in cand_field_list:
+        index_val_list = []
+        for j in field_def_num_list:
+          if (field_val_list[j] != None):
+            index_val_list.append(field_val_list[j])
+        cand_val_list.append(sep_str.join(index_val_list))
+      return cand_val_list
+
+    # Read the sampled and the true match records - - - - - - - - - - - - - - -
+    #
+    match_rec_ident_set1 = set([rec_pair[0] for rec_pair in true_match_set])
+    match_rec_ident_set2 = set([rec_pair[1] for rec_pair in true_match_set])
+
+    if (self.do_deduplication == True):
+      match_rec_ident_set1 = match_rec_ident_set1.union(match_rec_ident_set2)
+      read_list = [(self.dataset1, 0, match_rec_ident_set1)]
+    else:
+      read_list = [(self.dataset1, 0, match_rec_ident_set1),
+                   (self.dataset2, 1, match_rec_ident_set2)]
+
+    sample_list =    []  # For each data set the sampled candidate values
+    match_val_list = []  # For each data set a dictionary with the candidate
+                         # values of the true match records
+    sample_perc_list = []
+
+    for (this_dataset, ds_index, match_rec_ident_set) in read_list:
+      sample_prob = min(1.0, float(sample_size) / \
+                        max(1, this_dataset.num_records))
+
+      ds_sample_list = []
+      ds_match_val_dict = {}
+
+      for (rec_ident, rec) in this_dataset.readall():
+        is_sampled = (random.random() < sample_prob)
+
+        if ((is_sampled == True) or (rec_ident in match_rec_ident_set)):
+          cand_val_list = get_cand_index_values(rec, ds_index)
+          if (is_sampled == True):
+            ds_sample_list.append(cand_val_list)
+          if (rec_ident in match_rec_ident_set):
+            ds_match_val_dict[rec_ident] = cand_val_list
+
+      sample_list.append(ds_sample_list)
+      match_val_list.append(ds_match_val_dict)
+      sample_perc_list.append(float(len(ds_sample_list)) / \
+                              max(1, this_dataset.num_records))
+
+    if (self.do_deduplication == True):
+      num_all_pairs = self.dataset1.num_records * \
+                      (self.dataset1.num_records-1) / 2
+      sample_factor = sample_perc_list[0]**2
+      sample_list.append(sample_list[0])
+      match_val_list.append(match_val_list[0])
+    else:
+      num_all_pairs = self.dataset1.num_records * self.dataset2.num_records
+      sample_factor = sample_perc_list[0] * sample_perc_list[1]
+
+    num_all_pairs = max(1, num_all_pairs)
+    sample_factor = max(sample_factor, 1.0 / num_all_pairs)
+
+    true_match_list = []  # The true matches with both records read
+    for (rec_ident1, rec_ident2) in true_match_set:
+      if ((rec_ident1 in match_val_list[0]) and \
+          (rec_ident2 in match_val_list[1])):
+        true_match_list.append((rec_ident1, rec_ident2))
+
+    if (len(true_match_list) < len(true_match_set)):
+      logging.warn('%d true matches contain records not in the data sets' % \
+                   (len(true_match_set) - len(true_match_list)))
+    if (true_match_list == []):
+      logging.exception('No true matches with records in the data sets')
+      raise Exception
+
+    # Sampled record pairs and true matches of all candidates - - - - - - - -
+    #
+    num_sample2 = len(sample_list[1])
+    skip_missing = self.skip_missing
+
+    cand_stats_list = []  # Tuples with candidate number, sampled record
+                          # pairs (as numbers) and true matches (as numbers)
+
+    for c in range(len(cand_index_def_list)):
+
+      block_dict = {}
+      for ds_index in [0,1]:
+        if ((ds_index == 1) and (self.do_deduplication == True)):
+          break
+        r = 0
+        for cand_val_list in sample_list[ds_index]:
+          index_val = cand_val_list[c]
+          if ((index_val != '') or (skip_missing == False)):
+            block_recs = block_dict.get(index_val)
+            if (block_recs == None):
+              block_recs = ([], [])
+              block_dict[index_val] = block_recs
+            block_recs[ds_index].append(r)
+          r += 1
+
+      num_sample_pairs = 0
+      for (block_recs1, block_recs2) in block_dict.itervalues():
+        if (self.do_deduplication == True):
+          num_sample_pairs += len(block_recs1) * (len(block_recs1)-1) / 2
+        else:
+          num_sample_pairs += len(block_recs1) * len(block_recs2)
+
+      if ((1.0 - num_sample_pairs / sample_factor / num_all_pairs) < \
+          min_red_ratio):
+        continue  # Too many record pairs
+
+      sample_pair_set = set()
+      for (block_recs1, block_recs2) in block_dict.itervalues():
+        if (self.do_deduplication == True):
+          for j in range(len(block_recs1)):
+            for r2 in block_recs1[j+1:]:
+              sample_pair_set.add(block_recs1[j]*num_sample2 + r2)
+        else:
+          for r1 in block_recs1:
+            for r2 in block_recs2:
+              sample_pair_set.add(r1*num_sample2 + r2)
+
+      match_set = set()
+      for m in range(len(true_match_list)):
+        (rec_ident1, rec_ident2) = true_match_list[m]
+        index_val = match_val_list[0][rec_ident1][c]
+        if ((index_val == match_val_list[1][rec_ident2][c]) and \
+            ((index_val != '') or (skip_missing == False))):
+          match_set.add(m)
+
+      if (len(match_set) > 0):
+        cand_stats_list.append((c, sample_pair_set, match_set))
+
+    logging.info('  %d of %d candidate index definitions can be used' % \
+                 (len(cand_stats_list), len(cand_index_def_list)))
+
+    # Greedy selection of the candidates - - - - - - - - - - - - - - - - - - -
+    #
+    index_def_list =  []
+    union_pair_set =  set()
+    union_match_set = set()
+
+    pairs_compl = 0.0
+
+    while ((pairs_compl < target_pc) and (cand_stats_list != [])):
+
+      best_cand = None
+      best_gain = None
+
+      for cand in cand_stats_list:
+        num_new_matches = len(cand[2] - union_match_set)
+        if (num_new_matches == 0):
+          continue
+        num_new_pairs = len(cand[1] - union_pair_set)
+        gain = (float(num_new_matches) / (num_new_pairs + 1), -num_new_pairs)
+        if ((best_gain == None) or (gain > best_gain)):
+          best_cand = cand
+          best_gain = gain
+
+      if (best_cand == None):  # No candidate adds true matches
+        break
+
+      cand_stats_list.remove(best_cand)
+      index_def_list.append(cand_index_def_list[best_cand[0]])
+      union_pair_set.update(best_cand[1])
+      union_match_set.update(best_cand[2])
+
+      pairs_compl = 100.0 * len(union_match_set) / len(true_match_list)
+
+      logging.info('  Selected index definition: %s' % \
+                   (str(index_def_list[-1])))
+      logging.info('    Pairs completeness: %.2f%%' % (pairs_compl))
+
+    num_rec_pairs = int(round(len(union_pair_set) / sample_factor))
+    red_ratio =     max(0.0, 1.0 - float(num_rec_pairs) / num_all_pairs)
+
+    if (pairs_compl < target_pc):
+      logging.warn('Target pairs completeness of %.2f%% not reached' % \
+                   (target_pc))
+
+    logging.info('  Learned %d index definitions in %s' % \
+                 (len(index_def_list),
+                  auxiliary.time_string(time.time()-start_time)))
+    logging.info('    Estimated number of record pairs: %d' % (num_rec_pairs))
+    logging.info('    Estimated reduction ratio:        %.4f' % (red_ratio))
+    logging.info('    Pairs completeness:               %.2f%%' % \
+                 (pairs_compl))
+
+    return (index_def_list, num_rec_pairs, red_ratio, pairs_compl)
+
+  # ---------------------------------------------------------------------------
+
   def get_index_stats(self):
     """Extract and log information about the index.
+
+       Currently these are the numbers of hits and misses of the cache for
+       the index values of each index definition (see the 'index_cache_size'
+       argument). Returns a list with one element per index, each being a
+       list with one tuple (number of cache hits, number of cache misses) per
+       index definition. For index definitions without cache, these tuples
+       are (0, 0).
     """
 
-    pass
+    index_stats_list = []
+
+    logging.info('')
+    logging.info('Statistics for index "%s":' % (self.description))
+
+    if (self.index_cache_size == None):
+      logging.info('  Caching of index values is not activated')
+    else:
+      logging.info('  Index value cache size: %d' % (self.index_cache_size))
+
+    for i in range(len(self.index_cache_stats)):
+      logging.info('    Index %d:' % (i))
+
+      index_stats = []
+
+      for j in range(len(self.index_cache_stats[i])):
+        (num_hits, num_misses) = self.index_cache_stats[i][j]
+        index_stats.append((num_hits, num_misses))
+
+        if ((num_hits + num_misses) == 0):
+          logging.info('      Definition %d: No cache hits or misses' % (j))
+        else:
+          logging.info('      Definition %d: %d cache hits, %d misses ' % \
+                       (j, num_hits, num_misses) + '(hit rate %.2f%%)' % \
+                       (100.0*num_hits / (num_hits + num_misses)))
+
+      index_stats_list.append(index_stats)
+
+    return index_stats_list
 
 # =============================================================================
 
@@ -1371,6 +4790,9 @@ class FullIndex(Indexing):
        record identifier 2), and corresponding values the comparison weights.
 
        Length filtering and cut-off threshold will both be ignored.
+
+       If 'num_processes' is larger than 1, the records from the large data set
+       are compared in chunks by worker processes.
     """
 
     logging.info('Started comparison of %d record pairs' % \
@@ -1413,15 +4835,62 @@ class FullIndex(Indexing):
     else:  # So no progress report is being logged
       progress_report_cnt = self.num_rec_pairs + 1
 
-    weight_vec_dict = {}  # Dictionary with calculated weight vectors
+    weight_vec_dict = self.__new_weight_vec_dict__()  # Calculated weight
+                                                      # vectors
+
+    comp_done = 0  # Counter for the number of comparisons done so far
+
+    rec_comp_batch =      self.rec_comparator.compare_batch  # Shorthands
+    small_data_set_dict = self.small_data_set_dict
+    rec_length_cache =    self.rec_length_cache
+
+    def store_w_vec_list(w_vec_list):  # Put weight vectors into dictionary
+                                       # or write them into the file
+      for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+        if (self.weight_vec_file == None):
+          weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+        else:
+          weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+
+    if (self.num_processes > 1):  # Compare record pairs in parallel - - - - -
+
+      if (self.do_deduplication == True):
+        small_data_set_rec_id_list = small_data_set_dict.keys()
+        small_data_set_rec_id_list.sort()
+
+        rec_pair_iter = ((small_data_set_rec_id_list[i],
+                          small_data_set_rec_id_list[i+1:]) for i in \
+                         xrange(len(small_data_set_rec_id_list)))
+        rec_chunk_iter = self.__rec_pair_chunks__(rec_pair_iter,
+                                                  small_data_set_dict)
+      else:
+        rec_chunk_iter = self.__large_dataset_chunks__()
+
+      for (chunk_comp_done, chunk_w_vec_list, chunk_num_filtered,
+           chunk_num_below_thres) in \
+          self.__compare_rec_pair_chunks__(rec_chunk_iter,
+                                           small_data_set_dict, None, None):
 
-    comp_done = 0  # Counter for the number of comparisons done so far
+        for (rec_ident1, rec_ident2, w_vec) in chunk_w_vec_list:
 
-    compare_funct =       self.rec_comparator.compare  # Shorthands
-    small_data_set_dict = self.small_data_set_dict
-    rec_length_cache =    self.rec_length_cache
+          if ((self.do_deduplication == False) and (self.ds_swapped == False)):
+            rec_id_pair = (rec_ident2, rec_ident1)
+          else:
+            rec_id_pair = (rec_ident1, rec_ident2)
+
+          if (self.weight_vec_file == None):
+            weight_vec_dict[rec_id_pair] = w_vec
+          else:
+            weight_vec_writer.writerow(list(rec_id_pair)+w_vec)
 
-    if (self.do_deduplication == True):  # A deduplication run - - - - - - - -
+        prev_comp_done = comp_done
+        comp_done +=     chunk_comp_done
+
+        if ((comp_done / progress_report_cnt) > \
+            (prev_comp_done / progress_report_cnt)):
+          self.__log_comparison_progress__(comp_done, start_time)
+
+    elif (self.do_deduplication == True):  # A deduplication run - - - - - - -
 
       # Need a sorted list of all record identifiers
       #
@@ -1430,6 +4899,8 @@ class FullIndex(Indexing):
 
       rec_cnt = 1  # Counter for second record identifier
 
+      batch_list = []  # Record pairs to be compared in the next batch
+
       for rec_ident1 in small_data_set_rec_id_list:
         rec1 = small_data_set_dict[rec_ident1]  # Get values of first record
 
@@ -1439,14 +4910,14 @@ class FullIndex(Indexing):
 
           rec2 = small_data_set_dict[rec_ident2]  # Get values of second record
 
-          w_vec = compare_funct(rec1, rec2)  # Compare them
+          batch_list.append((rec_ident1, rec_ident2, rec1, rec2))
 
-          # Put result into weight vector dictionary
-          #
-          if (self.weight_vec_file == None):
-            weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
-          else:
-            weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+          if (len(batch_list) >= COMPARE_BATCH_SIZE):  # Compare them
+            w_vec_list = []
+            _compare_rec_pair_batch(rec_comp_batch, batch_list, None,
+                                    w_vec_list)
+            store_w_vec_list(w_vec_list)
+            batch_list = []
 
           comp_done += 1
 
@@ -1455,8 +4926,15 @@ class FullIndex(Indexing):
 
         rec_cnt += 1
 
+      if (batch_list != []):  # Compare the last batch
+        w_vec_list = []
+        _compare_rec_pair_batch(rec_comp_batch, batch_list, None, w_vec_list)
+        store_w_vec_list(w_vec_list)
+
     else: # A linkage run - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
+      batch_list = []  # Record pairs to be compared in the next batch
+
       for (rec_ident1, rec1) in self.large_dataset.readall():
 
         rec1_lower = []  # Make all values lowercase
@@ -1466,29 +4944,33 @@ class FullIndex(Indexing):
 
         for (rec_ident2, rec2) in small_data_set_dict.iteritems():
 
-          w_vec = compare_funct(rec1, rec2)  # Compare them
-
-          # Put result into weight vector dictionary
+          # Record identifiers are stored in the order of the data sets
           #
-          if (self.weight_vec_file == None):
-            if (self.ds_swapped == True):
-              weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
-            else:
-              weight_vec_dict[(rec_ident2, rec_ident1)] = w_vec
+          if (self.ds_swapped == True):
+            batch_list.append((rec_ident1, rec_ident2, rec1, rec2))
           else:
-            if (self.ds_swapped == True):
-              weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
-            else:
-              weight_vec_writer.writerow([rec_ident2, rec_ident1]+w_vec)
+            batch_list.append((rec_ident2, rec_ident1, rec1, rec2))
+
+          if (len(batch_list) >= COMPARE_BATCH_SIZE):  # Compare them
+            w_vec_list = []
+            _compare_rec_pair_batch(rec_comp_batch, batch_list, None,
+                                    w_vec_list)
+            store_w_vec_list(w_vec_list)
+            batch_list = []
 
           comp_done += 1
 
           if ((comp_done % progress_report_cnt) == 0):
             self.__log_comparison_progress__(comp_done, start_time)
 
+      if (batch_list != []):  # Compare the last batch
+        w_vec_list = []
+        _compare_rec_pair_batch(rec_comp_batch, batch_list, None, w_vec_list)
+        store_w_vec_list(w_vec_list)
+
     used_sec_str = auxiliary.time_string(time.time()-start_time)
     rec_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                         self.num_rec_pairs)
+                                         max(1, self.num_rec_pairs))
     logging.info('Compared %d record pairs in %s (%s per pair)' % \
                  (self.num_rec_pairs, used_sec_str,rec_time_str))
 
@@ -1502,6 +4984,36 @@ class FullIndex(Indexing):
       weight_vec_fp.close()
       return None
 
+  # ---------------------------------------------------------------------------
+
+  def __large_dataset_chunks__(self):
+    """A generator which reads the records from the large data set and returns
+       them in chunks to be compared by worker processes with all records from
+       the small data set (in the format as used by the function
+       _compare_rec_pair_chunk()).
+    """
+
+    CHUNK_NUM_REC_PAIRS = 10000  # Approximate number of record pairs per chunk
+
+    chunk_num_recs = max(1, CHUNK_NUM_REC_PAIRS / \
+                            max(1, len(self.small_data_set_dict)))
+    chunk = []
+
+    for (rec_ident1, rec1) in self.large_dataset.readall():
+
+      rec1_lower = []  # Make all values lowercase
+      for rec_val in rec1:
+        rec1_lower.append(rec_val.lower())
+
+      chunk.append((rec_ident1, rec1_lower, None))
+
+      if (len(chunk) >= chunk_num_recs):
+        yield chunk
+        chunk = []
+
+    if (chunk != []):
+      yield chunk
+
 # =============================================================================
 
 class BlockingIndex(Indexing):
@@ -1509,20 +5021,142 @@ class BlockingIndex(Indexing):
 
      Records that have the same index variable values for an index are put into
      the same blocks, and only records within a block are then compared.
+
+     This index supports the 'stream_pairs' argument of the base class, in
+     which case no record pair dictionary is built in the compact() method.
+
+     This index also supports the 'incremental' argument of the base class.
+     Once records have been added with the add_records() method, only the
+     blocks that contain new records are processed when the index is
+     compacted.
+
+     As a few very large blocks (for example for common surnames) can produce
+     most of the record pairs, the number of record pairs generated for large
+     blocks can be bounded with the following additional arguments:
+
+       max_block_size      A positive integer. Blocks that contain more
+                           records than this (for a linkage the records from
+                           both data sets) are handled according to the
+                           'large_block_method' when the index is compacted.
+                           Default value is None, in which case all blocks
+                           are handled in the same way.
+       large_block_method  A tuple that specifies how large blocks are
+                           handled, one of:
+                           ('drop',)
+                             No record pairs are generated for large blocks.
+                             This is the default.
+                           ('split', key_def)
+                             Large blocks are split into smaller blocks using
+                             the values of a secondary key, given as an index
+                             definition (a list of definitions in the same
+                             format as used for 'index_def'). Smaller blocks
+                             that are still large are dropped.
+                           ('window', window_size, key_def)
+                             The records in large blocks are sorted according
+                             to the values of a secondary key (defined as for
+                             'split'), and each record is only compared with
+                             the records in a window of the next
+                             'window_size'-1 records (as in the sorted
+                             neighbourhood approach).
+                           The secondary key values are calculated from the
+                           records in the record caches, so only fields used
+                           by the record comparator can be used in 'key_def'.
+
+     Large blocks cannot be handled if record pairs are streamed. For an
+     incremental index, record pairs generated before records were added are
+     kept even if their block has since become large (or, for 'window', the
+     records have moved apart), so the record pairs are a superset of the
+     record pairs of an index built from all records.
+
+     The get_block_stats() method can be used after the index has been built
+     to get the distribution of block sizes and the estimated numbers of
+     record pairs, and the get_max_block_size() method returns the largest
+     maximum block size for which the estimated number of record pairs is
+     within a given budget.
   """
 
+  supports_stream_pairs = True
+  supports_intern_rec_ids = True
+  supports_save = True
+  supports_incremental = True
+  supports_meta_blocking = True
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """No additional attributes needed, just call base class constructor.
+    """Constructor. Process the 'max_block_size' and 'large_block_method'
+       arguments first, then call the base class constructor.
 
        Note that number of record pairs will not be known after initialisation
        (so it is left at value None).
     """
 
-    Indexing.__init__(self, kwargs)  # Initialise base class
+    self.max_block_size =     None
+    self.large_block_method = ('drop',)
+
+    self.block_key_def_proc =   None  # Processed secondary key definition
+    self.block_key_funct_list = None  # and its functions
+
+    base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
+                      # class constructor
+
+    for (keyword, value) in kwargs.items():
+
+      if (keyword.startswith('max_block')):
+        if (value != None):
+          auxiliary.check_is_integer('max_block_size', value)
+          auxiliary.check_is_positive('max_block_size', value)
+        self.max_block_size = value
+
+      elif (keyword.startswith('large_block')):
+        auxiliary.check_is_tuple('large_block_method', value)
+        if ((len(value) == 0) or \
+            (value[0] not in ['drop', 'split', 'window'])):
+          logging.exception('Value of "large_block_method" must start ' + \
+                            'with "drop", "split" or "window": %s' % \
+                            (str(value)))
+          raise Exception
+        if (((value[0] == 'drop') and (len(value) != 1)) or \
+            ((value[0] == 'split') and (len(value) != 2)) or \
+            ((value[0] == 'window') and (len(value) != 3))):
+          logging.exception('Wrong number of elements in ' + \
+                            '"large_block_method": %s' % (str(value)))
+          raise Exception
+        if (value[0] == 'window'):
+          auxiliary.check_is_integer('large_block_method window size',
+                                     value[1])
+          auxiliary.check_is_positive('large_block_method window size',
+                                      value[1])
+        self.large_block_method = value
 
-    self.log()  # Log a message
+      else:
+        base_kwargs[keyword] = value
+
+    Indexing.__init__(self, base_kwargs)  # Initialise base class
+
+    # Process the secondary key definition used for large blocks - - - - - - -
+    #
+    if (self.large_block_method[0] != 'drop'):
+      key_def_list = self.large_block_method[-1]
+
+      (self.block_key_def_proc, self.block_key_funct_list, cache_stats) = \
+                                      self.__process_index_def__(key_def_list)
+
+      for key_def_proc in self.block_key_def_proc:
+        if ((key_def_proc[0] not in self.comp_field_used1) or \
+            (key_def_proc[1] not in self.comp_field_used2)):
+          logging.exception('Fields in secondary key definition of ' + \
+                            '"large_block_method" must be used by the ' + \
+                            'record comparator: %s' % (str(key_def_list)))
+          raise Exception
+
+    if ((self.max_block_size != None) and (self.stream_pairs == True)):
+      logging.exception('Large blocks cannot be handled if record pairs ' + \
+                        'are streamed')
+      raise Exception
+
+    self.log([('Maximum block size', self.max_block_size),
+              ('Large block method', self.large_block_method)])
 
   # ---------------------------------------------------------------------------
 
@@ -1573,163 +5207,622 @@ class BlockingIndex(Indexing):
                      (i, len(self.index1[i]))+'for data set 2 contains %d' % \
                      (len(self.index2[i]))+' blocks')
 
-        for block_val in self.index1[i]: # Loop over all block values in index
-          block_num_recs1 = len(self.index1[i][block_val])
+        for block_val in self.index1[i]: # Loop over all block values in index
+          block_num_recs1 = len(self.index1[i][block_val])
+
+          if block_val in self.index2[i]:  # Blocking values is both data sets'
+                                           # index
+            block_num_recs2 = len(self.index2[i][block_val])
+
+            if (block_num_recs1 > largest_block_num_rec):  # New largest block
+              largest_block_num_rec =   block_num_recs1
+              largest_block_val =       block_val
+              largest_block_index_num = i
+
+            if (block_num_recs2 > largest_block_num_rec):  # New largest block
+              largest_block_num_rec =   block_num_recs2
+              largest_block_val =       block_val
+              largest_block_index_num = i
+
+            self.num_rec_pairs += block_num_recs1*block_num_recs2
+
+    logging.info('Built blocking index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+
+    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+    logging.info('  Largest block with value "%s" contains %d records' % \
+                 (largest_block_val, largest_block_num_rec)+' (in index %d)' \
+                 % (largest_block_index_num))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    self.status = 'built'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def add_records(self, new_dataset1 = None, new_dataset2 = None):
+    """Add the records from new data sets into the blocks of an incremental
+       index, see the base class method for details.
+
+       Then calculate the number of record pairs that contain at least one new
+       record.
+    """
+
+    start_time = time.time()
+
+    Indexing.add_records(self, new_dataset1, new_dataset2)
+
+    self.num_rec_pairs = 0
+
+    for i in range(len(self.index_def)):
+
+      this_index1 = self.index1[i]  # Shorthands
+      this_index2 = self.index2[i]
+
+      if (self.new_block_dicts == None):  # Not compacted yet, all records
+                                          # are new
+        for block_val in this_index1:
+          block_num_recs1 = len(this_index1[block_val])
+
+          if (self.do_deduplication == True):
+            self.num_rec_pairs += block_num_recs1*(block_num_recs1-1)/2
+          elif (block_val in this_index2):
+            self.num_rec_pairs += block_num_recs1*len(this_index2[block_val])
+
+        logging.info('  Index %d contains %d blocks' % \
+                     (i, len(this_index1)))
+        continue
+
+      for (block_val, old_len_list) in self.new_block_dicts[i].iteritems():
+
+        if (self.do_deduplication == True):  # A deduplication - - - - - - - -
+          old_num_recs = old_len_list[0]
+          new_num_recs = len(this_index1[block_val]) - old_num_recs
+
+          self.num_rec_pairs += new_num_recs*old_num_recs + \
+                                new_num_recs*(new_num_recs-1)/2
+
+        else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - -
+          block_num_recs1 = len(this_index1.get(block_val, []))
+          block_num_recs2 = len(this_index2.get(block_val, []))
+
+          self.num_rec_pairs += block_num_recs1*block_num_recs2 - \
+                                old_len_list[0]*old_len_list[1]
+
+      logging.info('  Index %d contains %d blocks with new records' % \
+                   (i, len(self.new_block_dicts[i])))
+
+    logging.info('Added records to blocking index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of new record pairs: %d' % (self.num_rec_pairs))
+
+  # ---------------------------------------------------------------------------
+
+  def compact(self):
+    """Method to compact an index data structure.
+
+       Make a dictionary of all record pairs over all indices, which removes
+       duplicate record pairs.
+
+       If record pairs are streamed, the blocks are kept and nothing else is
+       done. The number of record pairs then stays the estimate calculated in
+       the build() method (which includes record pairs that occur in blocks
+       of several indices), and it is set to the number of unique record
+       pairs once these have been streamed in the run() method.
+
+       If the index is incremental the blocks are kept as well, and if records
+       have been added to the index only the record pairs that contain at
+       least one new record are put into the record pair dictionary.
+    """
+
+    NUM_BLOCK_PROGRESS_REPORT = 1000
+
+    logging.info('')
+    logging.info('Compact blocking index: "%s"' % (self.description))
+
+    start_time = time.time()
+
+    num_indices = len(self.index_def)
+
+    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
+    #
+    if (self.status != 'built'):
+      logging.exception('Index "%s" has not been built, compacting is not ' % \
+                        (self.description)+'possible')
+      raise Exception
+
+    old_num_rec_pairs = self.num_rec_pairs  # Keep old number of record pairs
+
+    # If record pairs are streamed they are only counted in run() - - - - - -
+    #
+    if (self.stream_pairs == True):
+
+      logging.info('Compacted blocking index (record pairs will be ' + \
+                   'streamed) in %s' % \
+                   (auxiliary.time_string(time.time()-start_time)))
+      logging.info('  Estimated number of record pairs (including ' + \
+                   'duplicates): %d' % (self.num_rec_pairs))
+
+      self.status = 'compacted'  # Update index status
+      return
+
+    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
+                        # as keys and sets of identifiers from data set 2 as
+                        # values
+
+    max_block_size =      self.max_block_size  # Shorthand
+    num_large_blocks =    0  # Number of large blocks
+    num_dropped_recs =    0  # Number of records in dropped (large) blocks
+
+    # If records have been added only process the blocks with new records - -
+    #
+    if (self.new_block_dicts != None):
+
+      for i in range(num_indices):
+
+        this_index1 = self.index1[i]  # Shorthands
+        this_index2 = self.index2[i]
+
+        for (block_val, old_len_list) in self.new_block_dicts[i].iteritems():
+
+          if (self.do_deduplication == True):  # A deduplication - - - - - - -
+            block_recs =  this_index1[block_val]
+            block_recs2 = None
+            block_size =  len(block_recs)
+
+          elif ((block_val in this_index1) and (block_val in this_index2)):
+            block_recs =  this_index1[block_val]  # A linkage - - - - - - - -
+            block_recs2 = this_index2[block_val]
+            block_size =  len(block_recs) + len(block_recs2)
+
+          else:
+            continue
+
+          if ((max_block_size != None) and (block_size > max_block_size)):
+            num_large_blocks += 1
+            num_dropped_recs += self.__large_block_rec_pairs__(block_recs,
+                                                    block_recs2, rec_pair_dict,
+                                                    old_len_list)
+
+          elif (self.do_deduplication == True):
+            self.__dedup_new_rec_pairs__(block_recs[:old_len_list[0]],
+                                         block_recs[old_len_list[0]:],
+                                         rec_pair_dict)
+
+          else:
+
+            # New records from data set 1 with all records from data set 2,
+            # and old records from data set 1 with new ones from data set 2
+            #
+            self.__link_rec_pairs__(block_recs[old_len_list[0]:],
+                                    block_recs2, rec_pair_dict)
+            self.__link_rec_pairs__(block_recs[:old_len_list[0]],
+                                    block_recs2[old_len_list[1]:],
+                                    rec_pair_dict)
+
+        logging.info('  Compacted %d blocks with new records of blocking ' % \
+                     (len(self.new_block_dicts[i])) + 'index %d' % (i))
+
+    else:  # Process all blocks in all indices - - - - - - - - - - - - - - -
+
+      for i in range(num_indices):
+
+        istart_time = time.time()
+
+        num_blocks_done = 0
+
+        if (self.do_deduplication == True):  # A deduplication - - - - - - -
+
+          this_index = self.index1[i]  # Shorthand
+
+          for block_val in this_index: # Loop over all block values in index
+
+            block_recs = this_index[block_val]  # All records in this block
+
+            if ((max_block_size != None) and \
+                (len(block_recs) > max_block_size)):
+              num_large_blocks += 1
+              num_dropped_recs += self.__large_block_rec_pairs__(block_recs,
+                                                          None, rec_pair_dict)
+
+            elif (len(block_recs) > 1):
+
+              self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
+
+            num_blocks_done += 1
+
+            # Log progress report every XXX blocks processed - - - - - - - -
+            #
+            if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+              logging.info('    Processed %d of %d blocks' % \
+                           (num_blocks_done, len(this_index)))
+              memory_usage_str = auxiliary.get_memory_usage()
+              if (memory_usage_str != None):
+                logging.info('      '+memory_usage_str)
+
+        else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - -
+
+          this_index1 = self.index1[i]  # Shorthands
+          this_index2 = self.index2[i]
+
+          for block_val in this_index1: # Loop over all block values in index
+
+            block_recs1 = this_index1[block_val]  # All records in this block
+                                                  # from data set 1
+            if block_val in this_index2:  # Blocking values is both data sets'
+                                          # index
+
+              block_recs2 = this_index2[block_val] # All records in this block
+                                                   # from data set 2
+
+              if ((max_block_size != None) and \
+                  (len(block_recs1)+len(block_recs2) > max_block_size)):
+                num_large_blocks += 1
+                num_dropped_recs += self.__large_block_rec_pairs__(
+                                      block_recs1, block_recs2, rec_pair_dict)
+
+              else:
+                self.__link_rec_pairs__(block_recs1, block_recs2,
+                                        rec_pair_dict)
+
+            num_blocks_done += 1
+
+            # Log progress report every XXX blocks processed - - - - - - - -
+            #
+            if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
+              logging.info('    Processed %d of %d blocks' % \
+                           (num_blocks_done, len(this_index1)))
+              memory_usage_str = auxiliary.get_memory_usage()
+              if (memory_usage_str != None):
+                logging.info('      '+memory_usage_str)
+
+        logging.info('  Compacted blocking index %d in %s' % \
+                     (i, auxiliary.time_string(time.time()-istart_time)))
+
+        if (self.incremental == False):  # Blocks are kept for adding records
+          self.index1[i].clear()  # Not needed anymore
+          self.index2[i].clear()
+
+        logging.info('    Explicitly run garbage collection')
+        gc.collect()
+
+        memory_usage_str = auxiliary.get_memory_usage()
+        if (memory_usage_str != None):
+          logging.info('      '+memory_usage_str)
+
+    self.rec_pair_dict = rec_pair_dict
+
+    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+
+    for rec_ident2_set in self.rec_pair_dict.itervalues():
+      self.num_rec_pairs += len(rec_ident2_set)
+
+    logging.info('Compacted blocking index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Old number of record pairs: %d' % (old_num_rec_pairs))
+    logging.info('  New number of record pairs: %d' % (self.num_rec_pairs))
+    if (max_block_size != None):
+      logging.info('  Handled %d blocks with more than %d records using ' % \
+                   (num_large_blocks, max_block_size) + 'method "%s" ' % \
+                   (self.large_block_method[0]) + '(%d records were in ' % \
+                   (num_dropped_recs) + 'dropped blocks)')
+
+    self.status = 'compacted'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def __get_block_key__(self, rec, ds_index):
+    """Return the secondary key value used for large blocks of the given
+       record (from a record cache) from data set 1 (if 'ds_index' is 0) or
+       data set 2 (if 'ds_index' is 1).
+    """
+
+    key_val_list = []
+
+    for (key_def, key_funct) in zip(self.block_key_def_proc,
+                                    self.block_key_funct_list):
+      field_val = rec[key_def[ds_index]]
+
+      if (field_val != ''):
+        key_val_list.append(key_funct(field_val))
+
+    return self.index_sep_str.join(key_val_list)
+
+  # ---------------------------------------------------------------------------
+
+  def __large_block_rec_pairs__(self, block_recs1, block_recs2, rec_pair_dict,
+                                old_len_list = None):
+    """Create the record pairs for a block which is larger than the maximum
+       block size according to the 'large_block_method', and insert them into
+       the given record pair dictionary.
+
+       For a deduplication 'block_recs2' must be None. If 'old_len_list' is
+       given (the numbers of records from data set 1 and 2 in the block before
+       records were added to the index), only record pairs that contain at
+       least one new record are inserted.
+
+       Returns the number of records in blocks that were dropped.
+    """
+
+    method = self.large_block_method[0]
+
+    if (block_recs2 == None):
+      block_size = len(block_recs1)
+    else:
+      block_size = len(block_recs1) + len(block_recs2)
+
+    if (method == 'drop'):
+      return block_size
+
+    # Get the secondary key values of all records in the block - - - - - - - -
+    #
+    get_block_key = self.__get_block_key__  # Shorthands
+    rec_cache1 =    self.rec_cache1
+
+    key_rec_list = []  # Tuples (key value, data set index, record identifier)
+
+    for rec_ident in block_recs1:
+      key_rec_list.append((get_block_key(rec_cache1[rec_ident], 0), 0,
+                           rec_ident))
+
+    if (block_recs2 != None):
+      rec_cache2 = self.rec_cache2
+      for rec_ident in block_recs2:
+        key_rec_list.append((get_block_key(rec_cache2[rec_ident], 1), 1,
+                             rec_ident))
+
+    if (old_len_list == None):
+      block_pair_dict = rec_pair_dict
+    else:
+      block_pair_dict = {}  # Record pairs are filtered below
+
+    num_dropped_recs = 0
+
+    if (method == 'split'):  # Put records into smaller blocks - - - - - - - -
+
+      sub_block_dict = {}
+
+      for (key_val, ds_index, rec_ident) in key_rec_list:
+        if (key_val not in sub_block_dict):
+          sub_block_dict[key_val] = ([], [])
+        sub_block_dict[key_val][ds_index].append(rec_ident)
+
+      for (sub_block_recs1, sub_block_recs2) in sub_block_dict.itervalues():
+        sub_block_size = len(sub_block_recs1) + len(sub_block_recs2)
+
+        if (sub_block_size > self.max_block_size):
+          num_dropped_recs += sub_block_size
+
+        elif (block_recs2 == None):
+          if (len(sub_block_recs1) > 1):
+            self.__dedup_rec_pairs__(sub_block_recs1, block_pair_dict)
+
+        else:
+          self.__link_rec_pairs__(sub_block_recs1, sub_block_recs2,
+                                  block_pair_dict)
+
+    else:  # Sorted neighbourhood window over sorted records - - - - - - - - -
+
+      window_size = self.large_block_method[1]
+
+      key_rec_list.sort()
+
+      for p in xrange(len(key_rec_list)):
+        (key_val, ds_index, rec_ident) = key_rec_list[p]
 
-          if block_val in self.index2[i]:  # Blocking values is both data sets'
-                                           # index
-            block_num_recs2 = len(self.index2[i][block_val])
+        for (key_val2, ds_index2, rec_ident2) in \
+            key_rec_list[p+1:p+window_size]:
 
-            if (block_num_recs1 > largest_block_num_rec):  # New largest block
-              largest_block_num_rec =   block_num_recs1
-              largest_block_val =       block_val
-              largest_block_index_num = i
+          if (block_recs2 == None):  # A deduplication
+            if (rec_ident < rec_ident2):
+              (rec_ident_a, rec_ident_b) = (rec_ident, rec_ident2)
+            else:
+              (rec_ident_a, rec_ident_b) = (rec_ident2, rec_ident)
 
-            if (block_num_recs2 > largest_block_num_rec):  # New largest block
-              largest_block_num_rec =   block_num_recs2
-              largest_block_val =       block_val
-              largest_block_index_num = i
+          elif (ds_index == ds_index2):  # Linkage, records from same data set
+            continue
 
-            self.num_rec_pairs += block_num_recs1*block_num_recs2
+          elif (ds_index == 0):
+            (rec_ident_a, rec_ident_b) = (rec_ident, rec_ident2)
+          else:
+            (rec_ident_a, rec_ident_b) = (rec_ident2, rec_ident)
 
-    logging.info('Built blocking index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
+          rec_ident2_set = block_pair_dict.get(rec_ident_a, set())
+          rec_ident2_set.add(rec_ident_b)
+          block_pair_dict[rec_ident_a] = rec_ident2_set
 
-    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
-    logging.info('  Largest block with value "%s" contains %d records' % \
-                 (largest_block_val, largest_block_num_rec)+' (in index %d)' \
-                 % (largest_block_index_num))
+    # Only keep the record pairs that contain new records - - - - - - - - - - -
+    #
+    if (old_len_list != None):
+      new_rec_set1 = set(block_recs1[old_len_list[0]:])
+      if (block_recs2 == None):
+        new_rec_set2 = new_rec_set1
+      else:
+        new_rec_set2 = set(block_recs2[old_len_list[1]:])
 
-    memory_usage_str = auxiliary.get_memory_usage()
-    if (memory_usage_str != None):
-      logging.info('  '+memory_usage_str)
+      for (rec_ident1, rec_ident2_set) in block_pair_dict.iteritems():
+        if (rec_ident1 not in new_rec_set1):
+          rec_ident2_set = rec_ident2_set & new_rec_set2
+        if (len(rec_ident2_set) > 0):
+          rec_pair_dict.setdefault(rec_ident1, set()).update(rec_ident2_set)
 
-    self.status = 'built'  # Update index status
+    return num_dropped_recs
 
   # ---------------------------------------------------------------------------
 
-  def compact(self):
-    """Method to compact an index data structure.
-
-       Make a dictionary of all record pairs over all indices, which removes
-       duplicate record pairs.
+  def get_block_stats(self, num_largest_blocks = 5):
+    """Calculate and log statistics about the blocks of a built index, before
+       it is compacted: The number of blocks, the distribution of the block
+       sizes (median, 90% and 99% quantiles and maximum number of records in
+       a block, for a linkage the records from both data sets), the estimated
+       number of record pairs, as well as the values, sizes and numbers of
+       record pairs of the 'num_largest_blocks' largest blocks.
+
+       If the 'max_block_size' argument is set, the number of large blocks and
+       their record pairs are also calculated.
+
+       Returns a list with one tuple per index made of the number of blocks,
+       the list of block size quantiles, the estimated number of record
+       pairs, the number of large blocks and their number of record pairs.
+       Only blocks that generate record pairs (i.e. for a linkage blocks that
+       contain records from both data sets) are considered.
     """
 
-    NUM_BLOCK_PROGRESS_REPORT = 1000
+    if ((self.status != 'built') and (self.incremental == False)):
+      logging.exception('Index "%s" has not been built or has been ' % \
+                        (self.description) + 'compacted, block statistics ' \
+                        + 'are not available')
+      raise Exception
 
     logging.info('')
-    logging.info('Compact blocking index: "%s"' % (self.description))
+    logging.info('Block statistics for index "%s":' % (self.description))
 
-    start_time = time.time()
+    block_stats_list = []
 
-    num_indices = len(self.index_def)
+    for (i, block_list) in enumerate(self.__get_block_size_lists__()):
 
-    # Check if index has been built - - - - - - - - - - - - - - - - - - - - - -
-    #
-    if (self.status != 'built'):
-      logging.exception('Index "%s" has not been built, compacting is not ' % \
-                        (self.description)+'possible')
-      raise Exception
+      block_size_list = [block_size for (block_size, num_block_rec_pairs,
+                                         block_val) in block_list]
+      num_rec_pairs = sum([num_block_rec_pairs for (block_size,
+                           num_block_rec_pairs, block_val) in block_list])
 
-    old_num_rec_pairs = self.num_rec_pairs  # Keep old number of record pairs
+      num_large_blocks =    0
+      num_large_rec_pairs = 0
 
-    rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
-                        # as keys and sets of identifiers from data set 2 as
-                        # values
+      if (self.max_block_size != None):
+        for (block_size, num_block_rec_pairs, block_val) in block_list:
+          if (block_size > self.max_block_size):
+            num_large_blocks +=    1
+            num_large_rec_pairs += num_block_rec_pairs
 
-    for i in range(num_indices):
+      logging.info('  Index %d contains %d blocks with an estimated %d ' % \
+                   (i, len(block_list), num_rec_pairs) + 'record pairs')
 
-      istart_time = time.time()
+      if (block_list == []):
+        block_stats_list.append((0, [], 0, 0, 0))
+        continue
 
-      num_blocks_done = 0
+      size_quant_list = mymath.quantiles(block_size_list,
+                                         [0.5, 0.9, 0.99, 1.0])
+      logging.info('    Block sizes: Median %.1f, 90%% %.1f, 99%% %.1f, ' % \
+                   tuple(size_quant_list[:3]) + 'maximum %d' % \
+                   (size_quant_list[3]))
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+      block_list.sort(reverse=True)
+      for (block_size, num_block_rec_pairs, block_val) in \
+          block_list[:num_largest_blocks]:
+        logging.info('    Block "%s" contains %d records (%d record ' % \
+                     (block_val, block_size, num_block_rec_pairs) + 'pairs)')
 
-        this_index = self.index1[i]  # Shorthand
+      if (self.max_block_size != None):
+        logging.info('    %d blocks contain more than %d records ' % \
+                     (num_large_blocks, self.max_block_size) + '(%d ' % \
+                     (num_large_rec_pairs) + 'record pairs)')
 
-        for block_val in this_index: # Loop over all block values in index
+      block_stats_list.append((len(block_list), size_quant_list,
+                               num_rec_pairs, num_large_blocks,
+                               num_large_rec_pairs))
 
-          block_recs = this_index[block_val]  # All records in this block
+    return block_stats_list
 
-          if (len(block_recs) > 1):
+  # ---------------------------------------------------------------------------
 
-            self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
+  def get_max_block_size(self, max_num_rec_pairs):
+    """Return the largest maximum block size for which the estimated number
+       of record pairs of all blocks that are not larger than this size
+       (summed over all indices) is not larger than the given number of
+       record pairs. The estimate does not consider that the same record pair
+       can be in blocks of several indices, so the actual number of record
+       pairs after compacting with this maximum block size (and the 'drop'
+       method for large blocks) will not be larger than the given number.
+    """
 
-          num_blocks_done += 1
+    auxiliary.check_is_integer('max_num_rec_pairs', max_num_rec_pairs)
+    auxiliary.check_is_not_negative('max_num_rec_pairs', max_num_rec_pairs)
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
-          #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, len(this_index)))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+    all_block_list = []  # Tuples (block size, number of record pairs)
 
-      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+    for block_list in self.__get_block_size_lists__():
+      for (block_size, num_block_rec_pairs, block_val) in block_list:
+        all_block_list.append((block_size, num_block_rec_pairs))
 
-        this_index1 = self.index1[i]  # Shorthands
-        this_index2 = self.index2[i]
+    all_block_list.sort()
 
-        for block_val in this_index1: # Loop over all block values in index
+    max_block_size = 1
+    num_rec_pairs =  0
 
-          block_recs1 = this_index1[block_val]  # All records in this block
-                                                # from data set 1
-          if block_val in this_index2:  # Blocking values is both data sets'
-                                        # index
+    for p in xrange(len(all_block_list)):
+      (block_size, num_block_rec_pairs) = all_block_list[p]
+      num_rec_pairs += num_block_rec_pairs
 
-            block_recs2 = this_index2[block_val] # All records in this block
-                                                 # from data set 2
+      if (num_rec_pairs > max_num_rec_pairs):
+        break
 
-            self.__link_rec_pairs__(block_recs1, block_recs2, rec_pair_dict)
+      # All blocks with this size must fit
+      #
+      if ((p+1 == len(all_block_list)) or \
+          (all_block_list[p+1][0] > block_size)):
+        max_block_size = block_size
 
-          num_blocks_done += 1
+    logging.info('Maximum block size for at most %d record pairs: %d' % \
+                 (max_num_rec_pairs, max_block_size))
 
-          # Log progress report every XXX blocks processed - - - - - - - - - -
-          #
-          if ((num_blocks_done % NUM_BLOCK_PROGRESS_REPORT) == 0):
-            logging.info('    Processed %d of %d blocks' % \
-                         (num_blocks_done, len(this_index1)))
-            memory_usage_str = auxiliary.get_memory_usage()
-            if (memory_usage_str != None):
-              logging.info('      '+memory_usage_str)
+    return max_block_size
 
-      logging.info('  Compacted blocking index %d in %s' % \
-                   (i, auxiliary.time_string(time.time()-istart_time)))
+  # ---------------------------------------------------------------------------
 
-      self.index1[i].clear()  # Not needed anymore
-      self.index2[i].clear()
+  def __get_block_size_lists__(self):
+    """Return a list with one list per index containing tuples (block size,
+       number of record pairs, block value) for all blocks which generate
+       record pairs.
+    """
 
-      logging.info('    Explicitly run garbage collection')
-      gc.collect()
+    block_size_lists = []
 
-      memory_usage_str = auxiliary.get_memory_usage()
-      if (memory_usage_str != None):
-        logging.info('      '+memory_usage_str)
+    for i in range(len(self.index_def)):
 
-    self.rec_pair_dict = rec_pair_dict
+      block_list = []
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
 
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+        for (block_val, block_recs) in self.index1[i].iteritems():
+          block_size = len(block_recs)
+          if (block_size > 1):
+            block_list.append((block_size, block_size*(block_size-1)/2,
+                               block_val))
 
-    logging.info('Compacted blocking index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
-    logging.info('  Old number of record pairs: %d' % (old_num_rec_pairs))
-    logging.info('  New number of record pairs: %d' % (self.num_rec_pairs))
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
-    self.status = 'compacted'  # Update index status
+        this_index2 = self.index2[i]
+
+        for (block_val, block_recs1) in self.index1[i].iteritems():
+          if (block_val in this_index2):
+            block_size1 = len(block_recs1)
+            block_size2 = len(this_index2[block_val])
+            block_list.append((block_size1+block_size2,
+                               block_size1*block_size2, block_val))
+
+      block_size_lists.append(block_list)
+
+    return block_size_lists
 
   # ---------------------------------------------------------------------------
 
-  def run(self, length_filter_perc = None, cut_off_threshold = None):
+  def run(self, length_filter_perc = None, cut_off_threshold = None,
+          weight_vec_dict = None):
     """Iterate over all blocks in the index.
 
        Compare the record pairs as produced by the blocking process, and return
        a weight vector dictionary with keys made of a tuple (record identifier
        1, record identifier 2), and corresponding values the comparison
        weights.
+
+       For an incremental index, the weight vector dictionary returned by a
+       previous call of this method can be given as 'weight_vec_dict'. The
+       weight vectors of the record pairs with new records are then added to
+       it (so the weight vectors of old record pairs are reused).
     """
 
     logging.info('')
@@ -1748,8 +5841,13 @@ class BlockingIndex(Indexing):
 
     # Compare the records
     #
-    return self.__compare_rec_pairs_from_dict__(length_filter_perc,
-                                                cut_off_threshold)
+    if (self.stream_pairs == True):
+      return self.__compare_rec_pairs_from_stream__(length_filter_perc,
+                                                    cut_off_threshold)
+    else:
+      return self.__compare_rec_pairs_from_dict__(length_filter_perc,
+                                                  cut_off_threshold,
+                                                  weight_vec_dict)
 
 # =============================================================================
 
@@ -1771,8 +5869,15 @@ class SortingIndex(Indexing):
      Note that a window_size of 1 will result in the same records being
      compared as with the standard blocking approach (as a window of size 1
      does not cover any neighbouring index variable values).
+
+     This index does not support the 'incremental' argument of the base class
+     (an exception is raised if it is set to True), so records cannot be added
+     to it once it has been built.
   """
 
+  supports_intern_rec_ids = True
+  supports_save = True
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -2099,8 +6204,27 @@ class SortingArrayIndex(Indexing):
 
      Note that a window_size of 1 will result in no records being compared with
      each other (this is different from the previous SortingIndex above).
+
+     The following optional argument can also be set:
+
+       pair_method  Either 'sets' (default), in which case the record pairs of
+                    each window are inserted into the sets of the record pair
+                    dictionary, or 'codes', in which case all records are
+                    numbered, each index (pass) is turned into one array of
+                    record numbers sorted on the encoded index values, and all
+                    windows of a pass are slid at once by pairing each record
+                    with the following window_size-1 records. Each record pair
+                    is stored as a single integer code, and duplicate pairs
+                    (from overlapping windows and from several passes) are
+                    removed on these codes before the record pair dictionary
+                    is built. The NumPy module is used for sorting and
+                    removing duplicates if it is available. Both methods
+                    generate the same record pairs.
   """
 
+  supports_intern_rec_ids = True
+  supports_save = True
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -2109,6 +6233,7 @@ class SortingArrayIndex(Indexing):
     """
 
     self.window_size = None  # Set the window size to not defined
+    self.pair_method = 'sets'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -2124,6 +6249,13 @@ class SortingArrayIndex(Indexing):
 
         self.window_size = value
 
+      elif (keyword.startswith('pair_m')):
+        if (value not in ['sets', 'codes']):
+          logging.exception('Value of "pair_method" is not "sets" or ' + \
+                            '"codes": %s' % (str(value)))
+          raise Exception
+        self.pair_method = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -2134,7 +6266,8 @@ class SortingArrayIndex(Indexing):
     auxiliary.check_is_integer('window_size', self.window_size)
     auxiliary.check_is_positive('window_size', self.window_size)
 
-    self.log([('Window size', self.window_size)])  # Log a message
+    self.log([('Window size', self.window_size),
+              ('Pair method', self.pair_method)])  # Log a message
 
   # ---------------------------------------------------------------------------
 
@@ -2184,6 +6317,17 @@ class SortingArrayIndex(Indexing):
                         (self.description)+'possible')
       raise Exception
 
+    if (self.pair_method == 'codes'):  # All passes on integer pair codes - - -
+
+      [self.rec_pair_dict, self.num_rec_pairs] = self.__compact_pair_codes__()
+
+      logging.info('Compacted sorting index in %s' % \
+                   (auxiliary.time_string(time.time()-start_time)))
+      logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+
+      self.status = 'compacted'  # Update index status
+      return
+
     num_indices = len(self.index_def)
 
     dedup_rec_pair_funct = self.__dedup_rec_pairs__  # Shorthands
@@ -2401,6 +6545,232 @@ class SortingArrayIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
+  def __compact_pair_codes__(self):
+    """Multi-pass sorted neighbourhood over all indices using integer record
+       numbers and integer record pair codes.
+
+       All record identifiers are numbered in their sorted order (separately
+       for the two data sets in a linkage), so that the smaller record number
+       of a pair in a deduplication also is the smaller record identifier.
+       For each index the distinct index values are sorted as an array of
+       fixed-width strings, and the record numbers of the blocks are then
+       concatenated in this order. A record at position p in this array is
+       paired with the records at positions p+1 to p+window_size-1, which
+       gives exactly the record pairs of all window positions. A pair is
+       encoded as 'rec_num1*num_rec2+rec_num2'.
+
+       Returns a list made of the record pair dictionary and the number of
+       record pairs in it.
+    """
+
+    num_indices = len(self.index_def)
+    w =           self.window_size
+
+    do_dedup = self.do_deduplication  # Shorthand
+
+    # Number all record identifiers in all indices - - - - - - - - - - - - - -
+    #
+    rec_ident_set1 = set()
+    rec_ident_set2 = set()
+
+    for i in range(num_indices):
+      for rec_id_list in self.index1[i].itervalues():
+        rec_ident_set1.update(rec_id_list)
+      if (do_dedup == False):
+        for rec_id_list in self.index2[i].itervalues():
+          rec_ident_set2.update(rec_id_list)
+
+    rec_ident_list1 = sorted(rec_ident_set1)
+    del rec_ident_set1
+    rec_num_dict1 = dict(zip(rec_ident_list1, range(len(rec_ident_list1))))
+
+    if (do_dedup == True):
+      rec_ident_list2 = rec_ident_list1
+      rec_num_dict2 =   rec_num_dict1
+    else:
+      rec_ident_list2 = sorted(rec_ident_set2)
+      rec_num_dict2 = dict(zip(rec_ident_list2, range(len(rec_ident_list2))))
+    del rec_ident_set2
+
+    num_rec2 = max(1, len(rec_ident_list2))  # Multiplier for pair codes
+
+    if (imp_numpy == True):
+      pair_codes = numpy.zeros(0, dtype=numpy.int64)  # Sorted unique codes
+    else:
+      pair_codes = set()
+
+    for i in range(num_indices):
+
+      istart_time = time.time()
+
+      this_index1 = self.index1[i]  # Shorthands
+      this_index2 = self.index2[i]
+
+      if (do_dedup == True):
+        block_val_list = this_index1.keys()
+      else:
+        block_val_list = list(set(this_index1.keys()+this_index2.keys()))
+
+      # Sort the index values - - - - - - - - - - - - - - - - - - - - - - - - -
+      #
+      if (imp_numpy == True) and (len(block_val_list) > 0):
+        block_val_array = numpy.array(block_val_list)  # Fixed width strings
+        block_val_order = numpy.argsort(block_val_array, kind='mergesort')
+        block_val_list = [block_val_list[j] for j in block_val_order]
+        del block_val_array, block_val_order
+      else:
+        block_val_list.sort()
+
+      # Make the sorted array of record numbers (and their data set) - - - - -
+      #
+      rec_num_array = array.array('l')
+      src_array =     array.array('b')  # 1 or 2 for the data set (linkage)
+
+      for block_key_val in block_val_list:
+
+        if (do_dedup == True):
+          rec_num_array.extend([rec_num_dict1[rec_ident] for rec_ident in \
+                                this_index1[block_key_val]])
+          continue
+
+        rec_id_list1 = this_index1.get(block_key_val, [])
+        rec_id_list2 = this_index2.get(block_key_val, [])
+
+        if (rec_id_list1 != []) and (rec_id_list2 != []):
+
+          # Merge records as in compact(), i.e. on their relative positions
+          #
+          merge_list = []
+
+          interval1 = 1.0 / (len(rec_id_list1)+1.0)
+          j = 1
+          for rec_ident in rec_id_list1:
+            merge_list.append((j*interval1, rec_ident, '1'))
+            j += 1
+          interval2 = 1.0 / (len(rec_id_list2)+1.0)
+          j = 1
+          for rec_ident in rec_id_list2:
+            merge_list.append((j*interval2, rec_ident, '2'))
+            j += 1
+
+          merge_list.sort()
+
+          for (val, rec_ident, src_index) in merge_list:
+            if (src_index == '1'):
+              rec_num_array.append(rec_num_dict1[rec_ident])
+              src_array.append(1)
+            else:
+              rec_num_array.append(rec_num_dict2[rec_ident])
+              src_array.append(2)
+
+        elif (rec_id_list1 == []):
+          rec_num_array.extend([rec_num_dict2[rec_ident] for rec_ident in \
+                                rec_id_list2])
+          src_array.extend([2]*len(rec_id_list2))
+
+        else:
+          rec_num_array.extend([rec_num_dict1[rec_ident] for rec_ident in \
+                                rec_id_list1])
+          src_array.extend([1]*len(rec_id_list1))
+
+      del block_val_list
+
+      num_sorted = len(rec_num_array)
+
+      # Pair each record with the next w-1 records (all window positions) - -
+      #
+      if (num_sorted >= w):  # Otherwise no window fits into the array
+
+        if (imp_numpy == True):
+          rec_nums = numpy.array(rec_num_array, dtype=numpy.int64)
+          if (do_dedup == False):
+            srcs = numpy.array(src_array, dtype=numpy.int8)
+
+          code_list = []
+
+          for d in range(1, w):
+            rec_nums_a = rec_nums[:-d]
+            rec_nums_b = rec_nums[d:]
+
+            if (do_dedup == True):
+              code_list.append(numpy.minimum(rec_nums_a, rec_nums_b) * \
+                               num_rec2 + numpy.maximum(rec_nums_a,
+                                                        rec_nums_b))
+            else:
+              srcs_a = srcs[:-d]
+              is_pair = (srcs_a != srcs[d:])
+              is_first = (srcs_a == 1)
+              code_list.append((numpy.where(is_first, rec_nums_a,
+                                            rec_nums_b)[is_pair] * num_rec2) + \
+                               numpy.where(is_first, rec_nums_b,
+                                           rec_nums_a)[is_pair])
+
+          pass_codes = numpy.unique(numpy.concatenate(code_list))
+          del code_list, rec_nums
+
+          pair_codes = numpy.union1d(pair_codes, pass_codes)
+          del pass_codes
+
+        else:  # Plain Python set of integer codes
+          for p in xrange(num_sorted-1):
+            rec_num1 = rec_num_array[p]
+            src1 =     src_array[p] if (do_dedup == False) else 1
+
+            for q in xrange(p+1, min(p+w, num_sorted)):
+              rec_num2 = rec_num_array[q]
+
+              if (do_dedup == True):
+                if (rec_num1 < rec_num2):
+                  pair_codes.add(rec_num1*num_rec2 + rec_num2)
+                else:
+                  pair_codes.add(rec_num2*num_rec2 + rec_num1)
+
+              elif (src_array[q] != src1):
+                if (src1 == 1):
+                  pair_codes.add(rec_num1*num_rec2 + rec_num2)
+                else:
+                  pair_codes.add(rec_num2*num_rec2 + rec_num1)
+
+      del rec_num_array, src_array
+
+      logging.info('  Compacted sorting index %d in %s (%d records in ' % \
+                   (i, auxiliary.time_string(time.time()-istart_time),
+                   num_sorted) + 'sorted array, %d unique record pairs)' % \
+                   (len(pair_codes)))
+
+      self.index1[i].clear()  # Not needed anymore
+      self.index2[i].clear()
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('    '+memory_usage_str)
+
+    # Decode the record pairs into the record pair dictionary - - - - - - - - -
+    #
+    if (imp_numpy == True):
+      pair_codes = pair_codes.tolist()  # Already sorted
+    else:
+      pair_codes = sorted(pair_codes)
+
+    num_rec_pairs = len(pair_codes)
+
+    rec_pair_dict = {}
+
+    prev_rec_num1 = -1
+    for pair_code in pair_codes:
+      (rec_num1, rec_num2) = divmod(pair_code, num_rec2)
+
+      if (rec_num1 != prev_rec_num1):
+        rec_ident2_set = set()
+        rec_pair_dict[rec_ident_list1[rec_num1]] = rec_ident2_set
+        prev_rec_num1 = rec_num1
+
+      rec_ident2_set.add(rec_ident_list2[rec_num2])
+
+    return [rec_pair_dict, num_rec_pairs]
+
+  # ---------------------------------------------------------------------------
+
   def run(self, length_filter_perc = None, cut_off_threshold = None):
     """Iterate over all blocks in the index.
 
@@ -2458,8 +6828,36 @@ class AdaptSortingIndex(Indexing):
                       stringcmp module).
        str_cmp_thres  The threshold for the string comparison function, must
                       be in (0..1).
+
+     The following optional argument can also be set:
+
+       adapt_method   The way block boundaries are searched for. Possible are:
+                      - 'linear'        The simplified linear scan over
+                                        adjacent index key values (default).
+                      - 'incremental'   Incrementally-adaptive (IA-SNM): a
+                                        block contains all following index
+                                        key values that are similar to its
+                                        first value. The window is doubled
+                                        from the first value until a value
+                                        that is not similar is found, and the
+                                        boundary is then found with a binary
+                                        search.
+                      - 'accumulative'  Accumulatively-adaptive (AA-SNM):
+                                        windows that overlap by one value are
+                                        doubled in size as long as their first
+                                        and last values are similar, then the
+                                        boundary pair in the last window is
+                                        found with a binary search.
+                      Both accelerated methods need O(log n) string
+                      comparisons per block instead of one per index key
+                      value, and they cache the similarities already
+                      calculated. They assume that similarities decrease
+                      within the sorted index key values.
   """
 
+  supports_intern_rec_ids = True
+  supports_save = True
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -2469,6 +6867,7 @@ class AdaptSortingIndex(Indexing):
 
     self.str_cmp_funct = None
     self.str_cmp_thres = None
+    self.adapt_method =  'linear'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -2483,6 +6882,14 @@ class AdaptSortingIndex(Indexing):
         auxiliary.check_is_normalised('str_cmp_thres', value)
         self.str_cmp_thres = value
 
+      elif (keyword.startswith('adapt_m')):
+        if (value not in ['linear', 'incremental', 'accumulative']):
+          logging.exception('Value of "adapt_method" is not "linear", ' + \
+                            '"incremental" or "accumulative": %s' % \
+                            (str(value)))
+          raise Exception
+        self.adapt_method = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -2496,7 +6903,8 @@ class AdaptSortingIndex(Indexing):
     # A log a message
     #
     self.log([('String comparison function',  self.str_cmp_funct),
-              ('String comparison threshold', self.str_cmp_thres)])
+              ('String comparison threshold', self.str_cmp_thres),
+              ('Adaptive method',             self.adapt_method)])
 
   # ---------------------------------------------------------------------------
 
@@ -2558,6 +6966,9 @@ class AdaptSortingIndex(Indexing):
     str_cmp_funct =  self.str_cmp_funct
     str_cmp_thres =  self.str_cmp_thres
 
+    adapt_method =         self.adapt_method
+    find_block_end_funct = self.__find_block_end__
+
     rec_pair_dict = {}  # A dictionary with record identifiers from data set 1
                         # as keys and sets of identifiers from data set 2 as
                         # values
@@ -2568,6 +6979,8 @@ class AdaptSortingIndex(Indexing):
 
       num_blocks_done = 0
 
+      str_sim_cache = {}  # Similarities calculated so far in this index
+
       if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
 
         this_index = self.index1[i]  # Shorthand
@@ -2621,51 +7034,59 @@ class AdaptSortingIndex(Indexing):
 
         while (block_start_index < num_index_vals):
 
-          w_first = block_start_index
-          w = 1  # To make sure this works even with one single index key value
-          w_last = w_first + w
+          if (adapt_method != 'linear'):  # Exponential and binary search
+            block_end_index = find_block_end_funct(index_val_list,
+                                                   block_start_index,
+                                                   str_sim_cache)
 
-          # Get the first and last index key values in the current window
-          #
-          first_val = index_val_list[w_first]
-          last_val =  index_val_list[w_last-1]
+          else:  # Simplified linear scan
+            w_first = block_start_index
+            w = 1  # To make sure this works even with one single index key
+                   # value
+            w_last = w_first + w
 
-          # Enlargement phase: Move the window forward as long as index key
-          # values are similar
-          #
-          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
-                 (w_last < num_index_vals)):
-            w_first = w_last-1  # Make sure the windows overlap
-            w *= 2              # Geometric increase in the window size
-            w_last += w-1       # Adjust for overlap
-            if (w_last > num_index_vals):
-              w_last = num_index_vals  # Reached end of array
-
-            first_val = last_val
+            # Get the first and last index key values in the current window
+            #
+            first_val = index_val_list[w_first]
             last_val =  index_val_list[w_last-1]
 
-          # Retrenchment phase: Find the boundary pair (use simple linear scan)
-          # (the retrenchment phase as described in the above mentioned paper is
-          # yet to be implementd)
-          #
-          tmp_pos = block_start_index
+            # Enlargement phase: Move the window forward as long as index key
+            # values are similar
+            #
+            while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
+                   (w_last < num_index_vals)):
+              w_first = w_last-1  # Make sure the windows overlap
+              w *= 2              # Geometric increase in the window size
+              w_last += w-1       # Adjust for overlap
+              if (w_last > num_index_vals):
+                w_last = num_index_vals  # Reached end of array
+
+              first_val = last_val
+              last_val =  index_val_list[w_last-1]
+
+            # Retrenchment phase: Find the boundary pair (use simple linear
+            # scan) (the binary search retrenchment phase as described in the
+            # above mentioned paper is done by __find_block_end__())
+            #
+            tmp_pos = block_start_index
 
-          # Take care of special case where last block is 1 index key value only
-          #
-          if (tmp_pos+1 == num_index_vals):
-            block_end_index = tmp_pos+1
+            # Take care of special case where last block is 1 index key value
+            # only
+            #
+            if (tmp_pos+1 == num_index_vals):
+              block_end_index = tmp_pos+1
 
-          else:
-            first_val =  index_val_list[tmp_pos]
-            second_val = index_val_list[tmp_pos+1]
+            else:
+              first_val =  index_val_list[tmp_pos]
+              second_val = index_val_list[tmp_pos+1]
 
-            while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
-                   ((tmp_pos+1) < num_index_vals)):
-              tmp_pos += 1
-              first_val =  second_val
-              second_val = index_val_list[tmp_pos]
+              while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
+                     ((tmp_pos+1) < num_index_vals)):
+                tmp_pos += 1
+                first_val =  second_val
+                second_val = index_val_list[tmp_pos]
 
-            block_end_index = tmp_pos+1
+              block_end_index = tmp_pos+1
 
           # Generate the list of record identifiers from this block
           #
@@ -2762,52 +7183,60 @@ class AdaptSortingIndex(Indexing):
 
         while (block_start_index < num_index_vals):
 
-          w_first = block_start_index
-          w = 1  # To make sure this works even with one single index key value
-          w_last = w_first + w
+          if (adapt_method != 'linear'):  # Exponential and binary search
+            block_end_index = find_block_end_funct(index_val_list,
+                                                   block_start_index,
+                                                   str_sim_cache)
 
-          # Get the first and last index key values in the current window
-          #
-          first_val = index_val_list[w_first]
-          last_val =  index_val_list[w_last-1]
+          else:  # Simplified linear scan
+            w_first = block_start_index
+            w = 1  # To make sure this works even with one single index key
+                   # value
+            w_last = w_first + w
 
-          # Enlargement phase: Move the window forward as long as index key
-          # values are similar
-          #
-          while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
-                 (w_last < num_index_vals)):
-            w_first = w_last-1  # Make sure the windows overlap
-            w *= 2              # Geometric increase in the window size
-            w_last += w-1       # Adjust for overlap
-            if (w_last > num_index_vals):
-              w_last = num_index_vals  # Reached end of array
-
-            first_val = last_val
+            # Get the first and last index key values in the current window
+            #
+            first_val = index_val_list[w_first]
             last_val =  index_val_list[w_last-1]
 
-          # Retrenchment phase: Find the boundary pair (use simple linear scan)
-          # (the retrenchment phase as described in the above mentioned paper is
-          # yet to be implementd)
-          #
-          #
-          tmp_pos = block_start_index
+            # Enlargement phase: Move the window forward as long as index key
+            # values are similar
+            #
+            while ((str_cmp_funct(first_val, last_val) > str_cmp_thres) and
+                   (w_last < num_index_vals)):
+              w_first = w_last-1  # Make sure the windows overlap
+              w *= 2              # Geometric increase in the window size
+              w_last += w-1       # Adjust for overlap
+              if (w_last > num_index_vals):
+                w_last = num_index_vals  # Reached end of array
+
+              first_val = last_val
+              last_val =  index_val_list[w_last-1]
+
+            # Retrenchment phase: Find the boundary pair (use simple linear
+            # scan) (the binary search retrenchment phase as described in the
+            # above mentioned paper is done by __find_block_end__())
+            #
+            #
+            tmp_pos = block_start_index
 
-          # Take care of special case where last block is 1 index key value only
-          #
-          if (tmp_pos+1 == num_index_vals):
-            block_end_index = tmp_pos+1
+            # Take care of special case where last block is 1 index key value
+            # only
+            #
+            if (tmp_pos+1 == num_index_vals):
+              block_end_index = tmp_pos+1
 
-          else:
-            first_val =  index_val_list[tmp_pos]
-            second_val = index_val_list[tmp_pos+1]
+            else:
+              first_val =  index_val_list[tmp_pos]
+              second_val = index_val_list[tmp_pos+1]
 
-            while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
-                   ((tmp_pos+1) < num_index_vals)):
-              tmp_pos += 1
-              first_val =  second_val
-              second_val = index_val_list[tmp_pos]
+              while ((str_cmp_funct(first_val, second_val) > str_cmp_thres) and
+                     ((tmp_pos+1) < num_index_vals)):
+                tmp_pos += 1
+                first_val =  second_val
+                second_val = index_val_list[tmp_pos]
 
-            block_end_index = tmp_pos+1
+              block_end_index = tmp_pos+1
 
           # Generate the list of record identifiers from this block
           #
@@ -2851,28 +7280,134 @@ class AdaptSortingIndex(Indexing):
       logging.info('  Compacted sorting index %d in %s' % \
                    (i, auxiliary.time_string(time.time()-istart_time)))
 
+      if (adapt_method != 'linear'):
+        logging.info('    Calculated %d string similarities for %d ' % \
+                     (len(str_sim_cache), num_index_vals) + \
+                     'index key values in %d blocks' % (num_blocks_done))
+      del str_sim_cache
+
       self.index1[i].clear()  # Not needed anymore
       self.index2[i].clear()
 
       logging.info('    Explicitly run garbage collection')
       gc.collect()
 
-      memory_usage_str = auxiliary.get_memory_usage()
-      if (memory_usage_str != None):
-        logging.info('      '+memory_usage_str)
+      memory_usage_str = auxiliary.get_memory_usage()
+      if (memory_usage_str != None):
+        logging.info('      '+memory_usage_str)
+
+    self.rec_pair_dict = rec_pair_dict
+
+    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+
+    for rec_ident2_set in self.rec_pair_dict.itervalues():
+      self.num_rec_pairs += len(rec_ident2_set)
+
+    logging.info('Compacted sorting index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+
+    self.status = 'compacted'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def __get_str_sim__(self, val1, val2, str_sim_cache):
+    """Return the similarity of the two given index key values, and keep it
+       in the given cache dictionary so it is only calculated once.
+    """
+
+    str_sim = str_sim_cache.get((val1, val2), None)
+
+    if (str_sim == None):
+      str_sim = self.str_cmp_funct(val1, val2)
+      str_sim_cache[(val1, val2)] = str_sim
+
+    return str_sim
+
+  # ---------------------------------------------------------------------------
+
+  def __find_block_end__(self, index_val_list, block_start_index,
+                         str_sim_cache):
+    """Find the end of the block starting at the given position in the sorted
+       list of index key values, according to the 'adapt_method' of this
+       index (either 'incremental' or 'accumulative').
+
+       The window is enlarged by doubling its size as long as its first and
+       last values are similar, and the block boundary is then searched for
+       with a binary search in the last window.
+
+       Returns the position of the first index key value after the block.
+    """
+
+    num_index_vals = len(index_val_list)
+
+    if (block_start_index+1 >= num_index_vals):  # Last value only
+      return num_index_vals
+
+    get_str_sim =   self.__get_str_sim__  # Shorthands
+    str_cmp_thres = self.str_cmp_thres
+
+    if (self.adapt_method == 'incremental'):  # Similar to the first value - -
+
+      first_val = index_val_list[block_start_index]
 
-    self.rec_pair_dict = rec_pair_dict
+      # Exponential probing: 'low' is similar to the first value, 'high' is
+      # the next position to check
+      #
+      low =  block_start_index
+      high = block_start_index+1
+      step = 1
+
+      while (get_str_sim(first_val, index_val_list[high],
+                         str_sim_cache) > str_cmp_thres):
+        low = high
+        if (high == num_index_vals-1):  # All remaining values are similar
+          return num_index_vals
+        step *= 2
+        high = min(block_start_index+step, num_index_vals-1)
+
+      # Binary search for the first value not similar to the first value
+      #
+      while (high - low > 1):
+        mid = (low + high) / 2
+        if (get_str_sim(first_val, index_val_list[mid],
+                        str_sim_cache) > str_cmp_thres):
+          low = mid
+        else:
+          high = mid
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+    else:  # Accumulative, windows overlapping by one value - - - - - - - - - -
 
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+      w = 2
+      w_first = block_start_index
+      w_last =  min(w_first+w-1, num_index_vals-1)
 
-    logging.info('Compacted sorting index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
-    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+      # Enlargement phase: Move and enlarge the window forward as long as its
+      # first and last index key values are similar
+      #
+      while (get_str_sim(index_val_list[w_first], index_val_list[w_last],
+                         str_sim_cache) > str_cmp_thres):
+        if (w_last == num_index_vals-1):  # Reached end of array
+          return num_index_vals
+        w_first = w_last  # Make sure the windows overlap
+        w *= 2            # Geometric increase in the window size
+        w_last = min(w_first+w-1, num_index_vals-1)
+
+      # Retrenchment phase: Binary search for the boundary pair, i.e. two
+      # neighbouring values that are not similar
+      #
+      low =  w_first
+      high = w_last
+
+      while (high - low > 1):
+        mid = (low + high) / 2
+        if (get_str_sim(index_val_list[low], index_val_list[mid],
+                        str_sim_cache) > str_cmp_thres):
+          low = mid
+        else:
+          high = mid
 
-    self.status = 'compacted'  # Update index status
+    return high
 
   # ---------------------------------------------------------------------------
 
@@ -2960,18 +7495,54 @@ class QGramIndex(Indexing):
      The lower the threshold, the shorter the sub-lists, but also the more
      sub-lists there will be per field value, resulting in more (smaller
      blocks) in the inverted index.
+
+     As the number of sub-lists grows combinatorially with the length of the
+     index variable values, long values (like addresses) with low thresholds
+     can take a lot of time and memory. The following additional argument
+     allows to select a different method:
+
+       qgram_method    Either 'sublist' (default) for the method described
+                       above, or 'prefix', in which case all pairs of index
+                       variable values (from the two data sets, or from the
+                       one data set for a deduplication) with a Dice
+                       coefficient of their q-gram lists of at least the
+                       threshold are found with a similarity join based on
+                       prefix and length filtering. Repeated q-grams in a
+                       value are counted multiple times, and the Dice
+                       coefficient is 2*c/(n1+n2), with c the number of common
+                       q-grams and n1 and n2 the numbers of q-grams in the two
+                       values.
+
+     For the 'prefix' method the q-grams of each value are sorted by their
+     global frequency (rarest first). Two values with a Dice coefficient of at
+     least the threshold must have a common q-gram in the first few
+     (according to their length and the threshold) of their sorted q-grams, so
+     only these prefixes are inserted into an inverted index, and the
+     candidate value pairs found in it are then verified. The records in the
+     blocks of all verified value pairs are paired when the index is
+     compacted.
+
+     This index does not support the 'incremental' argument of the base class
+     (an exception is raised if it is set to True), so records cannot be added
+     to it once it has been built.
   """
 
+  supports_intern_rec_ids = True
+  supports_save = True
+  supports_meta_blocking = True
+  saved_attr_list = ['qgram_index1', 'qgram_index2']
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """Constructor. Process the 'q', padded' and 'threshold' arguments first,
-       then call the base class constructor.
+    """Constructor. Process the 'q', padded', 'threshold' and 'qgram_method'
+       arguments first, then call the base class constructor.
     """
 
-    self.padded =    True
-    self.q =         2
-    self.threshold = None
+    self.padded =       True
+    self.q =            2
+    self.threshold =    None
+    self.qgram_method = 'sublist'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -2991,6 +7562,13 @@ class QGramIndex(Indexing):
         auxiliary.check_is_normalised('threshold', value)
         self.threshold = value
 
+      elif (keyword.startswith('qgram_m')):
+        if (value not in ['sublist', 'prefix']):
+          logging.exception('Value of "qgram_method" is not "sublist" or ' + \
+                            '"prefix": %s' % (str(value)))
+          raise Exception
+        self.qgram_method = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -3000,9 +7578,15 @@ class QGramIndex(Indexing):
     #
     auxiliary.check_is_normalised('threshold', self.threshold)
 
+    if ((self.qgram_method == 'prefix') and (self.threshold == 0.0)):
+      logging.exception('Threshold must be larger than 0.0 for q-gram ' + \
+                        'method "prefix"')
+      raise Exception
+
     self.log([('Threshold', self.threshold),
               ('q', self.q),
-              ('Padded flag', self.padded)])  # Log a message
+              ('Padded flag', self.padded),
+              ('Q-gram method', self.qgram_method)])  # Log a message
 
     self.QGRAM_START_CHAR = chr(1)
     self.QGRAM_END_CHAR =   chr(2)
@@ -3059,6 +7643,26 @@ class QGramIndex(Indexing):
 
     for i in range(num_indices):
 
+      if (self.qgram_method == 'prefix'):  # Similarity join of index values
+
+        qstart_time = time.time()
+
+        num_blocks += len(self.index1[i])
+
+        if (self.do_deduplication == True):
+          self.qgram_index1[i] = self.__prefix_join__(self.index1[i], None)
+        else:
+          num_blocks += len(self.index2[i])
+          self.qgram_index1[i] = self.__prefix_join__(self.index1[i],
+                                                      self.index2[i])
+
+        for index_val_set in self.qgram_index1[i].itervalues():
+          num_qgram_blocks += len(index_val_set)
+
+        logging.info('  Built %d-gram index %d with prefix filtering in %s' \
+                     % (q, i, auxiliary.time_string(time.time()-qstart_time)))
+        continue
+
       # Build a list of data structures needed for the build process
       #
       index_list = [(self.index1[i], self.qgram_index1[i],0)]  # For data set 1
@@ -3111,8 +7715,13 @@ class QGramIndex(Indexing):
 
     logging.info('  Number of basic index blocks (number of different ' + \
                  'index variable values): %d' % (num_blocks))
-    logging.info('  Number of %d-gram index blocks (number of different ' % \
-                 (q) + '%d-gram index values):  %d' % (q, num_qgram_blocks))
+    if (self.qgram_method == 'prefix'):
+      logging.info('  Number of similar index variable value pairs: %d' % \
+                   (num_qgram_blocks))
+    else:
+      logging.info('  Number of %d-gram index blocks (number of different '
+                   % (q) + '%d-gram index values):  %d' % \
+                   (q, num_qgram_blocks))
 
     memory_usage_str = auxiliary.get_memory_usage()
     if (memory_usage_str != None):
@@ -3122,6 +7731,140 @@ class QGramIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
+  def __get_qgram_tokens__(self, index_val):
+    """Return the list of q-grams of the given index variable value as tuples
+       (q-gram, occurrence number), so that repeated q-grams are counted
+       multiple times in set operations.
+    """
+
+    q = self.q
+
+    if (self.padded == True):
+      qgram_str = '%s%s%s' % ((q-1)*self.QGRAM_START_CHAR, index_val,
+                              (q-1)*self.QGRAM_END_CHAR)
+    else:
+      qgram_str = index_val
+
+    qgram_count_dict = {}
+    qgram_token_list = []
+
+    for j in xrange(len(qgram_str)-(q-1)):
+      qgram = qgram_str[j:j+q]
+      qgram_count = qgram_count_dict.get(qgram, 0)
+      qgram_token_list.append((qgram, qgram_count))
+      qgram_count_dict[qgram] = qgram_count+1
+
+    return qgram_token_list
+
+  # ---------------------------------------------------------------------------
+
+  def __prefix_join__(self, basic_index1, basic_index2):
+    """Find all pairs of index variable values from the two given basic
+       indices (or from the first one only if 'basic_index2' is None, for a
+       deduplication) that have a Dice coefficient of their q-gram lists of
+       at least the threshold, using prefix and length filtering.
+
+       Returns a dictionary with the index variable values of the first basic
+       index as keys and sets of similar index variable values from the
+       second basic index as values. For a deduplication each value is
+       similar to itself, and other similar values are only stored with the
+       smaller value as key.
+    """
+
+    threshold = self.threshold
+    len_fact =  threshold / (2.0-threshold)  # Ratio of smallest length
+
+    if (basic_index2 == None):
+      val_list_pair = [basic_index1.keys()]
+    else:
+      val_list_pair = [basic_index1.keys(), basic_index2.keys()]
+
+    # Get the q-gram tokens of all values and their global frequencies - - - -
+    #
+    token_dict_pair = []
+    token_freq_dict = {}
+
+    for val_list in val_list_pair:
+      token_dict = {}
+      for index_val in val_list:
+        token_list = self.__get_qgram_tokens__(index_val)
+        token_dict[index_val] = token_list
+        for token in token_list:
+          token_freq_dict[token] = token_freq_dict.get(token, 0) + 1
+      token_dict_pair.append(token_dict)
+
+    # Sort tokens with rare ones first and calculate prefix lengths: A value
+    # with n tokens can only be similar to values with at least
+    # ceil(len_fact*n) tokens, which need to have at least this many common
+    # tokens, so its first n-ceil(len_fact*n)+1 tokens must contain one of
+    # them (a small epsilon is subtracted to allow for rounding errors)
+    #
+    for token_dict in token_dict_pair:
+      for (index_val, token_list) in token_dict.iteritems():
+        token_list.sort(key = lambda token: (token_freq_dict[token], token))
+
+    def prefix_len(num_tokens):
+      return num_tokens - int(math.ceil(len_fact*num_tokens-0.000001)) + 1
+
+    # Build inverted index of prefix tokens of the second (or only) values - -
+    #
+    prefix_index = {}
+
+    for (index_val, token_list) in token_dict_pair[-1].iteritems():
+      for token in token_list[:prefix_len(len(token_list))]:
+        prefix_val_list = prefix_index.get(token, [])
+        prefix_val_list.append(index_val)
+        prefix_index[token] = prefix_val_list
+
+    token_dict2 = token_dict_pair[-1]
+
+    # Probe the prefix index with the prefixes of the first values - - - - - -
+    #
+    sim_val_dict = {}
+
+    for (index_val1, token_list1) in token_dict_pair[0].iteritems():
+
+      num_tokens1 = len(token_list1)
+
+      sim_val_set = set()
+
+      if (basic_index2 == None):
+        sim_val_set.add(index_val1)  # Records with the same value are paired
+
+      if (num_tokens1 == 0):  # Values without q-grams only match themselves
+        if (index_val1 in token_dict2):
+          sim_val_set.add(index_val1)
+
+      else:
+        min_len = len_fact*num_tokens1 - 0.000001  # Length filter
+        max_len = num_tokens1 / len_fact + 0.000001
+
+        token_set1 = set(token_list1)
+        cand_val_set = set()
+
+        for token in token_list1[:prefix_len(num_tokens1)]:
+          for index_val2 in prefix_index.get(token, []):
+            if ((basic_index2 == None) and (index_val2 <= index_val1)):
+              continue
+            cand_val_set.add(index_val2)
+
+        for index_val2 in cand_val_set:  # Verify candidate values
+          token_list2 = token_dict2[index_val2]
+          num_tokens2 = len(token_list2)
+
+          if ((num_tokens2 >= min_len) and (num_tokens2 <= max_len)):
+            num_common = len(token_set1.intersection(token_list2))
+
+            if (2.0*num_common >= threshold*(num_tokens1+num_tokens2)):
+              sim_val_set.add(index_val2)
+
+      if (len(sim_val_set) > 0):
+        sim_val_dict[index_val1] = sim_val_set
+
+    return sim_val_dict
+
+  # ---------------------------------------------------------------------------
+
   def compact(self):
     """Method to compact an index data structure.
 
@@ -3157,7 +7900,53 @@ class QGramIndex(Indexing):
 
       num_qgram_blocks_done = 0
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+      if (self.qgram_method == 'prefix'):  # Pair blocks of similar values - -
+
+        this_index1 = self.index1[i]
+        if (self.do_deduplication == True):
+          this_index2 = this_index1
+        else:
+          this_index2 = self.index2[i]
+
+        for (index_val1, index_val_set2) in self.qgram_index1[i].iteritems():
+
+          block_recs1 = this_index1[index_val1]
+
+          for index_val2 in index_val_set2:
+
+            if (self.do_deduplication == False):
+              self.__link_rec_pairs__(block_recs1, this_index2[index_val2],
+                                      rec_pair_dict)
+
+            elif (index_val2 == index_val1):
+              if (len(block_recs1) > 1):
+                self.__dedup_rec_pairs__(block_recs1, rec_pair_dict)
+
+            else:
+              for rec_ident1 in block_recs1:
+                for rec_ident2 in this_index2[index_val2]:
+
+                  if (rec_ident1 < rec_ident2):
+                    rec_ident2_set = rec_pair_dict.get(rec_ident1, set())
+                    rec_ident2_set.add(rec_ident2)
+                    rec_pair_dict[rec_ident1] = rec_ident2_set
+                  elif (rec_ident2 < rec_ident1):
+                    rec_ident2_set = rec_pair_dict.get(rec_ident2, set())
+                    rec_ident2_set.add(rec_ident1)
+                    rec_pair_dict[rec_ident2] = rec_ident2_set
+
+          num_qgram_blocks_done += 1
+
+          # Log progress report every XXX index values processed
+          #
+          if ((num_qgram_blocks_done % NUM_QGRAM_BLOCK_PROGRESS_REPORT) == 0):
+            logging.info('    Processed %d of %d index values' % \
+                         (num_qgram_blocks_done, len(self.qgram_index1[i])))
+            memory_usage_str = auxiliary.get_memory_usage()
+            if (memory_usage_str != None):
+              logging.info('      '+memory_usage_str)
+
+      elif (self.do_deduplication == True):  # A deduplication - - - - - - - -
 
         this_qgram_index = self.qgram_index1[i]
         this_index =       self.index1[i]
@@ -3364,19 +8153,38 @@ class CanopyIndex(Indexing):
        delete_perc       Threshold for deleting common q-grams (if they appear
                          in more than this percentage of all records). Default
                          is None, in which case no q-grams will be deleted.
+       canopy_engine     Either 'basic' (default), in which case the records
+                         similar to a canopy centre are found by accumulating
+                         the similarities over all records in the inverted
+                         lists of the centre's q-grams, or 'maxscore', in which
+                         case the inverted index is converted into arrays of
+                         sparse vectors and inverted lists, and the similar
+                         records are found with the MaxScore top-k retrieval
+                         method, which stops scanning inverted lists once no
+                         new record can become similar enough. The canopies
+                         are the same for a given centre record (for the
+                         'jaccard','nearest' method the nearest records are
+                         found exactly instead of approximately). Removing
+                         records from the pool takes constant time.
+
+     This index does not support the 'incremental' argument of the base class
+     (an exception is raised if it is set to True), so records cannot be added
+     to it once it has been built.
   """
 
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """Constructor. Process the arguments 'canopy_method', 'q', 'padded' and
-       'delete_perc' first, then call the base class constructor.
+    """Constructor. Process the arguments 'canopy_method', 'q', 'padded',
+       'delete_perc' and 'canopy_engine' first, then call the base class
+       constructor.
     """
 
     self.canopy_method =  None
     self.q =              2
     self.padded =         True
     self.delete_perc =    None
+    self.canopy_engine =  'basic'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -3408,6 +8216,13 @@ class CanopyIndex(Indexing):
         auxiliary.check_is_percentage('delete_perc', value)
         self.delete_perc = value
 
+      elif (keyword.startswith('canopy_e')):
+        if (value not in ['basic', 'maxscore']):
+          logging.exception('Value of "canopy_engine" is not "basic" or ' + \
+                            '"maxscore": %s' % (str(value)))
+          raise Exception
+        self.canopy_engine = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -3459,7 +8274,8 @@ class CanopyIndex(Indexing):
     self.log([('Canopy method', self.canopy_method),
               ('q', self.q),
               ('Padded flag', self.padded),
-              ('Delete percentage', self.delete_perc)])  # Log a message
+              ('Delete percentage', self.delete_perc),
+              ('Canopy engine', self.canopy_engine)])  # Log a message
 
     self.QGRAM_START_CHAR = chr(1)
     self.QGRAM_END_CHAR =   chr(2)
@@ -3923,19 +8739,37 @@ class CanopyIndex(Indexing):
                    (i, total_num_rec, len(self.index1[i]))+'%d-grams' % \
                    (self.q))
 
+      # With the MaxScore engine the records left are kept in its pool
+      #
+      if (self.canopy_engine == 'maxscore'):
+        canopy_engine = _CanopyEngine(self, i)
+        canopy_pool =   canopy_engine
+      else:
+        canopy_engine = None
+        canopy_pool =   this_index_val_cache
+
       # Loop over all values, extract canopies and delete records from values
       # cache that are within the tight threshold of a canopy
       #
-      while(len(this_index_val_cache) > 0):
+      while(len(canopy_pool) > 0):
 
-        # Get arbitrary record identifier and value from the values cache
-        #
-        (rec_ident, index_val) = this_index_val_cache.popitem()
-        this_index_val_cache[rec_ident] = index_val  # Put back in
+        if (canopy_engine != None):
+          rec_ident = canopy_engine.next_centre()
+          index_val = this_index_val_cache[rec_ident]
+
+        else:
+
+          # Get arbitrary record identifier and value from the values cache
+          #
+          (rec_ident, index_val) = this_index_val_cache.popitem()
+          this_index_val_cache[rec_ident] = index_val  # Put back in
 
         # Get all records in this canopy - - - - - - - - - - - - - - - - - - -
         #
-        if (do_tfidf == True):
+        if (canopy_engine != None):
+          canopy_recs = canopy_engine.get_canopy(rec_ident)
+
+        elif (do_tfidf == True):
           canopy_recs = tfidf_canopy_funct(self.index1[i], index_val,
                                           this_index_val_cache,
                                           self.qgram_inv_doc_freq_cache[i],
@@ -3990,7 +8824,7 @@ class CanopyIndex(Indexing):
         #
         if ((num_canopies % NUM_CANOPY_PROGRESS_REPORT) == 0):
           logging.info('    Created %d canopies; %d records and ' % \
-                       (num_canopies, len(self.index_val_cache[i])) + \
+                       (num_canopies, len(canopy_pool)) + \
                        '%d %d-grams' % (len(self.index1[i]), self.q)+' left')
           memory_usage_str = auxiliary.get_memory_usage()
           if (memory_usage_str != None):
@@ -4577,13 +9411,51 @@ class StringMapIndex(Indexing):
                                             be a positive integer and larger
                                             than or equal to the value of
                                             remove nearest.
+       metric_index     Either 'grid' (default) for the string-map mapping and
+                        inverted grid index described above, or 'vptree', in
+                        which case the strings are inserted into a vantage
+                        point tree (VP-tree) built with the string distances
+                        (1.0-similarity value) directly. In this case the
+                        arguments 'dim', 'sub_dim', 'cache_dist' and
+                        'grid_resolution' are not needed, and the thresholds
+                        of the canopy method are compared with the string
+                        similarities (instead of the Euclidean distances in the
+                        mapped space).
+
+     With the VP-tree, the strings in a threshold canopy are found with a
+     range query at the loose threshold, and the strings in a nearest canopy
+     with one nearest neighbour query that returns all strings up to the
+     distance of the 'cluster_nearest'-th nearest string. The results are exact
+     if the string distance is a metric (for example a normalised edit distance
+     with a fixed divisor), otherwise some close strings might be missed. The
+     number of distance calculations done when the index is built and
+     compacted is logged for both metric indices.
+
+     Note that compacting a VP-tree index is much slower than compacting a
+     grid index. Building the VP-tree needs far fewer similarity calculations
+     than the string-map mapping, but for short strings (like names) the
+     string distances allow few sub-trees to be skipped, so each canopy query
+     still compares its center with a large part of the strings left. In the
+     timings of indexingTiming.py the compact step took more than twice as
+     long as with the grid for threshold canopies, and almost twenty times as
+     long for nearest canopies. The 'vptree' metric index is therefore only
+     worth using if canopies should be based on the string similarities
+     themselves rather than on the (approximate) distances in the mapped
+     space, which for threshold canopies can result in many more record pairs.
   """
 
+  supports_intern_rec_ids = True
+  supports_save = True
+  supports_meta_blocking = True
+  saved_attr_list = ['string_list', 'coord', 'grid_index', 'comp_dist_cache',
+                     'num_dist_calc', 'vp_tree']
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
-    """Constructor. Process the 'dim', 'sub_dim', 'sim_funct', 'cache_dist' and
-       'grid_resolution' arguments first, then call the base class constructor.
+    """Constructor. Process the 'dim', 'sub_dim', 'sim_funct', 'cache_dist',
+       'grid_resolution' and 'metric_index' arguments first, then call the
+       base class constructor.
     """
 
     self.dim =              None
@@ -4592,6 +9464,7 @@ class StringMapIndex(Indexing):
     self.cache_dist =       True
     self.grid_resolution =  None
     self.canopy_method =    None
+    self.metric_index =     'grid'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -4625,6 +9498,13 @@ class StringMapIndex(Indexing):
         auxiliary.check_is_tuple('canopy_method', value)
         self.canopy_method = value
 
+      elif (keyword.startswith('metric_i')):
+        if (value not in ['grid', 'vptree']):
+          logging.exception('Value of "metric_index" is not "grid" or ' + \
+                            '"vptree": %s' % (str(value)))
+          raise Exception
+        self.metric_index = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -4632,20 +9512,23 @@ class StringMapIndex(Indexing):
 
     # Make sure necessary attributes are set - - - - - - - - - - - - - - - - -
     #
-    auxiliary.check_is_positive('dim', self.dim)
-    auxiliary.check_is_positive('sub_dim', self.sub_dim)
-    if (self.sub_dim > self.dim):
-      logging.exception('Argument "sub_dim" is larger than "dim": %d / %d' % \
-                        (self.sub_dim, self.dim))
-      raise Exception
+    if (self.metric_index == 'grid'):
+      auxiliary.check_is_positive('dim', self.dim)
+      auxiliary.check_is_positive('sub_dim', self.sub_dim)
+      if (self.sub_dim > self.dim):
+        logging.exception('Argument "sub_dim" is larger than "dim": %d / %d' \
+                          % (self.sub_dim, self.dim))
+        raise Exception
 
     auxiliary.check_is_function_or_method('sim_funct', self.sim_funct)
-    auxiliary.check_is_integer('grid_resolution', self.grid_resolution)
-    auxiliary.check_is_positive('grid_resolution', self.grid_resolution)
-    if (self.grid_resolution not in [10,100,1000,10000]):
-      logging.exception('Argument "grid_resolution" is not a power of 10 ' + \
-                        'number: %d' % (elf.grid_resolution))
-      raise Exception
+
+    if (self.metric_index == 'grid'):
+      auxiliary.check_is_integer('grid_resolution', self.grid_resolution)
+      auxiliary.check_is_positive('grid_resolution', self.grid_resolution)
+      if (self.grid_resolution not in [10,100,1000,10000]):
+        logging.exception('Argument "grid_resolution" is not a power of 10 ' \
+                          + 'number: %d' % (self.grid_resolution))
+        raise Exception
 
     # Check if canopy method and parameters given are OK - - - - - - - - - - -
     #
@@ -4690,6 +9573,7 @@ class StringMapIndex(Indexing):
     self.string_list = {}  # Dictionary with lists with strings from data sets
     self.coord =       {}  # String object coordinates, dim x (num. of strings)
     self.grid_index =  {}
+    self.vp_tree =     {}  # VP-trees if the metric index is 'vptree'
 
     self.m = 5  # Number of iterations in __choose_pivot__() to get two strings
 
@@ -4698,7 +9582,8 @@ class StringMapIndex(Indexing):
               ('Cache distance calculations', self.cache_dist),
               ('Inverted grid resolution', self.grid_resolution),
               ('Canopy method', self.canopy_method),
-              ('Similarity function', self.sim_funct)])  # Log a message
+              ('Similarity function', self.sim_funct),
+              ('Metric index', self.metric_index)])  # Log a message
 
   # ---------------------------------------------------------------------------
 
@@ -4769,12 +9654,22 @@ class StringMapIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
+  def __get_str_distance__(self, str1, str2):
+    """Return the distance of the two given strings (1.0-similarity value),
+       as used in the VP-trees.
+    """
+
+    return 1.0 - self.sim_funct(str1, str2)
+
+  # ---------------------------------------------------------------------------
+
   def build(self):
     """Method to build an index data structure.
 
        First load the records from the data sets and put them into a basic
        inverted index data structure with blocking variables as keys. Next
-       map them into a multi-dimensional space.
+       map them into a multi-dimensional space (or insert them into a VP-tree
+       if the metric index is 'vptree').
 
        If both data sets are the same (a deduplication) only insert records
        from one data set.
@@ -4802,7 +9697,8 @@ class StringMapIndex(Indexing):
     get_distance_funct = self.__get_distance__
     dim =                self.dim
 
-    grid_round_digit = {10:1, 100:2, 1000:3, 10000:4}[self.grid_resolution]
+    if (self.metric_index == 'grid'):
+      grid_round_digit = {10:1, 100:2, 1000:3, 10000:4}[self.grid_resolution]
 
     for i in range(num_indices):
 
@@ -4823,6 +9719,17 @@ class StringMapIndex(Indexing):
 
       num_string = len(string_list)  # Number of strings in this index
 
+      if (self.metric_index == 'vptree'):  # Build a VP-tree instead - - - - -
+
+        self.vp_tree[i] = _VPTree(string_list, self.__get_str_distance__)
+
+        logging.info('  Built VP-tree for index %d with %d strings values ' % \
+                     (i, num_string)+'in %s' % \
+                     (auxiliary.time_string(time.time()-istart_time)))
+        logging.info('    Number of distance calculations done: %d' % \
+                     (self.vp_tree[i].num_dist_calc))
+        continue
+
       coord = self.coord[i]  # Shorthand
 
       self.comp_dist_cache = {}  # Cache of calculated distances
@@ -4942,10 +9849,11 @@ class StringMapIndex(Indexing):
 
     num_indices = len(self.index_def)
 
-    grid_res = self.grid_resolution
-    grid_round_digit = {10:1, 100:2, 1000:3, 10000:4}[grid_res]
+    if (self.metric_index == 'grid'):
+      grid_res = self.grid_resolution
+      grid_round_digit = {10:1, 100:2, 1000:3, 10000:4}[grid_res]
 
-    interval_size = 1.0/self.grid_resolution  # To get neighbouring grid cells
+      interval_size = 1.0/self.grid_resolution  # To get neighbouring cells
 
     dedup_rec_pairs_funct = self.__dedup_rec_pairs__  # Shorthands
     link_rec_pair_funct =   self.__link_rec_pairs__
@@ -4958,6 +9866,9 @@ class StringMapIndex(Indexing):
       remove_nearest =  self.canopy_method[1]
       cluster_nearest = self.canopy_method[2]
 
+    elif (self.metric_index == 'vptree'):  # Thresholds used in VP-tree
+      do_nearest = False
+
     else:  # Re-scale similarity measure and make it a distance
       do_nearest = False
       tight_threshold = (1.0-self.canopy_method[1])*math.sqrt(dim)
@@ -4976,6 +9887,10 @@ class StringMapIndex(Indexing):
 
     for i in range(num_indices):
 
+      if (self.metric_index == 'vptree'):
+        self.__compact_vp_tree__(i, rec_pair_dict)
+        continue
+
       istart_time = time.time()
 
       num_canopies = 0  # Count the number of canopies created
@@ -5347,6 +10262,206 @@ class StringMapIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
+  def __compact_vp_tree__(self, i, rec_pair_dict):
+    """Extract canopies from the VP-tree of index 'i' and insert their record
+       pairs into the given record pair dictionary.
+
+       The first string left in the tree is taken as canopy center, and its
+       candidate strings are found with one query (a range query for threshold
+       canopies, a nearest neighbour query for nearest canopies). For a
+       threshold canopy all strings with a similarity of at least the loose
+       threshold to the center are added to the canopy, and the ones with a
+       similarity of at least the tight threshold are removed from the tree.
+       For a nearest canopy the strings are added and removed (in order of
+       their distance to the center) as long as they have not more records
+       than 'cluster_nearest' and 'remove_nearest', respectively.
+    """
+
+    NUM_CANOPY_PROGRESS_REPORT = 100  # Log a message every XXX canopies
+
+    istart_time = time.time()
+
+    dist_funct = self.__get_str_distance__  # Shorthands
+    do_dedup =   self.do_deduplication
+
+    if (self.canopy_method[0] == 'nearest'):
+      do_nearest = True
+      remove_nearest =  self.canopy_method[1]
+      cluster_nearest = self.canopy_method[2]
+    else:
+      do_nearest = False
+      tight_dist = 1.0 - self.canopy_method[1]
+      loose_dist = 1.0 - self.canopy_method[2]
+
+    vp_tree =     self.vp_tree[i]
+    string_list = self.string_list[i]
+    num_string =  len(string_list)
+
+    this_index1 = self.index1[i]  # Shorthands to basic inverted index
+    if (do_dedup == False):  # A linkage
+      this_index2 = self.index2[i]
+
+    vp_tree.num_dist_calc = 0
+
+    num_canopies = 0  # Count the number of canopies created
+
+    smallest_canopy_size =   999999
+    smallest_canopy_center = ''    # Indexing value of the smallest canopy
+    largest_canopy_size =    -99999
+    largest_canopy_center =  ''    # Indexing value of the largest canopy
+
+    logging.info('  Compacting index %d containing %d strings' % \
+                 (i, num_string))
+
+    center_num = 0  # Strings before this have all been removed from the tree
+
+    while (center_num < num_string):
+
+      if (vp_tree.is_left(center_num) == False):
+        center_num += 1
+        continue
+
+      center_str_val = string_list[center_num]
+
+      # Get the strings close to the center with their distances - - - - - - -
+      #
+      if (do_nearest == True):
+        cand_list = vp_tree.nearest(center_str_val, cluster_nearest,
+                                    dist_funct)
+      else:
+        cand_list = vp_tree.range_query(center_str_val, loose_dist,
+                                        dist_funct)
+      cand_list.sort()
+
+      remove_str_list = []  # String numbers to be removed from the tree
+
+      canopy_recs1 = [] # All record identifiers from data set 1 in canopy
+      canopy_recs2 = [] # Record identifiers from data set 2, linkage only
+
+      # Process the strings with the same distance together - - - - - - - - -
+      #
+      c = 0
+      while (c < len(cand_list)):
+        this_dist = cand_list[c][0]
+
+        this_str_list = []
+        while ((c < len(cand_list)) and (cand_list[c][0] == this_dist)):
+          this_str_list.append(cand_list[c][1])
+          c += 1
+
+        this_str_val_recs1 = []  # All record identifiers for these strings
+        this_str_val_recs2 = []
+
+        for str_num in this_str_list:
+          str_val = string_list[str_num]
+          if (str_val in this_index1):
+            this_str_val_recs1 += this_index1[str_val]
+          if (do_dedup == False) and (str_val in this_index2):
+            this_str_val_recs2 += this_index2[str_val]
+
+        if (do_nearest == True):
+
+          comb_list_len = len(canopy_recs1) + len(canopy_recs2) + \
+                          len(this_str_val_recs1) + len(this_str_val_recs2)
+
+          if (comb_list_len <= cluster_nearest):  # Add more to canopy
+            canopy_recs1 += this_str_val_recs1
+            canopy_recs2 += this_str_val_recs2
+
+            # Remove string (make sure at least closest will be removed)
+            #
+            if ((comb_list_len <= remove_nearest) or
+                (len(remove_str_list) == 0)):
+              remove_str_list += this_str_list
+
+          else:
+            if ((canopy_recs1 == []) and (canopy_recs2 == [])):
+              canopy_recs1 = this_str_val_recs1
+              canopy_recs2 = this_str_val_recs2
+              remove_str_list = this_str_list
+
+            break
+
+        else:  # Thresholds, all strings are within the loose threshold - - -
+
+          canopy_recs1 += this_str_val_recs1
+          canopy_recs2 += this_str_val_recs2
+
+          # Remove string (make sure at least closest will be removed)
+          #
+          if ((this_dist <= tight_dist) or (len(remove_str_list) == 0)):
+            remove_str_list += this_str_list
+
+      # Make sure center string will be removed - - - - - - - - - - - - - - -
+      #
+      if (center_num not in remove_str_list):
+        remove_str_list.append(center_num)
+
+      for str_num in remove_str_list:
+        vp_tree.remove(str_num)
+
+      del cand_list
+      del remove_str_list
+
+      num_canopy_rec = len(canopy_recs1) + len(canopy_recs2)
+      num_canopies += 1
+
+      if (num_canopy_rec < smallest_canopy_size):
+        smallest_canopy_size =   num_canopy_rec
+        smallest_canopy_center = center_str_val
+      elif (num_canopy_rec > largest_canopy_size):
+        largest_canopy_size =   num_canopy_rec
+        largest_canopy_center = center_str_val
+
+      # Build record pairs from record identifiers in this canopy - - - - - -
+      #
+      if (do_dedup == True):
+
+        if (len(canopy_recs1) > 1):  # For deduplication at least two records
+          self.__dedup_rec_pairs__(canopy_recs1, rec_pair_dict)
+
+      else:  # A linkage - - - - - - - - - - - - - - - - - - - - - - - - - - -
+
+        if ((len(canopy_recs1) > 0) and (len(canopy_recs2) > 0)):
+          self.__link_rec_pairs__(canopy_recs1, canopy_recs2, rec_pair_dict)
+
+      del canopy_recs1
+      del canopy_recs2
+
+      # Log progress report every XXX canopies - - - - - - - - - - - - - - - -
+      #
+      if ((num_canopies % NUM_CANOPY_PROGRESS_REPORT) == 0):
+        logging.info('    Created %d canopies; %d strings left' % \
+                     (num_canopies, len(vp_tree)))
+        memory_usage_str = auxiliary.get_memory_usage()
+        if (memory_usage_str != None):
+          logging.info('      '+memory_usage_str)
+
+    # Delete not needed index data to free-up memory - - - - - - - - - - - - -
+    #
+    this_index1.clear()  # Not needed anymore
+    if (do_dedup == False):
+      this_index2.clear()
+
+    logging.info('  Compacted VP-tree index %d in %s' % \
+                 (i, auxiliary.time_string(time.time()-istart_time)))
+    logging.info('    Number of distance calculations done: %d' % \
+                 (vp_tree.num_dist_calc))
+    logging.info('    Produced %d canopies' % (num_canopies))
+    logging.info('      Smallest canopy with %d strings and center ' % \
+                 (smallest_canopy_size)+'index value: "%s"' % \
+                 (smallest_canopy_center))
+    logging.info('      Largest canopy with %d strings and center ' % \
+                 (largest_canopy_size)+'index value: "%s"' % \
+                 (largest_canopy_center))
+
+    self.vp_tree[i] = None  # Not needed anymore
+
+    logging.info('  Explicitly run garbage collection')
+    gc.collect()
+
+  # ---------------------------------------------------------------------------
+
   def run(self, length_filter_perc = None, cut_off_threshold = None):
     """Iterate over all blocks in the index.
 
@@ -5413,8 +10528,20 @@ class SuffixArrayIndex(Indexing):
                                       example for 'peter', the values 'pete',
                                       'eter', 'pet', 'ete', 'ter', etc. will
                                       be generated.
+       array_method   Either 'strings' (default), in which case all suffix
+                      strings (or sub-strings) of all index variable values
+                      are generated and stored as keys in a dictionary, or
+                      'lcp', in which case a suffix array and a longest common
+                      prefix (LCP) array are built over the concatenated
+                      distinct index variable values, and the blocks are
+                      formed from ranges in the suffix array. The second method
+                      only needs a few integers per character instead of a
+                      copy of every suffix string. Both methods generate the
+                      same record pairs.
   """
 
+  supports_meta_blocking = True
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -5428,6 +10555,7 @@ class SuffixArrayIndex(Indexing):
     self.block_method =  None
     self.padded =        True
     self.suffix_method = None
+    self.array_method =  'strings'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -5451,6 +10579,13 @@ class SuffixArrayIndex(Indexing):
           raise Exception
         self.suffix_method = value
 
+      elif (keyword.startswith('array_m')):
+        if (value not in ['strings', 'lcp']):
+          logging.exception('Value of "array_method" is not "strings" or ' + \
+                            '"lcp": %s' % (str(value)))
+          raise Exception
+        self.array_method = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -5473,7 +10608,8 @@ class SuffixArrayIndex(Indexing):
 
     self.log([('Blocking method', self.block_method),
               ('Suffix method', self.suffix_method),
-              ('Padded flag', self.padded)])
+              ('Padded flag', self.padded),
+              ('Array method', self.array_method)])
 
     self.START_CHAR = chr(1)
     self.END_CHAR =   chr(2)
@@ -5492,6 +10628,20 @@ class SuffixArrayIndex(Indexing):
 
     start_time = time.time()
 
+    if (self.array_method == 'lcp'):  # Suffix arrays over the index values
+      self.__build_suffix_arrays__(self.padded, self.START_CHAR,
+                                   self.END_CHAR)
+
+      logging.info('Built suffix array index in %s' % \
+                   (auxiliary.time_string(time.time()-start_time)))
+
+      memory_usage_str = auxiliary.get_memory_usage()
+      if (memory_usage_str != None):
+        logging.info('  '+memory_usage_str)
+
+      self.status = 'built'  # Update index status
+      return
+
     num_indices = len(self.index_def)
 
     # Index data structure for blocks is one dictionary per index - - - - - - -
@@ -5767,7 +10917,11 @@ class SuffixArrayIndex(Indexing):
       num_strings_done = 0
       largest_block =    0
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+      if (self.array_method == 'lcp'):  # Blocks from suffix array ranges - - -
+
+        largest_block = self.__compact_suffix_array__(i, rec_pair_dict)
+
+      elif (self.do_deduplication == True):  # A deduplication - - - - - - - -
 
         this_str_list = self.suffix_array_strings1[i]  # Shorthands
         this_index =    self.index1[i]
@@ -5846,34 +11000,126 @@ class SuffixArrayIndex(Indexing):
             if (memory_usage_str != None):
               logging.info('      '+memory_usage_str)
 
-          del curr_str_val_records1
+          del curr_str_val_records1
+
+      logging.info('  Compacted suffix array index %d in %s' % \
+                   (i, auxiliary.time_string(time.time()-istart_time)))
+      logging.info('    Largest block contained %d records' % (largest_block))
+
+      self.index1[i].clear()  # Not needed anymore
+      self.index2[i].clear()
+
+      logging.info('    Explicitly run garbage collection')
+      gc.collect()
+
+      memory_usage_str = auxiliary.get_memory_usage()
+      if (memory_usage_str != None):
+        logging.info('      '+memory_usage_str)
+
+    self.rec_pair_dict = rec_pair_dict
+
+    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+
+    for rec_ident2_set in self.rec_pair_dict.itervalues():
+      self.num_rec_pairs += len(rec_ident2_set)
+
+    logging.info('Compacted suffix array index in %s' % \
+                 (auxiliary.time_string(time.time()-start_time)))
+    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+
+    self.status = 'compacted'  # Update index status
+
+  # ---------------------------------------------------------------------------
+
+  def __compact_suffix_array__(self, i, rec_pair_dict):
+    """Form the blocks of index 'i' from the ranges in its suffix array (as
+       built with the 'lcp' array method), and insert the record pairs of all
+       blocks that do not contain more than 'max_block_size' records (from
+       each data set) into the given record pair dictionary.
+
+       A block contains the records of all index variable values that have
+       the same suffix (or sub-string) of at least 'min_suffix_len'
+       characters, or the records of one index variable value shorter than
+       this. Returns the number of records in the largest block.
+    """
+
+    min_suffix_len = self.block_method[0]  # Shorthands
+    max_block_size = self.block_method[1]
+    suffix_array =   self.suffix_arrays[i]
+    index_val_list = self.suffix_array_vals[i]
+    this_index1 =    self.index1[i]
+    this_index2 =    self.index2[i]
+
+    # Number of records per index variable value in both data sets
+    #
+    size_list1 = array.array('l', [len(this_index1.get(index_val, [])) for \
+                                   index_val in index_val_list])
+    if (self.do_deduplication == True):
+      size_list2 = array.array('l', [0])*len(index_val_list)
+    else:
+      size_list2 = array.array('l', [len(this_index2.get(index_val, [])) for \
+                                     index_val in index_val_list])
+
+    if (self.suffix_method == 'allsubstr'):
+      group_iter = suffix_array.substring_groups(min_suffix_len, size_list1,
+                                                 size_list2, max_block_size)
+    else:
+      group_iter = (str_num_list for (pos, suff_len, str_num_list) in \
+                    suffix_array.suffix_groups(min_suffix_len))
+
+    num_blocks =    0
+    largest_block = 0
+
+    for str_num_list in group_iter:
 
-      logging.info('  Compacted suffix array index %d in %s' % \
-                   (i, auxiliary.time_string(time.time()-istart_time)))
-      logging.info('    Largest block contained %d records' % (largest_block))
+      block_size1 = 0
+      block_size2 = 0
+      for str_num in str_num_list:
+        block_size1 += size_list1[str_num]
+        block_size2 += size_list2[str_num]
 
-      self.index1[i].clear()  # Not needed anymore
-      self.index2[i].clear()
+      if ((block_size1 > max_block_size) or (block_size2 > max_block_size)):
+        continue  # Block is too large
 
-      logging.info('    Explicitly run garbage collection')
-      gc.collect()
+      if (self.do_deduplication == True):
+        if (block_size1 < 2):
+          continue
 
-      memory_usage_str = auxiliary.get_memory_usage()
-      if (memory_usage_str != None):
-        logging.info('      '+memory_usage_str)
+        block_recs = []
+        for str_num in str_num_list:
+          if (size_list1[str_num] > 0):
+            block_recs.extend(this_index1[index_val_list[str_num]])
 
-    self.rec_pair_dict = rec_pair_dict
+        self.__dedup_rec_pairs__(block_recs, rec_pair_dict)
 
-    self.num_rec_pairs = 0  # Count lengths of all record identifier sets - - -
+        largest_block = max(largest_block, block_size1)
 
-    for rec_ident2_set in self.rec_pair_dict.itervalues():
-      self.num_rec_pairs += len(rec_ident2_set)
+      else:
+        if ((block_size1 == 0) or (block_size2 == 0)):
+          continue
 
-    logging.info('Compacted suffix array index in %s' % \
-                 (auxiliary.time_string(time.time()-start_time)))
-    logging.info('  Number of record pairs: %d' % (self.num_rec_pairs))
+        block_recs1 = []
+        block_recs2 = []
+        for str_num in str_num_list:
+          index_val = index_val_list[str_num]
+          if (size_list1[str_num] > 0):
+            block_recs1.extend(this_index1[index_val])
+          if (size_list2[str_num] > 0):
+            block_recs2.extend(this_index2[index_val])
 
-    self.status = 'compacted'  # Update index status
+        self.__link_rec_pairs__(block_recs1, block_recs2, rec_pair_dict)
+
+        largest_block = max(largest_block, block_size1+block_size2)
+
+      num_blocks += 1
+
+    logging.info('    Processed %d blocks from suffix array with %d suffixes' \
+                 % (num_blocks, len(suffix_array)))
+
+    self.suffix_arrays[i] =     None  # Not needed anymore
+    self.suffix_array_vals[i] = None
+
+    return largest_block
 
   # ---------------------------------------------------------------------------
 
@@ -5940,8 +11186,14 @@ class RobustSuffixArrayIndex(Indexing):
                       stringcmp module).
        str_cmp_thres  The threshold for the string comparison function, must
                       be in (0..1).
+       array_method   Either 'strings' (default) or 'lcp', see the
+                      SuffixArrayIndex for details. With the 'lcp' method the
+                      suffix strings are only extracted from the concatenated
+                      index variable values when they are compared.
   """
 
+  supports_meta_blocking = True
+
   # ---------------------------------------------------------------------------
 
   def __init__(self, **kwargs):
@@ -5956,6 +11208,7 @@ class RobustSuffixArrayIndex(Indexing):
     self.padded =        True
     self.str_cmp_funct = None
     self.str_cmp_thres = None
+    self.array_method =  'strings'
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -5978,6 +11231,13 @@ class RobustSuffixArrayIndex(Indexing):
         auxiliary.check_is_normalised('str_cmp_thres', value)
         self.str_cmp_thres = value
 
+      elif (keyword.startswith('array_m')):
+        if (value not in ['strings', 'lcp']):
+          logging.exception('Value of "array_method" is not "strings" or ' + \
+                            '"lcp": %s' % (str(value)))
+          raise Exception
+        self.array_method = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -6000,7 +11260,8 @@ class RobustSuffixArrayIndex(Indexing):
     self.log([('Blocking method',             self.block_method),
               ('String comparison function',  self.str_cmp_funct),
               ('String comparison threshold', self.str_cmp_thres),
-              ('Padded flag',                 self.padded)])
+              ('Padded flag',                 self.padded),
+              ('Array method',                self.array_method)])
 
     self.START_CHAR = chr(1)
     self.END_CHAR =   chr(2)
@@ -6018,6 +11279,20 @@ class RobustSuffixArrayIndex(Indexing):
 
     start_time = time.time()
 
+    if (self.array_method == 'lcp'):  # Suffix arrays over the index values
+      self.__build_suffix_arrays__(self.padded, self.START_CHAR,
+                                   self.END_CHAR)
+
+      logging.info('Built suffix array index in %s' % \
+                   (auxiliary.time_string(time.time()-start_time)))
+
+      memory_usage_str = auxiliary.get_memory_usage()
+      if (memory_usage_str != None):
+        logging.info('  '+memory_usage_str)
+
+      self.status = 'built'  # Update index status
+      return
+
     num_indices = len(self.index_def)
 
     # Index data structure for blocks is one dictionary per index - - - - - - -
@@ -6279,7 +11554,11 @@ class RobustSuffixArrayIndex(Indexing):
       num_strings_done = 0
       largest_block =    0
 
-      if (self.do_deduplication == True):  # A deduplication - - - - - - - - -
+      if (self.array_method == 'lcp'):  # Suffixes from suffix array - - - - -
+
+        largest_block = self.__compact_suffix_array__(i, rec_pair_dict)
+
+      elif (self.do_deduplication == True):  # A deduplication - - - - - - - -
 
         this_str_list = self.suffix_array_strings1[i]  # Shorthands
         this_index =    self.index1[i]
@@ -6485,6 +11764,107 @@ class RobustSuffixArrayIndex(Indexing):
 
   # ---------------------------------------------------------------------------
 
+  def __compact_suffix_array__(self, i, rec_pair_dict):
+    """Go through the suffixes of index 'i' in the order of its suffix array
+       (as built with the 'lcp' array method), merge the records of similar
+       neighbouring suffixes, and insert the record pairs of the resulting
+       blocks into the given record pair dictionary.
+
+       The suffixes, their records, and the merging are the same as in the
+       'strings' array method, but the suffix strings are extracted from the
+       suffix array only for comparison. Returns the number of records in the
+       largest block.
+    """
+
+    min_suffix_len = self.block_method[0]  # Shorthands
+    max_block_size = self.block_method[1]
+    str_cmp_funct =  self.str_cmp_funct
+    str_cmp_thres =  self.str_cmp_thres
+    suffix_array =   self.suffix_arrays[i]
+    suffix_buf =     suffix_array.buf
+    index_val_list = self.suffix_array_vals[i]
+    this_index1 =    self.index1[i]
+    this_index2 =    self.index2[i]
+
+    # Get the suffixes (position and length in the suffix array buffer) and
+    # their record lists in sorted order, without the suffixes that have too
+    # many records (or only one record for a deduplication)
+    #
+    suffix_list = []
+
+    for (pos, suff_len, str_num_list) in \
+      suffix_array.suffix_groups(min_suffix_len):
+
+      suff_recs1 = []
+      suff_recs2 = []
+      for str_num in str_num_list:
+        index_val = index_val_list[str_num]
+        suff_recs1.extend(this_index1.get(index_val, []))
+        if (self.do_deduplication == False):
+          suff_recs2.extend(this_index2.get(index_val, []))
+
+      if (len(suff_recs1) > max_block_size):
+        suff_recs1 = []
+      if (len(suff_recs2) > max_block_size):
+        suff_recs2 = []
+
+      if (self.do_deduplication == True):
+        if (len(suff_recs1) > 1):
+          suffix_list.append((pos, suff_len, suff_recs1, suff_recs2))
+      elif ((suff_recs1 != []) or (suff_recs2 != [])):
+        suffix_list.append((pos, suff_len, suff_recs1, suff_recs2))
+
+    self.suffix_arrays[i] =     None  # Not needed anymore
+    self.suffix_array_vals[i] = None
+    del suffix_array
+
+    suffix_list_len = len(suffix_list)
+
+    largest_block = 0
+
+    # Compare each suffix with the following suffixes until their similarity
+    # is below the threshold, and merge their records
+    #
+    j = 0
+    while (j < (suffix_list_len-1)):
+      (pos, suff_len, merged_recs1, merged_recs2) = suffix_list[j]
+      this_str = suffix_buf[pos:pos+suff_len]
+
+      k = j+1
+      while (k < suffix_list_len):
+        (pos, suff_len) = suffix_list[k][:2]
+        if (str_cmp_funct(this_str, suffix_buf[pos:pos+suff_len]) < \
+            str_cmp_thres):
+          break
+        k += 1
+
+      if ((j+1) < k):  # Merge records of similar suffixes
+        merged_recs1 = set(merged_recs1)
+        merged_recs2 = set(merged_recs2)
+        for l in range(j+1,k):
+          merged_recs1.update(suffix_list[l][2])
+          merged_recs2.update(suffix_list[l][3])
+        merged_recs1 = list(merged_recs1)
+        merged_recs2 = list(merged_recs2)
+
+      if (self.do_deduplication == True):
+        self.__dedup_rec_pairs__(merged_recs1, rec_pair_dict)
+        largest_block = max(largest_block, len(merged_recs1))
+
+      elif ((merged_recs1 != []) and (merged_recs2 != [])):
+        self.__link_rec_pairs__(merged_recs1, merged_recs2, rec_pair_dict)
+        largest_block = max(largest_block,
+                            len(merged_recs1) + len(merged_recs2))
+
+      j = k  # k is the first not merged suffix
+
+    logging.info('    Processed %d suffixes from suffix array' % \
+                 (suffix_list_len))
+
+    return largest_block
+
+  # ---------------------------------------------------------------------------
+
   def run(self, length_filter_perc = None, cut_off_threshold = None):
     """Iterate over all blocks in the index.
 
@@ -6535,6 +11915,27 @@ class BigMatchIndex(Indexing):
                        ('qgram',q,padded,threshold)
                      with parameters similar to the corresponding indexing
                      methods.
+
+     The following optional arguments can also be set:
+
+       batch_size    If set to a positive integer, the large data set is read
+                     in batches of this number of records. The candidate
+                     records from the small data set of all records in a batch
+                     are looked up in the index, and then the batch is
+                     compared (by a pool of worker processes if the base class
+                     argument 'num_processes' is larger than 1). Weight
+                     vectors are passed on batch by batch, so memory usage
+                     does not grow with the size of the large data set if a
+                     weight vector file or a 'batch_funct' is used. Default
+                     value is None, in which case the records of the large
+                     data set are processed one at a time.
+       batch_funct   A function that is called with the list of (rec_ident1,
+                     rec_ident2, weight vector) tuples of each batch once it
+                     has been compared. If set, the weight vectors are not
+                     kept in a weight vector dictionary (or written into the
+                     weight vector file), and the run() method returns None.
+                     Can only be used with a 'batch_size'. Default value is
+                     None.
   """
 
   # ---------------------------------------------------------------------------
@@ -6548,6 +11949,8 @@ class BigMatchIndex(Indexing):
     """
 
     self.block_method = None
+    self.batch_size =   None
+    self.batch_funct =  None
 
     base_kwargs = {}  # Dictionary, will contain unprocessed arguments for base
                       # class constructor
@@ -6558,6 +11961,17 @@ class BigMatchIndex(Indexing):
         auxiliary.check_is_tuple('block_method', value)
         self.block_method = value
 
+      elif (keyword.startswith('batch_s')):
+        if (value != None):
+          auxiliary.check_is_integer('batch_size', value)
+          auxiliary.check_is_positive('batch_size', value)
+        self.batch_size = value
+
+      elif (keyword.startswith('batch_f')):
+        if (value != None):
+          auxiliary.check_is_function_or_method('batch_funct', value)
+        self.batch_funct = value
+
       else:
         base_kwargs[keyword] = value
 
@@ -6601,6 +12015,11 @@ class BigMatchIndex(Indexing):
                         (str(self.block_method)))
       raise Exception
 
+    if ((self.batch_funct != None) and (self.batch_size == None)):
+      logging.exception('Argument "batch_funct" can only be used together ' + \
+                        'with "batch_size"')
+      raise Exception
+
     num_rec1 = self.dataset1.num_records
     num_rec2 = self.dataset2.num_records
 
@@ -6626,7 +12045,9 @@ class BigMatchIndex(Indexing):
 
     self.log([('Small data set', self.small_dataset.description),
               ('Large data set',  self.large_dataset.description),
-              ('Blocking method', self.block_method)])
+              ('Blocking method', self.block_method),
+              ('Batch size',      self.batch_size),
+              ('Batch function',  self.batch_funct)])
 
     self.QGRAM_START_CHAR = chr(1)
     self.QGRAM_END_CHAR =   chr(2)
@@ -6902,52 +12323,30 @@ class BigMatchIndex(Indexing):
       auxiliary.check_is_number('Cut-off threshold', cut_off_threshold)
       logging.info('  Cut-off threshold set to: %.2f' % (cut_off_threshold))
 
-    num_rec_pairs_filtered =    0  # Count number of removed record pairs
-    num_rec_pairs_below_thres = 0
-
-    # For sort and q-gram block methods get their parameter values - - - - - -
-    #
-    block_method = self.block_method[0]
-
-    if (block_method == 'sort'):
-      win_size =  self.block_method[1]
-      win_size_after =  win_size/2  # Number of index values after and before
-      win_size_before = win_size - win_size_after - 1
-      sorted_index_val_list = self.sorted_index_val_list
-
-      num_sorted_index_val = []  # Get number of values for each index
-      for i in range(num_indices):
-        num_sorted_index_val.append(len(sorted_index_val_list[i]))
+    if (self.batch_size != None):  # Process the large data set in batches
 
-    elif (block_method == 'qgram'):
-      q =         self.block_method[1]
-      q1 =        q-1
-      padded =    self.block_method[2]
-      threshold = self.block_method[3]
+      if (self.weight_vec_file == None):
+        weight_vec_fp =     None
+        weight_vec_writer = None
 
-      if (padded == True):  # More shorthands
-        start_str = q1*self.QGRAM_START_CHAR
-        end_str =   q1*self.QGRAM_END_CHAR
+      return self.__run_batches__(length_filter_perc, cut_off_threshold,
+                                  weight_vec_fp, weight_vec_writer,
+                                  start_time)
 
-      # Depending upon threshold values use one of two sub-list methods
-      # (the switch value of 0.75 was found experimentally)
-      #
-      if (threshold > 0.75):
-        qgram_sublist_funct = self.__get_sublists1__
-      else:
-        qgram_sublist_funct = self.__get_sublists2__
+    num_rec_pairs_filtered =    0  # Count number of removed record pairs
+    num_rec_pairs_below_thres = 0
 
-    compare_funct =          self.rec_comparator.compare  # Shorthands
+    rec_comp_batch =         self.rec_comparator.compare_batch  # Shorthands
     get_index_values_funct = self.__get_index_values__
     skip_missing =           self.skip_missing
     large_data_set_no =      self.large_data_set_no
-    this_index =             self.index1
     rec_length_cache =       self.rec_length_cache
     comp_field_used_list =   self.large_comp_field
-    find_closest_funct =     self.__find_closest__
     small_rec_cache =        self.small_rec_cache
     small_data_set_no =      self.small_data_set_no
 
+    get_small_rec_idents_funct = self.__get_small_rec_idents__
+
     # Calculate a counter for the progress report
     #
     if (self.progress_report != None):
@@ -6956,7 +12355,8 @@ class BigMatchIndex(Indexing):
     else:  # So no progress report is being logged
       progress_report_cnt = self.large_dataset.num_records + 1
 
-    weight_vec_dict = {}  # Dictionary with calculated weight vectors
+    weight_vec_dict = self.__new_weight_vec_dict__()  # Calculated weight
+                                                      # vectors
 
     rec_read =  0  # Number of records read from the large data set
     comp_done = 0  # Number of comparisons done
@@ -6965,6 +12365,22 @@ class BigMatchIndex(Indexing):
     #
     small_block_rec_set = set()
 
+    batch_list = []  # Record pairs to be compared in the next batch
+
+    def compare_batch_funct(batch_list):  # Compare a batch of record pairs
+                                          # and store their weight vectors
+      w_vec_list = []
+      num_below_thres = _compare_rec_pair_batch(rec_comp_batch, batch_list,
+                                                cut_off_threshold, w_vec_list)
+
+      for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+        if (self.weight_vec_file == None):
+          weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+        else:
+          weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+
+      return num_below_thres
+
     # Reading loop over all records in the large data set - - - - - - - - - - -
     #
     for (large_rec_ident, large_rec) in self.large_dataset.readall():
@@ -6994,136 +12410,336 @@ class BigMatchIndex(Indexing):
 
         if ((index_val != '') or (skip_missing == False)):
 
-          # Process index value depending upon the block method
+          # Get record identifiers from the small data set depending upon
+          # the block method
           #
-          if (block_method == 'block'):  # Simply get record identifiers
+          small_rec_ident_list = get_small_rec_idents_funct(i, index_val)
 
-            small_rec_ident_list = this_index[i].get(index_val, [])
+          # Now loop over all record identifiers from small data set - - - - -
+          # with this index value
+          #
+          for small_rec_ident in small_rec_ident_list:
 
-          elif (block_method == 'sort'):  # Get record identifiers in window -
+            # Only compare record if it hasn't been compared before
+            #
+            if (small_rec_ident not in small_block_rec_set):
+              small_block_rec_set.add(small_rec_ident)
+
+              # Get record values from cache
+              #
+              small_rec = small_rec_cache[small_rec_ident]
+
+              do_comp = True  # Flag, specify if comparison should be done
+
+              if (length_filter_perc != None):
+                if (small_rec_ident in rec_length_cache):  # Length is cached
+                  small_rec_len = rec_length_cache[small_rec_ident]
+                else:
+                  small_rec_len = len(''.join(small_rec))  # Length in chars
+                  rec_length_cache[small_rec_ident] = small_rec_len
+
+                perc_diff = float(abs(large_rec_len - small_rec_len)) / \
+                            max(large_rec_len, small_rec_len)
+
+                if (perc_diff > length_filter_perc):
+                  do_comp = False  # Difference too large, don't do comparison
+                  num_rec_pairs_filtered += 1
+
+              if (do_comp == True):
+
+                if (small_data_set_no == 0):
+                  batch_list.append((small_rec_ident, large_rec_ident,
+                                     small_rec, large_rec))
+                else:
+                  batch_list.append((large_rec_ident, small_rec_ident,
+                                     large_rec, small_rec))
+
+              comp_done += 1
+
+      small_block_rec_set.clear()
+
+      if (len(batch_list) >= COMPARE_BATCH_SIZE):  # Compare record pairs
+        num_rec_pairs_below_thres += compare_batch_funct(batch_list)
+        batch_list = []
+
+      rec_read += 1
+
+      if ((rec_read % progress_report_cnt) == 0):
+        self.__log_build_progress__(rec_read, self.large_dataset.num_records,
+                                    start_time)
+        logging.info('    Number of comparisons done so far: %d (%.1f in ' % \
+                     (comp_done, float(comp_done)/rec_read)+'average per ' + \
+                     'record from the large data set)')
+
+    if (batch_list != []):  # Compare the last batch
+      num_rec_pairs_below_thres += compare_batch_funct(batch_list)
+
+    self.num_rec_pairs = comp_done
+
+    used_sec_str = auxiliary.time_string(time.time()-start_time)
+    rec_read_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                              self.large_dataset.num_records)
+    if (comp_done > 0):
+      rec_comp_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                                comp_done)
+    else:
+      rec_comp_time_str = 0
+    logging.info('Read %d records in %s (%s per record)' % \
+                 (self.large_dataset.num_records, used_sec_str,
+                  rec_read_time_str))
+    logging.info('  Compared %d record pairs in %s (%s per pair)' % \
+                 (comp_done, used_sec_str, rec_comp_time_str))
+    if (length_filter_perc != None):
+      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
+                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
+    if (cut_off_threshold != None):
+      logging.info('  %d record pairs had summed weights below threshold ' % \
+                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    if (self.weight_vec_file == None):
+      return [self.__get_field_names_list__(), weight_vec_dict]
+    else:
+      weight_vec_fp.close()
+      return None
+
+  # ---------------------------------------------------------------------------
+
+  def __get_small_rec_idents__(self, i, index_val):
+    """Return the list of record identifiers from the small data set that a
+       record from the large data set with the given value in index 'i' has
+       to be compared with, depending upon the block method.
+    """
+
+    block_method = self.block_method[0]
+    this_index =   self.index1
+
+    if (block_method == 'block'):  # Simply get record identifiers
+
+      small_rec_ident_list = this_index[i].get(index_val, [])
+
+    elif (block_method == 'sort'):  # Get record identifiers in window - - - -
+
+      win_size =  self.block_method[1]
+      win_size_after =  win_size/2  # Number of index values after and before
+      win_size_before = win_size - win_size_after - 1
+
+      sorted_index_val_list = self.sorted_index_val_list[i]
+
+      # Find the list index of this index value or value before
+      #
+      list_index = self.__find_closest__(sorted_index_val_list, index_val)
+
+      # Get indices in list for the window and then the index values
+      #
+      win_start = max(0, list_index-win_size_before)
+      win_end = min(len(sorted_index_val_list), list_index+win_size_after+1)
+
+      win_index_val_list = sorted_index_val_list[win_start:win_end]
+
+      small_rec_ident_list = []
+
+      for sort_index_val in win_index_val_list:
+
+        for small_rec_ident in this_index[i].get(sort_index_val, []):
+
+          if (small_rec_ident not in small_rec_ident_list):
+            small_rec_ident_list.append(small_rec_ident)
+
+    elif (block_method == 'qgram'):  # Make q-gram sub-lists - - - - - - - - -
+
+      q =         self.block_method[1]
+      q1 =        q-1
+      padded =    self.block_method[2]
+      threshold = self.block_method[3]
+
+      if (padded == True):
+        qgram_str = '%s%s%s' % (q1*self.QGRAM_START_CHAR, index_val,
+                                q1*self.QGRAM_END_CHAR)
+      else:
+        qgram_str = index_val
+
+      # Create the q-gram list
+      #
+      qgram_list= [qgram_str[j:j+q] for j in xrange(len(qgram_str)-q1)]
+
+      # Calculate length of sub-lists needed and then create them
+      #
+      num_qgrams = len(qgram_list)
+
+      min_num_qgrams = max(1, int(num_qgrams*threshold))
+
+      # Depending upon threshold values use one of two sub-list methods
+      # (the switch value of 0.75 was found experimentally)
+      #
+      if (threshold > 0.75):
+        qgram_sublists = self.__get_sublists1__(qgram_list, min_num_qgrams)
+      else:
+        qgram_sublists = self.__get_sublists2__(qgram_list, min_num_qgrams)
+
+      small_rec_ident_list = []
+
+      # Convert q-gram sub-lists into strings and get record identifiers
+      # from small data set
+      #
+      for qgram_sublist in qgram_sublists:
+
+        qgram_substr = ''.join(qgram_sublist)
+        for small_rec_ident in this_index[i].get(qgram_substr, []):
+
+          if (small_rec_ident not in small_rec_ident_list):
+            small_rec_ident_list.append(small_rec_ident)
+
+    else:
+      logging.exception('Illegal blocking method given: %s' %
+                        (str(self.block_method)))
+      raise Exception
+
+    return small_rec_ident_list
+
+  # ---------------------------------------------------------------------------
+
+  def __large_rec_batches__(self):
+    """A generator which reads the records from the large data set in batches
+       of 'batch_size' records, and returns each batch in the format used by
+       the function _compare_rec_pair_chunk(): A list of tuples made of a
+       record identifier from the large data set, the record (with the values
+       of the fields not used in comparisons set to '') and the list of record
+       identifiers from the small data set it has to be compared with.
+    """
+
+    batch_size =             self.batch_size  # Shorthands
+    num_indices =            len(self.index_def)
+    get_index_values_funct = self.__get_index_values__
+    get_small_rec_idents_funct = self.__get_small_rec_idents__
+    skip_missing =           self.skip_missing
+    large_data_set_no =      self.large_data_set_no
+    comp_field_used_list =   self.large_comp_field
 
-            # Find the list index of this index value or value before
-            #
-            list_index = find_closest_funct(sorted_index_val_list[i],index_val)
+    batch = []
 
-            # Get indices in list for the window and then the index values
-            #
-            win_start = max(0, list_index-win_size_before)
-            win_end = min(num_sorted_index_val[i], list_index+win_size_after+1)
+    for (large_rec_ident, large_rec) in self.large_dataset.readall():
 
-            win_index_val_list = sorted_index_val_list[i][win_start:win_end]
+      large_rec_lower = []  # Make all values lowercase
+      for field_val in large_rec:
+        large_rec_lower.append(field_val.lower())
 
-            small_rec_ident_list = []
+      # Extract record fields needed for comparisons (set all others to '')
+      #
+      comp_rec = []
 
-            for sort_index_val in win_index_val_list:
+      field_ind = 0
+      for field_val in large_rec_lower:
+        if (field_ind in comp_field_used_list):
+          comp_rec.append(field_val)
+        else:
+          comp_rec.append('')
+        field_ind += 1
 
-              for small_rec_ident in this_index[i].get(sort_index_val, []):
+      # Get the index variable values for this record and the record
+      # identifiers from the small data set for all indices (each only once)
+      #
+      rec_index_val_list = get_index_values_funct(large_rec_lower,
+                                                  large_data_set_no)
 
-                if (small_rec_ident not in small_rec_ident_list):
-                  small_rec_ident_list.append(small_rec_ident)
+      small_rec_ident_list = []
+      small_block_rec_set =  set()
 
-          elif (block_method == 'qgram'):  # Make q-gram sub-lists - - - - - -
+      for i in range(num_indices):
 
-            if (padded == True):
-              qgram_str = '%s%s%s' % (start_str, index_val, end_str)
-            else:
-              qgram_str = index_val
+        index_val = rec_index_val_list[i]
 
-            # Create the q-gram list
-            #
-            qgram_list= [qgram_str[j:j+q] for j in xrange(len(qgram_str)-q1)]
+        if ((index_val != '') or (skip_missing == False)):
 
-            # Calculate length of sub-lists needed and then create them
-            #
-            num_qgrams = len(qgram_list)
+          for small_rec_ident in get_small_rec_idents_funct(i, index_val):
+            if (small_rec_ident not in small_block_rec_set):
+              small_block_rec_set.add(small_rec_ident)
+              small_rec_ident_list.append(small_rec_ident)
 
-            min_num_qgrams = max(1, int(num_qgrams*threshold))
+      batch.append((large_rec_ident, comp_rec, small_rec_ident_list))
 
-            qgram_sublists = qgram_sublist_funct(qgram_list, min_num_qgrams)
+      if (len(batch) >= batch_size):
+        yield batch
+        batch = []
 
-            small_rec_ident_list = []
+    if (batch != []):
+      yield batch
 
-            # Convert q-gram sub-lists into strings and get record identifiers
-            # from small data set
-            #
-            for qgram_sublist in qgram_sublists:
+  # ---------------------------------------------------------------------------
 
-              qgram_substr = ''.join(qgram_sublist)
-              for small_rec_ident in this_index[i].get(qgram_substr, []):
+  def __run_batches__(self, length_filter_perc, cut_off_threshold,
+                      weight_vec_fp, weight_vec_writer, start_time):
+    """Read the large data set in batches, compare the records of each batch
+       with their record pairs from the small data set, and pass the
+       resulting weight vectors on batch by batch, either to the 'batch_funct',
+       into the weight vector file, or into a weight vector dictionary.
 
-                if (small_rec_ident not in small_rec_ident_list):
-                  small_rec_ident_list.append(small_rec_ident)
+       The length filter percentage must already be normalised (between 0 and
+       1). Returns the same values as the run() method.
+    """
 
-          else:
-            logging.exception('Illegal blocking method given: %s' %
-                              (str(self.block_method)))
-            raise Exception
+    # If the small data set is data set 1, the record pairs need to be swapped
+    #
+    swap_rec_pairs = (self.small_data_set_no == 0)
 
-          # Now loop over all record identifiers from small data set - - - - -
-          # with this index value
-          #
-          for small_rec_ident in small_rec_ident_list:
+    batch_funct = self.batch_funct  # Shorthand
 
-            # Only compare record if it hasn't been compared before
-            #
-            if (small_rec_ident not in small_block_rec_set):
-              small_block_rec_set.add(small_rec_ident)
+    if ((batch_funct == None) and (weight_vec_writer == None)):
+      weight_vec_dict = self.__new_weight_vec_dict__()  # Calculated weight
+                                                        # vectors
+    else:
+      weight_vec_dict = None
 
-              # Get record values from cache
-              #
-              small_rec = small_rec_cache[small_rec_ident]
+    num_batches = max(1, int(math.ceil(float(self.large_dataset.num_records) \
+                                       / self.batch_size)))
 
-              do_comp = True  # Flag, specify if comparison should be done
+    # Calculate a counter for the progress report (in batches)
+    #
+    if (self.progress_report != None):
+      progress_report_cnt = max(1, int(num_batches / \
+                                   (100.0 / self.progress_report)))
+    else:  # So no progress report is being logged
+      progress_report_cnt = num_batches + 1
 
-              if (length_filter_perc != None):
-                if (small_rec_ident in rec_length_cache):  # Length is cached
-                  small_rec_len = rec_length_cache[small_rec_ident]
-                else:
-                  small_rec_len = len(''.join(small_rec))  # Length in chars
-                  rec_length_cache[small_rec_ident] = small_rec_len
+    batch_done = 0  # Number of batches compared
+    comp_done =  0  # Number of comparisons done
 
-                perc_diff = float(abs(large_rec_len - small_rec_len)) / \
-                            max(large_rec_len, small_rec_len)
+    num_rec_pairs_filtered =    0  # Count number of removed record pairs
+    num_rec_pairs_below_thres = 0
 
-                if (perc_diff > length_filter_perc):
-                  do_comp = False  # Difference too large, don't do comparison
-                  num_rec_pairs_filtered += 1
+    for (batch_comp_done, batch_w_vec_list, batch_num_filtered,
+         batch_num_below_thres) in \
+        self.__compare_rec_pair_chunks__(self.__large_rec_batches__(),
+                                         self.small_rec_cache,
+                                         length_filter_perc,
+                                         cut_off_threshold, swap_rec_pairs):
 
-              if (do_comp == True):
+      if (batch_funct != None):
+        batch_funct(batch_w_vec_list)
 
-                if (small_data_set_no == 0):
-                  w_vec = compare_funct(small_rec, large_rec)
-
-                  if (cut_off_threshold == None) or \
-                     (sum(w_vec) >= cut_off_threshold):
-                    if (self.weight_vec_file == None):
-                      weight_vec_dict[(small_rec_ident,large_rec_ident)]= w_vec
-                    else:
-                      weight_vec_writer.writerow([small_rec_ident,
-                                                  large_rec_ident]+w_vec)
-                  else:
-                    num_rec_pairs_below_thres += 1
+      elif (weight_vec_writer != None):
+        for (rec_ident1, rec_ident2, w_vec) in batch_w_vec_list:
+          weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+        weight_vec_fp.flush()
 
-                else:
-                  w_vec = compare_funct(large_rec, small_rec)
-
-                  if (cut_off_threshold == None) or \
-                     (sum(w_vec) >= cut_off_threshold):
-                    if (self.weight_vec_file == None):
-                      weight_vec_dict[(large_rec_ident,small_rec_ident)]= w_vec
-                    else:
-                      weight_vec_writer.writerow([large_rec_ident,
-                                                  small_rec_ident]+w_vec)
-                  else:
-                    num_rec_pairs_below_thres += 1
+      else:
+        for (rec_ident1, rec_ident2, w_vec) in batch_w_vec_list:
+          weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
 
-              comp_done += 1
+      del batch_w_vec_list
 
-      small_block_rec_set.clear()
+      comp_done +=                 batch_comp_done
+      num_rec_pairs_filtered +=    batch_num_filtered
+      num_rec_pairs_below_thres += batch_num_below_thres
 
-      rec_read += 1
+      batch_done += 1
 
-      if ((rec_read % progress_report_cnt) == 0):
+      if ((batch_done % progress_report_cnt) == 0):
+        rec_read = min(batch_done*self.batch_size,
+                       self.large_dataset.num_records)
         self.__log_build_progress__(rec_read, self.large_dataset.num_records,
                                     start_time)
         logging.info('    Number of comparisons done so far: %d (%.1f in ' % \
@@ -7133,18 +12749,13 @@ class BigMatchIndex(Indexing):
     self.num_rec_pairs = comp_done
 
     used_sec_str = auxiliary.time_string(time.time()-start_time)
-    rec_read_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                              self.large_dataset.num_records)
-    if (comp_done > 0):
-      rec_comp_time_str = auxiliary.time_string((time.time()-start_time) / \
-                                                comp_done)
-    else:
-      rec_comp_time_str = 0
-    logging.info('Read %d records in %s (%s per record)' % \
-                 (self.large_dataset.num_records, used_sec_str,
-                  rec_read_time_str))
-    logging.info('  Compared %d record pairs in %s (%s per pair)' % \
-                 (comp_done, used_sec_str, rec_comp_time_str))
+    rec_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                         max(1, comp_done))
+    logging.info('Read %d records in %d batches of %d records in %s' % \
+                 (self.large_dataset.num_records, batch_done, self.batch_size,
+                  used_sec_str))
+    logging.info('  Compared %d record pairs (%s per pair)' % \
+                 (comp_done, rec_time_str))
     if (length_filter_perc != None):
       logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
                    (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
@@ -7156,10 +12767,12 @@ class BigMatchIndex(Indexing):
     if (memory_usage_str != None):
       logging.info('  '+memory_usage_str)
 
-    if (self.weight_vec_file == None):
+    if (weight_vec_fp != None):
+      weight_vec_fp.close()
+
+    if (weight_vec_dict != None):
       return [self.__get_field_names_list__(), weight_vec_dict]
     else:
-      weight_vec_fp.close()
       return None
 
 # =============================================================================
@@ -7183,6 +12796,13 @@ class DedupIndex(Indexing):
                        ('qgram', q, padded, threshold)
                      with parameters similar to the corresponding indexing
                      methods.
+
+     If the base class argument 'num_processes' is set to a value larger than
+     1, the records are partitioned by their blocking keys into this number of
+     worker processes, which each keep the blocks of their partition and
+     compare the records in them. The data set is read and the blocking keys
+     are calculated in the main process, which also merges the weight vectors.
+     The same record pairs are compared as with one process.
   """
 
   # ---------------------------------------------------------------------------
@@ -7344,6 +12964,16 @@ class DedupIndex(Indexing):
       auxiliary.check_is_number('Cut-off threshold', cut_off_threshold)
       logging.info('  Cut-off threshold set to: %.2f' % (cut_off_threshold))
 
+    if (self.num_processes > 1):  # Partition records into worker processes
+
+      if (self.weight_vec_file == None):
+        weight_vec_fp =     None
+        weight_vec_writer = None
+
+      return self.__run_partitioned__(length_filter_perc, cut_off_threshold,
+                                      weight_vec_fp, weight_vec_writer,
+                                      start_time)
+
     num_rec_pairs_filtered =    0  # Count number of removed record pairs
     num_rec_pairs_below_thres = 0
 
@@ -7378,7 +13008,7 @@ class DedupIndex(Indexing):
       else:
         qgram_sublist_funct = self.__get_sublists2__
 
-    compare_funct =          self.rec_comparator.compare  # Shorthands
+    rec_comp_batch =         self.rec_comparator.compare_batch  # Shorthands
     find_closest_funct =     self.__find_closest__
     get_index_values_funct = self.__get_index_values__
     skip_missing =           self.skip_missing
@@ -7394,11 +13024,31 @@ class DedupIndex(Indexing):
     else:  # So no progress report is being logged
       progress_report_cnt = self.dataset1.num_records + 1
 
-    weight_vec_dict = {}  # Dictionary with calculated weight vectors
+    weight_vec_dict = self.__new_weight_vec_dict__()  # Calculated weight
+                                                      # vectors
 
     rec_read =  0  # Number of records read from the data set
     comp_done = 0  # Number of comparisons done
 
+    batch_list = []  # Record pairs to be compared in the next batch
+
+    def compare_batch_funct(batch_list):  # Compare a batch of record pairs
+                                          # and store their weight vectors
+      w_vec_list = []
+      num_below_thres = _compare_rec_pair_batch(rec_comp_batch, batch_list,
+                                                cut_off_threshold, w_vec_list)
+
+      for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+        if (self.weight_vec_file != None):
+          weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+
+        elif (rec_ident1 < rec_ident2):  # Make sure record identifiers are
+          weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec  # sorted
+        else:
+          weight_vec_dict[(rec_ident2, rec_ident1)] = w_vec
+
+      return num_below_thres
+
     # Reading loop over all records in the data set - - - - - - - - - - - - - -
     #
     for (rec_ident1, rec1) in self.dataset1.readall():
@@ -7559,30 +13209,16 @@ class DedupIndex(Indexing):
 
         if (do_comp == True):
 
-          w_vec = compare_funct(rec1, rec2)
-
-          if (cut_off_threshold == None) or (sum(w_vec) >= cut_off_threshold):
-
-            # Make sure record identifiers are sorted
-            #
-            if (rec_ident1 < rec_ident2):
-              if (self.weight_vec_file == None):
-                weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
-              else:
-                weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
-
-            else:
-              if (self.weight_vec_file == None):
-                weight_vec_dict[(rec_ident2, rec_ident1)] = w_vec
-              else:
-                weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
-          else:
-            num_rec_pairs_below_thres += 1
+          batch_list.append((rec_ident1, rec_ident2, rec1, rec2))
 
           comp_done += 1
 
       del this_rec_block_rec_list
 
+      if (len(batch_list) >= COMPARE_BATCH_SIZE):  # Compare record pairs
+        num_rec_pairs_below_thres += compare_batch_funct(batch_list)
+        batch_list = []
+
       rec_read += 1
 
       if ((rec_read % progress_report_cnt) == 0):
@@ -7592,6 +13228,9 @@ class DedupIndex(Indexing):
                      (comp_done, float(comp_done)/rec_read)+'average per ' + \
                      'record)')
 
+    if (batch_list != []):  # Compare the last batch
+      num_rec_pairs_below_thres += compare_batch_funct(batch_list)
+
     self.num_rec_pairs = comp_done
 
     rec_cache.clear()
@@ -7626,4 +13265,273 @@ class DedupIndex(Indexing):
       weight_vec_fp.close()
       return None
 
+  # ---------------------------------------------------------------------------
+
+  def __run_partitioned__(self, length_filter_perc, cut_off_threshold,
+                          weight_vec_fp, weight_vec_writer, start_time):
+    """Read the data set in this process and send each record to the worker
+       processes (see function _dedup_partition_worker()) that own the blocks
+       the record is inserted into or is compared with. The blocking keys of
+       a record are tuples made of the index number and a key value, and are
+       partitioned by their hash values into 'num_processes' partitions.
+
+       For the sort block method, the values in the window of a record are
+       determined in this process using the sorted list of all index values
+       read so far, so a record is also sent to the partitions that own the
+       neighbouring values of its window. The compared record pairs are
+       therefore the same as in a run with one process.
+
+       The length filter percentage must already be normalised (between 0 and
+       1). Returns the same values as the run() method.
+    """
+
+    BATCH_NUM_RECS = 1000  # Number of records sent to a worker at once
+
+    num_parts =   self.num_processes
+    num_indices = len(self.index_def)
+
+    block_method = self.block_method[0]
+
+    if (block_method == 'sort'):
+      win_size =  self.block_method[1]
+      win_size_after =  win_size/2  # Number of index values after and before
+      win_size_before = win_size - win_size_after - 1
+
+      sorted_index_val_list = {}  # have a list per index of the sorted values
+      for i in range(num_indices):
+        sorted_index_val_list[i] = []
+
+    elif (block_method == 'qgram'):
+      q =         self.block_method[1]
+      q1 =        q-1
+      padded =    self.block_method[2]
+      threshold = self.block_method[3]
+
+      if (padded == True):  # More shorthands
+        start_str = q1*self.QGRAM_START_CHAR
+        end_str =   q1*self.QGRAM_END_CHAR
+
+      if (threshold > 0.75):
+        qgram_sublist_funct = self.__get_sublists1__
+      else:
+        qgram_sublist_funct = self.__get_sublists2__
+
+    find_closest_funct =     self.__find_closest__  # Shorthands
+    get_index_values_funct = self.__get_index_values__
+    skip_missing =           self.skip_missing
+    comp_field_used_list =   self.comp_field_used1
+
+    # Calculate a counter for the progress report
+    #
+    if (self.progress_report != None):
+      progress_report_cnt = max(1, int(self.dataset1.num_records / \
+                                   (100.0 / self.progress_report)))
+    else:  # So no progress report is being logged
+      progress_report_cnt = self.dataset1.num_records + 1
+
+    if (weight_vec_writer == None):
+      weight_vec_dict = self.__new_weight_vec_dict__()  # Calculated weight
+                                                        # vectors
+
+    def add_w_vec_list(w_vec_list):  # Merge the results of a worker
+      for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+        if (weight_vec_writer != None):
+          weight_vec_writer.writerow([rec_ident1, rec_ident2]+w_vec)
+        elif (rec_ident1 < rec_ident2):  # Make sure identifiers are sorted
+          weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+        else:
+          weight_vec_dict[(rec_ident2, rec_ident1)] = w_vec
+
+    self.__flush_disk_stores__()  # Worker processes are forked
+
+    out_queue =      multiprocessing.Queue()
+    in_queue_list =  []
+    worker_list =    []
+
+    for part_num in range(num_parts):
+      in_queue = multiprocessing.Queue(4)  # Limit records waiting in queue
+      worker = multiprocessing.Process(target = _dedup_partition_worker,
+                                       args = (part_num, num_parts, in_queue,
+                                               out_queue,
+                                          self.rec_comparator.compare_batch,
+                                               length_filter_perc,
+                                               cut_off_threshold))
+      worker.start()
+      in_queue_list.append(in_queue)
+      worker_list.append(worker)
+
+    try:
+      part_rec_list = [[] for part_num in range(num_parts)]
+
+      rec_read = 0  # Number of records read from the data set
+
+      # Reading loop over all records in the data set - - - - - - - - - - - -
+      #
+      for (rec_ident1, rec1) in self.dataset1.readall():
+
+        # Extract record fields needed for comparisons (set all others to '')
+        # (also count length of field values for length filtering)
+        #
+        comp_rec =  []
+        rec_len1 =  0
+
+        for field_ind in range(len(rec1)):
+          rec1[field_ind] = rec1[field_ind].lower()
+          field = rec1[field_ind]
+
+          if (field_ind in comp_field_used_list):
+            comp_rec.append(field)
+            rec_len1 += len(field)
+          else:
+            comp_rec.append('')
+
+        # Get the blocking keys of this record for all indices
+        #
+        rec_index_val_list = get_index_values_funct(rec1, 0)
+
+        insert_key_set = set()
+        lookup_key_set = set()
+
+        for i in range(num_indices):
+
+          index_val = rec_index_val_list[i]
+
+          if ((index_val != '') or (skip_missing == False)):
+
+            if (block_method == 'block'):
+              insert_key_set.add((i, index_val))
+              lookup_key_set.add((i, index_val))
+
+            elif (block_method == 'sort'):  # Values in window read so far -
+
+              this_sorted_list = sorted_index_val_list[i]
+
+              list_index = find_closest_funct(this_sorted_list, index_val)
+
+              win_start = max(0, list_index-win_size_before)
+              win_end =  min(len(this_sorted_list),
+                                 list_index+win_size_after+1)
+
+              for sort_index_val in this_sorted_list[win_start:win_end]:
+                lookup_key_set.add((i, sort_index_val))
+
+              insert_key_set.add((i, index_val))
+
+              if ((list_index < 0) or \
+                  (this_sorted_list[list_index] != index_val)):
+                bisect.insort(this_sorted_list, index_val)  # A new value
+
+            elif (block_method == 'qgram'):
+
+              if (padded == True):
+                qgram_str = '%s%s%s' % (start_str, index_val, end_str)
+              else:
+                qgram_str = index_val
+
+              qgram_list= [qgram_str[j:j+q] for j in \
+                           xrange(len(qgram_str)-q1)]
+
+              num_qgrams = len(qgram_list)
+
+              min_num_qgrams = max(1, int(num_qgrams*threshold))
+
+              for qgram_sublist in qgram_sublist_funct(qgram_list,
+                                                       min_num_qgrams):
+                qgram_substr = ''.join(qgram_sublist)
+                insert_key_set.add((i, qgram_substr))
+                lookup_key_set.add((i, qgram_substr))
+
+            else:
+              logging.exception('Illegal blocking method given: %s' %
+                                (str(self.block_method)))
+              raise Exception
+
+        # Send record to all partitions that own one of its blocking keys
+        #
+        rec_tuple = (rec_ident1, rec1, comp_rec, rec_len1,
+                     list(insert_key_set), sorted(lookup_key_set))
+
+        part_num_set = set()
+        for key in insert_key_set.union(lookup_key_set):
+          part_num_set.add(hash(key) % num_parts)
+
+        for part_num in part_num_set:
+          part_rec_list[part_num].append(rec_tuple)
+
+          if (len(part_rec_list[part_num]) >= BATCH_NUM_RECS):
+            in_queue_list[part_num].put(part_rec_list[part_num])
+            part_rec_list[part_num] = []
+
+        # Merge the results that are already available
+        #
+        while (not out_queue.empty()):
+          add_w_vec_list(out_queue.get())
+
+        rec_read += 1
+
+        if ((rec_read % progress_report_cnt) == 0):
+          self.__log_build_progress__(rec_read, self.dataset1.num_records,
+                                      start_time)
+
+      for part_num in range(num_parts):  # Send remaining records
+        if (part_rec_list[part_num] != []):
+          in_queue_list[part_num].put(part_rec_list[part_num])
+        in_queue_list[part_num].put(None)
+
+      # Collect the remaining results until all workers are finished
+      #
+      comp_done =                 0
+      num_rec_pairs_filtered =    0
+      num_rec_pairs_below_thres = 0
+
+      num_finished = 0
+
+      while (num_finished < num_parts):
+        result = out_queue.get()
+
+        if (isinstance(result, tuple)):  # Numbers of a finished worker
+          comp_done +=                 result[0]
+          num_rec_pairs_filtered +=    result[1]
+          num_rec_pairs_below_thres += result[2]
+          num_finished += 1
+        else:
+          add_w_vec_list(result)
+
+      for worker in worker_list:
+        worker.join()
+
+    finally:
+      for worker in worker_list:
+        if (worker.is_alive()):
+          worker.terminate()
+
+    self.num_rec_pairs = comp_done
+
+    used_sec_str = auxiliary.time_string(time.time()-start_time)
+    if (comp_done > 0):
+      rec_comp_time_str = auxiliary.time_string((time.time()-start_time) / \
+                                                comp_done)
+    else:
+      rec_comp_time_str = 0
+    logging.info('Read %d records in %s using %d partitions' % \
+                 (self.dataset1.num_records, used_sec_str, num_parts))
+    logging.info('  Compared %d record pairs in %s (%s per pair)' % \
+                 (comp_done, used_sec_str, rec_comp_time_str))
+    if (length_filter_perc != None):
+      logging.info('  Length filtering (set to %.1f%%) filtered %d record ' % \
+                   (length_filter_perc*100, num_rec_pairs_filtered) + 'pairs')
+    if (cut_off_threshold != None):
+      logging.info('  %d record pairs had summed weights below threshold ' % \
+                   (num_rec_pairs_below_thres) + '%.2f' % (cut_off_threshold))
+
+    memory_usage_str = auxiliary.get_memory_usage()
+    if (memory_usage_str != None):
+      logging.info('  '+memory_usage_str)
+
+    if (weight_vec_writer == None):
+      return [self.__get_field_names_list__(), weight_vec_dict]
+    else:
+      weight_vec_fp.close()
+      return None
+
 # =============================================================================
@@ -0,0 +1,197 @@
+# =============================================================================
+# AUSTRALIAN NATIONAL UNIVERSITY OPEN SOURCE LICENSE (ANUOS LICENSE)
+# VERSION 1.3
+#
+# The contents of this file are subject to the ANUOS License Version 1.3
+# (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at:
+#
+#   https://sourceforge.net/projects/febrl/
+#
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and limitations
+# The Original Software is: "indexingTiming.py"
+#
+# The Initial Developer of the Original Software is:
+#   Dr Peter Christen (Research School of Computer Science, The Australian
+#                      National University)
+#
+# Copyright (C) 2002 - 2011 the Australian National University and
+# others. All Rights Reserved.
+#
+# Contributors:
+#
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 2 or later (the "GPL"), in
+# which case the provisions of the GPL are applicable instead of those
+# above. The GPL is available at the following URL: http://www.gnu.org/
+# If you wish to allow use of your version of this file only under the
+# terms of the GPL, and not to allow others to use your version of this
+# file under the terms of the ANUOS License, indicate your decision by
+# deleting the provisions above and replace them with the notice and
+# other provisions required by the GPL. If you do not delete the
+# provisions above, a recipient may use your version of this file under
+# the terms of any one of the ANUOS License or the GPL.
+# =============================================================================
+#
+# Freely extensible biomedical record linkage (Febrl) - Version 0.4.2
+#
+# See: http://datamining.anu.edu.au/linkage.html
+#
+# =============================================================================
+
+
+"""Module indexingTiming.py - Timing of the StringMapIndex metric indices.
+
+Compares the string-map mapping with its inverted grid index ('grid') and the
+vantage point tree ('vptree') that can be used by the StringMapIndex in
+indexing.py (selected with its 'metric_index' argument).
+
+A data set generated with dbgen (by default 'dbgen/dataset3.csv') is
+deduplicated with one index on the surname, using the edit distance as string
+similarity function. For both canopy methods the time to build and to compact
+the index, the number of string similarity calculations done in total, the
+number of record pairs and the number of true duplicate pairs among them
+(dbgen record identifiers 'rec-N-org' and 'rec-N-dup-M') are reported.
+
+Usage: python indexingTiming.py [data_set_file_name] [number_of_repetitions]
+"""
+
+# =============================================================================
+# Imports go here
+
+import os
+import sys
+import time
+
+import comparison
+import dataset
+import indexing
+import stringcmp
+
+# =============================================================================
+
+num_sim_calc = [0]  # Number of calls of the similarity function
+
+def counted_editdist(str1, str2):
+  """Edit distance similarity function that counts how often it is called.
+  """
+
+  num_sim_calc[0] += 1
+
+  return stringcmp.editdist(str1, str2)
+
+# -----------------------------------------------------------------------------
+
+def count_true_pairs(rec_pair_dict):
+  """Return the number of record pairs in the given record pair dictionary
+     (record identifiers as keys and sets of record identifiers as values)
+     that are duplicates according to the dbgen record identifiers.
+  """
+
+  num_true_pairs = 0
+
+  for (rec_ident1, rec_ident2_set) in rec_pair_dict.iteritems():
+    rec_num1 = rec_ident1.split('-')[1]
+    for rec_ident2 in rec_ident2_set:
+      if (rec_ident2.split('-')[1] == rec_num1):
+        num_true_pairs += 1
+
+  return num_true_pairs
+
+# -----------------------------------------------------------------------------
+
+def time_string_map_index(data_set, rec_comp, metric_index, canopy_method,
+                          num_repeat):
+  """Build and compact a StringMapIndex the given number of times, and return
+     the smallest build and compact times, the number of string similarity
+     calculations done when building and compacting the index, the number of
+     record pairs and the number of true duplicate pairs.
+  """
+
+  index_def = [['surname', 'surname', False, False, None, []]]
+
+  index_kwargs = {'description':    'String-map timing (%s)' % (metric_index),
+                  'dataset1':       data_set,
+                  'dataset2':       data_set,
+                  'rec_comparator': rec_comp,
+                  'index_def':      [index_def],
+                  'sim_funct':      counted_editdist,
+                  'canopy_method':  canopy_method,
+                  'metric_index':   metric_index}
+  if (metric_index == 'grid'):
+    index_kwargs.update({'dim':15, 'sub_dim':2, 'grid_resolution':100})
+
+  build_time =   []
+  compact_time = []
+
+  for r in range(num_repeat):
+    test_index = indexing.StringMapIndex(**index_kwargs)
+    num_sim_calc[0] = 0
+
+    start_time = time.time()
+    test_index.build()
+    build_time.append(time.time() - start_time)
+
+    start_time = time.time()
+    test_index.compact()
+    compact_time.append(time.time() - start_time)
+
+  return (min(build_time), min(compact_time), num_sim_calc[0],
+          test_index.num_rec_pairs,
+          count_true_pairs(test_index.rec_pair_dict))
+
+# =============================================================================
+# Run the timing if called from command line
+#
+
+if (__name__ == '__main__'):
+
+  if (len(sys.argv) > 1):
+    file_name = sys.argv[1]
+  else:
+    file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'dbgen', 'dataset3.csv')
+  if (len(sys.argv) > 2):
+    num_repeat = int(sys.argv[2])
+  else:
+    num_repeat = 3
+
+  data_set = dataset.DataSetCSV(description='Timing data set',
+                                access_mode='read',
+                                rec_ident='rec_id',
+                                header_line=True,
+                                file_name=file_name)
+
+  sn_exact = comparison.FieldComparatorExactString(desc = 'Surname exact')
+  rec_comp = comparison.RecordComparator(data_set, data_set,
+                                         [(sn_exact, 'surname', 'surname')],
+                                         'Timing record comparator')
+
+  canopy_methods = [('threshold', 0.9, 0.8), ('nearest', 2, 3)]
+
+  print 'Febrl module "indexingTiming.py"'
+  print '--------------------------------'
+  print
+  print 'Data set: %s (%d records)' % (file_name, data_set.num_records)
+  print
+
+  for canopy_method in canopy_methods:
+
+    print 'Canopy method: %s' % (str(canopy_method))
+    print '  %-7s %10s %12s %12s %10s %10s' % ('Metric', 'Build (s)',
+          'Compact (s)', 'Sim calcs', 'Pairs', 'True pairs')
+
+    for metric_index in ['grid', 'vptree']:
+
+      (build_sec, compact_sec, num_calc, num_rec_pairs,
+       num_true_pairs) = time_string_map_index(data_set, rec_comp,
+                                               metric_index, canopy_method,
+                                               num_repeat)
+
+      print '  %-7s %10.3f %12.3f %12d %10d %10d' % (metric_index, build_sec,
+            compact_sec, num_calc, num_rec_pairs, num_true_pairs)
+    print
+
+# =============================================================================
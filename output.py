@@ -71,6 +71,7 @@
 
 import auxiliary
 import dataset
+import weightvec
 
 import csv
 import gzip
@@ -106,7 +107,7 @@ def GenerateHistogram(w_vec_dict, bin_width, file_name=None, match_sets=None):
 
   MAX_HISTO_WIDTH = 80  # maximum width in characters
 
-  auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+  weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
   auxiliary.check_is_number('bin_width', bin_width)
   auxiliary.check_is_positive('bin_width', bin_width)
   if (file_name != None):
@@ -127,7 +128,7 @@ def GenerateHistogram(w_vec_dict, bin_width, file_name=None, match_sets=None):
 
   # Check if weight vector dictionary is empty, if so return empty list
   #
-  if (w_vec_dict == {}):
+  if (len(w_vec_dict) == 0):
     logging.warn('Empty weight vector dictionary given for histogram ' + \
                  'generation')
     return []
@@ -250,7 +251,8 @@ def GenerateHistogram(w_vec_dict, bin_width, file_name=None, match_sets=None):
 
 # -----------------------------------------------------------------------------
 
-def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
+def SaveMatchStatusFile(w_vec_dict, match_set, file_name,
+                        rec_ident_lists=None):
   """Save the matched record identifiers into a CVS file.
 
      This function saves the record identifiers of all record pairs that are in
@@ -260,13 +262,33 @@ def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
      - Summed matching weight from the corresponding weight vector
      - A unique match identifier (generated in the same way as the ones in the
        function SaveMatchDataSet below).
+
+     If the weight vectors were generated by an index with interned record
+     identifiers (record numbers), then 'rec_ident_lists' must be set to the
+     pair of lists (index.rec_ident_list1, index.rec_ident_list2) which are
+     used to translate record numbers back into record identifiers.
   """
 
-  auxiliary.check_is_dictionary('w_vec_dict', w_vec_dict)
+  weightvec.check_is_weight_vector_dict('w_vec_dict', w_vec_dict)
   auxiliary.check_is_set('match_set', match_set)
   auxiliary.check_is_string('file_name', file_name)
 
-  match_rec_id_list = list(match_set)  # Make a list so it can be sorted
+  # Make a list of (record identifier pair, record pair as in match set) so it
+  # can be sorted according to record identifiers
+  #
+  match_rec_id_list = []
+
+  if (rec_ident_lists != None):
+    auxiliary.check_is_tuple('rec_ident_lists', rec_ident_lists)
+
+    for rec_id_tuple in match_set:
+      match_rec_id_list.append(((rec_ident_lists[0][rec_id_tuple[0]],
+                                 rec_ident_lists[1][rec_id_tuple[1]]),
+                                rec_id_tuple))
+  else:
+    for rec_id_tuple in match_set:
+      match_rec_id_list.append((rec_id_tuple, rec_id_tuple))
+
   match_rec_id_list.sort()
 
   if (len(match_set) > 0):
@@ -283,8 +305,8 @@ def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
     logging.exception('Cannot open file "%s" for writing' % (str(file_name)))
     raise IOError
 
-  for rec_id_tuple in match_rec_id_list:
-    w_vec = w_vec_dict[rec_id_tuple]
+  for (rec_id_tuple, w_vec_key) in match_rec_id_list:
+    w_vec = w_vec_dict[w_vec_key]
     w_sum = sum(w_vec)
 
     mid_count_str = '%s' % (mid_count)
@@ -302,7 +324,8 @@ def SaveMatchStatusFile(w_vec_dict, match_set, file_name):
 # -----------------------------------------------------------------------------
 
 def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
-                     dataset2=None, id_field2=None, new_dataset_name2=None):
+                     dataset2=None, id_field2=None, new_dataset_name2=None,
+                     rec_ident_lists=None):
   """Save the original data set(s) with an additional field (attribute) that
      contains match identifiers.
 
@@ -326,6 +349,11 @@ def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
 
      For a deduplication, it is assumed that the second data set is set to
      None.
+
+     If the match set was generated from an index with interned record
+     identifiers (record numbers), then 'rec_ident_lists' must be set to the
+     pair of lists (index.rec_ident_list1, index.rec_ident_list2) which are
+     used to translate record numbers back into record identifiers.
   """
 
   auxiliary.check_is_set('match_set', match_set)
@@ -341,7 +369,15 @@ def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
   else:
     do_link = False
 
-  match_rec_id_list = list(match_set)  # Make a list so it can be sorted
+  if (rec_ident_lists != None):  # Translate record numbers into identifiers
+    auxiliary.check_is_tuple('rec_ident_lists', rec_ident_lists)
+
+    match_rec_id_list = []
+    for (rec_num1, rec_num2) in match_set:
+      match_rec_id_list.append((rec_ident_lists[0][rec_num1],
+                                rec_ident_lists[1][rec_num2]))
+  else:
+    match_rec_id_list = list(match_set)  # Make a list so it can be sorted
   match_rec_id_list.sort()
 
   if (len(match_set) > 0):
@@ -500,7 +536,7 @@ def SaveMatchDataSet(match_set, dataset1, id_field1, new_dataset_name1,
 
 # =============================================================================
 
-def LoadWeightVectorFile(file_name):
+def LoadWeightVectorFile(file_name, weight_vec_store=False):
   """Function to load a weight vector dictionary from a file, assumed to be of
      type CSV (comma separated values), with the first line being a header line
      containing the field comparison names.
@@ -515,11 +551,17 @@ def LoadWeightVectorFile(file_name):
      The function first checks if a gzipped version of the file is available
      (with file ending '.gz' or '.GZ').
 
+     If 'weight_vec_store' is set to True the weight vectors are loaded into a
+     weight vector store (see module weightvec.py) instead of a dictionary,
+     which needs much less memory for large files. In this case record
+     identifier tuples that occur more than once are not detected.
+
      This function returns a list with the field comparison names and a weight
-     vector dictionary.
+     vector dictionary (or store).
   """
 
   auxiliary.check_is_string('file_name', file_name)
+  auxiliary.check_is_flag('weight_vec_store', weight_vec_store)
 
   if (file_name[-3:] not in ['.gz','.GZ']):  # Check for gzipped versions
     if (os.access(file_name+'.gz', os.F_OK) == True):
@@ -553,11 +595,22 @@ def LoadWeightVectorFile(file_name):
   #
   field_names_list = header_line[2:]  # Remove record identifier names
 
-  weight_vec_dict = {}  # Fill weight vector dictionary with data from file
+  # Fill weight vector dictionary (or store) with data from file
+  #
+  if (weight_vec_store == True):
+    num_weights =     len(field_names_list)
+    weight_vec_dict = weightvec.WeightVectorStore(description=file_name,
+                                                  num_weights=num_weights)
+  else:
+    weight_vec_dict = {}
 
   for line in csv_parser:
     rec_id_tuple = (line[0], line[1])
 
+    if (weight_vec_store == True):
+      weight_vec_dict.append(rec_id_tuple, map(float, line[2:]))
+      continue
+
     if (rec_id_tuple in weight_vec_dict):  # Check for unique record ids
       logging.warn('Record identifier tuple %s already in weight vector ' % \
                    (str(rec_id_tuple))+'dictionary')
@@ -250,6 +250,12 @@ def do_stringcmp(cmp_method, str1, str2, min_threshold = None):
   else:
     padded = False
 
+  # The Winkler modification increases similarity weights, so weights that
+  # can still reach the minimum threshold must not be cut off
+  #
+  if (cmp_method.endswith('-winkler') == True):
+    min_threshold = winkler_min_threshold(str1, str2, min_threshold)
+
   if (cmp_method.startswith('exa')):
     start_time = time.time()
     sim_weight = exact(str1, str2)
@@ -377,6 +383,74 @@ def exact(str1, str2):
 
 # =============================================================================
 
+def common_char_count(str1, str2):
+  """Return the number of characters the two strings have in common (with
+     repeated characters counted as often as they occur in both strings).
+
+  USAGE:
+    num_common = common_char_count(str1, str2)
+
+  DESCRIPTION:
+    This is the size of the intersection of the bags (multi-sets) of the
+    characters of the two strings. It is an upper bound of the number of
+    common characters of Jaro, the total length of common substrings, and the
+    number of matching characters in any alignment, and the longer string
+    length minus this count is the bag distance, which is never larger than
+    the edit distance. It is therefore used to check cheaply if a similarity
+    can reach a minimum threshold.
+  """
+
+  char_count = {}
+
+  for ch in str1:
+    char_count[ch] = char_count.get(ch, 0) + 1
+
+  num_common = 0
+
+  for ch in str2:
+    ch_count = char_count.get(ch, 0)
+    if (ch_count > 0):
+      num_common += 1
+      char_count[ch] = ch_count - 1
+
+  return num_common
+
+# =============================================================================
+
+def winkler_min_threshold(str1, str2, min_threshold):
+  """Return the minimum threshold a similarity weight has to reach so that
+     after the Winkler modification it can reach the given minimum threshold,
+     or None if any similarity weight can reach it.
+
+  USAGE:
+    base_threshold = winkler_min_threshold(str1, str2, min_threshold)
+
+  DESCRIPTION:
+    The Winkler modification increases a weight w to w + same*0.1*(1-w), with
+    'same' being the number of same characters at the beginning of the two
+    strings (up to four). A small value is subtracted from the returned
+    threshold so rounding errors cannot remove a weight that would reach the
+    minimum threshold.
+  """
+
+  if (min_threshold == None):
+    return None
+
+  minlen = min(len(str1), len(str2), 4)
+
+  same = 0
+  while (same < minlen) and (str1[same] == str2[same]):
+    same += 1
+
+  base_threshold = (min_threshold - same*0.1) / (1.0 - same*0.1) - 1.0E-9
+
+  if (base_threshold <= 0.0):
+    return None
+
+  return base_threshold
+
+# =============================================================================
+
 def jaro(str1, str2, min_threshold = None):
   """Return approximate string comparator measure (between 0.0 and 1.0)
 
@@ -386,12 +460,16 @@ def jaro(str1, str2, min_threshold = None):
   ARGUMENTS:
     str1           The first string
     str2           The second string
-    min_threshold  Minimum threshold between 0 and 1 (currently not used)
+    min_threshold  Minimum threshold between 0 and 1
 
   DESCRIPTION:
     As desribed in 'An Application of the Fellegi-Sunter Model of
     Record Linkage to the 1990 U.S. Decennial Census' by William E. Winkler
     and Yves Thibaudeau.
+
+    If a minimum threshold is given and the similarity cannot reach it (even
+    if all characters the strings have in common are assigned and there are
+    no transpositions) 0.0 is returned.
   """
 
   # Quick check if the strings are empty or the same - - - - - - - - - - - - -
@@ -404,6 +482,22 @@ def jaro(str1, str2, min_threshold = None):
   len1 = len(str1)
   len2 = len(str2)
 
+  if (min_threshold != None):
+    if (isinstance(min_threshold, float)) and (min_threshold > 0.0) and \
+       (min_threshold < 1.0):
+
+      max_common = float(common_char_count(str1, str2))
+
+      w = 1./3.*(max_common / float(len1) + max_common / float(len2) + 1.0)
+
+      if (w  < min_threshold):
+        return 0.0  # Similariy is smaller than minimum threshold
+
+    else:
+      logging.exception('Illegal value for minimum threshold (not between' + \
+                        ' 0 and 1): %f' % (min_threshold))
+      raise Exception
+
   halflen = max(len1,len2) / 2 - 1  # Or + 1?? PC 12/03/2009
 
   ass1 = ''  # Characters assigned in str1
@@ -530,7 +624,8 @@ def winkler(str1, str2, min_threshold = None):
   """For backwards compatibility, call Jaro followed by Winkler modification.
   """
 
-  jaro_weight = jaro(str1, str2, min_threshold)
+  jaro_weight = jaro(str1, str2, winkler_min_threshold(str1, str2,
+                                                       min_threshold))
 
   return winklermod(str1, str2, jaro_weight)
 
@@ -949,6 +1044,163 @@ def sgram(str1, str2, gc, common_divisor = 'average', min_threshold = None,
 
 # =============================================================================
 
+def editdist_bitparallel(str1, str2, max_dist = None):
+  """Return the edit (or Levenshtein) distance between two strings, calculated
+     with the bit-parallel algorithm by Myers (in the formulation by Hyyro).
+
+  USAGE:
+    dist = editdist_bitparallel(str1, str2, max_dist)
+
+  ARGUMENTS:
+    str1      The first string
+    str2      The second string
+    max_dist  Maximum distance of interest (or None)
+
+  DESCRIPTION:
+    One column of the distance matrix is kept as two bit vectors (Python
+    integers) holding the positive and negative differences between
+    neighbouring cells, so each character of the longer string is processed
+    with a few integer operations instead of a loop over the shorter string.
+
+    If a maximum distance is given and the distance is larger than it, a
+    lower bound of the distance (which is larger than the maximum distance)
+    is returned as soon as it is known.
+
+    For more information see:
+    - G. Myers, A fast bit-vector algorithm for approximate string matching
+      based on dynamic programming, Journal of the ACM, 46(3), 1999.
+    - H. Hyyro, A bit-vector algorithm for computing Levenshtein and Damerau
+      edit distances, Nordic Journal of Computing, 10(1), 2003.
+  """
+
+  n = len(str1)
+  m = len(str2)
+
+  if (n > m):  # Make sure n <= m, so the bit vectors are as short as possible
+    str1, str2 = str2, str1
+    n, m =       m, n
+
+  if (n == 0):
+    return m
+
+  # Bit vectors with the positions of each character in the shorter string
+  #
+  char_bits = {}
+  bit = 1
+  for c in str1:
+    char_bits[c] = char_bits.get(c, 0) | bit
+    bit <<= 1
+
+  all_bits = bit-1
+  last_bit = 1 << (n-1)
+
+  vert_pos = all_bits  # First column has distances 0,1,2,..,n
+  vert_neg = 0
+  dist =     n
+
+  for i in range(m):
+    eq = char_bits.get(str2[i], 0)
+
+    diag = (((eq & vert_pos) + vert_pos) ^ vert_pos) | eq | vert_neg
+    hor_pos = vert_neg | ~(diag | vert_pos)
+    hor_neg = vert_pos & diag
+
+    if (hor_pos & last_bit):
+      dist += 1
+    elif (hor_neg & last_bit):
+      dist -= 1
+
+    # Each of the remaining characters can decrease the distance by at most 1
+    #
+    if (max_dist != None) and (dist-(m-i-1) > max_dist):
+      return dist-(m-i-1)
+
+    hor_pos = (hor_pos << 1) | 1  # First row has distances 0,1,2,..,m
+    hor_neg <<= 1
+
+    vert_pos = (hor_neg | ~(diag | hor_pos)) & all_bits
+    vert_neg = hor_pos & diag
+
+  return dist
+
+# =============================================================================
+
+def mod_editdist_bitparallel(str1, str2, max_dist = None):
+  """Return the modified edit (or Damerau-Levenshtein) distance between two
+     strings, calculated with the bit-parallel algorithm by Hyyro.
+
+  USAGE:
+    dist = mod_editdist_bitparallel(str1, str2, max_dist)
+
+  ARGUMENTS:
+    str1      The first string
+    str2      The second string
+    max_dist  Maximum distance of interest (or None)
+
+  DESCRIPTION:
+    Same as editdist_bitparallel, but a transposition of two adjacent
+    characters is counted as one operation (as in mod_editdist).
+
+    For more information see:
+    - H. Hyyro, A bit-vector algorithm for computing Levenshtein and Damerau
+      edit distances, Nordic Journal of Computing, 10(1), 2003.
+  """
+
+  n = len(str1)
+  m = len(str2)
+
+  if (n > m):  # Make sure n <= m, so the bit vectors are as short as possible
+    str1, str2 = str2, str1
+    n, m =       m, n
+
+  if (n == 0):
+    return m
+
+  char_bits = {}
+  bit = 1
+  for c in str1:
+    char_bits[c] = char_bits.get(c, 0) | bit
+    bit <<= 1
+
+  all_bits = bit-1
+  last_bit = 1 << (n-1)
+
+  vert_pos = all_bits
+  vert_neg = 0
+  diag =     0
+  prev_eq =  0
+  dist =     n
+
+  for i in range(m):
+    eq = char_bits.get(str2[i], 0)
+
+    # Positions where a transposition gives a diagonal difference of 0
+    #
+    transp = (((~diag) & eq) << 1) & prev_eq
+
+    diag = (((eq & vert_pos) + vert_pos) ^ vert_pos) | eq | vert_neg | transp
+    hor_pos = vert_neg | ~(diag | vert_pos)
+    hor_neg = vert_pos & diag
+
+    if (hor_pos & last_bit):
+      dist += 1
+    elif (hor_neg & last_bit):
+      dist -= 1
+
+    if (max_dist != None) and (dist-(m-i-1) > max_dist):
+      return dist-(m-i-1)
+
+    hor_pos = (hor_pos << 1) | 1
+    hor_neg <<= 1
+
+    vert_pos = (hor_neg | ~(diag | hor_pos)) & all_bits
+    vert_neg = hor_pos & diag
+    prev_eq =  eq
+
+  return dist
+
+# =============================================================================
+
 def editdist(str1, str2, min_threshold = None):
   """Return approximate string comparator measure (between 0.0 and 1.0)
      using the edit (or Levenshtein) distance.
@@ -965,6 +1217,14 @@ def editdist(str1, str2, min_threshold = None):
     The edit distance is the minimal number of insertions, deletions and
     substitutions needed to make two strings equal.
 
+    The distance is calculated with the bit-parallel algorithm implemented in
+    editdist_bitparallel.
+
+    If a minimum threshold is given, the length difference and the bag
+    distance of the two strings are first checked, and the calculation of
+    the distance stops as soon as it is known to be too large. A similarity
+    below the minimum threshold is then not calculated exactly.
+
     For more information on the modified Soundex see:
     - http://www.nist.gov/dads/HTML/editdistance.html
   """
@@ -990,39 +1250,30 @@ def editdist(str1, str2, min_threshold = None):
       if (w  < min_threshold):
         return 0.0  # Similariy is smaller than minimum threshold
 
-      else: # Calculate the maximum distance possible with this threshold
-        max_dist = (1.0-min_threshold)*max_len
+      # The bag distance is never larger than the edit distance
+      #
+      bag_dist = max_len - common_char_count(str1, str2)
+      w = 1.0 - float(bag_dist) / float(max_len)
+
+      if (w  < min_threshold):
+        return 0.0  # Similariy is smaller than minimum threshold
+
+      # Calculate the maximum distance possible with this threshold (slightly
+      # larger to allow for rounding)
+      #
+      max_dist = (1.0-min_threshold)*max_len + 1e-9
 
     else:
       logging.exception('Illegal value for minimum threshold (not between' + \
                         ' 0 and 1): %f' % (min_threshold))
       raise Exception
 
-  if (n > m):  # Make sure n <= m, to use O(min(n,m)) space
-    str1, str2 = str2, str1
-    n, m =       m, n
-
-  current = range(n+1)
-
-  for i in range(1, m+1):
-
-    previous = current
-    current =  [i]+n*[0]
-    str2char = str2[i-1]
-
-    for j in range(1,n+1):
-      substitute = previous[j-1]
-      if (str1[j-1] != str2char):
-        substitute += 1
-
-      # Get minimum of insert, delete and substitute
-      #
-      current[j] = min(previous[j]+1, current[j-1]+1, substitute)
-
-    if (min_threshold != None) and (min(current) > max_dist):
-      return 1.0 - float(max_dist+1) / float(max_len)
+  if (min_threshold != None):
+    dist = editdist_bitparallel(str1, str2, max_dist)
+  else:
+    dist = editdist_bitparallel(str1, str2)
 
-  w = 1.0 - float(current[n]) / float(max_len)
+  w = 1.0 - float(dist) / float(max_len)
 
   assert (w >= 0.0) and (w <= 1.0), 'Similarity weight outside 0-1: %f' % (w)
 
@@ -1056,6 +1307,10 @@ def mod_editdist(str1, str2, min_threshold = None):
     (like: 'sydney' <-> 'sydeny' as 2 operations (two substitutions or one
     insert and one delet), this modified version handles this as 1 operation.
 
+    The distance is calculated with the bit-parallel algorithm implemented in
+    mod_editdist_bitparallel. A minimum threshold is used in the same way as
+    in editdist.
+
     Based on code from Justin Zobel's 'vrank'.
   """
 
@@ -1080,54 +1335,30 @@ def mod_editdist(str1, str2, min_threshold = None):
       if (w  < min_threshold):
         return 0.0  # Similariy is smaller than minimum threshold
 
-      else: # Calculate the maximum distance possible with this threshold
-        max_dist = (1.0-min_threshold)*max_len
+      # The bag distance is never larger than the edit distance
+      #
+      bag_dist = max_len - common_char_count(str1, str2)
+      w = 1.0 - float(bag_dist) / float(max_len)
+
+      if (w  < min_threshold):
+        return 0.0  # Similariy is smaller than minimum threshold
+
+      # Calculate the maximum distance possible with this threshold (slightly
+      # larger to allow for rounding)
+      #
+      max_dist = (1.0-min_threshold)*max_len + 1e-9
 
     else:
       logging.exception('Illegal value for minimum threshold (not between' + \
                         ' 0 and 1): %f' % (min_threshold))
       raise Exception
 
-  if (n > m):  # Make sure n <= m, to use O(min(n,m)) space
-    str1, str2 = str2, str1
-    n, m =       m, n
-
-  d = []  # Table with the full distance matrix
-
-  current = range(n+1)
-  d.append(current)
-
-  for i in range(1,m+1):
-
-    previous = current
-    current =  [i]+n*[0]
-    str2char = str2[i-1]
-
-    for j in range(1,n+1):
-      substitute = previous[j-1]
-      if (str1[j-1] != str2char):
-        substitute += 1
-
-      if (i == 1) or (j == 1):  # First characters, no transposition possible
-
-        # Get minimum of insert, delete and substitute
-        #
-        current[j] = min(previous[j]+1, current[j-1]+1, substitute)
-
-      else:
-        if (str1[j-2] == str2[i-1]) and (str1[j-1] == str2[i-2]):
-          transpose = d[i-2][j-2] + 1
-        else:
-          transpose = d[i-2][j-2] + 3
-
-        current[j] = min(previous[j]+1, current[j-1]+1, substitute, transpose)
-
-    d.append(current)
-
-    if (min_threshold != None) and (min(current) > max_dist):
-      return 1.0 - float(max_dist+1) / float(max_len)
+  if (min_threshold != None):
+    dist = mod_editdist_bitparallel(str1, str2, max_dist)
+  else:
+    dist = mod_editdist_bitparallel(str1, str2)
 
-  w = 1.0 - float(current[n]) / float(max_len)
+  w = 1.0 - float(dist) / float(max_len)
 
   assert (w >= 0.0) and (w <= 1.0), 'Similarity weight outside 0-1: %f' % (w)
 
@@ -1257,7 +1488,7 @@ def bagdist(str1, str2, min_threshold = None):
   ARGUMENTS:
     str1           The first string
     str2           The second string
-    min_threshold  Minimum threshold between 0 and 1 (currently not used)
+    min_threshold  Minimum threshold between 0 and 1
 
   DESCRIPTION:
     Bag distance is a cheap method to calculate the distance between two
@@ -1282,21 +1513,28 @@ def bagdist(str1, str2, min_threshold = None):
 
   n = len(str1)
   m = len(str2)
+  max_len = max(n,m)
 
-  list1 = list(str1)
-  list2 = list(str2)
+  if (min_threshold != None):
+    if (isinstance(min_threshold, float)) and (min_threshold > 0.0) and \
+       (min_threshold < 1.0):
 
-  for ch in str1:
-    if (ch in list2):
-      list2.remove(ch)
+      len_diff = abs(n-m)  # The bag distance is at least the length difference
+      w = 1.0 - float(len_diff) / float(max_len)
 
-  for ch in str2:
-    if (ch in list1):
-      list1.remove(ch)
+      if (w  < min_threshold):
+        return 0.0  # Similariy is smaller than minimum threshold
 
-  b = max(len(list1),len(list2))
+    else:
+      logging.exception('Illegal value for minimum threshold (not between' + \
+                        ' 0 and 1): %f' % (min_threshold))
+      raise Exception
 
-  w = 1.0 - float(b) / float(max(n,m))
+  # The characters not in common are left in the bags of both strings
+  #
+  b = max_len - common_char_count(str1, str2)
+
+  w = 1.0 - float(b) / float(max_len)
 
   assert (w >= 0.0) and (w <= 1.0), 'Similarity weight outside 0-1: %f' % (w)
 
@@ -1331,6 +1569,12 @@ def swdist(str1, str2, common_divisor = 'average', min_threshold = None):
 
     "The field matching problem: Algorithms and applications"
     by A.E. Monge and C.P. Elkan, 1996.
+
+    If a minimum threshold is given, 0.0 is returned as soon as the best
+    possible score cannot reach it. Before the table is calculated, the best
+    score is bounded by assuming all common characters are matched and all
+    other characters approximately matched, and after each row by assuming
+    all following rows add a match.
   """
 
   # Quick check if the strings are empty or the same - - - - - - - - - - - - -
@@ -1372,22 +1616,52 @@ def swdist(str1, str2, common_divisor = 'average', min_threshold = None):
   approx_matches = {'a':0, 'b':5, 'd':1, 'e':0, 'g':2, 'i':0, 'j':2, 'l':3,
                     'm':4, 'n':4, 'o':0, 'p':5, 'r':3, 't':1, 'u':0, 'v':5}
 
+  # Use the common characters to quickly check for minimum threshold - - - - -
+  #
+  if (min_threshold != None):
+    if (isinstance(min_threshold, float)) and (min_threshold > 0.0) and \
+       (min_threshold < 1.0):
+
+      num_common = common_char_count(str1, str2)
+      max_score = num_common*match_score + \
+                  (min(n,m)-num_common)*approx_score
+
+      w = float(max_score) / float(divisor)
+
+      if (w  < min_threshold):
+        return 0.0  # Similariy is smaller than minimum threshold
+
+    else:
+      logging.exception('Illegal value for minimum threshold (not between' + \
+                        ' 0 and 1): %f' % (min_threshold))
+      raise Exception
+
   best_score = 0  # Keep the best score while calculating table
 
-  d = []  # Table with the full distance matrix
+  # Only the previous row of the table is needed. The best scores of a gap
+  # ending in a cell are updated from the neighbouring cell (Gotoh), rather
+  # than by looping over all possible gap lengths.
+  #
+  current = [0.0]*(m+1)
 
-  for i in range(n+1):  # Initalise table
-    d.append([0.0]*(m+1))
+  insert = [0]*(m+1)  # Best score of a vertical gap, for each column
 
   for i in range(1,n+1):
+    previous = current
+    current =  [0.0]*(m+1)
+
+    str1char = str1[i-1]
+    approx_match1 = approx_matches.get(str1char,-1)
+
+    delete = 0  # Best score of a horizontal gap
+
     for j in range(1,m+1):
 
-      match = d[i-1][j-1]
+      match = previous[j-1]
 
-      if (str1[i-1] == str2[j-1]):
+      if (str1char == str2[j-1]):
         match += match_score
       else:
-        approx_match1 = approx_matches.get(str1[i-1],-1)
         approx_match2 = approx_matches.get(str2[j-1],-1)
 
         if (approx_match1 >= 0) and (approx_match2 >= 0) and \
@@ -1396,18 +1670,21 @@ def swdist(str1, str2, common_divisor = 'average', min_threshold = None):
         else:
           match += mismatch_score
 
-      insert = 0
-      for k in range(1,i):
-        score = d[i-k][j] - gap_penalty - k*extension_penalty
-        insert = max(insert, score)
+      insert[j] = max(insert[j] - extension_penalty,
+                      previous[j] - gap_penalty - extension_penalty, 0)
 
-      delete = 0
-      for l in range(1,j):
-        score = d[i][j-l] - gap_penalty - l*extension_penalty
-        delete = max(delete, score)
+      delete = max(delete - extension_penalty,
+                   current[j-1] - gap_penalty - extension_penalty, 0)
 
-      d[i][j] = max(match, insert, delete, 0)
-      best_score = max(d[i][j], best_score)
+      current[j] = max(match, insert[j], delete, 0)
+      best_score = max(current[j], best_score)
+
+    # Each of the remaining rows can increase the best score by at most a
+    # match score
+    #
+    if (min_threshold != None) and \
+       (float(best_score+(n-i)*match_score) / float(divisor) < min_threshold):
+      return 0.0  # Similariy is smaller than minimum threshold
 
   # best_score can be min(len(str1),len)str2))*match_score (if one string is
   # a sub-string ofd the other string).
@@ -1775,6 +2052,10 @@ def lcs(str1, str2, min_common_len = 2, common_divisor = 'average',
       'papr' / 'prap' -> 0.5  ('pr' is extracted first, leaving 'pa' / 'ap')
     (assuming minimum common length is set to 2). Therefore, lcs is run twice
     with input strings swapped and the similarity value averaged.
+
+    If a minimum threshold is given, 0.0 is returned as soon as the total
+    length of common substrings cannot reach it, as this length is at most
+    the number of characters the two strings have in common.
   """
 
   if (min_common_len < 1):
@@ -1819,6 +2100,13 @@ def lcs(str1, str2, min_common_len = 2, common_divisor = 'average',
       if (w  < min_threshold):
         return 0.0  # Similariy is smaller than minimum threshold
 
+      max_common_len = common_char_count(str1, str2)
+
+      w = float(max_common_len) / float(divisor)
+
+      if (w  < min_threshold):
+        return 0.0  # Similariy is smaller than minimum threshold
+
     else:
       logging.exception('Illegal value for minimum threshold (not between' + \
                         ' 0 and 1): %f' % (min_threshold))
@@ -1849,6 +2137,13 @@ def lcs(str1, str2, min_common_len = 2, common_divisor = 'average',
 
     #print '3:', s1, s2
 
+    # The total length of common substrings of the other pass is at most the
+    # number of common characters
+    #
+    if (min_threshold != None) and \
+       ((w + float(max_common_len) / float(divisor)) / 2.0 < min_threshold):
+      return 0.0  # Similariy is smaller than minimum threshold
+
   w /= 2.0
 
   assert (w >= 0.0) and (w <= 1.0), 'Similarity weight outside 0-1: %f' % (w)
@@ -1866,6 +2161,10 @@ def do_lcs(str1, str2):
   """Subroutine to extract longest common substring from the two input strings.
      Returns the common substring, its length, and the two input strings with
      the common substring removed.
+
+     The lengths of the common substrings are kept as bit vectors (Python
+     integers), so each row takes a few integer operations per common
+     substring length instead of a loop over the shorter string.
   """
 
   n = len(str1)
@@ -1878,25 +2177,48 @@ def do_lcs(str1, str2):
   else:
     swapped = False
 
-  current = (n+1)*[0]
+  # Bit vectors with the positions of each character in the shorter string
+  #
+  char_bits = {}
+  bit = 1
+  for c in str1:
+    char_bits[c] = char_bits.get(c, 0) | bit
+    bit <<= 1
 
   com_len = 0
   com_ans1 = -1
   com_ans2 = -1
 
+  # For each row i of the (not stored) common suffix length matrix, bit j of
+  # the k-th bit vector in 'current' is set if a common substring of length
+  # k+1 or more ends at positions j and i
+  #
+  current = []
+
   for i in range(m):
     previous = current
-    current =  (n+1)*[0]
 
-    for j in range(n):
-      if (str1[j] != str2[i]):
-        current[j] = 0
-      else:
-        current[j] = previous[j-1]+1
-        if (current[j] > com_len):
-          com_len = current[j]
-          com_ans1 = j
-          com_ans2 = i
+    run_bits = char_bits.get(str2[i], 0)
+
+    if (run_bits == 0):
+      current = []
+      continue
+
+    current = [run_bits]
+
+    for prev_bits in previous:
+      run_bits &= prev_bits << 1
+      if (run_bits == 0):
+        break
+      current.append(run_bits)
+
+    # The first (left-most) position of the longest substring ending in this
+    # row, as it would be found with a scan through the row
+    #
+    if (len(current) > com_len):
+      com_len = len(current)
+      com_ans1 = (current[-1] & -current[-1]).bit_length()-1
+      com_ans2 = i
 
   com1 = str1[com_ans1-com_len+1:com_ans1+1]
   com2 = str2[com_ans2-com_len+1:com_ans2+1]
@@ -0,0 +1,348 @@
+# =============================================================================
+# AUSTRALIAN NATIONAL UNIVERSITY OPEN SOURCE LICENSE (ANUOS LICENSE)
+# VERSION 1.3
+# 
+# The contents of this file are subject to the ANUOS License Version 1.3
+# (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at:
+# 
+#   https://sourceforge.net/projects/febrl/
+# 
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and limitations
+# The Original Software is: "stringcmpTiming.py"
+# 
+# The Initial Developer of the Original Software is:
+#   Dr Peter Christen (Research School of Computer Science, The Australian
+#                      National University)
+# 
+# Copyright (C) 2002 - 2011 the Australian National University and
+# others. All Rights Reserved.
+# 
+# Contributors:
+# 
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 2 or later (the "GPL"), in
+# which case the provisions of the GPL are applicable instead of those
+# above. The GPL is available at the following URL: http://www.gnu.org/
+# If you wish to allow use of your version of this file only under the
+# terms of the GPL, and not to allow others to use your version of this
+# file under the terms of the ANUOS License, indicate your decision by
+# deleting the provisions above and replace them with the notice and
+# other provisions required by the GPL. If you do not delete the
+# provisions above, a recipient may use your version of this file under
+# the terms of any one of the ANUOS License or the GPL.
+# =============================================================================
+#
+# Freely extensible biomedical record linkage (Febrl) - Version 0.4.2
+#
+# See: http://datamining.anu.edu.au/linkage.html
+#
+# =============================================================================
+
+
+"""Module stringcmpTiming.py - Timing of the string comparison kernels.
+
+Compares the run times of the bit-parallel edit distance, Damerau-Levenshtein
+distance and longest common substring kernels, and of the Smith-Waterman
+distance, in stringcmp.py with the plain dynamic programming implementations
+they replaced.
+
+The string pairs are taken from a data set generated with dbgen (by default
+'dbgen/dataset3.csv'): each duplicate record is paired with its original
+record, and the same number of randomly selected record pairs is added. Names
+and addresses are compared, so the string lengths are realistic for these
+fields.
+
+Usage: python stringcmpTiming.py [data_set_file_name] [number_of_repetitions]
+"""
+
+# =============================================================================
+# Imports go here
+
+import os
+import random
+import sys
+import time
+
+import stringcmp
+
+# =============================================================================
+# Plain dynamic programming implementations (as used before the bit-parallel
+# kernels were added to stringcmp.py)
+
+def dp_editdist(str1, str2):
+  """Return the edit distance, calculated with the full distance matrix.
+  """
+
+  n = len(str1)
+  m = len(str2)
+
+  if (n > m):
+    str1, str2 = str2, str1
+    n, m =       m, n
+
+  current = range(n+1)
+
+  for i in range(1, m+1):
+    previous = current
+    current =  [i]+n*[0]
+    str2char = str2[i-1]
+
+    for j in range(1, n+1):
+      substitute = previous[j-1]
+      if (str1[j-1] != str2char):
+        substitute += 1
+
+      current[j] = min(previous[j]+1, current[j-1]+1, substitute)
+
+  return current[n]
+
+# -----------------------------------------------------------------------------
+
+def dp_mod_editdist(str1, str2):
+  """Return the Damerau-Levenshtein distance, calculated with the full
+     distance matrix.
+  """
+
+  n = len(str1)
+  m = len(str2)
+
+  if (n > m):
+    str1, str2 = str2, str1
+    n, m =       m, n
+
+  current = range(n+1)
+  d = [current]
+
+  for i in range(1, m+1):
+    previous = current
+    current =  [i]+n*[0]
+    str2char = str2[i-1]
+
+    for j in range(1, n+1):
+      substitute = previous[j-1]
+      if (str1[j-1] != str2char):
+        substitute += 1
+
+      if (i == 1) or (j == 1):
+        current[j] = min(previous[j]+1, current[j-1]+1, substitute)
+
+      else:
+        if (str1[j-2] == str2[i-1]) and (str1[j-1] == str2[i-2]):
+          transpose = d[i-2][j-2] + 1
+        else:
+          transpose = d[i-2][j-2] + 3
+
+        current[j] = min(previous[j]+1, current[j-1]+1, substitute, transpose)
+
+    d.append(current)
+
+  return current[n]
+
+# -----------------------------------------------------------------------------
+
+def dp_do_lcs(str1, str2):
+  """Extract the longest common substring, calculated with the full matrix of
+     common suffix lengths. Returns the same as stringcmp.do_lcs.
+  """
+
+  n = len(str1)
+  m = len(str2)
+
+  if (n > m):
+    str1, str2 = str2, str1
+    n, m =       m, n
+    swapped = True
+  else:
+    swapped = False
+
+  current = (n+1)*[0]
+
+  com_len = 0
+  com_ans1 = -1
+  com_ans2 = -1
+
+  for i in range(m):
+    previous = current
+    current =  (n+1)*[0]
+
+    for j in range(n):
+      if (str1[j] != str2[i]):
+        current[j] = 0
+      else:
+        current[j] = previous[j-1]+1
+        if (current[j] > com_len):
+          com_len = current[j]
+          com_ans1 = j
+          com_ans2 = i
+
+  com1 = str1[com_ans1-com_len+1:com_ans1+1]
+
+  str1 = str1[:com_ans1-com_len+1] + str1[1+com_ans1:]
+  str2 = str2[:com_ans2-com_len+1] + str2[1+com_ans2:]
+
+  if (swapped == True):
+    return com1, com_len, str2, str1
+  else:
+    return com1, com_len, str1, str2
+
+# -----------------------------------------------------------------------------
+
+def dp_swdist(str1, str2):
+  """Return the Smith-Waterman distance (with the 'average' common divisor),
+     looping over all possible gap lengths in each cell.
+  """
+
+  n = len(str1)
+  m = len(str2)
+
+  approx_matches = {'a':0, 'b':5, 'd':1, 'e':0, 'g':2, 'i':0, 'j':2, 'l':3,
+                    'm':4, 'n':4, 'o':0, 'p':5, 'r':3, 't':1, 'u':0, 'v':5}
+
+  best_score = 0
+
+  d = []
+  for i in range(n+1):
+    d.append([0.0]*(m+1))
+
+  for i in range(1,n+1):
+    for j in range(1,m+1):
+
+      match = d[i-1][j-1]
+
+      if (str1[i-1] == str2[j-1]):
+        match += 5
+      else:
+        approx_match1 = approx_matches.get(str1[i-1],-1)
+        approx_match2 = approx_matches.get(str2[j-1],-1)
+
+        if (approx_match1 >= 0) and (approx_match2 >= 0) and \
+           (approx_match1 == approx_match2):
+          match += 2
+        else:
+          match -= 5
+
+      insert = 0
+      for k in range(1,i):
+        insert = max(insert, d[i-k][j] - 5 - k)
+
+      delete = 0
+      for l in range(1,j):
+        delete = max(delete, d[i][j-l] - 5 - l)
+
+      d[i][j] = max(match, insert, delete, 0)
+      best_score = max(d[i][j], best_score)
+
+  return float(best_score) / (0.5*(n+m)*5)
+
+# =============================================================================
+
+def load_string_pairs(file_name, field_names):
+  """Load a dbgen data set and return a dictionary with a list of string pairs
+     for each of the given fields.
+  """
+
+  in_file = open(file_name)
+  header = [f.strip() for f in in_file.readline().split(',')]
+
+  rec_dict = {}
+  for line in in_file:
+    rec = [f.strip() for f in line.split(',')]
+    if (len(rec) == len(header)):
+      rec_dict[rec[0]] = rec
+  in_file.close()
+
+  # Pair each duplicate with its original, and add as many random pairs
+  #
+  rec_pair_list = []
+  for (rec_id, rec) in rec_dict.items():
+    if ('-dup-' in rec_id):
+      org_id = rec_id.split('-dup-')[0]+'-org'
+      if (org_id in rec_dict):
+        rec_pair_list.append((rec_dict[org_id], rec))
+
+  random.seed(42)
+  rec_list = rec_dict.values()
+  for i in range(len(rec_pair_list)):
+    rec_pair_list.append((random.choice(rec_list), random.choice(rec_list)))
+
+  pair_dict = {}
+  for field_name in field_names:
+    col = header.index(field_name)
+    pair_dict[field_name] = [(rec1[col], rec2[col]) for (rec1, rec2) in \
+                             rec_pair_list if (rec1[col] != '') and \
+                             (rec2[col] != '')]
+  return pair_dict
+
+# =============================================================================
+# Run the timing if called from command line
+#
+
+if (__name__ == '__main__'):
+
+  if (len(sys.argv) > 1):
+    file_name = sys.argv[1]
+  else:
+    file_name = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             'dbgen', 'dataset3.csv')
+  if (len(sys.argv) > 2):
+    num_repeat = int(sys.argv[2])
+  else:
+    num_repeat = 3
+
+  field_names = ['given_name', 'surname', 'address_1', 'suburb']
+
+  kernels = [('Edit distance', dp_editdist, stringcmp.editdist_bitparallel),
+             ('DaLe distance', dp_mod_editdist,
+              stringcmp.mod_editdist_bitparallel),
+             ('Longest common substring', dp_do_lcs, stringcmp.do_lcs),
+             ('Smith-Waterman', dp_swdist, stringcmp.swdist)]
+
+  pair_dict = load_string_pairs(file_name, field_names)
+
+  print 'Febrl module "stringcmpTiming.py"'
+  print '---------------------------------'
+  print
+  print 'Data set: %s' % (file_name)
+  print
+
+  for field_name in field_names:
+    pair_list = pair_dict[field_name]
+    str_len_list = [len(s) for pair in pair_list for s in pair]
+
+    print 'Field "%s": %d string pairs, average length %.1f ' % \
+          (field_name, len(pair_list), float(sum(str_len_list)) / \
+          len(str_len_list)) + '(%d to %d)' % \
+          (min(str_len_list), max(str_len_list))
+    print '  %-26s %12s %12s %8s' % ('Kernel', 'DP (usec)', 'New (usec)',
+                                     'Speedup')
+
+    for (kernel_name, dp_funct, new_funct) in kernels:
+
+      dp_res = [dp_funct(s1, s2) for (s1, s2) in pair_list]
+      new_res = [new_funct(s1, s2) for (s1, s2) in pair_list]
+      assert dp_res == new_res, kernel_name
+
+      dp_time = []
+      new_time = []
+      for r in range(num_repeat):
+        start_time = time.time()
+        for (s1, s2) in pair_list:
+          dp_funct(s1, s2)
+        dp_time.append(time.time() - start_time)
+
+        start_time = time.time()
+        for (s1, s2) in pair_list:
+          new_funct(s1, s2)
+        new_time.append(time.time() - start_time)
+
+      dp_usec =  1000000.0*min(dp_time) / len(pair_list)
+      new_usec = 1000000.0*min(new_time) / len(pair_list)
+
+      print '  %-26s %12.2f %12.2f %7.1fx' % (kernel_name, dp_usec, new_usec,
+                                              dp_usec / new_usec)
+    print
+
+# =============================================================================
@@ -28,6 +28,12 @@ python lookupTest.py
 echo "Run simplehmmTest.py"
 python simplehmmTest.py
 
+echo "Run diskstoreTest.py"
+python diskstoreTest.py
+
+echo "Run weightvecTest.py"
+python weightvecTest.py
+
 echo "Run indexingTest.py"
 python indexingTest.py
 
@@ -55,6 +55,7 @@ sys.path.append('..')
 
 import classification
 import mymath  # For K-means distance measures
+import weightvec
 
 import logging
 my_logger = logging.getLogger()  # New logger at root level
@@ -940,6 +941,63 @@ class TestCase(unittest.TestCase):
         assert ff_class2.nm_centroid[i] <= 1.0
 
 
+  def testWeightMatrixClustering(self):  # - - - - - - - - - - - - - - - - - -
+    """Test K-means and farthest first training using a weight matrix"""
+
+    if (classification.imp_numpy == False):
+      return  # NumPy not available, only weight vector loops are used
+
+    w_vec_store = weightvec.WeightVectorStore()
+    for (rec_id_tuple, w_vec) in self.w_vec_dict.iteritems():
+      w_vec_store.append(rec_id_tuple, w_vec)
+
+    for dm in [mymath.distL1, mymath.distL2, mymath.distLInf,
+               mymath.distCanberra, mymath.distCosine]:
+
+      def loop_dm(vec1, vec2):  # Not known, so weight vector loops are used
+        return dm(vec1, vec2)
+
+      for w_vec_dict in [self.w_vec_dict, w_vec_store]:
+
+        # The first farthest first centroid is taken with popitem(), which
+        # for a dictionary depends upon previous calls, so each classifier is
+        # trained with a new copy of the dictionary
+        #
+        if (isinstance(w_vec_dict, dict)):
+          get_ff_w_vec_dict = lambda : dict(self.w_vec_dict)
+        else:
+          get_ff_w_vec_dict = lambda : w_vec_store
+
+        loop_km = classification.KMeans(max_iter_count = 100,
+                                        dist_measure = loop_dm,
+                                        centroid_init = 'min/max')
+        loop_km.train(w_vec_dict, self.m_set, self.nm_set)
+
+        loop_ff = classification.FarthestFirst(dist_measure = loop_dm)
+        loop_ff.train(get_ff_w_vec_dict(), self.m_set, self.nm_set)
+
+        for chunk_size in [7, 100000]:
+
+          matrix_km = classification.KMeans(max_iter_count = 100,
+                                            dist_measure = dm,
+                                            centroid_init = 'min/max',
+                                            chunk_size = chunk_size)
+          assert matrix_km.chunk_size == chunk_size
+          matrix_km.train(w_vec_dict, self.m_set, self.nm_set)
+
+          for i in range(5):
+            assert abs(matrix_km.m_centroid[i]-loop_km.m_centroid[i]) < 1e-9
+            assert abs(matrix_km.nm_centroid[i]-loop_km.nm_centroid[i]) < 1e-9
+
+          matrix_ff = classification.FarthestFirst(dist_measure = dm,
+                                                   chunk_size = chunk_size)
+          matrix_ff.train(get_ff_w_vec_dict(), self.m_set, self.nm_set)
+
+          assert matrix_ff.m_centroid == loop_ff.m_centroid, \
+                 (dm, matrix_ff.m_centroid, loop_ff.m_centroid)
+          assert matrix_ff.nm_centroid == loop_ff.nm_centroid, \
+                 (dm, matrix_ff.nm_centroid, loop_ff.nm_centroid)
+
   def testSuppVecMachineClassifier(self):  # - - - - - - - - - - - - - - - -
     """Test SVM classifier"""
 
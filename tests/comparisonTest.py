@@ -50,6 +50,7 @@
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
 import logging
+import multiprocessing
 import sys
 import unittest
 sys.path.append('..')
@@ -1936,13 +1937,14 @@ class TestCase(unittest.TestCase):
 
       jfc.get_cache_stats()
 
-      # Test with enabled caching (with maximum size 10)
+      # Test with enabled caching (with maximum size 10, no eviction)
       #
       jfc = comparison.FieldComparatorJaro(threshold = 0.5,
                                           missing_v = self.missing_values_list,
                                           desc = 'FieldComparatorJaro',
                                           do_cache = True,
-                                          max_cache_size = 10)
+                                          max_cache_size = 10,
+                                          cache_policy = 'fill')
 
       assert jfc.do_caching == True, \
              'Wrong value for caching for "%s" (should be %s but is %s)' % \
@@ -1976,13 +1978,14 @@ class TestCase(unittest.TestCase):
 
       jfc.get_cache_stats()
 
-      # Test with enabled caching (with maximum size 501)
+      # Test with enabled caching (with maximum size 1000, no eviction)
       #
       jfc = comparison.FieldComparatorJaro(threshold = 0.5,
                                           missing_v = self.missing_values_list,
                                           desc = 'FieldComparatorJaro',
                                           do_cache = True,
-                                          max_cache_size = 1000)
+                                          max_cache_size = 1000,
+                                          cache_policy = 'fill')
 
       assert jfc.do_caching == True, \
              'Wrong value for caching for "%s" (should be %s but is %s)' % \
@@ -2016,6 +2019,186 @@ class TestCase(unittest.TestCase):
 
       jfc.get_cache_stats()
 
+  # ---------------------------------------------------------------------------
+  # Test cache eviction
+
+  def testCacheEviction(self):
+
+    # A list of 20 values that is compared with itself repeatedly, so that
+    # each values pair is used again after all other pairs of the same value
+    #
+    val_list = ['peter', 'petra', 'paul', 'pauline', 'mary', 'marie', 'john',
+                'jon', 'jane', 'joan', 'tim', 'tom', 'tina', 'anna', 'ann',
+                'hanna', 'chris', 'christine', 'kris', 'christina']
+
+    jfc_no_cache = comparison.FieldComparatorJaro(threshold = 0.5,
+                                          missing_v = self.missing_values_list,
+                                          desc = 'FieldComparatorJaro')
+
+    for cache_policy in ['lru', 'clock']:
+
+      jfc = comparison.FieldComparatorJaro(threshold = 0.5,
+                                          missing_v = self.missing_values_list,
+                                          desc = 'FieldComparatorJaro',
+                                          do_cache = True,
+                                          max_cache_size = 25,
+                                          cache_policy = cache_policy)
+
+      assert jfc.cache_policy == cache_policy, \
+             'Wrong cache policy for "%s" (should be %s but is %s)' % \
+             (jfc.description, cache_policy, jfc.cache_policy)
+
+      for k in range(3):
+        for val1 in val_list:
+          for val2 in val_list[:5]:
+
+            w = jfc.compare(val1, val2)
+            w_no_cache = jfc_no_cache.compare(val1, val2)
+
+            assert w == w_no_cache, \
+                   'Cached weight is different from non-cached weight ' + \
+                   '(%f / %f) for "%s" and "%s"' % (w, w_no_cache, val1, val2)
+
+            assert len(jfc.cache) <= 25, \
+                   'Cache is too large for "%s" (Length should be <= 25 ' % \
+                   (jfc.description)+'but is %d)' % (len(jfc.cache))
+
+      assert jfc.cache_num_evicted > 0, \
+             'No comparisons removed from cache for "%s"' % (jfc.description)
+      assert jfc.cache_num_not_cached == 0, \
+             'Comparisons not cached for "%s" (%d)' % \
+             (jfc.description, jfc.cache_num_not_cached)
+      assert len(jfc.cache) + jfc.cache_num_evicted <= \
+             jfc.cache_num_misses, \
+             'Wrong cache counters for "%s": %d / %d / %d' % \
+             (jfc.description, jfc.cache_num_hits, jfc.cache_num_misses,
+              jfc.cache_num_evicted)
+
+      jfc.get_cache_stats()
+
+    # With LRU the most recently used pair is never removed from the cache
+    #
+    jfc = comparison.FieldComparatorJaro(threshold = 0.5,
+                                          missing_v = self.missing_values_list,
+                                          desc = 'FieldComparatorJaro',
+                                          do_cache = True,
+                                          max_cache_size = 2)
+
+    assert jfc.cache_policy == 'lru', \
+           'Wrong default cache policy for "%s" (should be lru but is %s)' % \
+           (jfc.description, jfc.cache_policy)
+
+    jfc.compare('peter', 'petra')
+    jfc.compare('paul', 'pauline')
+    jfc.compare('peter', 'petra')  # Hit, now most recently used
+    jfc.compare('mary', 'marie')   # Removes ('paul', 'pauline')
+
+    assert ('peter', 'petra') in jfc.cache, \
+           'Recently used pair removed from cache for "%s"' % \
+           (jfc.description)
+    assert ('paul', 'pauline') not in jfc.cache, \
+           'Least recently used pair not removed from cache for "%s"' % \
+           (jfc.description)
+    assert (jfc.cache_num_hits, jfc.cache_num_evicted) == (1, 1), \
+           'Wrong cache counters for "%s": %d / %d' % \
+           (jfc.description, jfc.cache_num_hits, jfc.cache_num_evicted)
+
+    # Limit the cache memory instead of the number of cached comparisons
+    #
+    jfc = comparison.FieldComparatorJaro(threshold = 0.5,
+                                          missing_v = self.missing_values_list,
+                                          desc = 'FieldComparatorJaro',
+                                          do_cache = True,
+                                          max_cache_mem = 0.002)
+
+    for val1 in val_list:
+      for val2 in val_list:
+        jfc.compare(val1, val2)
+
+        assert jfc.cache_mem_used <= 0.002*1024*1024, \
+               'Cache uses too much memory for "%s" (%d bytes)' % \
+               (jfc.description, jfc.cache_mem_used)
+
+    assert jfc.cache_num_evicted > 0, \
+           'No comparisons removed from cache for "%s"' % (jfc.description)
+
+    jfc.get_cache_stats()
+
+  # ---------------------------------------------------------------------------
+  # Test shared cache
+
+  def testSharedCache(self):
+
+    val_pair_list = [('peter', 'petra'), ('paul', 'pauline'), ('mary', 'marie'),
+                     ('john', 'jon'), ('christine', 'kristina'),
+                     ('smith', 'smyth'), ('miller', 'muller')]
+
+    shared_cache = comparison.SharedComparisonCache(num_slots = 101,
+                                                    descr = 'Winkler cache')
+
+    wfc = comparison.FieldComparatorWinkler(threshold = 0.5,
+                                         missing_v = self.missing_values_list,
+                                         desc = 'FieldComparatorWinkler',
+                                         do_cache = True,
+                                         shared_cache = shared_cache)
+
+    wfc_no_cache = comparison.FieldComparatorWinkler(threshold = 0.5,
+                                         missing_v = self.missing_values_list,
+                                         desc = 'FieldComparatorWinkler')
+
+    # Compare the first pairs in this process, and then all pairs in the
+    # reversed order in a forked process
+    #
+    for (val1, val2) in val_pair_list[:4]:
+      wfc.compare(val1, val2)
+
+    assert shared_cache.get_stats() == (4, 0), \
+           'Wrong number of stored comparisons in shared cache: %s' % \
+           (str(shared_cache.get_stats()))
+
+    wfc.cache = {}  # Clear cache of this process before forking
+
+    def compare_in_process(queue):
+      weight_list = []
+      for (val1, val2) in val_pair_list:
+        weight_list.append(wfc.compare(val2, val1))
+      queue.put((weight_list, wfc.cache_num_shared_hits))
+
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target = compare_in_process,
+                                      args = (queue,))
+    process.start()
+    (weight_list, num_shared_hits) = queue.get()
+    process.join()
+
+    assert num_shared_hits == 4, \
+           'Wrong number of shared cache hits in other process: %d' % \
+           (num_shared_hits)
+
+    for i in range(len(val_pair_list)):
+      (val1, val2) = val_pair_list[i]
+      w_no_cache = wfc_no_cache.compare(val1, val2)
+
+      assert weight_list[i] == w_no_cache, \
+             'Shared cache weight is different from non-cached weight ' + \
+             '(%f / %f) for "%s" and "%s"' % \
+             (weight_list[i], w_no_cache, val1, val2)
+
+    # The comparisons done in the other process are now in the shared cache
+    #
+    assert shared_cache.get_stats() == (len(val_pair_list), 0), \
+           'Wrong number of stored comparisons in shared cache: %s' % \
+           (str(shared_cache.get_stats()))
+
+    for (val1, val2) in val_pair_list[4:]:
+      wfc.compare(val1, val2)
+
+    assert wfc.cache_num_shared_hits == len(val_pair_list)-4, \
+           'Wrong number of shared cache hits: %d' % \
+           (wfc.cache_num_shared_hits)
+
+    wfc.get_cache_stats()
+
   # ---------------------------------------------------------------------------
   # Test record comparator
   #
@@ -2091,6 +2274,59 @@ class TestCase(unittest.TestCase):
 
       rc.get_cache_stats()
 
+  # ---------------------------------------------------------------------------
+
+  def testRecordComparatorBatch(self):
+
+    gn_jfc = comparison.FieldComparatorJaro(threshold = 0.6,
+                                          missing_v = self.missing_values_list,
+                                          desc = 'Givenname Jaro')
+    sn_wfcc = comparison.FieldComparatorWinkler(threshold = 0.5,
+                                         missing_v = self.missing_values_list,
+                                         desc = 'Surname Winkler',
+                                         do_cache=True)
+    pc_kfc = comparison.FieldComparatorKeyDiff(max_key_di = 2,
+                                          missing_v = self.missing_values_list,
+                                          desc = 'Postcode KeyDiff')
+
+    field_comp_list = [(gn_jfc,   'gname', 'given_name'),
+                       (sn_wfcc,  'surname', 'sname'),
+                       (pc_kfc,   'postcode', 'zipcode')]
+
+    rc = comparison.RecordComparator(self.test_data_set1,self.test_data_set2,
+                                     field_comp_list, 'Test record comparator')
+
+    # All record pairs, some of them twice, and with lower case values
+    #
+    rec_pair_list = []
+    for r1 in self.recs1:
+      for r2 in self.recs2:
+        rec_pair_list.append((r1, r2))
+    rec_pair_list += rec_pair_list[:5]
+
+    lower_rec_pair_list = []
+    for (r1, r2) in rec_pair_list:
+      lower_rec_pair_list.append(([v.lower() for v in r1],
+                                  [v.lower() for v in r2]))
+
+    assert rc.compare_batch([]) == []
+
+    w_vec_list = rc.compare_batch(rec_pair_list)
+
+    assert len(w_vec_list) == len(rec_pair_list), \
+           'Wrong number of weight vectors returned: %d (should be %d)' % \
+           (len(w_vec_list), len(rec_pair_list))
+
+    for j in range(len(rec_pair_list)):
+      (r1, r2) = rec_pair_list[j]
+      w_vec = rc.compare(r1, r2)
+
+      assert w_vec_list[j] == w_vec, \
+             'Batch weight vector %s differs from weight vector %s' % \
+             (str(w_vec_list[j]), str(w_vec))
+
+    assert rc.compare_batch(lower_rec_pair_list, False) == w_vec_list
+
 # =============================================================================
 # Start tests when called from command line
 
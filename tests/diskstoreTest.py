@@ -0,0 +1,186 @@
+# =============================================================================
+# AUSTRALIAN NATIONAL UNIVERSITY OPEN SOURCE LICENSE (ANUOS LICENSE)
+# VERSION 1.3
+# 
+# The contents of this file are subject to the ANUOS License Version 1.3
+# (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at:
+# 
+#   https://sourceforge.net/projects/febrl/
+# 
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and limitations
+# under the License.
+# 
+# The Original Software is: "diskstoreTest.py"
+# 
+# The Initial Developer of the Original Software is:
+#   Dr Peter Christen (Research School of Computer Science, The Australian
+#                      National University)
+# 
+# Copyright (C) 2002 - 2011 the Australian National University and
+# others. All Rights Reserved.
+# 
+# Contributors:
+# 
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 2 or later (the "GPL"), in
+# which case the provisions of the GPL are applicable instead of those
+# above. The GPL is available at the following URL: http://www.gnu.org/
+# If you wish to allow use of your version of this file only under the
+# terms of the GPL, and not to allow others to use your version of this
+# file under the terms of the ANUOS License, indicate your decision by
+# deleting the provisions above and replace them with the notice and
+# other provisions required by the GPL. If you do not delete the
+# provisions above, a recipient may use your version of this file under
+# the terms of any one of the ANUOS License or the GPL.
+# =============================================================================
+#
+# Freely extensible biomedical record linkage (Febrl) - Version 0.4.2
+#
+# See: http://datamining.anu.edu.au/linkage.html
+#
+# =============================================================================
+
+
+"""Test module for diskstore.py.
+"""
+
+# =============================================================================
+# Import necessary modules (Python standard modules first, then Febrl modules)
+
+import array
+import os
+import random
+import sys
+import unittest
+sys.path.append('..')
+
+import diskstore
+
+# =============================================================================
+
+class TestCase(unittest.TestCase):
+
+  # Initialise test case  - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  #
+  def setUp(self):
+
+    self.store_file_name = './test-disk-store.db'
+
+    # Blocks with record identifiers and records with field values
+    #
+    random.seed(42)
+
+    self.block_dict = {}
+    self.rec_dict = {}
+    for i in range(2000):
+      rec_ident = 'rec-%d' % (i)
+      block_val = 'b%d' % (random.randint(0,100))
+      block_rec_list = self.block_dict.get(block_val, [])
+      block_rec_list.append(rec_ident)
+      self.block_dict[block_val] = block_rec_list
+      self.rec_dict[rec_ident] = [block_val, '', 'value %d' % (i)]
+
+  # Clean up test case  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  #
+  def tearDown(self):
+
+    for file_suffix in ['', '-wal', '-shm']:
+      if (os.access(self.store_file_name+file_suffix, os.F_OK) == True):
+        os.remove(self.store_file_name+file_suffix)
+
+  # ---------------------------------------------------------------------------
+  #
+  # Start test cases
+
+  def testBlockDict(self):  # - - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test appending to and accessing blocks"""
+
+    store = diskstore.SQLiteStore(self.store_file_name, buffer_size=100)
+    block_dict = store.block_dict('test_blocks')
+
+    for (block_val, block_rec_list) in self.block_dict.iteritems():
+      for rec_ident in block_rec_list:
+        block_dict.append(block_val, rec_ident)
+
+    assert len(block_dict) == len(self.block_dict)
+    assert sorted(block_dict.keys()) == sorted(self.block_dict.keys())
+    assert dict(block_dict.iteritems()) == self.block_dict
+
+    for (block_val, block_rec_list) in self.block_dict.iteritems():
+      assert block_val in block_dict
+      assert block_dict[block_val] == block_rec_list
+
+    assert 'x' not in block_dict
+    assert block_dict.get('x') == None
+    self.assertRaises(KeyError, block_dict.__getitem__, 'x')
+
+    block_dict['x'] = ['rec-1', 'rec-2']
+    block_dict.append('x', 'rec-3')
+    assert block_dict['x'] == ['rec-1', 'rec-2', 'rec-3']
+    block_dict['x'] = ['rec-4']
+    assert block_dict['x'] == ['rec-4']
+    del block_dict['x']
+    assert 'x' not in block_dict
+
+    block_dict.clear()
+    assert len(block_dict) == 0
+
+    # Blocks of record numbers are returned as arrays
+    #
+    num_block_dict = store.block_dict('test_num_blocks', int_postings=True)
+    num_block_dict.append('a', 3)
+    num_block_dict.append('a', 1)
+    assert num_block_dict['a'] == array.array('l', [3, 1])
+
+    store.close()
+
+  def testRecordDict(self):  # - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test storing and accessing records"""
+
+    store = diskstore.SQLiteStore(self.store_file_name, buffer_size=100)
+    rec_dict = store.record_dict('test_records')
+
+    for (rec_ident, rec) in self.rec_dict.iteritems():
+      rec_dict[rec_ident] = rec
+
+    assert len(rec_dict) == len(self.rec_dict)
+    assert sorted(rec_dict.keys()) == sorted(self.rec_dict.keys())
+    assert dict(rec_dict.iteritems()) == self.rec_dict
+
+    for (rec_ident, rec) in self.rec_dict.iteritems():
+      assert rec_ident in rec_dict
+      assert rec_dict[rec_ident] == rec
+
+    rec_dict['rec-1'] = ['a', 'b', 'c']
+    assert rec_dict['rec-1'] == ['a', 'b', 'c']
+    del rec_dict['rec-1']
+    assert 'rec-1' not in rec_dict
+    assert rec_dict.get('rec-1') == None
+    self.assertRaises(KeyError, rec_dict.__getitem__, 'rec-1')
+
+    store.close()
+
+  def testTruncateOnOpen(self):  # - - - - - - - - - - - - - - - - - - - - - -
+    """Test that a disk store is empty when opened"""
+
+    store = diskstore.SQLiteStore(self.store_file_name)
+    rec_dict = store.record_dict('test_records')
+    for (rec_ident, rec) in self.rec_dict.iteritems():
+      rec_dict[rec_ident] = rec
+    store.close()
+
+    store = diskstore.SQLiteStore(self.store_file_name)
+    rec_dict = store.record_dict('test_records')
+    assert len(rec_dict) == 0
+    store.close()
+
+# =============================================================================
+# Start tests when called from command line
+
+if (__name__ == "__main__"):
+  unittest.main()  # Run all test
+
+# =============================================================================
@@ -49,6 +49,7 @@
 # =============================================================================
 # Import necessary modules (Python standard modules first, then Febrl modules)
 
+import os
 import sets
 import sys
 import unittest
@@ -56,13 +57,21 @@ sys.path.append('..')
 
 import comparison  # Assumed to have been tested successfully
 import dataset     # Assumed to have been tested successfully
+import encode
 import stringcmp
 
+import diskstore
 import indexing
+import weightvec
 
 def print_log(x):  # Function to be used as 'log_funct'
   print x
 
+def prefix_sim(str1, str2):  # Similarity of the first two characters
+  if (str1[:2] == str2[:2]):
+    return 1.0
+  return 0.0
+
 # =============================================================================
 
 class TestCase(unittest.TestCase):
@@ -679,6 +688,842 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testBlockingIndexStreamPairs(self):  # - - - - - - - - - - - - - - - - -
+    """Test BlockingIndex with streamed record pairs"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (ds2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                            (self.dataset1, self.rec_comp_dedupl)]:
+
+      dict_index = indexing.BlockingIndex(description = 'Test blocking index',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = ds2,
+                                          rec_comparator = rec_comp,
+                                          progress=2,
+                                          index_def = [index_def1,index_def2])
+      dict_index.build()
+      dict_index.compact()
+
+      stream_index = indexing.BlockingIndex(description = 'Test stream index',
+                                            dataset1 = self.dataset1,
+                                            dataset2 = ds2,
+                                            rec_comparator = rec_comp,
+                                            progress=2,
+                                            stream_pairs = True,
+                                          index_def = [index_def1,index_def2])
+      assert stream_index.stream_pairs == True
+
+      stream_index.build()
+      stream_index.compact()
+
+      assert stream_index.status == 'compacted'
+
+      # Before the pairs are streamed their number is an estimate that
+      # includes pairs occurring in the blocks of both indices
+      #
+      assert stream_index.num_rec_pairs >= dict_index.num_rec_pairs
+
+      for (lf, cot) in [(None, None), (20, None), (None, 0.5)]:
+        [field_names_list, dict_w_vec_dict] = \
+              dict_index.run(length_filter_perc = lf, cut_off_threshold = cot)
+        [field_names_list, stream_w_vec_dict] = \
+            stream_index.run(length_filter_perc = lf, cut_off_threshold = cot)
+
+        assert isinstance(stream_w_vec_dict, dict)
+        assert stream_w_vec_dict == dict_w_vec_dict
+        assert stream_index.num_rec_pairs == dict_index.num_rec_pairs
+
+    # Streaming is not supported by indices with overlapping blocks
+    #
+    self.assertRaises(Exception, indexing.SortingIndex,
+                      description = 'Test sorting index',
+                      dataset1 = self.dataset1,
+                      dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      window_size = 3,
+                      stream_pairs = True,
+                      index_def = [index_def1])
+
+  def testParallelComparison(self):  # - - - - - - - - - - - - - - - - - - - -
+    """Test comparison of record pairs using several processes"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (ds2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                            (self.dataset1, self.rec_comp_dedupl)]:
+
+      for index_class in [indexing.FullIndex, indexing.BlockingIndex]:
+
+        seq_index = index_class(description = 'Test sequential index',
+                                dataset1 = self.dataset1,
+                                dataset2 = ds2,
+                                rec_comparator = rec_comp,
+                                progress=2,
+                                index_def = [index_def1,index_def2])
+        seq_index.build()
+        seq_index.compact()
+
+        par_index = index_class(description = 'Test parallel index',
+                                dataset1 = self.dataset1,
+                                dataset2 = ds2,
+                                rec_comparator = rec_comp,
+                                progress=2,
+                                num_processes = 3,
+                                index_def = [index_def1,index_def2])
+        assert par_index.num_processes == 3
+
+        par_index.build()
+        par_index.compact()
+
+        assert par_index.num_rec_pairs == seq_index.num_rec_pairs
+
+        for (lf, cot) in [(None, None), (20, None), (None, 0.5)]:
+          [field_names_list, seq_w_vec_dict] = \
+               seq_index.run(length_filter_perc = lf, cut_off_threshold = cot)
+          [field_names_list, par_w_vec_dict] = \
+               par_index.run(length_filter_perc = lf, cut_off_threshold = cot)
+
+          assert isinstance(par_w_vec_dict, dict)
+          assert par_w_vec_dict == seq_w_vec_dict
+
+    self.assertRaises(Exception, indexing.BlockingIndex,
+                      description = 'Test blocking index',
+                      dataset1 = self.dataset1,
+                      dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      num_processes = 0,
+                      index_def = [index_def1])
+
+  def testInternRecIdents(self):  # - - - - - - - - - - - - - - - - - - - - - -
+    """Test indices with record identifiers interned as record numbers"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    index_list = [(indexing.BlockingIndex, {}),
+                  (indexing.BlockingIndex, {'stream_pairs':True}),
+                  (indexing.SortingIndex, {'window_size':3}),
+                  (indexing.SortingArrayIndex, {'window_size':3}),
+                  (indexing.AdaptSortingIndex, {'str_cmp_funct':stringcmp.jaro,
+                                                'str_cmp_thres':0.8}),
+                  (indexing.QGramIndex, {'q':2, 'threshold':0.8,
+                                         'padded':True})]
+
+    for (ds2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                            (self.dataset1, self.rec_comp_dedupl)]:
+
+      for (index_class, index_kwargs) in index_list:
+
+        str_index = index_class(description = 'Test index',
+                                dataset1 = self.dataset1,
+                                dataset2 = ds2,
+                                rec_comparator = rec_comp,
+                                progress=2,
+                                index_def = [index_def1,index_def2],
+                                **index_kwargs)
+        str_index.build()
+        str_index.compact()
+        [field_names_list, str_w_vec_dict] = str_index.run()
+
+        int_index = index_class(description = 'Test interned index',
+                                dataset1 = self.dataset1,
+                                dataset2 = ds2,
+                                rec_comparator = rec_comp,
+                                progress=2,
+                                intern_rec_ids = True,
+                                index_def = [index_def1,index_def2],
+                                **index_kwargs)
+        assert int_index.intern_rec_ids == True
+        assert isinstance(int_index.rec_cache1, list)
+
+        int_index.build()
+
+        assert len(int_index.rec_cache1) == len(self.rec_ident1)
+        assert int_index.rec_ident_list1 == self.rec_ident1
+
+        int_index.compact()
+        [field_names_list, int_w_vec_dict] = int_index.run()
+
+        assert int_index.num_rec_pairs == str_index.num_rec_pairs
+        assert len(int_w_vec_dict) == len(str_w_vec_dict)
+
+        for ((rec_num1, rec_num2), w_vec) in int_w_vec_dict.iteritems():
+          assert isinstance(rec_num1, int)
+          assert isinstance(rec_num2, int)
+
+          rec_ident1 = int_index.rec_ident_list1[rec_num1]
+          rec_ident2 = int_index.rec_ident_list2[rec_num2]
+
+          if ((rec_ident1, rec_ident2) not in str_w_vec_dict):
+            assert int_index.do_deduplication == True
+            assert (rec_ident2, rec_ident1) in str_w_vec_dict
+          else:
+            assert str_w_vec_dict[(rec_ident1, rec_ident2)] == w_vec
+
+    self.assertRaises(Exception, indexing.CanopyIndex,
+                      description = 'Test canopy index',
+                      dataset1 = self.dataset1,
+                      dataset2 = self.dataset2,
+                      rec_comparator = self.rec_comp_link,
+                      canopy_method = ('jaccard', 'threshold', 0.8, 0.5),
+                      intern_rec_ids = True,
+                      index_def = [index_def1])
+
+  def testWeightVectorStore(self):  # - - - - - - - - - - - - - - - - - - - -
+    """Test indices returning their weight vectors in a weight vector store"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (ds2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                            (self.dataset1, self.rec_comp_dedupl)]:
+
+      for index_kwargs in [{}, {'intern_rec_ids':True},
+                           {'stream_pairs':True, 'num_processes':2}]:
+
+        dict_index = indexing.BlockingIndex(description = 'Test index',
+                                            dataset1 = self.dataset1,
+                                            dataset2 = ds2,
+                                            rec_comparator = rec_comp,
+                                            progress=2,
+                                            index_def = [index_def1,
+                                                         index_def2],
+                                            **index_kwargs)
+        dict_index.build()
+        dict_index.compact()
+        [field_names_list, w_vec_dict] = dict_index.run()
+
+        store_index = indexing.BlockingIndex(description = 'Test index',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = ds2,
+                                             rec_comparator = rec_comp,
+                                             progress=2,
+                                             weight_vec_store = True,
+                                             index_def = [index_def1,
+                                                          index_def2],
+                                             **index_kwargs)
+        store_index.build()
+        store_index.compact()
+        [field_names_list, w_vec_store] = store_index.run()
+
+        assert isinstance(w_vec_store, weightvec.WeightVectorStore)
+        assert len(w_vec_store) == len(w_vec_dict)
+        assert w_vec_store.get_weight_matrix().shape == \
+               (len(w_vec_dict), len(field_names_list))
+
+        for (rec_id_tuple, w_vec) in w_vec_dict.iteritems():
+          assert w_vec_store[rec_id_tuple] == w_vec, \
+                 (rec_id_tuple, w_vec_store[rec_id_tuple], w_vec)
+
+  def testIndexValueCache(self):  # - - - - - - - - - - - - - - - - - - - - -
+    """Test the cache of index values and the index statistics"""
+
+    index_def1 = [['surname','surname',False,False,None,[encode.dmetaphone]]]
+    index_def2 = [['given_name','given_name',True,True,4,[encode.soundex,3]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    field_names = [field_name for (field_name, field_data) in \
+                   self.dataset1.field_list]
+    surname_col = field_names.index('surname')
+
+    surname_list = []  # All non-empty surnames in the test data set
+    for (rec_ident, rec) in self.dataset1.readall():
+      if ((surname_col < len(rec)) and (rec[surname_col].strip() != '')):
+        surname_list.append(rec[surname_col].strip().lower())
+
+    for (ds2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                            (self.dataset1, self.rec_comp_dedupl)]:
+
+      index_list = []
+
+      for cache_size in [None, 1, 3, 10000]:
+
+        test_index = indexing.BlockingIndex(description = 'Test cache index',
+                                            dataset1 = self.dataset1,
+                                            dataset2 = ds2,
+                                            rec_comparator = rec_comp,
+                                            progress=2,
+                                            index_cache_size = cache_size,
+                                         index_def = [index_def1,index_def2])
+        assert test_index.index_cache_size == cache_size
+
+        test_index.build()
+
+        index_stats = test_index.get_index_stats()
+
+        assert len(index_stats) == 2
+        assert len(index_stats[0]) == 1
+        assert len(index_stats[1]) == 2
+
+        # No cache for an index definition without function
+        #
+        assert index_stats[1][1] == (0, 0)
+
+        (num_hits, num_misses) = index_stats[0][0]
+
+        if (cache_size == None):
+          assert (num_hits, num_misses) == (0, 0)
+        else:
+          if (ds2 == self.dataset1):  # Only one data set is indexed
+            assert (num_hits + num_misses) == len(surname_list)
+          else:
+            assert (num_hits + num_misses) == 2*len(surname_list)
+
+          assert num_misses >= len(set(surname_list))
+          if (cache_size == 10000):  # Each surname only calculated once
+            assert num_misses == len(set(surname_list)), \
+                   (num_misses, len(set(surname_list)))
+
+        index_list.append(test_index)
+
+      for test_index in index_list[1:]:
+        assert test_index.index1 == index_list[0].index1
+        assert test_index.index2 == index_list[0].index2
+
+  def testSaveLoad(self):  # - - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test saving and loading of indices"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[encode.soundex]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    index_file_name = './test-index.bin'
+
+    index_list = [(indexing.BlockingIndex, {}),
+                  (indexing.BlockingIndex, {'intern_rec_ids':True}),
+                  (indexing.BlockingIndex, {'stream_pairs':True}),
+                  (indexing.SortingIndex, {'window_size':3}),
+                  (indexing.QGramIndex, {'q':2, 'threshold':0.8,
+                                         'padded':True}),
+                  (indexing.StringMapIndex, {'canopy_method':('nearest',2,3),
+                                             'dim':15, 'sub_dim':2,
+                                             'grid_resolution':10,
+                                             'sim_funct':stringcmp.editdist})]
+
+    for (ds2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                            (self.dataset1, self.rec_comp_dedupl)]:
+
+      for (index_class, index_kwargs) in index_list:
+
+        for save_status in ['built', 'compacted']:
+
+          saved_index = index_class(description = 'Test saved index',
+                                    dataset1 = self.dataset1,
+                                    dataset2 = ds2,
+                                    rec_comparator = rec_comp,
+                                    progress=2,
+                                    index_def = [index_def1,index_def2],
+                                    **index_kwargs)
+          saved_index.build()
+          if (save_status == 'compacted'):
+            saved_index.compact()
+
+          saved_index.save(index_file_name)
+
+          loaded_index = index_class(description = 'Test loaded index',
+                                     dataset1 = self.dataset1,
+                                     dataset2 = ds2,
+                                     rec_comparator = rec_comp,
+                                     progress=2,
+                                     index_def = [index_def1,index_def2],
+                                     **index_kwargs)
+          loaded_index.load(index_file_name)
+
+          assert loaded_index.status == save_status, \
+                 (loaded_index.status, save_status)
+
+          for i in range(2):
+            assert dict(loaded_index.index1[i]) == dict(saved_index.index1[i])
+            assert dict(loaded_index.index2[i]) == dict(saved_index.index2[i])
+
+          # The blocks of the loaded index are read from the index file, which
+          # must stay valid if the loaded index is saved into the same file
+          #
+          loaded_index.save(index_file_name)
+          loaded_index.load(index_file_name)
+
+          for i in range(2):
+            assert dict(loaded_index.index1[i]) == dict(saved_index.index1[i])
+            assert dict(loaded_index.index2[i]) == dict(saved_index.index2[i])
+
+          # The record pairs of a compacted index (or the index values of the
+          # records if pairs are streamed) are read from the index file too
+          #
+          if (save_status == 'compacted'):
+            if (index_kwargs.get('stream_pairs', False) == True):
+              assert isinstance(loaded_index.rec_index_vals1,
+                                indexing._MappedIndexValDict)
+              assert dict(loaded_index.rec_index_vals1) == \
+                     saved_index.rec_index_vals1
+              assert dict(loaded_index.rec_index_vals2) == \
+                     saved_index.rec_index_vals2
+            else:
+              assert isinstance(loaded_index.rec_pair_dict,
+                                indexing._MappedRecPairDict)
+              assert len(loaded_index.rec_pair_dict) == \
+                     len(saved_index.rec_pair_dict)
+              assert dict(loaded_index.rec_pair_dict) == \
+                     saved_index.rec_pair_dict
+
+          if (save_status == 'built'):
+
+            # The canopies of the string map index depend upon the order of
+            # the strings in a dictionary, which can differ after loading
+            #
+            if (index_class == indexing.StringMapIndex):
+              assert loaded_index.coord == saved_index.coord
+              continue
+
+            saved_index.compact()
+            loaded_index.compact()
+
+          assert loaded_index.num_rec_pairs == saved_index.num_rec_pairs
+
+          [field_names_list, saved_w_vec_dict] =  saved_index.run()
+          [field_names_list, loaded_w_vec_dict] = loaded_index.run()
+
+          assert loaded_w_vec_dict == saved_w_vec_dict, \
+                 (index_class, index_kwargs, save_status)
+
+    # An index with different index definitions cannot be loaded
+    #
+    other_index = indexing.BlockingIndex(description = 'Test other index',
+                                         dataset1 = self.dataset1,
+                                         dataset2 = self.dataset1,
+                                         rec_comparator = self.rec_comp_dedupl,
+                                         index_def = [index_def1])
+    self.assertRaises(Exception, other_index.load, index_file_name)
+
+    # A saved index is not valid after its data set file has been modified
+    #
+    data_set_file_name = './test-data-copy.csv'
+    data_set_file = open(data_set_file_name, 'w')
+    data_set_file.write(open('./test-data.csv').read())
+    data_set_file.close()
+
+    copy_dataset = dataset.DataSetCSV(description='Copied test CSV data set',
+                                      access_mode='read',
+                                      rec_ident='rec_id',
+                                      header_line=True,
+                                      file_name=data_set_file_name)
+    gn_jfc = comparison.FieldComparatorJaro(threshold = 0.75,
+                                            desc = 'Givenname Jaro')
+    copy_rec_comp = comparison.RecordComparator(copy_dataset, copy_dataset,
+                                  [(gn_jfc, 'given_name', 'given_name')],
+                                  'Test record comparator for copied data set')
+
+    copy_index_list = []
+    for i in range(2):
+      copy_index_list.append(indexing.BlockingIndex(description = 'Test',
+                                        dataset1 = copy_dataset,
+                                        dataset2 = copy_dataset,
+                                        rec_comparator = copy_rec_comp,
+                                        index_def = [index_def1,index_def2]))
+    copy_index_list[0].build()
+    copy_index_list[0].save(index_file_name)
+
+    file_mtime = os.stat(data_set_file_name).st_mtime
+    os.utime(data_set_file_name, (file_mtime+10, file_mtime+10))
+
+    self.assertRaises(Exception, copy_index_list[1].load, index_file_name)
+
+    copy_dataset.finalise()
+    os.remove(data_set_file_name)
+    os.remove(index_file_name)
+
+  def testIncrementalIndex(self):  # - - - - - - - - - - - - - - - - - - - - -
+    """Test adding records to an incremental blocking index"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[encode.soundex]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    index_file_name = './test-index.bin'
+
+    # Split the test data set into old and new records
+    #
+    data_line_list = open('./test-data.csv').readlines()
+
+    old_file_name = './test-data-old.csv'
+    new_file_name = './test-data-new.csv'
+    old_file = open(old_file_name, 'w')
+    old_file.writelines(data_line_list[:13])
+    old_file.close()
+    new_file = open(new_file_name, 'w')
+    new_file.writelines(data_line_list[:1]+data_line_list[13:])
+    new_file.close()
+
+    ds_list = []
+    for (file_name, desc) in [(old_file_name, 'Old test CSV data set 1'),
+                              (old_file_name, 'Old test CSV data set 2'),
+                              (new_file_name, 'New test CSV data set')]:
+      ds_list.append(dataset.DataSetCSV(description=desc,
+                                        access_mode='read',
+                                        rec_ident='rec_id',
+                                        header_line=True,
+                                        file_name=file_name))
+    [old_dataset1, old_dataset2, new_dataset] = ds_list
+
+    old_rec_comp = comparison.RecordComparator(old_dataset1, old_dataset1,
+                                   self.rec_comp_dedupl.field_comparator_list,
+                                   'Test record comparator for old records')
+
+    index_kwargs_list = [{}, {'intern_rec_ids':True},
+                         {'intern_rec_ids':True, 'weight_vec_store':True}]
+
+    for index_kwargs in index_kwargs_list:
+
+      # Indices with all records as reference
+      #
+      full_index_link = indexing.BlockingIndex(description = 'Test full',
+                                        dataset1 = self.dataset1,
+                                        dataset2 = self.dataset2,
+                                        rec_comparator = self.rec_comp_link,
+                                        index_def = [index_def1,index_def2],
+                                        **index_kwargs)
+      full_index_dedup = indexing.BlockingIndex(description = 'Test full',
+                                        dataset1 = self.dataset1,
+                                        dataset2 = self.dataset1,
+                                        rec_comparator = self.rec_comp_dedupl,
+                                        index_def = [index_def1,index_def2],
+                                        **index_kwargs)
+
+      for full_index in [full_index_link, full_index_dedup]:
+
+        full_index.build()
+        full_index.compact()
+        [field_names_list, full_w_vec_dict] = full_index.run()
+
+        if (full_index.do_deduplication == True):
+          new_ds_list = [(new_dataset, None)]
+        else:
+          new_ds_list = [(new_dataset, new_dataset), (new_dataset, None),
+                         (None, new_dataset)]
+
+        for (new_dataset1, new_dataset2) in new_ds_list:
+
+          # Data sets without new records contain all records
+          #
+          if (new_dataset1 != None):
+            dataset1 = old_dataset1
+          else:
+            dataset1 = self.dataset1
+          if (full_index.do_deduplication == True):
+            dataset2 = dataset1
+          elif (new_dataset2 != None):
+            dataset2 = old_dataset2
+          else:
+            dataset2 = self.dataset2
+
+          rec_comp = comparison.RecordComparator(dataset1, dataset2,
+                                 self.rec_comp_dedupl.field_comparator_list,
+                                 'Test record comparator for old records')
+
+          inc_index = indexing.BlockingIndex(description = 'Test incremental',
+                                        dataset1 = rec_comp.dataset1,
+                                        dataset2 = rec_comp.dataset2,
+                                        rec_comparator = rec_comp,
+                                        index_def = [index_def1,index_def2],
+                                        incremental = True,
+                                        **index_kwargs)
+          inc_index.build()
+          inc_index.compact()
+          [field_names_list, w_vec_dict] = inc_index.run()
+          inc_index.save(index_file_name)
+
+          loaded_index = indexing.BlockingIndex(description = 'Test loaded',
+                                        dataset1 = rec_comp.dataset1,
+                                        dataset2 = rec_comp.dataset2,
+                                        rec_comparator = rec_comp,
+                                        index_def = [index_def1,index_def2],
+                                        incremental = True,
+                                        **index_kwargs)
+          loaded_index.load(index_file_name)
+
+          loaded_index.add_records(new_dataset1, new_dataset2)
+          num_new_rec_pairs = loaded_index.num_rec_pairs
+          loaded_index.compact()
+
+          assert loaded_index.num_rec_pairs <= num_new_rec_pairs
+          assert loaded_index.num_rec_pairs + len(w_vec_dict) == \
+                 len(full_w_vec_dict), (loaded_index.num_rec_pairs,
+                                        len(w_vec_dict), len(full_w_vec_dict))
+
+          [field_names_list, inc_w_vec_dict] = \
+                            loaded_index.run(weight_vec_dict = w_vec_dict)
+
+          assert dict(inc_w_vec_dict.iteritems()) == \
+                 dict(full_w_vec_dict.iteritems()), (index_kwargs,
+                                                     new_dataset1,
+                                                     new_dataset2)
+
+          # Records cannot be added twice
+          #
+          if (new_dataset1 != None):
+            self.assertRaises(Exception, loaded_index.add_records,
+                              new_dataset1)
+
+    # Records added before the index is compacted for the first time are new
+    # together with all records the index was built with
+    #
+    old_rec_comp_link = comparison.RecordComparator(old_dataset1, old_dataset2,
+                                   self.rec_comp_link.field_comparator_list,
+                                   'Test record comparator for old records')
+
+    for (full_dataset2, full_rec_comp, old_dataset, rec_comp, new_dataset2) in \
+        [(self.dataset1, self.rec_comp_dedupl, old_dataset1, old_rec_comp,
+          None),
+         (self.dataset2, self.rec_comp_link, old_dataset2, old_rec_comp_link,
+          new_dataset)]:
+
+      full_index = indexing.BlockingIndex(description = 'Test full',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = full_dataset2,
+                                          rec_comparator = full_rec_comp,
+                                          index_def = [index_def1])
+      full_index.build()
+      full_index.compact()
+      [field_names_list, full_w_vec_dict] = full_index.run()
+
+      inc_index = indexing.BlockingIndex(description = 'Test incremental',
+                                         dataset1 = old_dataset1,
+                                         dataset2 = old_dataset,
+                                         rec_comparator = rec_comp,
+                                         index_def = [index_def1],
+                                         incremental = True)
+      inc_index.build()
+      inc_index.add_records(new_dataset, new_dataset2)
+      assert inc_index.num_rec_pairs == full_index.num_rec_pairs
+      inc_index.compact()
+      assert inc_index.num_rec_pairs == full_index.num_rec_pairs
+
+      [field_names_list, inc_w_vec_dict] = inc_index.run()
+
+      assert inc_w_vec_dict == full_w_vec_dict, (len(inc_w_vec_dict),
+                                                 len(full_w_vec_dict))
+
+    # Records cannot be added to an index which is not incremental
+    #
+    other_index = indexing.BlockingIndex(description = 'Test other index',
+                                         dataset1 = old_dataset1,
+                                         dataset2 = old_dataset1,
+                                         rec_comparator = old_rec_comp,
+                                         index_def = [index_def1,index_def2])
+    other_index.build()
+    self.assertRaises(Exception, other_index.add_records, new_dataset)
+
+    # Only the blocking index can be incremental
+    #
+    for (index_class, index_kwargs) in \
+        [(indexing.SortingIndex, {'window_size':3}),
+         (indexing.QGramIndex, {'threshold':0.8}),
+         (indexing.CanopyIndex,
+          {'canopy_method':('jaccard', 'threshold', 0.9, 0.8)})]:
+      self.assertRaises(Exception, index_class, description = 'Test other',
+                        dataset1 = old_dataset1, dataset2 = old_dataset1,
+                        rec_comparator = old_rec_comp,
+                        index_def = [index_def1], incremental = True,
+                        **index_kwargs)
+      index_class(description = 'Test other', dataset1 = old_dataset1,
+                  dataset2 = old_dataset1, rec_comparator = old_rec_comp,
+                  index_def = [index_def1], incremental = False,
+                  **index_kwargs)
+
+    old_dataset1.finalise()
+    old_dataset2.finalise()
+    new_dataset.finalise()
+    os.remove(old_file_name)
+    os.remove(new_file_name)
+    os.remove(index_file_name)
+
+  def testDiskStore(self):  # - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test indices with blocks and record caches in disk stores"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[encode.soundex]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    disk_kwargs = {'index1_shelve_name':'./test-index1.db',
+                   'index2_shelve_name':'./test-index2.db',
+                   'rec_cache1_file_name':'./test-rec-cache.db',
+                   'rec_cache2_file_name':'./test-rec-cache.db'}
+
+    index_list = [(indexing.BlockingIndex, {}),
+                  (indexing.BlockingIndex, {'num_processes':2}),
+                  (indexing.SortingIndex, {'window_size':3})]
+
+    for (ds2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                            (self.dataset1, self.rec_comp_dedupl)]:
+
+      for (index_class, index_kwargs) in index_list:
+
+        w_vec_dict_list = []
+
+        for file_kwargs in [{}, disk_kwargs]:
+
+          test_index = index_class(description = 'Test disk store index',
+                                   dataset1 = self.dataset1,
+                                   dataset2 = ds2,
+                                   rec_comparator = rec_comp,
+                                   progress=2,
+                                   index_def = [index_def1,index_def2],
+                                   **dict(index_kwargs, **file_kwargs))
+          test_index.build()
+          test_index.compact()
+
+          [field_names_list, w_vec_dict] = test_index.run()
+          w_vec_dict_list.append(w_vec_dict)
+
+          if (file_kwargs != {}):
+            assert isinstance(test_index.rec_cache1,
+                              diskstore.SQLiteRecordDict)
+            for disk_store in test_index.disk_store_list:
+              disk_store.close()
+
+        assert w_vec_dict_list[0] == w_vec_dict_list[1], \
+               (index_class, index_kwargs)
+
+    for file_name in ['./test-index1.db', './test-index2.db',
+                      './test-rec-cache.db']:
+      for file_suffix in ['', '-wal', '-shm']:
+        if (os.access(file_name+file_suffix, os.F_OK) == True):
+          os.remove(file_name+file_suffix)
+
+  def testLargeBlocks(self):  # - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test handling of large blocks in the blocking index"""
+
+    index_def1 = [['postcode','postcode',False,False,1,[]]]  # One large block
+    index_def2 = [['surname','surname',False,False,None,[]]]
+
+    key_def = [['postcode','postcode',False,False,3,[]]]
+
+    large_block_method_list = [('drop',), ('split', key_def),
+                               ('window', 3, key_def)]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      # Indices without large block handling as reference
+      #
+      full_index = indexing.BlockingIndex(description = 'Test full',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = dataset2,
+                                          rec_comparator = rec_comp,
+                                          index_def = [index_def1,index_def2])
+      full_index.build()
+
+      block_stats_list = full_index.get_block_stats()
+      assert len(block_stats_list) == 2
+      for (num_blocks, quant_list, num_rec_pairs, num_large_blocks,
+           num_large_rec_pairs) in block_stats_list:
+        assert num_blocks > 0
+        assert len(quant_list) == 4
+        assert quant_list == sorted(quant_list)
+        assert num_rec_pairs > 0
+        assert num_large_blocks == 0
+        assert num_large_rec_pairs == 0
+
+      # The first index contains one block with all records
+      #
+      assert block_stats_list[0][0] == 1
+      assert block_stats_list[0][1][3] == len(self.rec_ident1) + \
+                                          (dataset2 == self.dataset2)* \
+                                          len(self.rec_ident2)
+
+      max_num_rec_pairs = block_stats_list[1][2]
+      max_block_size = full_index.get_max_block_size(max_num_rec_pairs)
+      assert max_block_size < block_stats_list[0][1][3]
+      assert max_block_size >= block_stats_list[1][1][3]
+      assert full_index.get_max_block_size(0) == 1
+
+      full_index.compact()
+      [field_names_list, full_w_vec_dict] = full_index.run()
+
+      surname_index = indexing.BlockingIndex(description = 'Test surname',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = dataset2,
+                                             rec_comparator = rec_comp,
+                                             index_def = [index_def2])
+      surname_index.build()
+      surname_index.compact()
+      [field_names_list, surname_w_vec_dict] = surname_index.run()
+
+      for large_block_method in large_block_method_list:
+
+        block_index = indexing.BlockingIndex(description = 'Test large',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = dataset2,
+                                          rec_comparator = rec_comp,
+                                          index_def = [index_def1,index_def2],
+                                          max_block_size = max_block_size,
+                                          large_block_method = \
+                                                            large_block_method)
+        block_index.build()
+
+        block_stats_list = block_index.get_block_stats()
+        assert block_stats_list[0][3] == 1
+        assert block_stats_list[0][4] == block_stats_list[0][2]
+        assert block_stats_list[1][3] == 0
+
+        block_index.compact()
+        [field_names_list, w_vec_dict] = block_index.run()
+
+        assert len(w_vec_dict) == block_index.num_rec_pairs
+
+        for rec_pair in w_vec_dict:
+          assert rec_pair in full_w_vec_dict, rec_pair
+        for rec_pair in surname_w_vec_dict:
+          assert rec_pair in w_vec_dict, rec_pair
+
+        if (large_block_method[0] == 'drop'):
+          assert len(w_vec_dict) == len(surname_w_vec_dict)
+          assert len(w_vec_dict) <= max_num_rec_pairs
+
+        elif (large_block_method[0] == 'split'):
+          for rec_pair in w_vec_dict:
+            if (rec_pair not in surname_w_vec_dict):
+              rec1 = block_index.rec_cache1[rec_pair[0]]
+              if (block_index.do_deduplication == True):
+                rec2 = block_index.rec_cache1[rec_pair[1]]
+              else:
+                rec2 = block_index.rec_cache2[rec_pair[1]]
+              assert rec1[7][:3] == rec2[7][:3], (rec1, rec2)
+
+        else:  # With a window size of 3 at most 2 pairs per record
+          assert len(w_vec_dict) <= len(surname_w_vec_dict) + \
+                                    2*len(self.rec_ident1)
+
+        assert len(w_vec_dict) <= len(full_w_vec_dict)
+
+    # Check illegal arguments
+    #
+    for (large_block_method, max_block_size) in \
+        [(('split',), 10), (('window', 0, key_def), 10),
+         (('merge',), 10), (('window', 3, key_def), -1),
+         (('split', [['street_number','street_number',False,False,None,
+                      []]]), 10)]:
+      try:
+        block_index = indexing.BlockingIndex(description = 'Test illegal',
+                                         dataset1 = self.dataset1,
+                                         dataset2 = self.dataset1,
+                                         rec_comparator = self.rec_comp_dedupl,
+                                         index_def = [index_def1],
+                                         max_block_size = max_block_size,
+                                         large_block_method = \
+                                                           large_block_method)
+      except:
+        pass
+      else:
+        raise Exception, 'Illegal large block arguments not detected: %s' % \
+                         (str((large_block_method, max_block_size)))
+
   def testSortingIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - - -
     """Test SortingIndex linkage"""
 
@@ -1498,6 +2343,79 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testAdaptSortIndexSearch(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test AdaptSortingIndex with the accelerated adaptive methods"""
+
+    # With a similarity on the first two characters only the blocks must be
+    # the same as the ones of a blocking index on these two characters
+    #
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['surname','surname',False,False,2,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      block_index = indexing.BlockingIndex(desc = 'Test blocking index',
+                                           dataset1 = self.dataset1,
+                                           dataset2 = dataset2,
+                                           rec_comparator = rec_comp,
+                                           index_def = [index_def2])
+      block_index.build()
+      block_index.compact()
+
+      block_rec_pair_dict = {}
+      for (rec_ident1, rec_ident2_set) in \
+          block_index.rec_pair_dict.iteritems():
+        if (len(rec_ident2_set) > 0):
+          block_rec_pair_dict[rec_ident1] = set(rec_ident2_set)
+
+      for adapt_method in ['incremental', 'accumulative']:
+
+        adapt_index = indexing.AdaptSortingIndex(desc = 'Test adapt index',
+                                                 dataset1 = self.dataset1,
+                                                 dataset2 = dataset2,
+                                                 rec_comparator = rec_comp,
+                                                 str_cmp_funct = prefix_sim,
+                                                 str_cmp_thres = 0.5,
+                                                 adapt_method = adapt_method,
+                                                 index_def = [index_def1])
+        assert adapt_index.adapt_method == adapt_method
+
+        adapt_index.build()
+        assert adapt_index.status == 'built'
+        adapt_index.compact()
+        assert adapt_index.status == 'compacted'
+
+        rec_pair_dict = {}
+        for (rec_ident1, rec_ident2_set) in \
+            adapt_index.rec_pair_dict.iteritems():
+          if (len(rec_ident2_set) > 0):
+            rec_pair_dict[rec_ident1] = set(rec_ident2_set)
+
+        assert rec_pair_dict == block_rec_pair_dict, adapt_method
+
+        [field_names_list, weight_vec_dict] = adapt_index.run()
+        assert len(weight_vec_dict) == adapt_index.num_rec_pairs
+
+    # Check an illegal adaptive method
+    #
+    try:
+      adapt_index = indexing.AdaptSortingIndex(desc = 'Test illegal',
+                                               dataset1 = self.dataset1,
+                                               dataset2 = self.dataset2,
+                                               rec_comparator = \
+                                                 self.rec_comp_link,
+                                               str_cmp_funct = stringcmp.jaro,
+                                               str_cmp_thres = 0.8,
+                                               adapt_method = 'binary',
+                                               index_def = [index_def1])
+    except:
+      pass
+    else:
+      raise Exception, 'Illegal adaptive method not detected'
+
+  # ---------------------------------------------------------------------------
+
   def testSortArrayIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - -
     """Test SortingArrayIndex linkage"""
 
@@ -1794,6 +2712,69 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testSortArrayIndexCodes(self):  # - - - - - - - - - - - - - - - - - - - -
+    """Test SortingArrayIndex with the 'codes' pair method"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      for w in [2, 3, 5, 9, 20]:
+
+        rec_pair_dict_list = []
+
+        for pair_method in ['sets', 'codes']:
+          sort_index = indexing.SortingArrayIndex(description = \
+                                                  'Test SortingArray index',
+                                                  dataset1 = self.dataset1,
+                                                  dataset2 = dataset2,
+                                                  rec_comparator = rec_comp,
+                                                  window_s = w,
+                                                  pair_method = pair_method,
+                                                  index_def = [index_def1,
+                                                               index_def2])
+          assert sort_index.pair_method == pair_method
+
+          sort_index.build()
+          assert sort_index.status == 'built'
+          sort_index.compact()
+          assert sort_index.status == 'compacted'
+
+          rec_pair_dict = {}
+          for (rec_ident1, rec_ident2_set) in \
+              sort_index.rec_pair_dict.iteritems():
+            if (len(rec_ident2_set) > 0):
+              rec_pair_dict[rec_ident1] = set(rec_ident2_set)
+          rec_pair_dict_list.append(rec_pair_dict)
+
+          num_rec_pairs = sort_index.num_rec_pairs
+
+        assert rec_pair_dict_list[0] == rec_pair_dict_list[1], w
+
+        [field_names_list, weight_vec_dict] = sort_index.run()
+        assert len(weight_vec_dict) == num_rec_pairs
+
+    # Check an illegal pair method
+    #
+    try:
+      sort_index = indexing.SortingArrayIndex(description = 'Test illegal',
+                                              dataset1 = self.dataset1,
+                                              dataset2 = self.dataset2,
+                                              rec_comparator = \
+                                                self.rec_comp_link,
+                                              window_s = 3,
+                                              pair_method = 'bitmap',
+                                              index_def = [index_def1])
+    except:
+      pass
+    else:
+      raise Exception, 'Illegal pair method not detected'
+
+  # ---------------------------------------------------------------------------
+
   def testQGramIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - - -
     """Test QGramIndex linkage"""
 
@@ -2248,6 +3229,276 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testQGramIndexPrefix(self):  # - - - - - - - - - - - - - - - - - - - - -
+    """Test QGramIndex with prefix filtering"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['suburb','suburb',False,False,None,[]]]
+
+    def get_qgram_list(val, q, padded):  # Q-grams with repeats numbered
+      if (padded == True):
+        val = (q-1)*chr(1) + val + (q-1)*chr(2)
+      qgram_list = [val[j:j+q] for j in range(len(val)-(q-1))]
+      return [(qgram_list[j], qgram_list[:j].count(qgram_list[j])) for j in
+              range(len(qgram_list))]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      for (t, q, padded) in [(1.0,2,True), (0.9,2,True), (0.7,2,False),
+                             (0.5,3,True), (0.3,1,False), (0.1,2,True)]:
+
+        qgram_index = indexing.QGramIndex(description = 'Test prefix index',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = dataset2,
+                                          rec_comparator = rec_comp,
+                                          index_def = [index_def1,index_def2],
+                                          q = q,
+                                          padded = padded,
+                                          threshold = t,
+                                          qgram_method = 'prefix')
+        assert qgram_index.qgram_method == 'prefix'
+
+        qgram_index.build()
+
+        # Compare the similar value pairs with all pairs of index values
+        #
+        exp_rec_pair_set = set()
+
+        for i in range(len(qgram_index.index_def)):
+          index1 = qgram_index.index1[i]
+          if (qgram_index.do_deduplication == True):
+            index2 = index1
+          else:
+            index2 = qgram_index.index2[i]
+
+          for index_val1 in index1:
+            qgram_set1 = set(get_qgram_list(index_val1, q, padded))
+
+            for index_val2 in index2:
+              qgram_list2 = get_qgram_list(index_val2, q, padded)
+              num_common = len(qgram_set1.intersection(qgram_list2))
+              is_similar = (2.0*num_common >= \
+                            t*(len(qgram_set1)+len(qgram_list2)))
+
+              if ((qgram_index.do_deduplication == True) and \
+                  (index_val1 > index_val2)):
+                pass  # Only stored with the smaller value
+              else:
+                sim_val_set = qgram_index.qgram_index1[i].get(index_val1,
+                                                              set())
+                assert is_similar == (index_val2 in sim_val_set), \
+                       (t, q, index_val1, index_val2, num_common)
+
+              if (is_similar == True):
+                for rec_ident1 in index1[index_val1]:
+                  for rec_ident2 in index2[index_val2]:
+                    if (qgram_index.do_deduplication == False):
+                      exp_rec_pair_set.add((rec_ident1, rec_ident2))
+                    elif (rec_ident1 < rec_ident2):
+                      exp_rec_pair_set.add((rec_ident1, rec_ident2))
+
+        qgram_index.compact()
+        [field_names_list, weight_vec_dict] = qgram_index.run()
+
+        assert set(weight_vec_dict.keys()) == exp_rec_pair_set, t
+        assert len(weight_vec_dict) == qgram_index.num_rec_pairs
+
+    # Check an illegal q-gram method
+    #
+    try:
+      qgram_index = indexing.QGramIndex(description = 'Test illegal',
+                                        dataset1 = self.dataset1,
+                                        dataset2 = self.dataset2,
+                                        rec_comparator = self.rec_comp_link,
+                                        index_def = [index_def1],
+                                        threshold = 0.8,
+                                        qgram_method = 'suffix')
+    except:
+      pass
+    else:
+      raise Exception, 'Illegal q-gram method not detected'
+
+  # ---------------------------------------------------------------------------
+
+  def testLearnIndexDef(self):  # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test learning of index definitions from true matches"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+
+    block_index = indexing.BlockingIndex(description = 'Test learn index',
+                                         dataset1 = self.dataset1,
+                                         dataset2 = self.dataset2,
+                                         rec_comparator = self.rec_comp_link,
+                                         index_def = [index_def1])
+
+    true_match_set = set()
+    for rec_ident in self.rec_ident1:
+      true_match_set.add((rec_ident, rec_ident))
+
+    comp_field_names = ['given_name', 'surname', 'suburb', 'postcode']
+
+    for max_num_fields in [1, 2]:
+
+      (index_def_list, num_rec_pairs, red_ratio, pairs_compl) = \
+         block_index.learn_index_def(true_match_set, target_pc = 90.0,
+                                     sample_size = 50,
+                                     max_num_fields = max_num_fields,
+                                     min_red_ratio = 0.0)
+
+      assert len(index_def_list) > 0
+      assert pairs_compl >= 90.0, pairs_compl
+      assert (red_ratio >= 0.0) and (red_ratio <= 1.0)
+      assert num_rec_pairs >= 0
+
+      for index_def in index_def_list:
+        assert len(index_def) <= max_num_fields
+        for field_def in index_def:
+          assert field_def[0] in comp_field_names
+          assert field_def[0] == field_def[1]
+
+      # The pairs completeness is calculated from all true matches
+      #
+      learned_index = indexing.BlockingIndex(description = 'Learned index',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = self.dataset2,
+                                             rec_comparator = \
+                                                          self.rec_comp_link,
+                                             index_def = index_def_list)
+      learned_index.build()
+      learned_index.compact()
+
+      num_found = 0
+      for (rec_ident1, rec_ident2) in true_match_set:
+        if (rec_ident2 in learned_index.rec_pair_dict.get(rec_ident1, [])):
+          num_found += 1
+
+      assert abs(100.0*num_found/len(true_match_set) - pairs_compl) < 0.001
+
+    try:
+      block_index.learn_index_def(true_match_set, max_num_fields = 3)
+    except:
+      pass
+    else:
+      raise Exception, 'Illegal number of fields not detected'
+
+  # ---------------------------------------------------------------------------
+
+  def testQGramIndexMetaBlocking(self):  # - - - - - - - - - - - - - - - - - -
+    """Test QGramIndex with meta-blocking"""
+
+    index_file_name = './test-index.bin'
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['suburb','suburb',False,False,None,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      full_index = indexing.QGramIndex(description = 'Test full index',
+                                       dataset1 = self.dataset1,
+                                       dataset2 = dataset2,
+                                       rec_comparator = rec_comp,
+                                       index_def = [index_def1,index_def2],
+                                       q = 2,
+                                       threshold = 0.8)
+      full_index.build()
+      full_index.compact()
+
+      full_rec_pair_set = set()
+      for (rec_ident1, rec_ident2_set) in full_index.rec_pair_dict.items():
+        for rec_ident2 in rec_ident2_set:
+          full_rec_pair_set.add((rec_ident1, rec_ident2))
+
+      true_match_set = set(sorted(full_rec_pair_set)[::3])
+
+      for meta_blocking in [('cbs','wep'), ('ecbs','wep'), ('jaccard','wep'),
+                            ('cbs','cnp'), ('jaccard','cnp',2),
+                            ('ecbs','cnp',100000)]:
+
+        meta_index = indexing.QGramIndex(description = 'Test meta index',
+                                         dataset1 = self.dataset1,
+                                         dataset2 = dataset2,
+                                         rec_comparator = rec_comp,
+                                         index_def = [index_def1,index_def2],
+                                         q = 2,
+                                         threshold = 0.8,
+                                         meta_blocking = meta_blocking)
+        assert meta_index.meta_blocking == meta_blocking
+
+        meta_index.build()
+        meta_index.compact()
+
+        assert meta_index.num_rec_pairs == full_index.num_rec_pairs
+
+        (old_num_rec_pairs, new_num_rec_pairs, red_ratio, old_pairs_compl,
+         new_pairs_compl) = meta_index.meta_block(true_match_set)
+
+        assert old_num_rec_pairs == full_index.num_rec_pairs
+        assert new_num_rec_pairs == meta_index.num_rec_pairs
+        assert new_num_rec_pairs <= old_num_rec_pairs
+        assert red_ratio == 1.0 - float(new_num_rec_pairs)/old_num_rec_pairs
+        assert old_pairs_compl == 100.0
+        assert new_pairs_compl <= old_pairs_compl
+
+        [field_names_list, weight_vec_dict] = meta_index.run()
+
+        assert len(weight_vec_dict) == new_num_rec_pairs
+        assert set(weight_vec_dict.keys()).issubset(full_rec_pair_set)
+
+        if (meta_blocking == ('ecbs','cnp',100000)):  # All pairs are kept
+          assert set(weight_vec_dict.keys()) == full_rec_pair_set
+        else:
+          assert new_num_rec_pairs < old_num_rec_pairs, meta_blocking
+
+      # The block counts are not saved, so the record pairs of a compacted
+      # index are pruned before it is saved
+      #
+      index_list = []
+      for description in ['Test saved meta index', 'Test loaded meta index']:
+        index_list.append(indexing.QGramIndex(description = description,
+                                         dataset1 = self.dataset1,
+                                         dataset2 = dataset2,
+                                         rec_comparator = rec_comp,
+                                         index_def = [index_def1,index_def2],
+                                         q = 2,
+                                         threshold = 0.8,
+                                         meta_blocking = ('cbs','wep')))
+      [saved_index, loaded_index] = index_list
+
+      saved_index.build()
+      saved_index.compact()
+      saved_index.save(index_file_name)
+      assert saved_index.meta_pruned == True
+      assert saved_index.num_rec_pairs < full_index.num_rec_pairs
+
+      loaded_index.load(index_file_name)
+      assert loaded_index.meta_pruned == True
+      assert loaded_index.num_rec_pairs == saved_index.num_rec_pairs
+      assert loaded_index.run() == saved_index.run()
+
+    os.remove(index_file_name)
+
+    # Check illegal meta-blocking values
+    #
+    for meta_blocking in [('cbs',), ('cbs','wep',3), ('count','cnp'),
+                          ('jaccard','cnp',0)]:
+      try:
+        meta_index = indexing.QGramIndex(description = 'Test illegal',
+                                         dataset1 = self.dataset1,
+                                         dataset2 = self.dataset2,
+                                         rec_comparator = self.rec_comp_link,
+                                         index_def = [index_def1],
+                                         threshold = 0.8,
+                                         meta_blocking = meta_blocking)
+      except:
+        pass
+      else:
+        raise Exception, 'Illegal meta-blocking not detected: %s' % \
+                         (str(meta_blocking))
+
   def testCanopyIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - - -
     """Test CanopyIndex linkage"""
 
@@ -2786,6 +4037,112 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testCanopyIndexMaxScore(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test CanopyIndex with the MaxScore canopy engine"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+    index_def3 = [['suburb','suburb',False,False,None,[]]]
+
+    canopy_method_list = [('tfidf', 'threshold', 0.9, 0.5),
+                          ('tfidf', 'threshold', 0.5, 0.1),
+                          ('tfidf', 'nearest', 1, 3),
+                          ('tfidf', 'nearest', 4, 6),
+                          ('jaccard', 'threshold', 0.9, 0.5),
+                          ('jaccard', 'threshold', 0.6, 0.2),
+                          ('jaccard', 'nearest', 2, 5)]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      for canopy_method in canopy_method_list:
+
+        index_list = []
+        for canopy_engine in ['basic', 'maxscore']:
+          canopy_index = indexing.CanopyIndex(description = 'Test canopy',
+                                              dataset1 = self.dataset1,
+                                              dataset2 = dataset2,
+                                              rec_comparator = rec_comp,
+                                              canopy_method = canopy_method,
+                                              canopy_engine = canopy_engine,
+                                              delete_perc = 80,
+                                              index_def = [index_def1,
+                                                           index_def2,
+                                                           index_def3])
+          assert canopy_index.canopy_engine == canopy_engine
+          canopy_index.build()
+          index_list.append(canopy_index)
+
+        [basic_index, maxscore_index] = index_list
+
+        # Extract canopies with the same centres from both indices
+        #
+        for i in range(3):
+          canopy_engine = indexing._CanopyEngine(maxscore_index, i)
+          index_val_cache = basic_index.index_val_cache[i]
+
+          while (len(canopy_engine) > 0):
+            rec_ident = canopy_engine.next_centre()
+            index_val = index_val_cache[rec_ident]
+
+            if (canopy_method[0] == 'tfidf'):
+              basic_canopy = basic_index.__tfidf_canopy__(
+                                 basic_index.index1[i], index_val,
+                                 index_val_cache,
+                                 basic_index.qgram_inv_doc_freq_cache[i],
+                                 basic_index.max_qgram_count[i])
+            else:
+              basic_canopy = basic_index.__jaccard_canopy__(
+                                 basic_index.index1[i], index_val,
+                                 index_val_cache,
+                                 basic_index.index_val_num_qgram[i])
+
+            maxscore_canopy = canopy_engine.get_canopy(rec_ident)
+
+            assert sorted(basic_canopy) == sorted(maxscore_canopy), \
+                   (canopy_method, index_val, basic_canopy, maxscore_canopy)
+            assert len(canopy_engine) == len(index_val_cache)
+
+        # Compact an index with the MaxScore engine - - - - - - - - - - - - - -
+        #
+        canopy_index = indexing.CanopyIndex(description = 'Test canopy',
+                                            dataset1 = self.dataset1,
+                                            dataset2 = dataset2,
+                                            rec_comparator = rec_comp,
+                                            canopy_method = canopy_method,
+                                            canopy_engine = 'maxscore',
+                                            index_def = [index_def1,
+                                                         index_def2])
+        canopy_index.build()
+        canopy_index.compact()
+        [field_names_list, weight_vec_dict] = canopy_index.run()
+
+        assert len(weight_vec_dict) == canopy_index.num_rec_pairs
+
+        if (canopy_index.do_deduplication == False):
+          for rec_ident in self.rec_ident1:
+            assert (rec_ident, rec_ident) in weight_vec_dict, rec_ident
+        else:
+          for (rec_ident1, rec_ident2) in weight_vec_dict:
+            assert rec_ident1 < rec_ident2
+
+    # Check an illegal canopy engine
+    #
+    try:
+      canopy_index = indexing.CanopyIndex(description = 'Test illegal',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = self.dataset2,
+                                          rec_comparator = self.rec_comp_link,
+                                          canopy_method = ('tfidf', 'nearest',
+                                                           1, 3),
+                                          canopy_engine = 'wand',
+                                          index_def = [index_def1])
+    except:
+      pass
+    else:
+      raise Exception, 'Illegal canopy engine not detected'
+
   def testStringMapIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - -
     """Test StringMapIndex linkage"""
 
@@ -3315,6 +4672,180 @@ class TestCase(unittest.TestCase):
         assert this_w_vec_dict[rec_id_pair] == prev_w_vec_dict[rec_id_pair]
 
       prev_w_vec_dict = this_w_vec_dict
+  # ---------------------------------------------------------------------------
+
+  def testStringMapIndexVPTree(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test StringMapIndex with a VP-tree metric index"""
+
+    def edit_sim(str1, str2):  # Edit distance divided by a fixed length
+      max_len = max(len(str1), len(str2))
+      edit_dist = round((1.0 - stringcmp.editdist(str1, str2))*max_len)
+      return 1.0 - edit_dist / 20.0
+
+    # Check range and nearest neighbour queries against all distances
+    #
+    str_list = ['peter', 'pete', 'petra', 'paul', 'pauline', 'christen',
+                'christensen', 'kristen', 'miller', 'muller', 'mueller',
+                'smith', 'smyth', 'smithers', '', 'a', 'ab', 'abc']
+    dist_funct = lambda str1, str2: 1.0 - edit_sim(str1, str2)
+
+    vp_tree = indexing._VPTree(str_list, dist_funct)
+    assert len(vp_tree) == len(str_list)
+
+    # More than half of the strings are removed, so the tree is also rebuilt
+    #
+    for remove_str_num in [None, 0, 3, 6, 9, 14, 1, 10, 11, 15, 16, 12]:
+      if (remove_str_num != None):
+        vp_tree.remove(remove_str_num)
+        assert vp_tree.is_left(remove_str_num) == False
+
+      left_list = [j for j in range(len(str_list)) if vp_tree.is_left(j)]
+      assert len(vp_tree) == len(left_list)
+
+      for query_str in ['peter', 'muler', 'smit', 'xyz', '']:
+        all_dist_list = [(dist_funct(query_str, str_list[j]), j) for j in \
+                         left_list]
+        all_dist_list.sort()
+
+        for radius in [0.0, 0.05, 0.1, 0.2, 1.0]:
+          range_list = vp_tree.range_query(query_str, radius, dist_funct)
+          range_list.sort()
+          assert range_list == [(dist, j) for (dist, j) in all_dist_list \
+                                if dist <= radius], (query_str, radius)
+
+        for k in [1, 2, 5, 50]:
+          kth_dist = all_dist_list[min(k, len(all_dist_list))-1][0]
+          nearest_list = vp_tree.nearest(query_str, k, dist_funct)
+          nearest_list.sort()
+          assert nearest_list == [(dist, j) for (dist, j) in all_dist_list \
+                                  if dist <= kth_dist], (query_str, k)
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+
+    index_file_name = './test-index.bin'
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      # With a tight threshold of 1.0 every string becomes a canopy center, so
+      # all pairs of strings with a similarity of at least the loose threshold
+      # are in a canopy (and only these with a loose threshold of 1.0)
+      #
+      for loose_threshold in [1.0, 0.9, 0.8]:
+
+        strmap_index = indexing.StringMapIndex(descri = 'Test VP-tree index',
+                                               dataset1 = self.dataset1,
+                                               dataset2 = dataset2,
+                                               rec_comp = rec_comp,
+                                               canopy_me = ('threshold', 1.0,
+                                                            loose_threshold),
+                                               sim_funct = edit_sim,
+                                               metric_index = 'vptree',
+                                               index_def = [index_def1])
+        assert strmap_index.metric_index == 'vptree'
+        strmap_index.build()
+
+        index1 = dict(strmap_index.index1[0])
+        index2 = dict(strmap_index.index2[0])
+
+        strmap_index.compact()
+
+        test_rec_pair_dict = {}
+        for (index_val1, rec_list1) in index1.iteritems():
+
+          if (strmap_index.do_deduplication == True):
+            for (index_val2, rec_list2) in index1.iteritems():
+              if (edit_sim(index_val1, index_val2) >= loose_threshold):
+                for rec_ident1 in rec_list1:
+                  for rec_ident2 in rec_list2:
+                    if (rec_ident1 < rec_ident2):
+                      rec_ident2_set = test_rec_pair_dict.get(rec_ident1,
+                                                              set())
+                      rec_ident2_set.add(rec_ident2)
+                      test_rec_pair_dict[rec_ident1] = rec_ident2_set
+
+          else:
+            for (index_val2, rec_list2) in index2.iteritems():
+              if (edit_sim(index_val1, index_val2) >= loose_threshold):
+                for rec_ident1 in rec_list1:
+                  rec_ident2_set = test_rec_pair_dict.get(rec_ident1, set())
+                  rec_ident2_set.update(rec_list2)
+                  test_rec_pair_dict[rec_ident1] = rec_ident2_set
+
+        rec_pair_dict = {}
+        for (rec_ident1, rec_ident2_set) in \
+            strmap_index.rec_pair_dict.iteritems():
+          if (len(rec_ident2_set) > 0):
+            rec_pair_dict[rec_ident1] = set(rec_ident2_set)
+
+        for (rec_ident1, rec_ident2_set) in test_rec_pair_dict.iteritems():
+          assert rec_ident2_set.issubset(rec_pair_dict[rec_ident1]), \
+                 (loose_threshold, rec_ident1)
+
+        if (loose_threshold == 1.0):
+          assert rec_pair_dict == test_rec_pair_dict
+
+      # Nearest and threshold canopies, compared with the grid index - - - - -
+      #
+      for canopy_method in [('nearest', 1, 3), ('nearest', 2, 4),
+                            ('threshold', 0.9, 0.7)]:
+
+        for metric_index in ['grid', 'vptree']:
+          strmap_index = indexing.StringMapIndex(descri = 'Test VP-tree index',
+                                                 dataset1 = self.dataset1,
+                                                 dataset2 = dataset2,
+                                                 rec_comp = rec_comp,
+                                                 canopy_me = canopy_method,
+                                                 dim = 10,
+                                                 sub_d = 2,
+                                                 grid_resol = 10,
+                                                 sim_funct = stringcmp.jaro,
+                                                 metric_index = metric_index,
+                                                 index_def = [index_def1])
+          strmap_index.build()
+
+          if (metric_index == 'vptree'):  # Compact a saved and loaded VP-tree
+            strmap_index.save(index_file_name)
+            strmap_index = indexing.StringMapIndex(descri = \
+                                                     'Test VP-tree index',
+                                                   dataset1 = self.dataset1,
+                                                   dataset2 = dataset2,
+                                                   rec_comp = rec_comp,
+                                                   canopy_me = canopy_method,
+                                                   sim_funct = stringcmp.jaro,
+                                                   metric_index = metric_index,
+                                                   index_def = [index_def1])
+            strmap_index.load(index_file_name)
+            os.remove(index_file_name)
+
+          strmap_index.compact()
+          [field_names_list, weight_vec_dict] = strmap_index.run()
+
+          assert len(weight_vec_dict) == strmap_index.num_rec_pairs
+
+          if (strmap_index.do_deduplication == False):
+            for rec_ident in self.rec_ident1:
+              assert (rec_ident, rec_ident) in weight_vec_dict, rec_ident
+          else:
+            for (rec_ident1, rec_ident2) in weight_vec_dict:
+              assert rec_ident1 < rec_ident2
+
+    # Check an illegal metric index
+    #
+    try:
+      strmap_index = indexing.StringMapIndex(descri = 'Test illegal',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = self.dataset2,
+                                             rec_comp = self.rec_comp_link,
+                                             canopy_me = ('nearest', 1, 3),
+                                             sim_funct = stringcmp.jaro,
+                                             metric_index = 'bktree',
+                                             index_def = [index_def1])
+    except:
+      pass
+    else:
+      raise Exception, 'Illegal metric index not detected'
+
 
   # ---------------------------------------------------------------------------
 
@@ -3560,6 +5091,89 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testBigMatchIndexBatches(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test BigMatchIndex with the large data set processed in batches"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for block_method in [('block',), ('sort',3), ('qgram',2,True,0.8)]:
+
+      weight_vec_dict_list = []
+
+      for (batch_size, num_processes) in [(None,1), (1,1), (7,1), (5,2),
+                                          (1000,1)]:
+
+        bigmatch_index= indexing.BigMatchIndex(descrip = 'Test BigMatch index',
+                                               dataset1 = self.dataset1,
+                                               dataset2 = self.dataset2,
+                                               block_method = block_method,
+                                               rec_compar = self.rec_comp_link,
+                                               batch_size = batch_size,
+                                               num_processes = num_processes,
+                                               index_d = [index_def1,
+                                                          index_def2])
+        assert bigmatch_index.batch_size == batch_size
+
+        bigmatch_index.build()
+        bigmatch_index.compact()
+
+        [field_names_list, weight_vec_dict] = \
+                                    bigmatch_index.run(length_filter_perc = 50)
+        assert len(weight_vec_dict) <= bigmatch_index.num_rec_pairs
+
+        weight_vec_dict_list.append(weight_vec_dict)
+
+      for weight_vec_dict in weight_vec_dict_list[1:]:
+        assert weight_vec_dict == weight_vec_dict_list[0], block_method
+
+      # Weight vectors passed on to a function batch by batch
+      #
+      batch_w_vec_list = []
+
+      def batch_funct(w_vec_list):
+        batch_w_vec_list.append(w_vec_list)
+
+      bigmatch_index= indexing.BigMatchIndex(descrip = 'Test BigMatch index',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = self.dataset2,
+                                             block_method = block_method,
+                                             rec_compar = self.rec_comp_link,
+                                             batch_size = 3,
+                                             batch_funct = batch_funct,
+                                             index_d = [index_def1,
+                                                        index_def2])
+      bigmatch_index.build()
+      bigmatch_index.compact()
+
+      assert bigmatch_index.run(length_filter_perc = 50) == None
+      assert len(batch_w_vec_list) > 1
+
+      weight_vec_dict = {}
+      for w_vec_list in batch_w_vec_list:
+        for (rec_ident1, rec_ident2, w_vec) in w_vec_list:
+          weight_vec_dict[(rec_ident1, rec_ident2)] = w_vec
+
+      assert weight_vec_dict == weight_vec_dict_list[0], block_method
+
+    # A batch function needs a batch size
+    #
+    try:
+      bigmatch_index= indexing.BigMatchIndex(descrip = 'Test illegal',
+                                             dataset1 = self.dataset1,
+                                             dataset2 = self.dataset2,
+                                             block_method = ('block',),
+                                             rec_compar = self.rec_comp_link,
+                                             batch_funct = batch_funct,
+                                             index_d = [index_def1])
+    except:
+      pass
+    else:
+      raise Exception, 'Batch function without batch size not detected'
+
+  # ---------------------------------------------------------------------------
+
   def testDedupIndexLinkage(self):  # - - - - - - - - - - - - - - - - - - - - -
     """Test DedupIndex deduplication"""
 
@@ -3800,6 +5414,47 @@ class TestCase(unittest.TestCase):
 
   # ---------------------------------------------------------------------------
 
+  def testDedupIndexPartitioned(self):  # - - - - - - - - - - - - - - - - - - -
+    """Test DedupIndex with records partitioned into worker processes"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for block_method in [('block',), ('sort',1), ('sort',4), ('sort',7),
+                         ('qgram',2,True,0.8), ('qgram',3,False,0.6)]:
+
+      weight_vec_dict_list = []
+      num_rec_pairs_list =   []
+
+      for num_processes in [1, 2, 3]:
+
+        dedup_index = indexing.DedupIndex(descrip = 'Test Dedup index',
+                                          dataset1 = self.dataset1,
+                                          dataset2 = self.dataset1,
+                                          block_method = block_method,
+                                          rec_comp = self.rec_comp_dedupl,
+                                          num_processes = num_processes,
+                                          index_sep_str = chr(1),
+                                          index_def = [index_def1,
+                                                       index_def2])
+        dedup_index.build()
+        dedup_index.compact()
+
+        [field_names_list, weight_vec_dict] = \
+                                       dedup_index.run(length_filter_perc = 50)
+
+        weight_vec_dict_list.append(weight_vec_dict)
+        num_rec_pairs_list.append(dedup_index.num_rec_pairs)
+
+      for j in [1, 2]:
+        assert weight_vec_dict_list[j] == weight_vec_dict_list[0], \
+               (block_method, j)
+        assert num_rec_pairs_list[j] == num_rec_pairs_list[0], \
+               (block_method, j)
+
+  # ---------------------------------------------------------------------------
+
   def testSuffixArrayIndexLinkage(self):  # - - - - - - - - - - - - - - - - - -
     """Test SuffixArrayIndex linkage"""
 
@@ -4776,6 +6431,85 @@ class TestCase(unittest.TestCase):
 
       prev_w_vec_dict = this_w_vec_dict
 
+  # ---------------------------------------------------------------------------
+
+  def testSuffixArrayIndexLCP(self):  # - - - - - - - - - - - - - - - - - - - -
+    """Test suffix array indices with the 'lcp' array method"""
+
+    index_def1 = [['surname','surname',False,False,None,[]]]
+    index_def2 = [['given_name','given_name',True,True,4,[]],
+                  ['postcode','postcode',True,False,2,[]]]
+
+    for (dataset2, rec_comp) in [(self.dataset2, self.rec_comp_link),
+                                 (self.dataset1, self.rec_comp_dedupl)]:
+
+      for (min_suffix_len, max_block_size, padded) in \
+          [(5,5,False), (3,5,True), (2,10,False), (1,10,True), (3,100,True)]:
+
+        for index_args in [{'suffix_method':'suffixonly'},
+                           {'suffix_method':'allsubstr'},
+                           {'str_cmp_funct':stringcmp.jaro,
+                            'str_cmp_thres':0.8},
+                           {'str_cmp_funct':stringcmp.bigram,
+                            'str_cmp_thres':0.7}]:
+
+          if ('suffix_method' in index_args):
+            index_class = indexing.SuffixArrayIndex
+          else:
+            index_class = indexing.RobustSuffixArrayIndex
+
+          rec_pair_dict_list = []
+
+          for array_method in ['strings', 'lcp']:
+            sarray_index = index_class(desc = 'Test suffix array index',
+                                       dataset1 = self.dataset1,
+                                       dataset2 = dataset2,
+                                       rec_comparator = rec_comp,
+                                       padded = padded,
+                                       block_method = (min_suffix_len,
+                                                       max_block_size),
+                                       array_method = array_method,
+                                       index_def = [index_def1, index_def2],
+                                       **index_args)
+            assert sarray_index.array_method == array_method
+
+            sarray_index.build()
+            assert sarray_index.status == 'built'
+            sarray_index.compact()
+            assert sarray_index.status == 'compacted'
+
+            rec_pair_dict = {}
+            for (rec_ident1, rec_ident2_set) in \
+                sarray_index.rec_pair_dict.iteritems():
+              if (len(rec_ident2_set) > 0):
+                rec_pair_dict[rec_ident1] = set(rec_ident2_set)
+            rec_pair_dict_list.append(rec_pair_dict)
+
+            num_rec_pairs = sarray_index.num_rec_pairs
+
+          assert rec_pair_dict_list[0] == rec_pair_dict_list[1], \
+                 (index_args, min_suffix_len, max_block_size, padded)
+
+          [field_names_list, weight_vec_dict] = sarray_index.run()
+          assert len(weight_vec_dict) == num_rec_pairs
+
+    # Check an illegal array method
+    #
+    try:
+      sarray_index = indexing.SuffixArrayIndex(desc = 'Test illegal',
+                                               dataset1 = self.dataset1,
+                                               dataset2 = self.dataset2,
+                                               rec_comparator = \
+                                                 self.rec_comp_link,
+                                               suffix_method = 'suffixonly',
+                                               block_method = (3,10),
+                                               array_method = 'sais',
+                                               index_def = [index_def1])
+    except:
+      pass
+    else:
+      raise Exception, 'Illegal array method not detected'
+
 
 # =============================================================================
 # Start tests when called from command line
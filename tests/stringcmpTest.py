@@ -455,6 +455,109 @@ class TestCase(unittest.TestCase):
       assert (approx_str_value_permwinkler >= approx_str_value_winkler), \
              '"PermWinkler" value smaller than "Winkler" value for:'+str(pair)
 
+  def testMinThreshold(self):  # - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test approximate string comparators with a minimum threshold"""
+
+    funct_list = [('Jaro',         lambda s1, s2, t: stringcmp.jaro(s1, s2, t)),
+                  ('Winkler',   lambda s1, s2, t: stringcmp.winkler(s1, s2, t)),
+                  ('EditDist', lambda s1, s2, t: stringcmp.editdist(s1, s2, t)),
+                  ('ModEditDist',
+                   lambda s1, s2, t: stringcmp.mod_editdist(s1, s2, t)),
+                  ('BagDist',   lambda s1, s2, t: stringcmp.bagdist(s1, s2, t)),
+                  ('SWDist',
+                   lambda s1, s2, t: stringcmp.swdist(s1, s2, 'average', t)),
+                  ('LCS',
+                   lambda s1, s2, t: stringcmp.lcs(s1, s2, 2, 'average', t)),
+                  ('Jaro-Winkler',
+                   lambda s1, s2, t: stringcmp.do_stringcmp('jaro-winkler',
+                                                            s1, s2, t)[0])]
+
+    for pair in self.string_pairs:
+
+      for (funct_name, funct) in funct_list:
+
+        approx_str_value = funct(pair[0], pair[1], None)
+
+        for min_threshold in [0.3, 0.5, 0.75, 0.9]:
+
+          approx_str_value_thres = funct(pair[0], pair[1], min_threshold)
+
+          # Values (clearly) above the threshold must not change, all others
+          # must stay below the threshold
+          #
+          if (approx_str_value >= min_threshold + 0.001):
+            assert (approx_str_value_thres == approx_str_value), \
+                   '"%s" returns a different value with minimum ' % \
+                   (funct_name) + 'threshold %.2f for: %s: %f, %f' % \
+                   (min_threshold, str(pair), approx_str_value_thres,
+                    approx_str_value)
+
+          elif (approx_str_value < min_threshold):
+            assert (approx_str_value_thres < min_threshold), \
+                   '"%s" returns a value above minimum threshold ' % \
+                   (funct_name) + '%.2f for: %s: %f, %f' % \
+                   (min_threshold, str(pair), approx_str_value_thres,
+                    approx_str_value)
+
+    # The number of common characters counts repeated characters
+    #
+    assert (stringcmp.common_char_count('peter', 'petra') == 4)
+    assert (stringcmp.common_char_count('aab', 'aaa') == 2)
+    assert (stringcmp.common_char_count('hardin', 'martinez') == 4)
+
+  def testBitParallel(self):  # - - - - - - - - - - - - - - - - - - - - - - - -
+    """Test the bit-parallel edit distance and longest common substring"""
+
+    def full_matrix_dist(str1, str2, do_transp):
+      d = [range(len(str2)+1)]
+      for i in range(1, len(str1)+1):
+        d.append([i]+len(str2)*[0])
+        for j in range(1, len(str2)+1):
+          d[i][j] = min(d[i-1][j]+1, d[i][j-1]+1,
+                        d[i-1][j-1]+int(str1[i-1] != str2[j-1]))
+          if (do_transp == True) and (i > 1) and (j > 1) and \
+             (str1[i-1] == str2[j-2]) and (str1[i-2] == str2[j-1]):
+            d[i][j] = min(d[i][j], d[i-2][j-2]+1)
+      return d[len(str1)][len(str2)]
+
+    str_pairs = self.string_pairs + [['', 'abc'], ['ab', 'ba'],
+                                     ['ca', 'abc'], ['sydney', 'sydeny'],
+                                     ['a'*70, 'a'*69+'b']]
+
+    for (str1, str2) in str_pairs:
+      for (funct, do_transp) in [(stringcmp.editdist_bitparallel, False),
+                                 (stringcmp.mod_editdist_bitparallel, True)]:
+
+        dist = full_matrix_dist(str1, str2, do_transp)
+
+        assert (funct(str1, str2) == dist), (funct.__name__, str1, str2)
+        assert (funct(str2, str1) == dist), (funct.__name__, str2, str1)
+
+        # With a maximum distance, a distance larger than it is not exact
+        #
+        for max_dist in [0.5, 1.0, 2.5]:
+          if (dist <= max_dist):
+            assert (funct(str1, str2, max_dist) == dist)
+          else:
+            assert (max_dist < funct(str1, str2, max_dist) <= dist)
+
+      com_str, com_len, str1n, str2n = stringcmp.do_lcs(str1, str2)
+
+      max_len = 0
+      for i in range(len(str1)):
+        for j in range(i+1, len(str1)+1):
+          if (str1[i:j] in str2):
+            max_len = max(max_len, j-i)
+
+      assert (com_len == len(com_str) == max_len), (str1, str2, com_str)
+      assert (len(str1n) == len(str1)-com_len)
+      assert (len(str2n) == len(str2)-com_len)
+
+    assert (stringcmp.editdist_bitparallel('sydney', 'sydeny') == 2)
+    assert (stringcmp.mod_editdist_bitparallel('sydney', 'sydeny') == 1)
+    assert (stringcmp.do_lcs('prapasi asawakun', 'paprasi asawakun') == \
+            ('asi asawakun', 12, 'prap', 'papr'))
+
 # =============================================================================
 # Start tests when called from command line
 
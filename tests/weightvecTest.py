@@ -0,0 +1,186 @@
+# =============================================================================
+# AUSTRALIAN NATIONAL UNIVERSITY OPEN SOURCE LICENSE (ANUOS LICENSE)
+# VERSION 1.3
+# 
+# The contents of this file are subject to the ANUOS License Version 1.3
+# (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at:
+# 
+#   https://sourceforge.net/projects/febrl/
+# 
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and limitations
+# under the License.
+# 
+# The Original Software is: "weightvecTest.py"
+# 
+# The Initial Developer of the Original Software is:
+#   Dr Peter Christen (Research School of Computer Science, The Australian
+#                      National University)
+# 
+# Copyright (C) 2002 - 2011 the Australian National University and
+# others. All Rights Reserved.
+# 
+# Contributors:
+# 
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 2 or later (the "GPL"), in
+# which case the provisions of the GPL are applicable instead of those
+# above. The GPL is available at the following URL: http://www.gnu.org/
+# If you wish to allow use of your version of this file only under the
+# terms of the GPL, and not to allow others to use your version of this
+# file under the terms of the ANUOS License, indicate your decision by
+# deleting the provisions above and replace them with the notice and
+# other provisions required by the GPL. If you do not delete the
+# provisions above, a recipient may use your version of this file under
+# the terms of any one of the ANUOS License or the GPL.
+# =============================================================================
+#
+# Freely extensible biomedical record linkage (Febrl) - Version 0.4.2
+#
+# See: http://datamining.anu.edu.au/linkage.html
+#
+# =============================================================================
+
+
+"""Test module for weightvec.py.
+"""
+
+# =============================================================================
+# Import necessary modules (Python standard modules first, then Febrl modules)
+
+import random
+import sys
+import unittest
+sys.path.append('..')
+
+import weightvec
+
+# =============================================================================
+
+class TestCase(unittest.TestCase):
+
+  # Initialise test case  - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  #
+  def setUp(self):
+
+    # A weight vector dictionary with record identifier tuples as keys
+    #
+    random.seed(42)
+
+    self.w_vec_dict = {}
+    for i in range(3000):
+      rec_id_pair = ('rec-%d' % (random.randint(0,500)),
+                     'rec-%d' % (random.randint(0,500)))
+      self.w_vec_dict[rec_id_pair] = [random.random(), random.random(), 1.0]
+
+  # Clean up test case  - - - - - - - - - - - - - - - - - - - - - - - - - - - -
+  #
+  def tearDown(self):
+    pass  # Nothing to clean up
+
+  # ---------------------------------------------------------------------------
+  #
+  # Start test cases
+
+  def testAppendAndLookUp(self):  # - - - - - - - - - - - - - - - - - - - - - -
+    """Test appending and accessing weight vectors"""
+
+    w_vec_store = weightvec.WeightVectorStore(desc='Test store', capacity=16)
+
+    for (rec_id_pair, w_vec) in self.w_vec_dict.iteritems():
+      w_vec_store.append(rec_id_pair, w_vec)
+
+    assert len(w_vec_store) == len(self.w_vec_dict), \
+           (len(w_vec_store), len(self.w_vec_dict))
+    assert w_vec_store.get_weight_matrix().shape == (len(self.w_vec_dict), 3)
+
+    for (rec_id_pair, w_vec) in self.w_vec_dict.iteritems():
+      assert rec_id_pair in w_vec_store, rec_id_pair
+      assert w_vec_store[rec_id_pair] == w_vec, \
+             (rec_id_pair, w_vec_store[rec_id_pair], w_vec)
+
+    assert ('rec-1', 'rec-999') not in w_vec_store
+    assert ('rec-999', 'rec-1') not in w_vec_store
+    assert w_vec_store.get(('rec-999', 'rec-1')) == None
+
+    assert dict(w_vec_store.iteritems()) == self.w_vec_dict
+    assert sorted(w_vec_store.keys()) == sorted(self.w_vec_dict.keys())
+
+    # Keys are returned in the same order as the rows of the weight matrix
+    #
+    assert w_vec_store.values() == \
+           [self.w_vec_dict[rec_id_pair] for rec_id_pair in w_vec_store]
+
+  def testDictionaryAccess(self):  # - - - - - - - - - - - - - - - - - - - - - -
+    """Test modifying a weight vector store like a dictionary"""
+
+    w_vec_store = weightvec.WeightVectorStore()
+    test_dict =   {}
+
+    for (rec_id_pair, w_vec) in self.w_vec_dict.iteritems():
+      w_vec_store[rec_id_pair] = w_vec
+      test_dict[rec_id_pair] =   w_vec
+
+      if (random.random() < 0.1):  # Overwrite a weight vector
+        w_vec_store[rec_id_pair] = [0.0, 0.0, 0.0]
+        test_dict[rec_id_pair] =   [0.0, 0.0, 0.0]
+
+      if (random.random() < 0.05):  # Remove a random weight vector
+        del_rec_id_pair = random.choice(test_dict.keys())
+        del w_vec_store[del_rec_id_pair]
+        del test_dict[del_rec_id_pair]
+
+      assert len(w_vec_store) == len(test_dict)
+
+    assert dict(w_vec_store.items()) == test_dict
+
+    # Remove and put back a weight vector (as done by classifiers)
+    #
+    (rec_id_pair, w_vec) = w_vec_store.popitem()
+    assert test_dict[rec_id_pair] == w_vec
+    assert rec_id_pair not in w_vec_store
+    w_vec_store[rec_id_pair] = w_vec
+    assert dict(w_vec_store.items()) == test_dict
+
+    for rec_id_pair in test_dict.keys():
+      del w_vec_store[rec_id_pair]
+    assert len(w_vec_store) == 0
+    self.assertRaises(KeyError, w_vec_store.popitem)
+
+  def testRecordNumbers(self):  # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test a weight vector store with given record identifier lists"""
+
+    rec_ident_list1 = ['a', 'b', 'c']
+    rec_ident_list2 = ['x', 'y']
+
+    w_vec_store = weightvec.WeightVectorStore(num_weights=2,
+                         rec_ident_lists=(rec_ident_list1, rec_ident_list2))
+
+    w_vec_store.append((2,1), [0.5, 1.0])
+    w_vec_store.append((0,1), [1.0, 0.0])
+
+    assert w_vec_store.keys() == [(2,1), (0,1)]
+    assert w_vec_store[(0,1)] == [1.0, 0.0]
+    assert w_vec_store.get_rec_num_array().tolist() == [[2,1], [0,1]]
+
+    self.assertRaises(Exception, w_vec_store.append, (1,1), [1.0])
+
+  def testCheckFunction(self):  # - - - - - - - - - - - - - - - - - - - - - - -
+    """Test the weight vector dictionary check function"""
+
+    weightvec.check_is_weight_vector_dict('test', {})
+    weightvec.check_is_weight_vector_dict('test',
+                                          weightvec.WeightVectorStore())
+
+    self.assertRaises(Exception, weightvec.check_is_weight_vector_dict,
+                      'test', [])
+
+# =============================================================================
+# Start tests when called from command line
+
+if (__name__ == "__main__"):
+  unittest.main()  # Run all test
+
+# =============================================================================
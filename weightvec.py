@@ -0,0 +1,488 @@
+# =============================================================================
+# AUSTRALIAN NATIONAL UNIVERSITY OPEN SOURCE LICENSE (ANUOS LICENSE)
+# VERSION 1.3
+# 
+# The contents of this file are subject to the ANUOS License Version 1.3
+# (the "License"); you may not use this file except in compliance with
+# the License. You may obtain a copy of the License at:
+# 
+#   https://sourceforge.net/projects/febrl/
+# 
+# Software distributed under the License is distributed on an "AS IS"
+# basis, WITHOUT WARRANTY OF ANY KIND, either express or implied. See
+# the License for the specific language governing rights and limitations
+# under the License.
+# 
+# The Original Software is: "weightvec.py"
+# 
+# The Initial Developer of the Original Software is:
+#   Dr Peter Christen (Research School of Computer Science, The Australian
+#                      National University)
+# 
+# Copyright (C) 2002 - 2011 the Australian National University and
+# others. All Rights Reserved.
+# 
+# Contributors:
+# 
+# Alternatively, the contents of this file may be used under the terms
+# of the GNU General Public License Version 2 or later (the "GPL"), in
+# which case the provisions of the GPL are applicable instead of those
+# above. The GPL is available at the following URL: http://www.gnu.org/
+# If you wish to allow use of your version of this file only under the
+# terms of the GPL, and not to allow others to use your version of this
+# file under the terms of the ANUOS License, indicate your decision by
+# deleting the provisions above and replace them with the notice and
+# other provisions required by the GPL. If you do not delete the
+# provisions above, a recipient may use your version of this file under
+# the terms of any one of the ANUOS License or the GPL.
+# =============================================================================
+#
+# Freely extensible biomedical record linkage (Febrl) - Version 0.4.2
+#
+# See: http://datamining.anu.edu.au/linkage.html
+#
+# =============================================================================
+
+"""Module weightvec.py - Compact storage of weight vectors.
+
+   This module provides a class that stores weight vectors (as produced by the
+   run() methods of the indices in indexing.py) in a column based format made
+   of a two-dimensional NumPy array of weights plus an integer array of record
+   pairs, rather than a Python dictionary with record identifier tuples as keys
+   and lists of weights as values.
+
+     WeightVectorStore  A weight vector store which can be accessed like a
+                        weight vector dictionary.
+
+   The following auxiliary functions are also provided:
+
+     check_is_weight_vector_dict  Check if a value is either a weight vector
+                                  dictionary or a weight vector store.
+     get_weight_matrix            Return the weights of a weight vector
+                                  dictionary or store as a NumPy array.
+
+   The NumPy module is needed to use a weight vector store.
+"""
+
+# =============================================================================
+# Import necessary modules (Python standard modules first, then Febrl modules)
+
+import logging
+
+try:
+  import numpy
+  imp_numpy = True
+except:
+  imp_numpy = False
+
+import auxiliary
+
+# =============================================================================
+
+def check_is_weight_vector_dict(variable, value):
+  """Check if the value of the given variable is a weight vector dictionary or
+     a weight vector store, if not raise an exception.
+  """
+
+  if ((not isinstance(value, dict)) and \
+      (not isinstance(value, WeightVectorStore))):
+    logging.exception('Variable "%s" is not a dictionary or weight vector ' % \
+                      (variable) + 'store: %s' % (type(value)))
+    raise Exception
+
+# =============================================================================
+
+def get_weight_matrix(w_vec_dict):
+  """Return the weights of the given weight vector dictionary or weight vector
+     store as a two-dimensional NumPy array, with the rows in the same order as
+     the weight vectors returned by the itervalues() method.
+
+     For a weight vector store this is not a copy.
+  """
+
+  if (imp_numpy == False):
+    logging.exception('Module "numpy" not installed, cannot generate a ' + \
+                      'weight matrix')
+    raise Exception
+
+  if (isinstance(w_vec_dict, WeightVectorStore)):
+    return w_vec_dict.get_weight_matrix()
+
+  w_matrix = numpy.array(w_vec_dict.values(), numpy.float64)
+
+  if (len(w_vec_dict) == 0):
+    w_matrix = w_matrix.reshape((0, 0))
+
+  return w_matrix
+
+# =============================================================================
+
+class WeightVectorStore:
+  """Class that stores weight vectors as a two-dimensional NumPy array with one
+     row per record pair, and an integer array with the two record numbers of
+     each record pair.
+
+     Record identifiers are translated into record numbers when weight vectors
+     are added, and back into record identifiers when they are retrieved. So a
+     weight vector store can be used in the same way as a weight vector
+     dictionary, with record identifier tuples as keys and lists of weights as
+     values. Weight vectors are appended to the store with the append() method
+     (without checking if the record pair is already in the store), or with
+     the normal dictionary assignment.
+
+     Look-ups of record pairs use a sorted array of record pair numbers which
+     is generated the first time it is needed. Record pairs that are added
+     later are kept in a small dictionary until this array is re-generated.
+
+     The following arguments can be given when a weight vector store is
+     initialised:
+
+       description      A string describing the weight vector store.
+       num_weights      The number of weights in each weight vector. If not
+                        given it will be set when the first weight vector is
+                        added.
+       rec_ident_lists  If the record pairs are given as pairs of integer
+                        record numbers (as generated by an index with interned
+                        record identifiers), then this can be set to the pair
+                        of lists (index.rec_ident_list1, index.rec_ident_list2)
+                        with the original record identifiers. In this case the
+                        record numbers are stored directly, and the keys of the
+                        weight vector store are the record number pairs.
+                        Default is None, in which case record identifiers are
+                        translated into record numbers by the weight vector
+                        store itself.
+       capacity         The initial number of rows of the weight array, which
+                        is doubled each time it is full. Default is 1024.
+
+     The weights of all record pairs can be accessed as a NumPy array with the
+     get_weight_matrix() method, and the record numbers with the
+     get_rec_num_array() method.
+  """
+
+  # ---------------------------------------------------------------------------
+
+  def __init__(self, **kwargs):
+    """Constructor.
+    """
+
+    self.description =     ''
+    self.num_weights =     None
+    self.rec_ident_lists = None
+    self.capacity =        1024
+
+    for (keyword, value) in kwargs.items():
+
+      if (keyword.startswith('desc')):
+        auxiliary.check_is_string('description', value)
+        self.description = value
+
+      elif (keyword.startswith('num_w')):
+        auxiliary.check_is_integer('num_weights', value)
+        auxiliary.check_is_positive('num_weights', value)
+        self.num_weights = value
+
+      elif (keyword.startswith('rec_ident_l')):
+        auxiliary.check_is_tuple('rec_ident_lists', value)
+        if (len(value) != 2):
+          logging.exception('Argument "rec_ident_lists" does not contain ' + \
+                            'two lists: %s' % (str(value)))
+          raise Exception
+        self.rec_ident_lists = value
+
+      elif (keyword.startswith('capa')):
+        auxiliary.check_is_integer('capacity', value)
+        auxiliary.check_is_positive('capacity', value)
+        self.capacity = value
+
+      else:
+        logging.exception('Illegal constructor argument keyword: '+keyword)
+        raise Exception
+
+    if (imp_numpy == False):
+      logging.exception('Module "numpy" not installed, cannot use a ' + \
+                        'weight vector store')
+      raise Exception
+
+    self.num_w_vec = 0  # Number of weight vectors stored
+
+    self.rec_num_array = numpy.zeros((self.capacity, 2), numpy.int64)
+
+    if (self.num_weights != None):
+      self.weight_array = numpy.zeros((self.capacity, self.num_weights),
+                                      numpy.float64)
+    else:
+      self.weight_array = None  # Will be allocated with first weight vector
+
+    # If the record pairs are made of record identifiers, these are translated
+    # into record numbers using dictionaries, and lists for the other direction
+    #
+    if (self.rec_ident_lists == None):
+      self.rec_num_dict1 =   {}
+      self.rec_num_dict2 =   {}
+      self.rec_ident_list1 = []
+      self.rec_ident_list2 = []
+    else:
+      self.rec_ident_list1 = self.rec_ident_lists[0]
+      self.rec_ident_list2 = self.rec_ident_lists[1]
+
+    self.sorted_codes = None  # Sorted record pair numbers for look-ups
+    self.sorted_rows =  None  # Rows of the sorted record pair numbers
+    self.recent_rows =  {}    # Record pair numbers of rows added after the
+                              # sorted arrays were generated
+
+  # ---------------------------------------------------------------------------
+
+  def __pair_to_nums__(self, rec_id_pair, add):
+    """Convert a record pair into a tuple of two record numbers. If 'add' is
+       False and one of the record identifiers is not known, return None.
+    """
+
+    if (self.rec_ident_lists != None):
+      return rec_id_pair
+
+    (rec_ident1, rec_ident2) = rec_id_pair
+
+    rec_num1 = self.rec_num_dict1.get(rec_ident1, None)
+    if (rec_num1 == None):
+      if (add == False):
+        return None
+      rec_num1 = len(self.rec_ident_list1)
+      self.rec_num_dict1[rec_ident1] = rec_num1
+      self.rec_ident_list1.append(rec_ident1)
+
+    rec_num2 = self.rec_num_dict2.get(rec_ident2, None)
+    if (rec_num2 == None):
+      if (add == False):
+        return None
+      rec_num2 = len(self.rec_ident_list2)
+      self.rec_num_dict2[rec_ident2] = rec_num2
+      self.rec_ident_list2.append(rec_ident2)
+
+    return (rec_num1, rec_num2)
+
+  # ---------------------------------------------------------------------------
+
+  def __row_to_pair__(self, row):
+    """Return the record pair (key) of the given row.
+    """
+
+    rec_num1 = int(self.rec_num_array[row,0])
+    rec_num2 = int(self.rec_num_array[row,1])
+
+    if (self.rec_ident_lists != None):
+      return (rec_num1, rec_num2)
+    else:
+      return (self.rec_ident_list1[rec_num1], self.rec_ident_list2[rec_num2])
+
+  # ---------------------------------------------------------------------------
+
+  def __find_row__(self, rec_id_pair):
+    """Return the row of the given record pair, or -1 if it is not stored.
+    """
+
+    rec_num_pair = self.__pair_to_nums__(rec_id_pair, False)
+    if (rec_num_pair == None):
+      return -1
+
+    code = (rec_num_pair[0] << 32) + rec_num_pair[1]
+
+    if (code in self.recent_rows):
+      return self.recent_rows[code]
+
+    # Re-generate the sorted arrays if too many rows were added since
+    #
+    if ((self.sorted_codes is None) or \
+        (len(self.recent_rows) > max(1024, self.num_w_vec / 10))):
+      self.__sort_rec_pairs__()
+
+      if (code in self.recent_rows):
+        return self.recent_rows[code]
+
+    pos = numpy.searchsorted(self.sorted_codes, code)
+
+    if ((pos < len(self.sorted_codes)) and (self.sorted_codes[pos] == code)):
+      return int(self.sorted_rows[pos])
+    else:
+      return -1
+
+  # ---------------------------------------------------------------------------
+
+  def __sort_rec_pairs__(self):
+    """Generate the sorted array of record pair numbers used for look-ups.
+    """
+
+    rec_nums = self.rec_num_array[:self.num_w_vec]
+    codes =    (rec_nums[:,0] << 32) + rec_nums[:,1]
+
+    self.sorted_rows =  numpy.argsort(codes, kind='mergesort')
+    self.sorted_codes = codes[self.sorted_rows]
+    self.recent_rows =  {}
+
+  # ---------------------------------------------------------------------------
+
+  def __invalidate_look_up__(self):
+    """Remove the look-up arrays (after rows have been moved or removed).
+    """
+
+    self.sorted_codes = None
+    self.sorted_rows =  None
+    self.recent_rows =  {}
+
+  # ---------------------------------------------------------------------------
+
+  def append(self, rec_id_pair, w_vec):
+    """Append the given weight vector of the given record pair, without
+       checking if this record pair is already stored.
+    """
+
+    if (self.weight_array is None):  # First weight vector, allocate array
+      self.num_weights = len(w_vec)
+      self.weight_array = numpy.zeros((self.capacity, self.num_weights),
+                                      numpy.float64)
+
+    if (len(w_vec) != self.num_weights):
+      logging.exception('Weight vector has %d weights, but %d are expected' \
+                        % (len(w_vec), self.num_weights))
+      raise Exception
+
+    row = self.num_w_vec
+
+    if (row == self.capacity):  # Double the size of the arrays
+      self.capacity *= 2
+
+      new_weight_array = numpy.zeros((self.capacity, self.num_weights),
+                                     numpy.float64)
+      new_weight_array[:row] = self.weight_array
+      self.weight_array = new_weight_array
+
+      new_rec_num_array = numpy.zeros((self.capacity, 2), numpy.int64)
+      new_rec_num_array[:row] = self.rec_num_array
+      self.rec_num_array = new_rec_num_array
+
+    rec_num_pair = self.__pair_to_nums__(rec_id_pair, True)
+
+    self.weight_array[row] =  w_vec
+    self.rec_num_array[row] = rec_num_pair
+    self.num_w_vec += 1
+
+    if (self.sorted_codes is not None):  # Keep look-up up to date
+      self.recent_rows[(rec_num_pair[0] << 32) + rec_num_pair[1]] = row
+
+  # ---------------------------------------------------------------------------
+
+  def get_weight_matrix(self):
+    """Return the weights of all stored weight vectors as a two-dimensional
+       NumPy array (one row per record pair). This is not a copy.
+    """
+
+    if (self.weight_array is None):
+      return numpy.zeros((0, self.num_weights or 0), numpy.float64)
+
+    return self.weight_array[:self.num_w_vec]
+
+  # ---------------------------------------------------------------------------
+
+  def get_rec_num_array(self):
+    """Return the record numbers of all stored record pairs as a NumPy array
+       with two columns (in the same row order as the weight matrix). This is
+       not a copy.
+    """
+
+    return self.rec_num_array[:self.num_w_vec]
+
+  # ---------------------------------------------------------------------------
+
+  def get_rec_id_pair_list(self):
+    """Return a list with the record pairs (keys) of all stored weight vectors
+       in the same order as the rows of the weight matrix.
+    """
+
+    return [self.__row_to_pair__(row) for row in xrange(self.num_w_vec)]
+
+  # ---------------------------------------------------------------------------
+  # Methods to access the weight vector store like a dictionary
+
+  def __len__(self):
+    return self.num_w_vec
+
+  def __contains__(self, rec_id_pair):
+    return (self.__find_row__(rec_id_pair) >= 0)
+
+  def has_key(self, rec_id_pair):
+    return (self.__find_row__(rec_id_pair) >= 0)
+
+  def __getitem__(self, rec_id_pair):
+    row = self.__find_row__(rec_id_pair)
+    if (row < 0):
+      raise KeyError(rec_id_pair)
+    return self.weight_array[row].tolist()
+
+  def get(self, rec_id_pair, default = None):
+    row = self.__find_row__(rec_id_pair)
+    if (row < 0):
+      return default
+    return self.weight_array[row].tolist()
+
+  def __setitem__(self, rec_id_pair, w_vec):
+    row = self.__find_row__(rec_id_pair)
+    if (row < 0):
+      self.append(rec_id_pair, w_vec)
+    else:
+      self.weight_array[row] = w_vec
+
+  def __delitem__(self, rec_id_pair):
+    row = self.__find_row__(rec_id_pair)
+    if (row < 0):
+      raise KeyError(rec_id_pair)
+
+    last_row = self.num_w_vec - 1  # Move last row into the removed row
+    self.weight_array[row] =  self.weight_array[last_row]
+    self.rec_num_array[row] = self.rec_num_array[last_row]
+    self.num_w_vec -= 1
+
+    self.__invalidate_look_up__()
+
+  def popitem(self):
+    if (self.num_w_vec == 0):
+      raise KeyError('popitem(): weight vector store is empty')
+
+    last_row = self.num_w_vec - 1
+    rec_id_pair = self.__row_to_pair__(last_row)
+    w_vec = self.weight_array[last_row].tolist()
+    self.num_w_vec -= 1
+
+    if (self.sorted_codes is not None):
+      code = (int(self.rec_num_array[last_row,0]) << 32) + \
+             int(self.rec_num_array[last_row,1])
+      if (code in self.recent_rows):
+        del self.recent_rows[code]
+      else:
+        self.__invalidate_look_up__()
+
+    return (rec_id_pair, w_vec)
+
+  def __iter__(self):
+    for row in xrange(self.num_w_vec):
+      yield self.__row_to_pair__(row)
+
+  def iterkeys(self):
+    return self.__iter__()
+
+  def itervalues(self):
+    for row in xrange(self.num_w_vec):
+      yield self.weight_array[row].tolist()
+
+  def iteritems(self):
+    for row in xrange(self.num_w_vec):
+      yield (self.__row_to_pair__(row), self.weight_array[row].tolist())
+
+  def keys(self):
+    return self.get_rec_id_pair_list()
+
+  def values(self):
+    return self.get_weight_matrix().tolist()
+
+  def items(self):
+    return list(self.iteritems())
+
+# =============================================================================